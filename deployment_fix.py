@@ -18,7 +18,6 @@ def check_dependencies():
         'redis',
         'apscheduler',
         'socketio',
-        'slowapi',
         'sqlalchemy',
         'pydantic'
     ]
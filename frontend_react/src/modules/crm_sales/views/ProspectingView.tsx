@@ -148,12 +148,26 @@ export default function ProspectingView() {
         niche: niche.trim(),
         location: location.trim(),
         max_places: maxPlaces,
-      }, { timeout: 300000 }); // 5 minutes timeout for scraping
+      });
+      // The scrape runs as a background job: poll its status until it finishes
+      const jobId = res.data?.job_id;
+      let job = res.data;
+      while (jobId && !['completed', 'failed', 'cancelled'].includes(job?.status)) {
+        await new Promise((resolve) => setTimeout(resolve, 3000));
+        const jobRes = await api.get(`/admin/core/crm/prospecting/jobs/${jobId}`, {
+          params: { tenant_id_override: tenantId },
+        });
+        job = jobRes.data;
+      }
       await loadLeads(tenantId);
-      const total = res.data?.total_results ?? 0;
-      const imported = res.data?.imported ?? res.data?.imported_or_updated ?? 0;
-      const skipped = res.data?.skipped_already_exists ?? 0;
-      const fromWeb = res.data?.fetched_from_web ?? 0;
+      if (job?.status !== 'completed') {
+        setError(job?.error || t('prospecting.errorScraping'));
+        return;
+      }
+      const total = job?.fetched ?? 0;
+      const imported = (job?.imported ?? 0) + (job?.updated ?? 0);
+      const skipped = job?.skipped_already_exists ?? 0;
+      const fromWeb = job?.fetched_from_web ?? 0;
       setSuccess(
         t('prospecting.scrapeSuccess', { total, imported, skipped, fromWeb }),
       );
@@ -10,11 +10,14 @@ from pydantic import BaseModel
 
 from db import db
 from core.credentials import (
-    get_tenant_credential, save_tenant_credential, 
+    get_tenant_credential, save_tenant_credential, invalidate_tenant_credentials,
     YCLOUD_API_KEY, YCLOUD_WEBHOOK_SECRET
 )
-from core.security import verify_admin_token, get_resolved_tenant_id, get_allowed_tenant_ids, ADMIN_TOKEN, audit_access
-from core.utils import normalize_phone, ARG_TZ
+from core.security import (
+    verify_admin_token, get_resolved_tenant_id, get_allowed_tenant_ids, ADMIN_TOKEN, audit_access,
+    invalidate_user_identity, invalidate_tenant_identity,
+)
+from core.utils import normalize_phone, phone_lookup_key, ARG_TZ
 
 from core.services.chat_service import ChatService
 
@@ -133,6 +136,9 @@ async def update_user_status(user_id: str, payload: StatusUpdate, user_data = De
             if user['role'] == 'professional':
                 await db.pool.execute("UPDATE professionals SET is_active = TRUE, updated_at = NOW() WHERE user_id = $1", uid)
         
+    invalidate_user_identity(user_id)
+    from services.seller_assignment_service import invalidate_assignment_plan
+    invalidate_assignment_plan()
     return {"status": "updated"}
 
 # --- RUTAS DE CHAT ---
@@ -152,7 +158,20 @@ async def get_chat_sessions(tenant_id: int, allowed_ids: List[int] = Depends(get
 async def get_chat_messages(phone: str, tenant_id: int, limit: int = 50, offset: int = 0, allowed_ids: List[int] = Depends(get_allowed_tenant_ids)):
     if tenant_id not in allowed_ids: raise HTTPException(status_code=403)
     rows = await db.pool.fetch("SELECT * FROM chat_messages WHERE from_number = $1 AND tenant_id = $2 ORDER BY created_at DESC LIMIT $3 OFFSET $4", phone, tenant_id, limit, offset)
-    return sorted([dict(r) | {"created_at": str(r["created_at"])} for r in rows], key=lambda x: x['created_at'])
+    messages = [dict(r) | {"created_at": str(r["created_at"])} for r in rows]
+    if len(messages) < limit:
+        # Página incompleta: el resto del rango vive en cold storage (chat_archive_service)
+        hot_count = offset + len(messages) if messages or offset == 0 else await db.pool.fetchval(
+            "SELECT COUNT(*) FROM chat_messages WHERE from_number = $1 AND tenant_id = $2", phone, tenant_id
+        )
+        try:
+            from services.chat_archive_service import chat_archive_service
+            messages += await chat_archive_service.get_archived_chat_messages(
+                phone, tenant_id, limit=limit - len(messages), offset=max(offset - hot_count, 0)
+            )
+        except Exception as e:
+            logger.error(f"Error leyendo historial archivado de {phone}: {e}")
+    return sorted(messages, key=lambda x: x['created_at'])
 
 @router.post("/chat/send", dependencies=[Depends(verify_admin_token)], tags=["Chat"])
 async def send_chat_message(payload: ChatSendMessage, request: Request, background_tasks: BackgroundTasks, allowed_ids: List[int] = Depends(get_allowed_tenant_ids)):
@@ -177,30 +196,29 @@ async def send_chat_message(payload: ChatSendMessage, request: Request, backgrou
 async def mark_chat_session_read(phone: str, tenant_id: int, allowed_ids: List[int] = Depends(get_allowed_tenant_ids)):
     if tenant_id not in allowed_ids: raise HTTPException(status_code=403)
     # C-02: Persistir lectura en DB — actualiza updated_at del lead
-    norm_phone = normalize_phone(phone)
     await db.pool.execute("""
         UPDATE leads SET updated_at = NOW()
-        WHERE tenant_id = $1 AND (phone_number = $2 OR phone_number = $3)
-    """, tenant_id, norm_phone, phone)
+        WHERE tenant_id = $1 AND phone_e164 = $2
+    """, tenant_id, phone_lookup_key(phone))
     return {"status": "ok", "phone": phone, "tenant_id": tenant_id}
 
 @router.post("/chat/human-intervention", dependencies=[Depends(verify_admin_token)], tags=["Chat"])
 async def toggle_human_intervention(payload: HumanInterventionToggle, request: Request, allowed_ids: List[int] = Depends(get_allowed_tenant_ids)):
     if payload.tenant_id not in allowed_ids: raise HTTPException(status_code=403)
-    norm_phone = normalize_phone(payload.phone)
+    phone_key = phone_lookup_key(payload.phone)
     if payload.activate:
         override_until = datetime.now(ARG_TZ) + timedelta(milliseconds=payload.duration or 86400000)
         await db.pool.execute("""
             UPDATE leads SET human_handoff_requested = TRUE, human_override_until = $1, updated_at = NOW()
-            WHERE tenant_id = $2 AND (phone_number = $3 OR phone_number = $4)
-        """, override_until, payload.tenant_id, norm_phone, payload.phone)
+            WHERE tenant_id = $2 AND phone_e164 = $3
+        """, override_until, payload.tenant_id, phone_key)
         await emit_appointment_event("HUMAN_OVERRIDE_CHANGED", {"phone_number": payload.phone, "tenant_id": payload.tenant_id, "enabled": True, "until": override_until.isoformat()}, request)
         return {"status": "activated", "phone": payload.phone, "tenant_id": payload.tenant_id, "until": override_until.isoformat()}
     else:
         await db.pool.execute("""
             UPDATE leads SET human_handoff_requested = FALSE, human_override_until = NULL, updated_at = NOW()
-            WHERE tenant_id = $1 AND (phone_number = $2 OR phone_number = $3)
-        """, payload.tenant_id, norm_phone, payload.phone)
+            WHERE tenant_id = $1 AND phone_e164 = $2
+        """, payload.tenant_id, phone_key)
         await emit_appointment_event("HUMAN_OVERRIDE_CHANGED", {"phone_number": payload.phone, "tenant_id": payload.tenant_id, "enabled": False}, request)
         return {"status": "deactivated", "phone": payload.phone, "tenant_id": payload.tenant_id}
 
@@ -211,11 +229,10 @@ class RemoveSilencePayload(BaseModel):
 @router.post("/chat/remove-silence", dependencies=[Depends(verify_admin_token)], tags=["Chat"])
 async def remove_silence(payload: RemoveSilencePayload, request: Request, allowed_ids: List[int] = Depends(get_allowed_tenant_ids)):
     if payload.tenant_id not in allowed_ids: raise HTTPException(status_code=403)
-    norm_phone = normalize_phone(payload.phone)
     await db.pool.execute("""
         UPDATE leads SET human_handoff_requested = FALSE, human_override_until = NULL, updated_at = NOW()
-        WHERE tenant_id = $1 AND (phone_number = $2 OR phone_number = $3)
-    """, payload.tenant_id, norm_phone, payload.phone)
+        WHERE tenant_id = $1 AND phone_e164 = $2
+    """, payload.tenant_id, phone_lookup_key(payload.phone))
     await emit_appointment_event("HUMAN_OVERRIDE_CHANGED", {"phone_number": payload.phone, "tenant_id": payload.tenant_id, "enabled": False}, request)
     return {"status": "removed", "phone": payload.phone, "tenant_id": payload.tenant_id}
 
@@ -229,9 +246,8 @@ async def get_dashboard_stats(
     days = 7 if range == "weekly" else 30
     try:
         ia_conversations = await db.pool.fetchval("""
-            SELECT COUNT(DISTINCT m.from_number) FROM chat_messages m
-            JOIN leads l ON m.from_number = l.phone_number AND l.tenant_id = m.tenant_id
-            WHERE m.tenant_id = $1 AND m.created_at >= CURRENT_DATE - INTERVAL '1 day' * $2
+            SELECT COUNT(DISTINCT m.lead_id) FROM chat_messages m
+            WHERE m.tenant_id = $1 AND m.lead_id IS NOT NULL AND m.created_at >= CURRENT_DATE - INTERVAL '1 day' * $2
         """, tenant_id, days) or 0
         ia_events = await db.pool.fetchval("""
             SELECT COUNT(*) FROM seller_agenda_events e
@@ -302,6 +318,7 @@ async def update_tenant(tenant_id: int, payload: TenantUpdate, user_data=Depends
     params.append(tenant_id)
     query = "UPDATE tenants SET " + ", ".join(updates) + f", updated_at = NOW() WHERE id = ${pos}"
     await db.pool.execute(query, *params)
+    invalidate_tenant_identity(tenant_id)
     return {"status": "ok"}
 
 @router.post("/tenants", tags=["Sedes"])
@@ -319,6 +336,7 @@ async def create_tenant(payload: TenantCreate, user_data=Depends(verify_admin_to
         if "unique" in str(e).lower() or "duplicate" in str(e).lower():
             raise HTTPException(status_code=400, detail="bot_phone_number already in use")
         raise HTTPException(status_code=400, detail=str(e))
+    invalidate_tenant_identity()
     return {"status": "created"}
 
 @router.delete("/tenants/{tenant_id}", tags=["Sedes"])
@@ -330,6 +348,7 @@ async def delete_tenant(tenant_id: int, user_data=Depends(verify_admin_token)):
     count = await db.pool.fetchval("SELECT COUNT(*) FROM tenants")
     if count <= 1: raise HTTPException(status_code=400, detail="Cannot delete the last tenant")
     await db.pool.execute("DELETE FROM tenants WHERE id = $1", tenant_id)
+    invalidate_tenant_identity(tenant_id)
     return {"status": "deleted"}
 
 def _config_as_dict(config):  # config from DB can be dict (JSONB) or str
@@ -454,12 +473,13 @@ async def delete_credential(cred_id: int, user_data=Depends(verify_admin_token),
     role = user_data.role
     
     if role == "ceo":
-        result = await db.pool.execute("DELETE FROM credentials WHERE id = $1", cred_id)
+        deleted = await db.pool.fetchrow("DELETE FROM credentials WHERE id = $1 RETURNING tenant_id", cred_id)
     else:
-        result = await db.pool.execute("DELETE FROM credentials WHERE id = $1 AND tenant_id = $2", cred_id, tenant_id)
+        deleted = await db.pool.fetchrow("DELETE FROM credentials WHERE id = $1 AND tenant_id = $2 RETURNING tenant_id", cred_id, tenant_id)
         
-    if result == "DELETE 0":
+    if not deleted:
         raise HTTPException(status_code=404, detail="Credential not found or access denied")
+    invalidate_tenant_credentials(deleted["tenant_id"])
     return {"status": "ok"}
 
 @router.get("/settings/integration/{provider}/{tenant_id}", dependencies=[Depends(verify_admin_token)], tags=["Configuración"])
@@ -527,6 +547,15 @@ async def clean_media(request: Request, user_data=Depends(verify_admin_token)):
         
     return {"status": "ok", "message": "Limpieza de archivos completada exitosamente. (Mock)"}
 
+@router.post("/maintenance/archive-chats", tags=["Mantenimiento"])
+async def archive_chats(user_data=Depends(verify_admin_token)):
+    """Ejecuta el archivado de conversaciones frías (solo CEO)."""
+    if user_data.role != 'ceo':
+        raise HTTPException(status_code=403, detail="Only CEO can run maintenance tasks")
+    from services.chat_archive_service import chat_archive_service
+    results = await chat_archive_service.archive_all()
+    return {"status": "ok", "archived": results}
+
 
 @router.get("/audit/logs", tags=["Seguridad"])
 async def get_audit_logs(
@@ -8,7 +8,7 @@ import json
 import logging
 from db import db
 from auth_service import auth_service
-from core.security import audit_access
+from core.security import audit_access, invalidate_tenant_identity
 from core.rate_limiter import limiter
 from services.metrics_cache_service import metrics_cache_service
 
@@ -96,7 +96,7 @@ async def register_wizard(request: Request, payload: WizardRegisterRequest):
     if existing:
         raise HTTPException(status_code=400, detail="El correo ya se encuentra registrado.")
 
-    password_hash = auth_service.get_password_hash(payload.password)
+    password_hash = await auth_service.get_password_hash_async(payload.password)
     user_id = str(uuid.uuid4())
     first_name = payload.email.split("@")[0] # Minimalist fallback
     last_name = " "
@@ -161,6 +161,9 @@ async def register_wizard(request: Request, payload: WizardRegisterRequest):
                 except Exception as e:
                     logger.warning(f"Could not invalidate cache for new tenant {tenant_id}: {e}")
                 
+        # CEOs ven todos los tenants: la lista cacheada ya no es válida
+        invalidate_tenant_identity()
+
         # 7. Generar JWT y retornar (Forzamos 'ceo' en el payload del token y la respuesta)
         niche_type = "crm_sales"
         token_data = {
@@ -228,7 +231,7 @@ async def register(request: Request, payload: UserRegister):
         if not tenant_exists:
             raise HTTPException(status_code=400, detail="La empresa elegida no existe.")
 
-    password_hash = auth_service.get_password_hash(payload.password)
+    password_hash = await auth_service.get_password_hash_async(payload.password)
     user_id = str(uuid.uuid4())
     first_name = (payload.first_name or "").strip() or "Usuario"
     last_name = (payload.last_name or "").strip() or " "
@@ -283,7 +286,7 @@ async def login(request: Request, payload: UserLogin):
     if not user:
         raise HTTPException(status_code=401, detail="Credenciales inválidas.")
 
-    if not auth_service.verify_password(payload.password, user['password_hash']):
+    if not await auth_service.verify_password_async(payload.password, user['password_hash']):
         raise HTTPException(status_code=401, detail="Credenciales inválidas.")
 
     if user['status'] != 'active':
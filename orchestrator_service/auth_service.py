@@ -1,6 +1,8 @@
 import os
+import asyncio
 import logging
 import jwt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from passlib.context import CryptContext
@@ -26,6 +28,11 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 1 week
 # Password Hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt tarda decenas de ms por hash: corre en un pool acotado para no frenar el event loop
+# (chats, websockets) durante ráfagas de login. bcrypt libera el GIL, así que escala con CPUs.
+AUTH_CRYPTO_WORKERS = int(os.getenv("AUTH_CRYPTO_WORKERS", str(min(4, os.cpu_count() or 1))))
+_crypto_executor = ThreadPoolExecutor(max_workers=AUTH_CRYPTO_WORKERS, thread_name_prefix="auth-crypto")
+
 class TokenData(BaseModel):
     user_id: str
     email: str
@@ -45,6 +52,18 @@ class AuthService:
         safe_password = plain_password[:72]
         return pwd_context.verify(safe_password, hashed_password)
 
+    @staticmethod
+    async def get_password_hash_async(password: str) -> str:
+        """get_password_hash fuera del event loop (pool AUTH_CRYPTO_WORKERS)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_crypto_executor, AuthService.get_password_hash, password)
+
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        """verify_password fuera del event loop (pool AUTH_CRYPTO_WORKERS)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_crypto_executor, AuthService.verify_password, plain_password, hashed_password)
+
     @staticmethod
     def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
         to_encode = data.copy()
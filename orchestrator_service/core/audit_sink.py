@@ -0,0 +1,189 @@
+"""
+Nexus Audit Sink — escritura asíncrona y por lotes de `system_events`.
+
+Los eventos de auditoría se encolan en memoria (cola acotada) y un worker en segundo
+plano los inserta en lotes con un único INSERT ... SELECT FROM unnest(...), cada
+AUDIT_FLUSH_INTERVAL_MS o al juntar AUDIT_BATCH_SIZE eventos. Registrar un evento
+no hace ningún round trip a la base. Al apagar, `shutdown()` vacía la cola. Si un
+lote falla tras AUDIT_MAX_RETRIES intentos se reescribe fila por fila, así un evento
+inválido no arrastra al resto.
+
+Si la cola se llena, AUDIT_OVERFLOW_POLICY decide: 'drop_oldest' (por defecto)
+descarta el evento más viejo, 'drop_newest' descarta el entrante. Todo descarte
+queda contado en `stats()`.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "250"))
+AUDIT_OVERFLOW_POLICY = os.getenv("AUDIT_OVERFLOW_POLICY", "drop_oldest")
+AUDIT_MAX_RETRIES = int(os.getenv("AUDIT_MAX_RETRIES", "3"))
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+INSERT_EVENTS_SQL = """
+    INSERT INTO system_events (event_type, severity, message, payload, tenant_id, created_at)
+    SELECT e.event_type, e.severity, e.message, e.payload::jsonb, e.tenant_id, e.created_at
+    FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::int[], $6::timestamptz[])
+        AS e(event_type, severity, message, payload, tenant_id, created_at)
+"""
+
+# (event_type, severity, message, payload JSON, tenant_id, created_at)
+AuditEvent = Tuple[str, str, str, str, Optional[int], Any]
+
+
+class AuditSink:
+    def __init__(
+        self,
+        max_queue: int = AUDIT_QUEUE_MAX,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval_ms: int = AUDIT_FLUSH_INTERVAL_MS,
+        overflow_policy: str = AUDIT_OVERFLOW_POLICY,
+        max_retries: int = AUDIT_MAX_RETRIES,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of: {', '.join(OVERFLOW_POLICIES)}")
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.overflow_policy = overflow_policy
+        self.max_retries = max_retries
+        self._queue: Deque[AuditEvent] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._metrics = {
+            "enqueued": 0, "written": 0, "dropped_overflow": 0, "dropped_failed": 0,
+            "batches": 0, "write_errors": 0, "max_depth": 0, "last_flush_ms": 0.0,
+        }
+
+    # ── API ───────────────────────────────────────────────────────────────────
+
+    def emit(
+        self, event_type: str, severity: str, message: str,
+        payload: Dict[str, Any], tenant_id: Optional[int] = None,
+    ) -> bool:
+        """Encola un evento (sin I/O). Retorna False si fue descartado por overflow."""
+        event = (event_type, severity, message, json.dumps(payload, default=str), tenant_id, datetime.now(timezone.utc))
+        if len(self._queue) >= self.max_queue:
+            self._metrics["dropped_overflow"] += 1
+            if self.overflow_policy == "drop_newest":
+                return False
+            self._queue.popleft()
+        self._queue.append(event)
+        self._metrics["enqueued"] += 1
+        self._metrics["max_depth"] = max(self._metrics["max_depth"], len(self._queue))
+        self._ensure_worker()
+        if len(self._queue) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def flush(self) -> int:
+        """Escribe todo lo encolado ahora mismo. Retorna eventos escritos."""
+        written = 0
+        while self._queue:
+            n = await self._write_batch()
+            if n == 0:
+                break
+            written += n
+        return written
+
+    async def shutdown(self) -> None:
+        """Detiene el worker y vacía la cola (graceful shutdown)."""
+        self._closing = True
+        if self._task is not None:
+            if self._wakeup is not None:
+                self._wakeup.set()
+            try:
+                await self._task
+            except Exception as e:
+                logger.error(f"❌ Audit sink worker failed on shutdown: {e}")
+            self._task = None
+        await self.flush()
+        if self._queue:
+            logger.warning(f"⚠️ Audit sink: {len(self._queue)} eventos sin escribir al apagar")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._metrics,
+            "queued": len(self._queue),
+            "running": self._task is not None and not self._task.done(),
+            "overflow_policy": self.overflow_policy,
+        }
+
+    # ── Worker ────────────────────────────────────────────────────────────────
+
+    def _ensure_worker(self) -> None:
+        if self._closing or (self._task is not None and not self._task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Sin loop (scripts/tests sync): queda en cola hasta flush()
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._queue:
+                if await self._write_batch() == 0:
+                    break  # error de escritura: reintentar en el próximo intervalo
+                if len(self._queue) < self.batch_size and not self._closing:
+                    break
+
+    async def _write_batch(self) -> int:
+        batch: List[AuditEvent] = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        if not batch:
+            return 0
+        start = time.perf_counter()
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self._insert(batch)
+                break
+            except Exception as e:
+                self._metrics["write_errors"] += 1
+                if attempt == self.max_retries:
+                    logger.warning(f"⚠️ Audit sink: lote de {len(batch)} eventos falló {attempt} veces ({e}), fila por fila")
+                    return await self._write_rows(batch)
+                await asyncio.sleep(min(0.05 * 2 ** attempt, 1.0))
+        self._metrics["written"] += len(batch)
+        self._metrics["batches"] += 1
+        self._metrics["last_flush_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return len(batch)
+
+    async def _write_rows(self, batch: List[AuditEvent]) -> int:
+        """Fallback de un lote fallido: aísla los eventos que la base rechaza y escribe el resto."""
+        written = 0
+        for event in batch:
+            try:
+                await self._insert([event])
+                written += 1
+            except Exception as e:
+                self._metrics["write_errors"] += 1
+                self._metrics["dropped_failed"] += 1
+                logger.error(f"❌ Audit sink: descartado evento {event[0]!r}: {e}")
+        self._metrics["written"] += written
+        return written
+
+    @staticmethod
+    async def _insert(events: List[AuditEvent]) -> None:
+        await db.pool.execute(INSERT_EVENTS_SQL, *[list(c) for c in zip(*events)])
+
+audit_sink = AuditSink()
@@ -0,0 +1,69 @@
+"""
+Cache en memoria con expiración (TTL) para datos que se leen en cada request
+(identidad, tenant, credenciales, planes de asignación).
+
+Es por proceso: cada réplica mantiene su copia y los cambios se propagan al vencer
+el TTL o al invalidar explícitamente en el proceso que escribió.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class TTLCache:
+    """Cache en memoria con expiración; las cargas concurrentes de una misma clave se comparten."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: Dict[Any, Tuple[float, Any]] = {}
+        self._inflight: Dict[Any, "asyncio.Future"] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_load(self, key: Any, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # El request que cargaba se canceló: este carga por su cuenta
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # evita "exception never retrieved" si nadie más esperaba
+            raise
+        else:
+            if self.ttl > 0 and self._inflight.get(key) is future:
+                if len(self._data) >= self.max_entries:
+                    self._data.clear()
+                self._data[key] = (time.monotonic() + self.ttl, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def invalidate(self, predicate: Optional[Callable[[Any], bool]] = None) -> None:
+        """Sin predicado vacía todo; cargas en curso no guardan su resultado."""
+        if predicate is None:
+            self._data.clear()
+            self._inflight.clear()
+            return
+        for key in [k for k in self._data if predicate(k)]:
+            del self._data[key]
+        for key in [k for k in self._inflight if predicate(k)]:
+            del self._inflight[key]
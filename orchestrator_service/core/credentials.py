@@ -4,7 +4,7 @@ CLINICASV1.0 - paridad con Version Estable.
 """
 import logging
 import os
-from typing import Optional, Any
+from typing import Dict, Optional, Any
 from cryptography.fernet import Fernet
 
 # Configuración Global de Seguridad
@@ -35,6 +35,7 @@ def decrypt_value(cipher: str) -> str:
         return cipher
 
 from db import db
+from core.cache import TTLCache
 
 CHATWOOT_API_TOKEN = "CHATWOOT_API_TOKEN"
 CHATWOOT_ACCOUNT_ID = "CHATWOOT_ACCOUNT_ID"
@@ -49,24 +50,46 @@ META_APP_ID = "META_APP_ID"
 META_APP_SECRET = "META_APP_SECRET"
 
 
+# Cache por tenant: todas sus credenciales en una query, ya desencriptadas, con TTL.
+# save_tenant_credential y los borrados llaman a invalidate_tenant_credentials; en otras
+# réplicas el valor viejo vive como máximo CREDENTIAL_CACHE_TTL_SECONDS.
+CREDENTIAL_CACHE_TTL_SECONDS = float(os.getenv("CREDENTIAL_CACHE_TTL_SECONDS", "60"))
+CREDENTIAL_CACHE_MAX_TENANTS = int(os.getenv("CREDENTIAL_CACHE_MAX_TENANTS", "5000"))
+
+_credential_cache = TTLCache(CREDENTIAL_CACHE_TTL_SECONDS, CREDENTIAL_CACHE_MAX_TENANTS)
+
+
+async def _load_tenant_credentials(tenant_id: int) -> Dict[str, str]:
+    rows = await db.fetch("SELECT name, value FROM credentials WHERE tenant_id = $1", tenant_id)
+    return {r["name"]: decrypt_value(str(r["value"])) for r in rows if r["value"]}
+
+
+async def get_tenant_credentials(tenant_id: int) -> Dict[str, str]:
+    """
+    Todas las credenciales del tenant (name -> valor desencriptado), desde cache.
+    Nexus Resilience: Aislamiento estricto por tenant_id. No mutar el dict retornado.
+    """
+    return await _credential_cache.get_or_load(tenant_id, lambda: _load_tenant_credentials(tenant_id))
+
+
 async def get_tenant_credential(tenant_id: int, name: str) -> Optional[str]:
     """
-    Obtiene el valor de una credencial del tenant desde la tabla credentials.
+    Obtiene el valor de una credencial del tenant desde la tabla credentials (cacheada).
     Nexus Resilience: Aislamiento estricto por tenant_id.
     """
-    row = await db.fetchrow(
-        "SELECT value FROM credentials WHERE tenant_id = $1 AND name = $2 LIMIT 1",
-        tenant_id,
-        name,
-    )
-    if not row or not row["value"]:
-        return None
-    
-    # Intentar decriptar si es un valor encriptado (Fernet)
-    return decrypt_value(str(row["value"]))
+    return (await get_tenant_credentials(tenant_id)).get(name)
+
 
+def invalidate_tenant_credentials(tenant_id: Optional[int] = None) -> None:
+    """Llamar tras escribir/borrar credenciales. Sin tenant_id vacía todo."""
+    if tenant_id is None:
+        _credential_cache.invalidate()
+    else:
+        _credential_cache.invalidate(lambda key: key == tenant_id)
 
 
+def credential_cache_stats() -> Dict[str, int]:
+    return {"hits": _credential_cache.hits, "misses": _credential_cache.misses}
 
 
 async def get_tenant_credential_int(tenant_id: int, name: str) -> Optional[int]:
@@ -101,6 +124,7 @@ async def save_tenant_credential(tenant_id: int, name: str, value: str, category
             ON CONFLICT (tenant_id, name) 
             DO UPDATE SET value = $3, category = $4, updated_at = NOW()
         """, tenant_id, name, final_value, category)
+        invalidate_tenant_credentials(tenant_id)
         return True
     except Exception as e:
         logger.error(f"Error saving credential {name} for tenant {tenant_id}: {e}")
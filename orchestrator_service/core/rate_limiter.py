@@ -1,4 +1,207 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+"""
+Rate limiting distribuido (ventana deslizante en Redis).
 
-limiter = Limiter(key_func=get_remote_address)
+Cada chequeo es un único EVALSHA de un script Lua que, sobre un ZSET por clave,
+purga la ventana, cuenta y registra el hit de forma atómica, así el límite se
+respeta entre todas las réplicas / workers. La clave es ruta + tenant + usuario
+(o IP si el endpoint es anónimo).
+
+Si Redis no está configurado (REDIS_URL) o falla, se degrada a una ventana
+deslizante local por proceso y se reintenta Redis pasado RATE_LIMIT_REDIS_RETRY_SECONDS.
+Uso: `@limiter.limit("100/minute")` debajo del decorador de ruta, con `request: Request`
+entre los parámetros del endpoint.
+"""
+import functools
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_REDIS_TIMEOUT_MS = int(os.getenv("RATE_LIMIT_REDIS_TIMEOUT_MS", "100"))
+RATE_LIMIT_REDIS_RETRY_SECONDS = float(os.getenv("RATE_LIMIT_REDIS_RETRY_SECONDS", "10"))
+RATE_LIMIT_LOCAL_MAX_KEYS = int(os.getenv("RATE_LIMIT_LOCAL_MAX_KEYS", "10000"))
+RATE_LIMIT_KEY_PREFIX = os.getenv("RATE_LIMIT_KEY_PREFIX", "rl")
+
+# KEYS[1] = clave de la ventana; ARGV = ventana_ms, límite, id único del hit.
+# Usa el reloj de Redis (TIME) para que todas las réplicas compartan la misma referencia.
+# Retorna {permitido (1/0), hits en la ventana, ms hasta que se libere un lugar}.
+SLIDING_WINDOW_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return {1, count + 1, 0}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+local retry = window
+if oldest[2] then retry = tonumber(oldest[2]) + window - now end
+return {0, count, retry}
+"""
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_LIMIT_RE = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$")
+
+
+def parse_limit(limit_value: str) -> Tuple[int, int]:
+    """'100/minute' | '3/hour' | '10 per 5 minutes' → (cantidad, ventana en segundos)."""
+    match = _LIMIT_RE.match(limit_value.lower())
+    if not match:
+        raise ValueError(f"Invalid rate limit: {limit_value!r}")
+    amount, multiplier, period = match.groups()
+    return int(amount), int(multiplier or 1) * _PERIODS[period]
+
+
+class RateLimitExceeded(HTTPException):
+    def __init__(self, limit_value: str, retry_after: float):
+        self.limit_value = limit_value
+        self.retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(
+            status_code=429,
+            detail=limit_value,
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded) -> JSONResponse:
+    return JSONResponse(
+        {"error": f"Rate limit exceeded: {exc.detail}"},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def default_key(request: Request) -> str:
+    """tenant + usuario si el request ya pasó por la auth; si no, IP del cliente."""
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        identity = getattr(request.state, "identity", None) or {}
+        return f"t{identity.get('tenant_id', '-')}:u{user.user_id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class _LocalWindow:
+    """Ventana deslizante en memoria (fallback por proceso), acotada en cantidad de claves."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_LOCAL_MAX_KEYS):
+        self.max_keys = max_keys
+        self._hits: "OrderedDict[str, Deque[float]]" = OrderedDict()
+
+    def hit(self, key: str, amount: int, window: int) -> Tuple[bool, int, float]:
+        now = time.monotonic()
+        hits = self._hits.get(key)
+        if hits is None:
+            hits = self._hits[key] = deque()
+            if len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+        else:
+            self._hits.move_to_end(key)
+        while hits and hits[0] <= now - window:
+            hits.popleft()
+        if len(hits) < amount:
+            hits.append(now)
+            return True, len(hits), 0.0
+        return False, len(hits), hits[0] + window - now
+
+    def clear(self) -> None:
+        self._hits.clear()
+
+
+class DistributedLimiter:
+    def __init__(self, redis_url: Optional[str] = REDIS_URL, enabled: bool = RATE_LIMIT_ENABLED):
+        self.redis_url = redis_url
+        self.enabled = enabled
+        self.redis_client = None
+        self._script = None
+        self._redis_down_until = 0.0
+        self._local = _LocalWindow()
+        self._metrics = {
+            "allowed_redis": 0, "denied_redis": 0,
+            "allowed_local": 0, "denied_local": 0,
+            "redis_errors": 0,
+        }
+
+    def _get_script(self):
+        if self._script is None:
+            import redis.asyncio as redis
+            timeout = RATE_LIMIT_REDIS_TIMEOUT_MS / 1000
+            self.redis_client = redis.from_url(
+                self.redis_url, socket_timeout=timeout, socket_connect_timeout=timeout
+            )
+            self._script = self.redis_client.register_script(SLIDING_WINDOW_LUA)
+        return self._script
+
+    async def _redis_hit(self, key: str, amount: int, window: int) -> Tuple[bool, int, float]:
+        # register_script → EVALSHA (y EVAL solo si Redis perdió el script): un round trip
+        allowed, count, retry_ms = await self._get_script()(
+            keys=[key], args=[window * 1000, amount, uuid.uuid4().hex]
+        )
+        return bool(allowed), int(count), int(retry_ms) / 1000
+
+    async def hit(self, key: str, amount: int, window: int) -> Tuple[bool, int, float]:
+        """Registra un hit. Retorna (permitido, hits en la ventana, segundos para reintentar)."""
+        if self.redis_url and time.monotonic() >= self._redis_down_until:
+            try:
+                allowed, count, retry_after = await self._redis_hit(key, amount, window)
+                self._metrics["allowed_redis" if allowed else "denied_redis"] += 1
+                return allowed, count, retry_after
+            except Exception as e:
+                self._metrics["redis_errors"] += 1
+                self._redis_down_until = time.monotonic() + RATE_LIMIT_REDIS_RETRY_SECONDS
+                logger.warning(f"⚠️ Rate limiter: Redis no disponible, usando límites locales: {e}")
+        allowed, count, retry_after = self._local.hit(key, amount, window)
+        self._metrics["allowed_local" if allowed else "denied_local"] += 1
+        return allowed, count, retry_after
+
+    def limit(self, limit_value: str, key_func: Callable[[Request], str] = default_key):
+        """Decorador de endpoint: `@limiter.limit("100/minute")`."""
+        amount, window = parse_limit(limit_value)
+
+        def decorator(func):
+            route = f"{func.__module__}.{func.__name__}"
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                request = kwargs.get("request")
+                if request is None:
+                    request = next((a for a in args if isinstance(a, Request)), None)
+                if self.enabled and request is not None:
+                    key = f"{RATE_LIMIT_KEY_PREFIX}:{route}:{key_func(request)}"
+                    allowed, _, retry_after = await self.hit(key, amount, window)
+                    if not allowed:
+                        raise RateLimitExceeded(limit_value, retry_after)
+                return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._metrics,
+            "backend": "redis" if self.redis_url and time.monotonic() >= self._redis_down_until
+            else "local",
+            "local_keys": len(self._local._hits),
+        }
+
+    def reset(self) -> None:
+        """Limpia el estado local (tests)."""
+        self._local.clear()
+        self._redis_down_until = 0.0
+
+
+limiter = DistributedLimiter()
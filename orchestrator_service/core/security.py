@@ -6,9 +6,9 @@ Basado en ClinicForge Nexus Security v7.6.
 import os
 import uuid
 import logging
-import json
-from typing import List, Optional, Any
+from typing import Any, Dict, List, Optional
 from fastapi import Header, HTTPException, Depends, Request, status
+from core.cache import TTLCache
 from db import db
 
 logger = logging.getLogger(__name__)
@@ -120,93 +120,139 @@ def require_role(allowed_roles: List[str]):
 
 
 # ─── Capa 3: Resolución de Tenant ─────────────────────────────────────────────
+#
+# La identidad (tenant resuelto + tenants permitidos) y el estado de suscripción de
+# cada tenant se cachean en memoria con TTL corto. Dentro de un request se resuelve
+# una sola vez (request.state.identity). Las rutas que modifican users / sellers /
+# professionals / tenants llaman a invalidate_user_identity / invalidate_tenant_identity.
 
-async def get_resolved_tenant_id(user_data=Depends(verify_admin_token)) -> int:
-    """
-    Resuelve el tenant_id real contra la base de datos (Nexus Protocol).
-    Prioridad: sellers (CRM) → professionals (dental legacy) → primer tenant → 1.
-    Garantiza aislamiento total: nunca se usa tenant_id del JWT sin validar.
-    """
+IDENTITY_CACHE_TTL_SECONDS = float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "30"))
+IDENTITY_CACHE_MAX_ENTRIES = int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", "10000"))
+
+_ALL_TENANTS_KEY = "__all__"
+
+
+_identity_cache = TTLCache(IDENTITY_CACHE_TTL_SECONDS, IDENTITY_CACHE_MAX_ENTRIES)
+_tenant_cache = TTLCache(IDENTITY_CACHE_TTL_SECONDS, IDENTITY_CACHE_MAX_ENTRIES)
+
+
+def invalidate_user_identity(user_id: Any) -> None:
+    """Llamar al cambiar el rol/estado de un usuario o su fila en sellers/professionals."""
+    uid = str(user_id)
+    _identity_cache.invalidate(lambda key: key[0] == uid)
+
+
+def invalidate_tenant_identity(tenant_id: Optional[int] = None) -> None:
+    """Llamar al crear/borrar tenants o cambiar su suscripción. Sin tenant_id vacía todo."""
+    _identity_cache.invalidate()
+    if tenant_id is None:
+        _tenant_cache.invalidate()
+    else:
+        _tenant_cache.invalidate(lambda key: key in (tenant_id, _ALL_TENANTS_KEY))
+
+
+def identity_cache_stats() -> Dict[str, int]:
+    return {
+        "identity_hits": _identity_cache.hits, "identity_misses": _identity_cache.misses,
+        "tenant_hits": _tenant_cache.hits, "tenant_misses": _tenant_cache.misses,
+    }
+
+
+async def _load_all_tenant_ids() -> List[int]:
+    rows = await db.pool.fetch("SELECT id FROM tenants ORDER BY id ASC")
+    return [int(r["id"]) for r in rows]
+
+
+async def _lookup_user_tenant(uid: uuid.UUID) -> Optional[int]:
+    """sellers (CRM) → professionals (dental legacy)."""
+    # Prioridad 1: Tabla sellers (CRM Ventas — rol nativo)
+    try:
+        tid = await db.pool.fetchval("SELECT tenant_id FROM sellers WHERE user_id = $1", uid)
+        if tid is not None:
+            return int(tid)
+    except Exception:
+        pass  # Tabla sellers puede no existir en entornos legacy
+
+    # Prioridad 2: Tabla professionals (dental/legacy fallback)
+    try:
+        tid = await db.pool.fetchval("SELECT tenant_id FROM professionals WHERE user_id = $1", uid)
+        if tid is not None:
+            return int(tid)
+    except Exception:
+        pass
+    return None
+
+
+async def _load_identity(user_id: str, role: str) -> Dict[str, Any]:
     uid = None
     try:
-        uid = uuid.UUID(user_data.user_id)
+        uid = uuid.UUID(user_id)
     except (ValueError, TypeError):
         pass
 
-    if uid is not None:
-        # Prioridad 1: Tabla sellers (CRM Ventas — rol nativo)
+    tid = await _lookup_user_tenant(uid) if uid is not None else None
+    if tid is None or role == "ceo":
         try:
-            tid = await db.pool.fetchval(
-                "SELECT tenant_id FROM sellers WHERE user_id = $1",
-                uid
-            )
-            if tid is not None:
-                return int(tid)
+            all_ids = await _tenant_cache.get_or_load(_ALL_TENANTS_KEY, _load_all_tenant_ids)
         except Exception:
-            pass  # Tabla sellers puede no existir en entornos legacy
+            all_ids = []
+        if tid is None:
+            # Prioridad 3: Primer tenant del sistema (CEO sin fila en sellers/professionals) → 1
+            tid = all_ids[0] if all_ids else 1
+    else:
+        all_ids = []
+
+    # CEO: todos los tenants. Resto: solo su sede resuelta.
+    allowed = (all_ids or [1]) if role == "ceo" else [tid]
+    return {"tenant_id": tid, "allowed_tenant_ids": allowed}
 
-        # Prioridad 2: Tabla professionals (dental/legacy fallback)
-        try:
-            tid = await db.pool.fetchval(
-                "SELECT tenant_id FROM professionals WHERE user_id = $1",
-                uid
-            )
-            if tid is not None:
-                return int(tid)
-        except Exception:
-            pass
 
-    # Prioridad 3: Primer tenant del sistema (CEO sin fila en sellers/professionals)
+async def resolve_identity(user_data: Any, request: Optional[Request] = None) -> Dict[str, Any]:
+    """
+    Tenant resuelto y tenants permitidos del usuario (una vez por request, cache por usuario).
+    Garantiza aislamiento total: nunca se usa tenant_id del JWT sin validar.
+    """
+    if request is not None:
+        cached = getattr(request.state, "identity", None)
+        if cached is not None:
+            return cached
+    key = (str(user_data.user_id), user_data.role)
+    identity = await _identity_cache.get_or_load(key, lambda: _load_identity(*key))
+    if request is not None:
+        request.state.identity = identity
+    return identity
+
+
+async def get_resolved_tenant_id(user_data=Depends(verify_admin_token), request: Request = None) -> int:
+    """
+    Resuelve el tenant_id real contra la base de datos (Nexus Protocol).
+    Prioridad: sellers (CRM) → professionals (dental legacy) → primer tenant → 1.
+    """
     try:
-        first = await db.pool.fetchval("SELECT id FROM tenants ORDER BY id ASC LIMIT 1")
-        return int(first) if first is not None else 1
+        return (await resolve_identity(user_data, request))["tenant_id"]
     except Exception:
         return 1  # Fallback final: no devolver 500
 
 
-async def get_allowed_tenant_ids(user_data=Depends(verify_admin_token)) -> List[int]:
+async def get_allowed_tenant_ids(user_data=Depends(verify_admin_token), request: Request = None) -> List[int]:
     """
     Lista de tenant_id que el usuario puede ver.
     CEO: todos los tenants. Resto: solo su sede resuelta.
     """
     try:
-        if user_data.role == "ceo":
-            rows = await db.pool.fetch("SELECT id FROM tenants ORDER BY id ASC")
-            return [int(r["id"]) for r in rows] if rows else [1]
-
-        uid = None
-        try:
-            uid = uuid.UUID(user_data.user_id)
-        except (ValueError, TypeError):
-            pass
-
-        if uid is not None:
-            # Buscar en sellers primero (CRM)
-            try:
-                tid = await db.pool.fetchval(
-                    "SELECT tenant_id FROM sellers WHERE user_id = $1", uid
-                )
-                if tid is not None:
-                    return [int(tid)]
-            except Exception:
-                pass
-
-            # Fallback a professionals
-            try:
-                tid = await db.pool.fetchval(
-                    "SELECT tenant_id FROM professionals WHERE user_id = $1", uid
-                )
-                if tid is not None:
-                    return [int(tid)]
-            except Exception:
-                pass
-
-        first = await db.pool.fetchval("SELECT id FROM tenants ORDER BY id ASC LIMIT 1")
-        return [int(first)] if first is not None else [1]
+        return list((await resolve_identity(user_data, request))["allowed_tenant_ids"])
     except Exception:
         return [1]
 
 
+async def get_tenant_status(tenant_id: int) -> Optional[Dict[str, Any]]:
+    """subscription_status / trial_ends_at del tenant (cacheado)."""
+    async def load():
+        row = await db.pool.fetchrow("SELECT subscription_status, trial_ends_at FROM tenants WHERE id = $1", tenant_id)
+        return dict(row) if row else None
+    return await _tenant_cache.get_or_load(tenant_id, load)
+
+
 # ─── Auditoría ────────────────────────────────────────────────────────────────
 
 async def log_security_event(
@@ -218,7 +264,7 @@ async def log_security_event(
     details: str = ""
 ):
     """
-    Nexus Protocol v7.7 — Registro persistente de eventos de seguridad.
+    Nexus Protocol v7.7 — Registro persistente de eventos de seguridad (asíncrono, ver core.audit_sink).
     """
     payload = {
         "user_id": user_data.user_id,
@@ -232,13 +278,9 @@ async def log_security_event(
         "method": request.method,
     }
 
-    try:
-        await db.pool.execute("""
-            INSERT INTO system_events (event_type, severity, message, payload)
-            VALUES ($1, $2, $3, $4::jsonb)
-        """, event_type, severity, f"{user_data.role}@{user_data.email}: {event_type}", json.dumps(payload))
-    except Exception as e:
-        logger.error(f"❌ Error logging security event: {e}")
+    # Se encola sin I/O: el audit sink escribe en system_events por lotes
+    from core.audit_sink import audit_sink
+    audit_sink.emit(event_type, severity, f"{user_data.role}@{user_data.email}: {event_type}", payload)
 
 
 def audit_access(event_type: str, resource_param: str = "id"):
@@ -302,9 +344,9 @@ async def log_pii_access(
 async def get_current_user_context(request: Request, user_data=Depends(verify_admin_token)) -> dict:
     """Retorna el contexto del usuario actual para usar en dependencias de FastAPI.
     Valida además el estado del Trial de la entidad asociada."""
-    tenant_id = await get_resolved_tenant_id(user_data)
+    tenant_id = await get_resolved_tenant_id(user_data, request)
     
-    tenant_info = await db.pool.fetchrow("SELECT subscription_status, trial_ends_at FROM tenants WHERE id = $1", tenant_id)
+    tenant_info = await get_tenant_status(tenant_id)
     sub_status = tenant_info["subscription_status"] if tenant_info else "active"
     trial_ends = tenant_info["trial_ends_at"] if tenant_info else None
     
@@ -28,7 +28,11 @@ class ChatService:
                 l.human_override_until,
                 $1::int as tenant_id
             FROM leads l
-            JOIN chat_messages cm ON cm.from_number = l.phone_number AND cm.tenant_id = $1
+            JOIN LATERAL (
+                SELECT content, created_at FROM chat_messages
+                WHERE lead_id = l.id
+                ORDER BY created_at DESC LIMIT 1
+            ) cm ON TRUE
             WHERE l.tenant_id = $1
             ORDER BY l.phone_number, cm.created_at DESC NULLS LAST
         """, tenant_id)
@@ -43,3 +43,116 @@ def normalize_phone(phone: str) -> str:
     if not phone.startswith('+'):
         return '+' + clean
     return '+' + clean
+
+
+# --- Normalización E.164 (Prospección / n8n Scrap Phones) ---
+
+# Country prefix table (longest prefix first for correct matching)
+COUNTRY_PREFIXES = [
+    # NANP specifics
+    ("1787", "PR"), ("1939", "PR"), ("1809", "DO"), ("1829", "DO"), ("1849", "DO"),
+    # Hispanoamérica
+    ("549", "AR"), ("54", "AR"), ("591", "BO"), ("56", "CL"), ("57", "CO"),
+    ("506", "CR"), ("53", "CU"), ("593", "EC"), ("503", "SV"), ("502", "GT"),
+    ("504", "HN"), ("521", "MX"), ("52", "MX"), ("505", "NI"), ("507", "PA"),
+    ("595", "PY"), ("51", "PE"), ("598", "UY"), ("58", "VE"), ("34", "ES"),
+    ("240", "GQ"),
+    # LatAm no hispana
+    ("55", "BR"), ("501", "BZ"), ("509", "HT"), ("592", "GY"), ("597", "SR"), ("594", "GF"),
+    # NANP genérico
+    ("1", "US"),
+]
+COUNTRY_PREFIXES_BY_LENGTH = sorted(COUNTRY_PREFIXES, key=lambda x: len(x[0]), reverse=True)
+
+# Map country names / keywords to dial codes (for location inference)
+LOCATION_COUNTRY_MAP = {
+    "argentina": "54", "ar": "54",
+    "colombia": "57", "co": "57",
+    "chile": "56", "cl": "56",
+    "mexico": "52", "méxico": "52", "mx": "52",
+    "peru": "51", "perú": "51", "pe": "51",
+    "uruguay": "598", "uy": "598",
+    "paraguay": "595", "py": "595",
+    "bolivia": "591", "bo": "591",
+    "ecuador": "593", "ec": "593",
+    "venezuela": "58", "ve": "58",
+    "brasil": "55", "brazil": "55", "br": "55",
+    "españa": "34", "spain": "34", "es": "34",
+    "costa rica": "506", "cr": "506",
+    "panamá": "507", "panama": "507", "pa": "507",
+    "guatemala": "502", "gt": "502",
+    "honduras": "504", "hn": "504",
+    "el salvador": "503", "sv": "503",
+    "nicaragua": "505", "ni": "505",
+    "cuba": "53",
+    "united states": "1", "usa": "1", "us": "1",
+    "estados unidos": "1",
+    "puerto rico": "1787",
+    "dominican republic": "1809", "república dominicana": "1809",
+}
+_LOCATION_KEYWORDS = sorted(LOCATION_COUNTRY_MAP.keys(), key=len, reverse=True)
+
+_NON_DIGIT_RE = re.compile(r"\D")
+_REPEATED_DIGIT_RE = re.compile(r"^(\d)\1{6,}$")
+_AR_MOBILE_15_RE = re.compile(r"^(549\d{2,5})15")
+
+
+def phone_lookup_key(phone: Optional[str]) -> Optional[str]:
+    """
+    Clave canónica de búsqueda por teléfono: solo dígitos (E.164 sin '+').
+    Debe coincidir con la función SQL phone_lookup_key() que genera leads.phone_e164
+    y chat_messages.phone_e164, así '+54 9 351...' y '549351...' resuelven igual.
+    """
+    return _NON_DIGIT_RE.sub("", phone or "") or None
+
+
+def infer_country_code(location: str) -> str:
+    """Infer dial code from a location query string (e.g. 'Medellín, Colombia' -> '57')."""
+    location_lower = location.lower().strip()
+    # Try multi-word matches first (e.g. "costa rica", "el salvador")
+    for keyword in _LOCATION_KEYWORDS:
+        if keyword in location_lower:
+            return LOCATION_COUNTRY_MAP[keyword]
+    return "54"  # Default: Argentina
+
+
+def normalize_phone_e164(raw: str, default_country_code: str = "54") -> Optional[str]:
+    """
+    Ports the phone normalization logic from the n8n workflow (Scrap Phones.json).
+    Returns E.164 digits (without +) or None if invalid.
+    """
+    digits = _NON_DIGIT_RE.sub("", raw or "")
+    if not digits:
+        return None
+
+    # Check for garbage (repeating sequences like 0000000 or 1111111)
+    if _REPEATED_DIGIT_RE.match(digits):
+        return None
+    # Strip leading 00 (international prefix alternative to +) and local trunk 0
+    digits = digits.lstrip("0")
+
+    # Already has a known country code?
+    has_cc = any(digits.startswith(cc) for cc, _ in COUNTRY_PREFIXES_BY_LENGTH)
+
+    if not has_cc:
+        # 10-digit NANP
+        if len(digits) == 10:
+            digits = "1" + digits
+        else:
+            digits = default_country_code + digits
+
+    # Arg-specific: ensure 549 prefix for mobile
+    if digits.startswith("54") and not digits.startswith("549"):
+        digits = "54" + "9" + digits[2:]
+    # Arg-specific: remove "15" after area code (e.g. 5492215... -> 5492 ...)
+    if digits.startswith("549"):
+        digits = _AR_MOBILE_15_RE.sub(r"\1", digits)
+
+    # Mex: ensure 521
+    if digits.startswith("52") and not digits.startswith("521"):
+        digits = "52" + "1" + digits[2:]
+
+    # Validate E.164 length (8-15 digits)
+    if len(digits) < 8 or len(digits) > 15:
+        return None
+    return digits
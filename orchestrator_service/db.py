@@ -9,6 +9,33 @@ from contextlib import asynccontextmanager
 POSTGRES_DSN = os.getenv("POSTGRES_DSN")
 
 class Database:
+    # Single-statement lead upsert (constant text so asyncpg prepares it once per connection).
+    # On conflict: keep the stored name unless a real one arrives and only overwrite
+    # attribution when the message carries a Meta ad_id. "inserted" is true for new rows.
+    ENSURE_LEAD_SQL = """
+        INSERT INTO leads (tenant_id, phone_number, first_name, last_name, source,
+                           lead_source, meta_ad_id, meta_campaign_id)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+        ON CONFLICT (tenant_id, phone_number) DO UPDATE SET
+            first_name = CASE WHEN EXCLUDED.first_name <> 'Lead' THEN EXCLUDED.first_name ELSE leads.first_name END,
+            last_name = CASE WHEN EXCLUDED.last_name <> '' THEN EXCLUDED.last_name ELSE leads.last_name END,
+            lead_source = CASE WHEN EXCLUDED.meta_ad_id IS NOT NULL THEN EXCLUDED.lead_source ELSE leads.lead_source END,
+            meta_ad_id = COALESCE(EXCLUDED.meta_ad_id, leads.meta_ad_id),
+            meta_campaign_id = CASE WHEN EXCLUDED.meta_ad_id IS NOT NULL THEN EXCLUDED.meta_campaign_id ELSE leads.meta_campaign_id END,
+            updated_at = NOW()
+        RETURNING id, tenant_id, phone_number, first_name, last_name, status, source, lead_source,
+                  (xmax = 0) AS inserted
+    """
+
+    APPEND_CHAT_MESSAGE_SQL = """
+        INSERT INTO chat_messages (from_number, role, content, correlation_id, tenant_id, lead_id)
+        VALUES ($1, $2, $3, $4, $5, COALESCE($6::uuid, (
+            SELECT id FROM leads
+            WHERE tenant_id = $5 AND phone_e164 = phone_lookup_key($1)
+            ORDER BY created_at LIMIT 1
+        )))
+    """
+
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
 
@@ -586,6 +613,402 @@ class Database:
                     CREATE INDEX idx_ai_actions_lead_tenant ON ai_actions(lead_id, tenant_id, created_at DESC);
                 END IF;
             END $$;
+            """,
+            # Parche 17: Catálogo de segmentos archivados (Cold Storage de conversaciones)
+            """
+            DO $$ BEGIN
+                CREATE TABLE IF NOT EXISTS chat_archive_segments (
+                    id BIGSERIAL PRIMARY KEY,
+                    tenant_id INTEGER NOT NULL,
+                    table_name TEXT NOT NULL,
+                    month TEXT NOT NULL,
+                    path TEXT NOT NULL UNIQUE,
+                    row_count INTEGER NOT NULL DEFAULT 0,
+                    min_ts TIMESTAMPTZ,
+                    max_ts TIMESTAMPTZ,
+                    phone_numbers TEXT[] NOT NULL DEFAULT '{}',
+                    created_at TIMESTAMPTZ DEFAULT NOW()
+                );
+                CREATE INDEX IF NOT EXISTS idx_chat_archive_segments_lookup
+                    ON chat_archive_segments(table_name, tenant_id, max_ts DESC);
+                CREATE INDEX IF NOT EXISTS idx_chat_archive_segments_phones
+                    ON chat_archive_segments USING GIN (phone_numbers);
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 17: Error creando chat_archive_segments: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 18: Índice keyset para paginación de leads (tenant, created_at, id)
+            """
+            DO $$ BEGIN
+                CREATE INDEX IF NOT EXISTS idx_leads_tenant_created_id
+                    ON leads(tenant_id, created_at DESC, id DESC);
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 18: Error creando idx_leads_tenant_created_id: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 19: Búsqueda de leads (pg_trgm sobre nombre/email + sufijo de teléfono)
+            """
+            DO $$ BEGIN
+                CREATE INDEX IF NOT EXISTS idx_leads_phone_reverse
+                    ON leads(tenant_id, reverse(phone_number) text_pattern_ops);
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                CREATE INDEX IF NOT EXISTS idx_leads_search_trgm ON leads USING GIN (
+                    (lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || coalesce(email, ''))) gin_trgm_ops
+                );
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 19: Error creando índices de búsqueda de leads: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 20: Rollups diarios de leads (dashboard CRM) mantenidos por triggers de sentencia
+            """
+            DO $$ BEGIN
+                IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'lead_daily_stats') THEN
+                    CREATE TABLE lead_daily_stats (
+                        tenant_id INTEGER NOT NULL,
+                        seller_id UUID NOT NULL DEFAULT '00000000-0000-0000-0000-000000000000',
+                        day DATE NOT NULL,
+                        status TEXT NOT NULL,
+                        source TEXT NOT NULL DEFAULT '',
+                        lead_count BIGINT NOT NULL DEFAULT 0,
+                        updated_at TIMESTAMPTZ DEFAULT NOW(),
+                        PRIMARY KEY (tenant_id, seller_id, day, status, source)
+                    );
+                    CREATE INDEX idx_lead_daily_stats_tenant_day ON lead_daily_stats(tenant_id, day);
+
+                    INSERT INTO lead_daily_stats (tenant_id, seller_id, day, status, source, lead_count)
+                    SELECT tenant_id,
+                           COALESCE(assigned_seller_id, '00000000-0000-0000-0000-000000000000'::uuid),
+                           (COALESCE(created_at, NOW()) AT TIME ZONE 'UTC')::date,
+                           COALESCE(status, 'new'), COALESCE(source, ''), COUNT(*)
+                    FROM leads
+                    GROUP BY 1, 2, 3, 4, 5;
+                END IF;
+
+                -- Cada escritura toma un advisory lock compartido por tenant (hasta el commit);
+                -- la reconciliación del tenant toma el mismo lock en modo exclusivo.
+                CREATE OR REPLACE FUNCTION lead_daily_stats_apply() RETURNS trigger AS $f$
+                BEGIN
+                    IF TG_OP = 'INSERT' THEN
+                        PERFORM pg_advisory_xact_lock_shared(hashtext('lead_daily_stats'), t.tenant_id)
+                        FROM (SELECT DISTINCT tenant_id FROM new_rows WHERE tenant_id IS NOT NULL ORDER BY 1) t;
+                        INSERT INTO lead_daily_stats (tenant_id, seller_id, day, status, source, lead_count)
+                        SELECT tenant_id, COALESCE(assigned_seller_id, '00000000-0000-0000-0000-000000000000'::uuid),
+                               (COALESCE(created_at, NOW()) AT TIME ZONE 'UTC')::date,
+                               COALESCE(status, 'new'), COALESCE(source, ''), COUNT(*)
+                        FROM new_rows GROUP BY 1, 2, 3, 4, 5
+                        ON CONFLICT (tenant_id, seller_id, day, status, source) DO UPDATE
+                            SET lead_count = lead_daily_stats.lead_count + EXCLUDED.lead_count, updated_at = NOW();
+                    ELSIF TG_OP = 'DELETE' THEN
+                        PERFORM pg_advisory_xact_lock_shared(hashtext('lead_daily_stats'), t.tenant_id)
+                        FROM (SELECT DISTINCT tenant_id FROM old_rows WHERE tenant_id IS NOT NULL ORDER BY 1) t;
+                        INSERT INTO lead_daily_stats (tenant_id, seller_id, day, status, source, lead_count)
+                        SELECT tenant_id, COALESCE(assigned_seller_id, '00000000-0000-0000-0000-000000000000'::uuid),
+                               (COALESCE(created_at, NOW()) AT TIME ZONE 'UTC')::date,
+                               COALESCE(status, 'new'), COALESCE(source, ''), -COUNT(*)
+                        FROM old_rows GROUP BY 1, 2, 3, 4, 5
+                        ON CONFLICT (tenant_id, seller_id, day, status, source) DO UPDATE
+                            SET lead_count = lead_daily_stats.lead_count + EXCLUDED.lead_count, updated_at = NOW();
+                    ELSE
+                        PERFORM pg_advisory_xact_lock_shared(hashtext('lead_daily_stats'), t.tenant_id)
+                        FROM (
+                            SELECT tenant_id FROM old_rows WHERE tenant_id IS NOT NULL
+                            UNION
+                            SELECT tenant_id FROM new_rows WHERE tenant_id IS NOT NULL
+                            ORDER BY 1
+                        ) t;
+                        INSERT INTO lead_daily_stats (tenant_id, seller_id, day, status, source, lead_count)
+                        SELECT tenant_id, seller_id, day, status, source, SUM(delta)
+                        FROM (
+                            SELECT tenant_id, COALESCE(assigned_seller_id, '00000000-0000-0000-0000-000000000000'::uuid) AS seller_id,
+                                   (COALESCE(created_at, NOW()) AT TIME ZONE 'UTC')::date AS day,
+                                   COALESCE(status, 'new') AS status, COALESCE(source, '') AS source, -1 AS delta
+                            FROM old_rows
+                            UNION ALL
+                            SELECT tenant_id, COALESCE(assigned_seller_id, '00000000-0000-0000-0000-000000000000'::uuid),
+                                   (COALESCE(created_at, NOW()) AT TIME ZONE 'UTC')::date,
+                                   COALESCE(status, 'new'), COALESCE(source, ''), 1
+                            FROM new_rows
+                        ) d
+                        GROUP BY 1, 2, 3, 4, 5
+                        HAVING SUM(delta) <> 0
+                        ON CONFLICT (tenant_id, seller_id, day, status, source) DO UPDATE
+                            SET lead_count = lead_daily_stats.lead_count + EXCLUDED.lead_count, updated_at = NOW();
+                    END IF;
+                    RETURN NULL;
+                END;
+                $f$ LANGUAGE plpgsql;
+
+                DROP TRIGGER IF EXISTS trg_lead_daily_stats_ins ON leads;
+                CREATE TRIGGER trg_lead_daily_stats_ins AFTER INSERT ON leads
+                    REFERENCING NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION lead_daily_stats_apply();
+                DROP TRIGGER IF EXISTS trg_lead_daily_stats_upd ON leads;
+                CREATE TRIGGER trg_lead_daily_stats_upd AFTER UPDATE ON leads
+                    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION lead_daily_stats_apply();
+                DROP TRIGGER IF EXISTS trg_lead_daily_stats_del ON leads;
+                CREATE TRIGGER trg_lead_daily_stats_del AFTER DELETE ON leads
+                    REFERENCING OLD TABLE AS old_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION lead_daily_stats_apply();
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 20: Error configurando lead_daily_stats: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 21: Cache persistente URL -> teléfono del crawler de prospección
+            """
+            DO $$ BEGIN
+                CREATE TABLE IF NOT EXISTS website_phone_cache (
+                    url TEXT PRIMARY KEY,
+                    phone TEXT,
+                    fetched_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                );
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 21: Error creando website_phone_cache: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 22: Jobs asíncronos de prospección (Apify)
+            """
+            DO $$ BEGIN
+                CREATE TABLE IF NOT EXISTS prospecting_jobs (
+                    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                    tenant_id INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+                    created_by UUID,
+                    niche TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    max_places INTEGER NOT NULL DEFAULT 30,
+                    country_code TEXT NOT NULL DEFAULT '54',
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    apify_run_id TEXT,
+                    apify_dataset_id TEXT,
+                    apify_status TEXT,
+                    fetched INTEGER NOT NULL DEFAULT 0,
+                    imported INTEGER NOT NULL DEFAULT 0,
+                    skipped_no_phone INTEGER NOT NULL DEFAULT 0,
+                    skipped_already_exists INTEGER NOT NULL DEFAULT 0,
+                    fetched_from_web INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    worker_id TEXT,
+                    heartbeat_at TIMESTAMPTZ,
+                    created_at TIMESTAMPTZ DEFAULT NOW(),
+                    started_at TIMESTAMPTZ,
+                    finished_at TIMESTAMPTZ,
+                    updated_at TIMESTAMPTZ DEFAULT NOW()
+                );
+                CREATE INDEX IF NOT EXISTS idx_prospecting_jobs_tenant_created
+                    ON prospecting_jobs(tenant_id, created_at DESC);
+                CREATE INDEX IF NOT EXISTS idx_prospecting_jobs_active
+                    ON prospecting_jobs(status) WHERE status IN ('queued', 'running', 'importing', 'cancelling');
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 22: Error creando prospecting_jobs: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 23: Contador de leads enriquecidos (update) por job de prospección
+            """
+            DO $$ BEGIN
+                ALTER TABLE prospecting_jobs ADD COLUMN IF NOT EXISTS updated INTEGER NOT NULL DEFAULT 0;
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 23: Error agregando prospecting_jobs.updated: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 24: Jobs de outreach masivo (plantillas WhatsApp) con destinatarios persistidos
+            """
+            DO $$ BEGIN
+                CREATE TABLE IF NOT EXISTS outreach_jobs (
+                    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                    tenant_id INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+                    created_by UUID,
+                    kind TEXT NOT NULL DEFAULT 'prospecting',
+                    campaign_id UUID,
+                    template_name TEXT NOT NULL,
+                    language TEXT NOT NULL DEFAULT 'es_AR',
+                    from_number TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    total INTEGER NOT NULL DEFAULT 0,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    worker_id TEXT,
+                    heartbeat_at TIMESTAMPTZ,
+                    created_at TIMESTAMPTZ DEFAULT NOW(),
+                    started_at TIMESTAMPTZ,
+                    finished_at TIMESTAMPTZ,
+                    updated_at TIMESTAMPTZ DEFAULT NOW()
+                );
+                CREATE INDEX IF NOT EXISTS idx_outreach_jobs_tenant_created
+                    ON outreach_jobs(tenant_id, created_at DESC);
+                CREATE INDEX IF NOT EXISTS idx_outreach_jobs_active
+                    ON outreach_jobs(status) WHERE status IN ('queued', 'running', 'cancelling');
+
+                CREATE TABLE IF NOT EXISTS outreach_recipients (
+                    job_id UUID NOT NULL REFERENCES outreach_jobs(id) ON DELETE CASCADE,
+                    lead_id UUID NOT NULL,
+                    phone TEXT NOT NULL,
+                    params JSONB NOT NULL DEFAULT '[]',
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    sent_at TIMESTAMPTZ,
+                    PRIMARY KEY (job_id, lead_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_outreach_recipients_pending
+                    ON outreach_recipients(job_id, lead_id) WHERE status IN ('pending', 'sending');
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 24: Error creando outreach_jobs: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 25: Campañas sobre outreach_jobs (segmento en streaming + respuestas por destinatario)
+            """
+            DO $$ BEGIN
+                ALTER TABLE outreach_jobs ADD COLUMN IF NOT EXISTS segment JSONB;
+                ALTER TABLE outreach_jobs ADD COLUMN IF NOT EXISTS template_params INTEGER NOT NULL DEFAULT 2;
+                ALTER TABLE outreach_jobs ADD COLUMN IF NOT EXISTS enqueued BOOLEAN NOT NULL DEFAULT TRUE;
+                ALTER TABLE outreach_jobs ADD COLUMN IF NOT EXISTS enqueue_cursor UUID;
+                ALTER TABLE outreach_recipients ADD COLUMN IF NOT EXISTS replied_at TIMESTAMPTZ;
+                CREATE INDEX IF NOT EXISTS idx_outreach_recipients_awaiting_reply
+                    ON outreach_recipients(lead_id) WHERE status = 'sent' AND replied_at IS NULL;
+                CREATE INDEX IF NOT EXISTS idx_outreach_jobs_campaign
+                    ON outreach_jobs(campaign_id) WHERE campaign_id IS NOT NULL;
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 25: Error extendiendo outreach_jobs para campañas: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 26: Teléfono canónico (solo dígitos E.164) generado e indexado en leads y chat_messages.
+            # phone_lookup_key() es el normalizador compartido; core.utils.phone_lookup_key lo replica en Python.
+            """
+            DO $$ BEGIN
+                CREATE OR REPLACE FUNCTION phone_lookup_key(raw TEXT) RETURNS TEXT
+                    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+                    AS $fn$ SELECT NULLIF(regexp_replace(COALESCE(raw, ''), '[^0-9]', '', 'g'), '') $fn$;
+                ALTER TABLE leads ADD COLUMN IF NOT EXISTS phone_e164 TEXT
+                    GENERATED ALWAYS AS (phone_lookup_key(phone_number)) STORED;
+                ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS phone_e164 TEXT
+                    GENERATED ALWAYS AS (phone_lookup_key(from_number)) STORED;
+                CREATE INDEX IF NOT EXISTS idx_leads_tenant_phone_e164 ON leads(tenant_id, phone_e164);
+                CREATE INDEX IF NOT EXISTS idx_chat_messages_tenant_phone_e164
+                    ON chat_messages(tenant_id, phone_e164, created_at DESC);
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 26: Error agregando phone_e164: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 27: chat_messages.lead_id (FK) para unir conversaciones y leads sin comparar teléfonos.
+            # Se completa al insertar; el histórico lo rellena ChatLeadLinkService por lotes.
+            """
+            DO $$ BEGIN
+                ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS lead_id UUID REFERENCES leads(id) ON DELETE SET NULL;
+                CREATE INDEX IF NOT EXISTS idx_chat_messages_lead_created ON chat_messages(lead_id, created_at DESC);
+                CREATE INDEX IF NOT EXISTS idx_chat_messages_unlinked ON chat_messages(id) WHERE lead_id IS NULL;
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 27: Error agregando chat_messages.lead_id: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 28: Índices compuestos para las consultas calientes (ver tests/test_query_plans.py)
+            """
+            DO $$ BEGIN
+                -- Historial por conversación (get_chat_history)
+                CREATE INDEX IF NOT EXISTS idx_chat_messages_tenant_from_created
+                    ON chat_messages(tenant_id, from_number, created_at DESC);
+                -- Conversaciones asignadas por vendedor (métricas / listado); reemplaza al índice de una columna
+                CREATE INDEX IF NOT EXISTS idx_chat_messages_seller_assigned
+                    ON chat_messages(assigned_seller_id, tenant_id, assigned_at DESC);
+                DROP INDEX IF EXISTS idx_chat_messages_assigned_seller;
+                -- Mensajes entrantes por vendedor (no leídos / recibidos)
+                CREATE INDEX IF NOT EXISTS idx_chat_messages_seller_inbound
+                    ON chat_messages(assigned_seller_id, tenant_id, created_at DESC) WHERE role = 'user';
+                -- Listado de leads filtrado por estado; cubre al índice (tenant_id, status)
+                CREATE INDEX IF NOT EXISTS idx_leads_tenant_status_created
+                    ON leads(tenant_id, status, created_at DESC);
+                DROP INDEX IF EXISTS idx_leads_status;
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 28: Error creando índices de chat_messages/leads: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 29: automation_logs con las columnas que usa AutomationService + índices de deduplicación
+            """
+            DO $$ BEGIN
+                ALTER TABLE automation_logs ADD COLUMN IF NOT EXISTS patient_id UUID;
+                ALTER TABLE automation_logs ADD COLUMN IF NOT EXISTS target_id TEXT;
+                ALTER TABLE automation_logs ADD COLUMN IF NOT EXISTS meta JSONB;
+                ALTER TABLE automation_logs ADD COLUMN IF NOT EXISTS error_details TEXT;
+                CREATE INDEX IF NOT EXISTS idx_automation_logs_target
+                    ON automation_logs(target_id, trigger_type, status);
+                CREATE INDEX IF NOT EXISTS idx_automation_logs_patient
+                    ON automation_logs(patient_id, trigger_type, status);
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 29: Error extendiendo automation_logs: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 30: Puntero de rotación round-robin por tenant (asignación de vendedores; por regla desde Parche 34)
+            """
+            DO $$ BEGIN
+                CREATE TABLE IF NOT EXISTS seller_rotation_state (
+                    tenant_id INTEGER PRIMARY KEY REFERENCES tenants(id) ON DELETE CASCADE,
+                    position BIGINT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMPTZ DEFAULT NOW()
+                );
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 30: Error creando seller_rotation_state: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 31: Contadores de carga en vivo por vendedor (conversaciones abiertas)
+            """
+            DO $$ BEGIN
+                CREATE TABLE IF NOT EXISTS seller_load (
+                    tenant_id INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+                    seller_id UUID NOT NULL,
+                    open_conversations INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMPTZ DEFAULT NOW(),
+                    reconciled_at TIMESTAMPTZ,
+                    PRIMARY KEY (tenant_id, seller_id)
+                );
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 31: Error creando seller_load: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 32: website_phone_cache por (url, país por defecto) y resultados no definitivos
+            """
+            DO $$ BEGIN
+                ALTER TABLE website_phone_cache ADD COLUMN IF NOT EXISTS default_cc TEXT NOT NULL DEFAULT '';
+                ALTER TABLE website_phone_cache ADD COLUMN IF NOT EXISTS definitive BOOLEAN NOT NULL DEFAULT TRUE;
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.key_column_usage
+                    WHERE table_name = 'website_phone_cache' AND constraint_name = 'website_phone_cache_pkey'
+                      AND column_name = 'default_cc'
+                ) THEN
+                    ALTER TABLE website_phone_cache DROP CONSTRAINT IF EXISTS website_phone_cache_pkey;
+                    ALTER TABLE website_phone_cache ADD PRIMARY KEY (url, default_cc);
+                END IF;
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 32: Error migrando website_phone_cache: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 33: Marcas de avance del vínculo chat_messages -> leads (fila única)
+            """
+            DO $$ BEGIN
+                CREATE TABLE IF NOT EXISTS chat_lead_link_state (
+                    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                    last_message_id BIGINT NOT NULL DEFAULT 0,
+                    leads_linked_until TIMESTAMPTZ,
+                    updated_at TIMESTAMPTZ DEFAULT NOW()
+                );
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 33: Error creando chat_lead_link_state: %', SQLERRM;
+            END $$;
+            """,
+            # Parche 34: Un puntero de rotación por regla round_robin ('' = reasignación masiva)
+            """
+            DO $$ BEGIN
+                ALTER TABLE seller_rotation_state ADD COLUMN IF NOT EXISTS rule_key TEXT NOT NULL DEFAULT '';
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.key_column_usage
+                    WHERE table_name = 'seller_rotation_state' AND constraint_name = 'seller_rotation_state_pkey'
+                      AND column_name = 'rule_key'
+                ) THEN
+                    ALTER TABLE seller_rotation_state DROP CONSTRAINT IF EXISTS seller_rotation_state_pkey;
+                    ALTER TABLE seller_rotation_state ADD PRIMARY KEY (tenant_id, rule_key);
+                END IF;
+            EXCEPTION WHEN others THEN
+                RAISE NOTICE 'Parche 34: Error migrando seller_rotation_state: %', SQLERRM;
+            END $$;
             """
         ]
 
@@ -624,12 +1047,17 @@ class Database:
         async with self.pool.acquire() as conn:
             await conn.execute(query, provider, provider_message_id, error)
 
-    async def append_chat_message(self, from_number: str, role: str, content: str, correlation_id: str, tenant_id: int = 1):
-        """Append a chat message and trigger notifications for leads."""
+    async def append_chat_message(
+        self, from_number: str, role: str, content: str, correlation_id: str, tenant_id: int = 1,
+        lead_id: Optional[Any] = None
+    ):
+        """Append a chat message and trigger notifications for leads.
+        lead_id: lead ya resuelto por el caller; si falta se resuelve por phone_e164 en el mismo INSERT."""
         async with self.pool.acquire() as conn:
-            # 1. Insert message
-            query = "INSERT INTO chat_messages (from_number, role, content, correlation_id, tenant_id) VALUES ($1, $2, $3, $4, $5)"
-            await conn.execute(query, from_number, role, content, correlation_id, tenant_id)
+            # 1. Insert message (linked to its lead)
+            await conn.execute(
+                self.APPEND_CHAT_MESSAGE_SQL, from_number, role, content, correlation_id, tenant_id, lead_id
+            )
             
             # 2. Trigger Notification if it's a message FROM the USER (lead)
             if role == "user":
@@ -638,14 +1066,14 @@ class Database:
                     row = await conn.fetchrow("""
                         SELECT assigned_seller_id, first_name, last_name 
                         FROM chat_messages cm
-                        LEFT JOIN leads l ON cm.from_number = l.phone_number AND cm.tenant_id = l.tenant_id
+                        LEFT JOIN leads l ON l.id = cm.lead_id
                         WHERE cm.from_number = $1 AND cm.tenant_id = $2
                         AND cm.assigned_seller_id IS NOT NULL
                         ORDER BY cm.created_at DESC LIMIT 1
                     """, from_number, tenant_id)
                     
                     if row:
-                        from services.seller_notification_service import seller_notification_service, Notification
+                        from services.seller_notification_service import notification_service as seller_notification_service, Notification
                         import datetime
                         timestamp = datetime.datetime.utcnow().timestamp()
                         lead_name = f"{row['first_name'] or ''} {row['last_name'] or ''}".strip() or from_number
@@ -704,56 +1132,19 @@ class Database:
         parts = (customer_name or "").strip().split(None, 1)
         first_name = parts[0] if parts else "Lead"
         last_name = parts[1] if len(parts) > 1 else ""
-        
+
+        # Attribution fields only when referral carries an ad_id (Spec Multi-Attribution)
+        meta_ad_id = referral.get("ad_id") if referral else None
+        meta_campaign_id = referral.get("campaign_id") if meta_ad_id else None
+        lead_source = "META_ADS" if meta_ad_id else "ORGANIC"
+
         async with self.pool.acquire() as conn:
-            # 1. Check for existing lead
-            existing = await conn.fetchrow(
-                "SELECT id, first_name, last_name, lead_source FROM leads WHERE tenant_id = $1 AND phone_number = $2",
-                tenant_id, phone_number
+            row = await conn.fetchrow(
+                self.ENSURE_LEAD_SQL,
+                tenant_id, phone_number, first_name, last_name, source,
+                lead_source, meta_ad_id, meta_campaign_id
             )
-            
-            # 2. Build attribution fields if referral present (Spec Multi-Attribution)
-            attribution_data = {}
-            if referral:
-                ad_id = referral.get("ad_id")
-                if ad_id:
-                    attribution_data = {
-                        "lead_source": "META_ADS",
-                        "meta_ad_id": ad_id,
-                        "meta_campaign_id": referral.get("campaign_id")
-                    }
-
-            if existing:
-                # Update existing lead
-                update_fields = {
-                    "first_name": first_name if first_name != "Lead" else existing["first_name"],
-                    "last_name": last_name if last_name else existing["last_name"],
-                    "updated_at": datetime.now()
-                }
-                if attribution_data:
-                    update_fields.update(attribution_data)
-                
-                set_clauses = [f"{k} = ${i+1}" for i, k in enumerate(update_fields.keys())]
-                query = f"UPDATE leads SET {', '.join(set_clauses)} WHERE id = ${len(update_fields)+1}"
-                await conn.execute(query, *update_fields.values(), existing["id"])
-                return {**dict(existing), **update_fields}
-
-            # 3. Create new lead
-            insert_fields = {
-                "tenant_id": tenant_id,
-                "phone_number": phone_number,
-                "first_name": first_name,
-                "last_name": last_name,
-                "source": source,
-                "lead_source": attribution_data.get("lead_source", "ORGANIC")
-            }
-            if attribution_data:
-                insert_fields.update(attribution_data)
-                
-            cols = ", ".join(insert_fields.keys())
-            placeholders = ", ".join([f"${i+1}" for i in range(len(insert_fields))])
-            query = f"INSERT INTO leads ({cols}) VALUES ({placeholders}) RETURNING id, tenant_id, phone_number, first_name, last_name, status, source, lead_source"
-            return await conn.fetchrow(query, *insert_fields.values())
+            return dict(row) if row else None
 
     async def get_chat_history(self, from_number: str, limit: int = 15, tenant_id: Optional[int] = None) -> List[dict]:
         if tenant_id is not None:
@@ -1,8 +1,5 @@
 import os
 import json
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 import logging
 import asyncio
 import socketio
@@ -21,7 +18,7 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 
 # --- APP SETUP ---
-from core.rate_limiter import limiter
+from core.rate_limiter import limiter, RateLimitExceeded, rate_limit_exceeded_handler
 
 from db import db
 from admin_routes import router as admin_router
@@ -49,7 +46,7 @@ AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=F
 # --- APP CONFIG ---
 app = FastAPI(title="Nexus Orchestrator", version="7.7.0")
 app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
 
 # CORS: Strict configuration powered by ALLOWED_ORIGINS env
 # Replace wildcard risk with official environment domains
@@ -318,6 +315,14 @@ async def chat_inbound(
             tenant_id, from_number, customer_name=customer_name, source="whatsapp_inbound", referral=referral
         )
 
+        # Campaign reply attribution (campaigns.stats.replied)
+        if lead and lead.get("id"):
+            try:
+                from services.outreach.outreach_dispatcher import outreach_dispatcher
+                await outreach_dispatcher.record_reply(tenant_id, lead["id"])
+            except Exception as reply_err:
+                logger.warning(f"⚠️ Error recording campaign reply: {reply_err}")
+
         # Notify via Socket.IO if attributed (Spec Mission 4)
         if referral and lead and lead.get("lead_source") == "META_ADS":
             try:
@@ -334,8 +339,9 @@ async def chat_inbound(
             except Exception as sio_err:
                 logger.error(f"⚠️ Error emitting Meta lead notification: {sio_err}")
 
+        lead_id = lead.get("id") if lead else None
         await db.append_chat_message(
-            from_number, "user", text, correlation_id, tenant_id
+            from_number, "user", text, correlation_id, tenant_id, lead_id=lead_id
         )
 
         # Build history (previous messages only; current turn is "input")
@@ -370,7 +376,7 @@ async def chat_inbound(
         output = (result.get("output") or "").strip()
 
         await db.append_chat_message(
-            from_number, "assistant", output, correlation_id, tenant_id
+            from_number, "assistant", output, correlation_id, tenant_id, lead_id=lead_id
         )
         await db.mark_inbound_done(provider, provider_message_id)
         return {"status": "ok", "send": True, "text": output, "messages": [{"text": output}]}
@@ -436,6 +442,22 @@ async def startup_event():
         import traceback
         traceback.print_exc()
 
+    # Resume prospecting jobs interrupted by a restart
+    try:
+        from services.prospecting.job_runner import prospecting_job_runner
+        resumed = await prospecting_job_runner.resume_pending()
+        logger.info(f"✅ Prospecting job runner ready ({resumed} jobs resumed)")
+    except Exception as e:
+        logger.error(f"❌ Error resuming prospecting jobs: {e}")
+
+    # Resume outreach jobs (bulk template sends) interrupted by a restart
+    try:
+        from services.outreach.outreach_dispatcher import outreach_dispatcher
+        resumed = await outreach_dispatcher.resume_pending()
+        logger.info(f"✅ Outreach dispatcher ready ({resumed} jobs resumed)")
+    except Exception as e:
+        logger.error(f"❌ Error resuming outreach jobs: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_event():
     # Stop scheduled tasks
@@ -446,6 +468,26 @@ async def shutdown_event():
     except Exception as e:
         logger.error(f"❌ Error stopping scheduled tasks: {e}")
     
+    try:
+        from services.prospecting.job_runner import prospecting_job_runner
+        await prospecting_job_runner.shutdown()
+    except Exception as e:
+        logger.error(f"❌ Error stopping prospecting jobs: {e}")
+
+    try:
+        from services.outreach.outreach_dispatcher import outreach_dispatcher
+        await outreach_dispatcher.shutdown()
+    except Exception as e:
+        logger.error(f"❌ Error stopping outreach jobs: {e}")
+
+    # Flush pending audit events before the pool closes
+    try:
+        from core.audit_sink import audit_sink
+        await audit_sink.shutdown()
+        logger.info(f"✅ Audit sink flushed ({audit_sink.stats()['written']} events written)")
+    except Exception as e:
+        logger.error(f"❌ Error flushing audit sink: {e}")
+    
     await db.disconnect()
     await engine.dispose()
 
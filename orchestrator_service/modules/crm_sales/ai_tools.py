@@ -9,7 +9,7 @@ from langchain_core.tools import BaseTool
 from dateutil.parser import parse as dateutil_parse
 
 from db import pool
-from core.utils import ARG_TZ
+from core.utils import ARG_TZ, normalize_phone, phone_lookup_key
 
 logger = logging.getLogger(__name__)
 
@@ -174,20 +174,23 @@ class CreateOrUpdateLeadTool(BaseTool):
         async with pool.acquire() as conn:
             # Upsert logic ensuring tenant_id isolation
             query = """
-                INSERT INTO leads (tenant_id, phone, name, email, qualification_score, status)
-                VALUES ($1, $2, $3, $4, $5, 'new')
-                ON CONFLICT (tenant_id, phone) 
+                INSERT INTO leads (tenant_id, phone_number, first_name, email, status)
+                VALUES ($1, $2, $3, $4, 'new')
+                ON CONFLICT (tenant_id, phone_number) 
                 DO UPDATE SET 
-                    name = EXCLUDED.name,
+                    first_name = EXCLUDED.first_name,
                     email = COALESCE(EXCLUDED.email, leads.email),
-                    qualification_score = EXCLUDED.qualification_score,
                     updated_at = NOW()
                 RETURNING id, status
             """
             try:
+                existing = await conn.fetchval(
+                    "SELECT phone_number FROM leads WHERE tenant_id = $1 AND phone_e164 = $2",
+                    self.tenant_id, phone_lookup_key(phone)
+                )
                 record = await conn.fetchrow(
                     query, 
-                    self.tenant_id, phone, name, email, qualification_score
+                    self.tenant_id, existing or normalize_phone(phone), name, email
                 )
                 if record:
                     # Persist event in history
@@ -234,8 +237,8 @@ class AssignToCloserAndHandoffTool(BaseTool):
         async with pool.acquire() as conn:
             # 1. Get the lead ID ensuring data isolation
             lead = await conn.fetchrow(
-                "SELECT id, name FROM leads WHERE tenant_id = $1 AND phone = $2",
-                self.tenant_id, phone
+                "SELECT id, first_name FROM leads WHERE tenant_id = $1 AND phone_e164 = $2",
+                self.tenant_id, phone_lookup_key(phone)
             )
             if not lead:
                 return f"No se encontró un lead con el teléfono {phone} para asignar."
@@ -321,8 +324,8 @@ class BookSalesMeetingTool(BaseTool):
 
             # 2. Get lead ensuring data isolation
             lead = await conn.fetchrow(
-                "SELECT id, first_name, last_name FROM leads WHERE tenant_id = $1 AND phone = $2",
-                self.tenant_id, phone
+                "SELECT id, first_name, last_name FROM leads WHERE tenant_id = $1 AND phone_e164 = $2",
+                self.tenant_id, phone_lookup_key(phone)
             )
             if not lead:
                 return "❌ Primero debo guardarte como lead. Por favor, dime tu nombre para registrarte antes de agendar."
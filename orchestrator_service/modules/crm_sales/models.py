@@ -75,6 +75,19 @@ class LeadResponse(LeadBase):
         from_attributes = True
 
 
+class LeadSearchResult(BaseModel):
+    """Typeahead result for /leads/search"""
+    id: UUID
+    phone_number: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    status: Optional[str] = None
+    assigned_seller_id: Optional[UUID] = None
+    created_at: Optional[datetime] = None
+    score: float = 0.0
+
+
 class LeadAssignRequest(BaseModel):
     """Request to assign a lead to a seller"""
     seller_id: UUID = Field(..., description="User ID of the seller to assign")
@@ -110,6 +123,7 @@ class AiActionResponse(BaseModel):
 
 class ProspectingScrapeRequest(BaseModel):
     """Request to scrape prospects from Apify."""
+    tenant_id: int
     niche: str = Field(..., min_length=2)
     location: str = Field(..., min_length=2)
     max_places: int = Field(default=30, ge=1, le=100)
@@ -154,6 +168,7 @@ class ProspectingLeadResponse(BaseModel):
 
 class ProspectingSendRequest(BaseModel):
     """Request to queue/send template outreach (Phase 3)."""
+    tenant_id: int
     lead_ids: Optional[List[UUID]] = None
     only_pending: bool = True
     template_name: Optional[str] = None
@@ -5,9 +5,11 @@ Endpoints for managing leads, WhatsApp connections, templates, campaigns, and se
 import uuid as uuid_lib
 import os
 import json
-import asyncio
+import base64
+import csv
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
 from typing import List, Optional, Any
 from uuid import UUID
 import httpx
@@ -25,14 +27,24 @@ from modules.crm_sales.models import (
     SellerCreate, SellerUpdate,
     AgendaEventCreate, AgendaEventUpdate,
     ProspectingScrapeRequest, ProspectingLeadResponse, ProspectingSendRequest,
-    CrmDashboardStats, AiActionResponse
+    CrmDashboardStats, AiActionResponse, LeadSearchResult
 )
-from core.security import get_current_user_context, verify_admin_token, get_resolved_tenant_id, get_allowed_tenant_ids, audit_access
-from core.utils import normalize_phone
+from core.security import (
+    get_current_user_context, verify_admin_token, get_resolved_tenant_id, get_allowed_tenant_ids, audit_access,
+    invalidate_user_identity,
+)
+from core.utils import normalize_phone, infer_country_code
 from db import db
+from services.prospecting.job_runner import prospecting_job_runner
+from services.outreach.outreach_dispatcher import outreach_dispatcher, prospecting_recipient_filter
+from services.outreach.campaign_service import campaign_service
+from services.lead_search_service import lead_search_service, build_lead_search_filter
+from services.lead_stats_service import lead_stats_service
+from services.lead_export_service import lead_export_service, parse_export_columns, EXPORT_FORMATS
+from services.lead_import_service import lead_import_service, IMPORT_FORMATS, CONFLICT_MODES
+from services.seller_load_service import seller_load_service
 
 router = APIRouter(prefix="", tags=["CRM Sales"])
-APIFY_ACTOR_URL = "https://api.apify.com/v2/acts/compass~crawler-google-places/run-sync-get-dataset-items"
 INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "internal-secret-token")
 WHATSAPP_SERVICE_URL = os.getenv("WHATSAPP_SERVICE_URL", "http://whatsapp_service:8002")
 
@@ -46,25 +58,71 @@ router.include_router(lead_status_router)
 # LEADS ENDPOINTS
 # ============================================
 
+def _encode_lead_cursor(created_at: datetime, lead_id: UUID) -> str:
+    """Opaque keyset cursor over (created_at, id) for lead listings."""
+    raw = json.dumps({"c": created_at.isoformat(), "i": str(lead_id)})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_lead_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return datetime.fromisoformat(data["c"]), UUID(data["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _build_lead_filters(
+    context: dict, status: Optional[str], assigned_seller_id: Optional[UUID], search: Optional[str], param_idx: int
+) -> tuple:
+    """Filtros comunes de listado/exportación de leads (rol, estado, vendedor, búsqueda). Retorna (sql, params)."""
+    role = context.get("role") or context.get("user_role") or ""
+    user_id = context.get("user_id") or context.get("id")
+    sql = ""
+    params: list = []
+
+    # Role-based filtering: Setters and Closers only see assigned leads
+    if role in ['setter', 'closer']:
+        sql += f" AND assigned_seller_id = ${param_idx + len(params)}"
+        params.append(UUID(user_id) if isinstance(user_id, str) else user_id)
+
+    if status:
+        sql += f" AND status = ${param_idx + len(params)}"
+        params.append(status)
+
+    if assigned_seller_id:
+        sql += f" AND assigned_seller_id = ${param_idx + len(params)}"
+        params.append(assigned_seller_id)
+
+    if search and search.strip():
+        search_sql, search_params = build_lead_search_filter(search, param_idx + len(params))
+        sql += search_sql
+        params.extend(search_params)
+
+    return sql, params
+
+
 @router.get("/leads", response_model=List[LeadResponse])
 @audit_access("list_leads")
 @limiter.limit("100/minute")
 async def list_leads(
     request: Request,
+    response: Response,
     status: Optional[str] = None,
     assigned_seller_id: Optional[UUID] = None,
     search: Optional[str] = Query(None, description="Search by name, phone, email"),
     limit: int = Query(50, le=500),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Opaque keyset cursor from X-Next-Cursor (takes precedence over offset)"),
     context: dict = Depends(get_current_user_context)
 ):
     """
     List all leads for the current tenant with optional filters.
     Excludes soft-deleted (status='deleted'). Supports search by first_name, last_name, phone_number, email.
+    Keyset pagination: when a full page is returned, the X-Next-Cursor header carries the cursor for the next page.
     """
     tenant_id = context["tenant_id"]
-    role = context.get("role") or context.get("user_role") or ""
-    user_id = context.get("user_id") or context.get("id")
 
     query = """
         SELECT id, tenant_id, phone_number, first_name, last_name, email,
@@ -77,37 +135,113 @@ async def list_leads(
         FROM leads
         WHERE tenant_id = $1 AND (status IS NULL OR status != 'deleted')
     """
-    params: list = [tenant_id]
-    param_idx = 2
-
-    # Role-based filtering: Setters and Closers only see assigned leads
-    if role in ['setter', 'closer']:
-        query += f" AND assigned_seller_id = ${param_idx}"
-        params.append(UUID(user_id) if isinstance(user_id, str) else user_id)
-        param_idx += 1
-    
-    if status:
-        query += f" AND status = ${param_idx}"
-        params.append(status)
-        param_idx += 1
+    filter_sql, filter_params = _build_lead_filters(context, status, assigned_seller_id, search, param_idx=2)
+    query += filter_sql
+    params: list = [tenant_id, *filter_params]
+    param_idx = 2 + len(filter_params)
+
+    if cursor:
+        cursor_created_at, cursor_id = _decode_lead_cursor(cursor)
+        query += f" AND (created_at, id) < (${param_idx}, ${param_idx + 1})"
+        params.extend([cursor_created_at, cursor_id])
+        param_idx += 2
+        offset = 0
     
-    if assigned_seller_id:
-        query += f" AND assigned_seller_id = ${param_idx}"
-        params.append(assigned_seller_id)
-        param_idx += 1
-    
-    if search and search.strip():
-        query += f" AND (first_name ILIKE ${param_idx} OR last_name ILIKE ${param_idx} OR phone_number ILIKE ${param_idx} OR email ILIKE ${param_idx})"
-        params.append(f"%{search.strip()}%")
-        param_idx += 1
-    
-    query += f" ORDER BY created_at DESC LIMIT ${param_idx} OFFSET ${param_idx + 1}"
+    query += f" ORDER BY created_at DESC, id DESC LIMIT ${param_idx} OFFSET ${param_idx + 1}"
     params.extend([limit, offset])
     
     rows = await db.pool.fetch(query, *params)
+    if len(rows) == limit and rows[-1]["created_at"] is not None:
+        response.headers["X-Next-Cursor"] = _encode_lead_cursor(rows[-1]["created_at"], rows[-1]["id"])
     return [dict(row) for row in rows]
 
 
+@router.get("/leads/search", response_model=List[LeadSearchResult])
+@limiter.limit("300/minute")
+async def search_leads(
+    request: Request,
+    q: str = Query(..., min_length=2, description="Name, email or last digits of the phone"),
+    limit: int = Query(20, ge=1, le=50),
+    context: dict = Depends(get_current_user_context)
+):
+    """
+    Typeahead search over the tenant's leads (trigram on name/email, suffix match on phone),
+    ordered by relevance.
+    """
+    role = context.get("role") or context.get("user_role") or ""
+    user_id = context.get("user_id") or context.get("id")
+    seller_id = None
+    if role in ['setter', 'closer']:
+        seller_id = UUID(user_id) if isinstance(user_id, str) else user_id
+    return await lead_search_service.search(context["tenant_id"], q, limit=limit, seller_id=seller_id)
+
+
+@router.get("/leads/export")
+@audit_access("export_leads")
+@limiter.limit("10/minute")
+async def export_leads(
+    request: Request,
+    format: str = Query("csv", description="csv | ndjson"),
+    columns: Optional[str] = Query(None, description="Comma-separated columns (default: basic lead fields)"),
+    status: Optional[str] = None,
+    assigned_seller_id: Optional[UUID] = None,
+    search: Optional[str] = Query(None, description="Search by name, phone, email"),
+    context: dict = Depends(get_current_user_context)
+):
+    """
+    Streams the tenant's leads as CSV or NDJSON with the same filters as GET /leads.
+    Rows are read through a server-side cursor in a read-only transaction (constant memory).
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    try:
+        selected = parse_export_columns(columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filter_sql, filter_params = _build_lead_filters(context, status, assigned_seller_id, search, param_idx=2)
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv; charset=utf-8"
+    filename = f"leads_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        lead_export_service.stream(context["tenant_id"], format, selected, filter_sql, filter_params),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/leads/import")
+@audit_access("import_leads")
+@limiter.limit("10/minute")
+async def import_leads(
+    request: Request,
+    file: UploadFile = File(..., description="CSV (header with phone_number) or NDJSON"),
+    format: Optional[str] = Query(None, description="csv | ndjson (default: inferred from the file name)"),
+    country_code: str = Query("54", description="Default country code for local phone numbers"),
+    on_conflict: str = Query("skip", description="skip | update existing leads (same phone)"),
+    context: dict = Depends(get_current_user_context)
+):
+    """
+    Bulk import of leads: staged with COPY and merged into leads with a single upsert.
+    Returns inserted/updated/skipped counters and per-row rejects (row number + reason).
+    """
+    role = context.get("role") or context.get("user_role") or ""
+    if role in ['setter', 'closer']:
+        raise HTTPException(status_code=403, detail="Solo administradores pueden importar leads")
+
+    fmt = format or ("ndjson" if (file.filename or "").lower().endswith((".ndjson", ".jsonl")) else "csv")
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(IMPORT_FORMATS)}")
+    if on_conflict not in CONFLICT_MODES:
+        raise HTTPException(status_code=400, detail=f"on_conflict must be one of: {', '.join(CONFLICT_MODES)}")
+
+    try:
+        return await lead_import_service.import_stream(
+            context["tenant_id"], file.file, fmt, default_cc=country_code, on_conflict=on_conflict
+        )
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Archivo inválido: {e}")
+
+
 @router.post("/leads", response_model=LeadResponse, status_code=201)
 async def create_lead(
     lead: LeadCreate,
@@ -151,13 +285,12 @@ async def get_lead_context_by_phone(
     Returns lead context for Chats panel: lead data and upcoming event.
     If tenant_id_override is provided and allowed, use it; else use context tenant_id.
     """
-    from core.utils import normalize_phone
+    from core.utils import phone_lookup_key
     tenant_id = tenant_id_override if (tenant_id_override is not None and tenant_id_override in allowed_ids) else context["tenant_id"]
-    norm_phone = normalize_phone(phone)
     lead_row = await db.pool.fetchrow("""
         SELECT id, first_name, last_name, phone_number, status, email
-        FROM leads WHERE tenant_id = $1 AND (phone_number = $2 OR phone_number = $3) AND (status IS NULL OR status != 'deleted')
-    """, tenant_id, norm_phone, phone)
+        FROM leads WHERE tenant_id = $1 AND phone_e164 = $2 AND (status IS NULL OR status != 'deleted')
+    """, tenant_id, phone_lookup_key(phone))
     if not lead_row:
         return {"lead": None, "upcoming_event": None, "last_event": None, "is_guest": True}
     lead_id = lead_row["id"]
@@ -373,22 +506,21 @@ async def convert_lead_to_client(
             status_code=400,
             detail="Ya existe un cliente con ese teléfono. Podés editarlo desde la página de Clientes.",
         )
-    row = await db.pool.fetchrow("""
-        INSERT INTO clients (tenant_id, phone_number, first_name, last_name, email, status, notes, created_at, updated_at)
-        VALUES ($1, $2, $3, $4, $5, 'active', NULL, NOW(), NOW())
-        RETURNING id, tenant_id, phone_number, first_name, last_name, email, status, notes, created_at, updated_at
-    """,
-        tenant_id,
-        lead["phone_number"],
-        (lead["first_name"] or "").strip() or None,
-        (lead["last_name"] or "").strip() or None,
-        (lead["email"] or "").strip() or None,
-    )
-    await db.pool.execute(
-        "UPDATE leads SET status = 'closed_won', updated_at = NOW() WHERE id = $1 AND tenant_id = $2",
-        lead_id,
-        tenant_id,
-    )
+    async with db.pool.acquire() as conn:
+        async with conn.transaction():
+            row = await conn.fetchrow("""
+                INSERT INTO clients (tenant_id, phone_number, first_name, last_name, email, status, notes, created_at, updated_at)
+                VALUES ($1, $2, $3, $4, $5, 'active', NULL, NOW(), NOW())
+                RETURNING id, tenant_id, phone_number, first_name, last_name, email, status, notes, created_at, updated_at
+            """,
+                tenant_id,
+                lead["phone_number"],
+                (lead["first_name"] or "").strip() or None,
+                (lead["last_name"] or "").strip() or None,
+                (lead["email"] or "").strip() or None,
+            )
+            # closed_won también libera la conversación del contador de carga del vendedor
+            await seller_load_service.close_lead(tenant_id, lead_id, "closed_won", conn)
     return dict(row)
 
 
@@ -452,25 +584,23 @@ async def create_client(
     )
     if existing:
         raise HTTPException(status_code=400, detail="Ya existe un cliente con ese teléfono en esta entidad.")
-    row = await db.pool.fetchrow("""
-        INSERT INTO clients (tenant_id, phone_number, first_name, last_name, email, status, notes, created_at, updated_at)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, NOW(), NOW())
-        RETURNING id, tenant_id, phone_number, first_name, last_name, email, status, notes, created_at, updated_at
-    """,
-        tenant_id,
-        payload.phone_number.strip(),
-        (payload.first_name or "").strip() or None,
-        (payload.last_name or "").strip() or None,
-        (payload.email or "").strip() or None,
-        (payload.status or "active").strip(),
-        (payload.notes or "").strip() or None,
-    )
-    if payload.lead_id:
-        await db.pool.execute(
-            "UPDATE leads SET status = 'closed_won', updated_at = NOW() WHERE id = $1 AND tenant_id = $2",
-            payload.lead_id,
-            tenant_id,
-        )
+    async with db.pool.acquire() as conn:
+        async with conn.transaction():
+            row = await conn.fetchrow("""
+                INSERT INTO clients (tenant_id, phone_number, first_name, last_name, email, status, notes, created_at, updated_at)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, NOW(), NOW())
+                RETURNING id, tenant_id, phone_number, first_name, last_name, email, status, notes, created_at, updated_at
+            """,
+                tenant_id,
+                payload.phone_number.strip(),
+                (payload.first_name or "").strip() or None,
+                (payload.last_name or "").strip() or None,
+                (payload.email or "").strip() or None,
+                (payload.status or "active").strip(),
+                (payload.notes or "").strip() or None,
+            )
+            if payload.lead_id:
+                await seller_load_service.close_lead(tenant_id, payload.lead_id, "closed_won", conn)
     return dict(row)
 
 
@@ -582,76 +712,25 @@ async def get_crm_dashboard_stats(
     user_id = context.get("user_id") or context.get("id")
     seller_uid = UUID(user_id) if isinstance(user_id, str) else user_id
 
-    # Base WHERE clause
-    where_base = "WHERE tenant_id = $1"
-    where_params = [tenant_id]
-    
-    # If seller, restrict to their leads
-    if role in ['setter', 'closer']:
-        where_base += " AND assigned_seller_id = $2"
-        where_params.append(seller_uid)
-
     try:
         # Determine days based on range
         days = 7 if range == "weekly" else 30
-        interval = f"INTERVAL '{days} days'"
-        
-        # 1. Total leads (all time)
-        total_leads = await db.pool.fetchval(f"""
-            SELECT COUNT(*) FROM leads 
-            {where_base} AND status != 'deleted'
-        """, *where_params) or 0
-        
-        # 2. Total clients (all time)
-        # Note: clients usually derived from won leads. 
-        # For simplicity, if role is seller, we count clients linked to THEIR won leads.
-        if role in ['setter', 'closer']:
-            total_clients = await db.pool.fetchval("""
-                SELECT COUNT(DISTINCT phone_number) FROM leads 
-                WHERE tenant_id = $1 AND assigned_seller_id = $2 AND status = 'closed_won'
-            """, tenant_id, seller_uid) or 0
-        else:
-            total_clients = await db.pool.fetchval("""
-                SELECT COUNT(*) FROM clients 
-                WHERE tenant_id = $1
-            """, tenant_id) or 0
-        
-        # 3. Active leads (recent, not converted)
-        active_leads = await db.pool.fetchval(f"""
-            SELECT COUNT(*) FROM leads 
-            {where_base} 
-            AND status NOT IN ('closed_won', 'closed_lost', 'deleted')
-            AND created_at >= NOW() - {interval}
-        """, *where_params) or 0
-        
-        # 4. Converted leads (closed won in period)
-        converted_leads = await db.pool.fetchval(f"""
-            SELECT COUNT(*) FROM leads 
-            {where_base} 
-            AND status = 'closed_won'
-            AND created_at >= NOW() - {interval}
-        """, *where_params) or 0
-        
-        # 5. Total revenue (estimated from converted leads: $1000 per lead)
+
+        # Single query over lead_daily_stats rollups (sellers only see their leads)
+        summary = await lead_stats_service.get_dashboard_summary(
+            tenant_id, days, seller_id=seller_uid if role in ['setter', 'closer'] else None
+        )
+
+        total_leads = summary["total_leads"]
+        total_clients = summary["total_clients"]
+        active_leads = summary["active_leads"]
+        converted_leads = summary["converted_leads"]
+        period_leads = summary["period_leads"]
+
+        # Total revenue (estimated from converted leads: $1000 per lead)
         total_revenue = converted_leads * 1000.0
-        
-        # 6. Conversion rate (based on period)
-        period_leads = await db.pool.fetchval(f"""
-            SELECT COUNT(*) FROM leads 
-            {where_base} 
-            AND status != 'deleted'
-            AND created_at >= NOW() - {interval}
-        """, *where_params) or 0
-        
         conversion_rate = (converted_leads / period_leads * 100) if period_leads > 0 else 0.0
-        
-        # 7. Status distribution
-        status_rows = await db.pool.fetch(f"""
-            SELECT status, COUNT(*) as count FROM leads
-            {where_base} AND status != 'deleted'
-            GROUP BY status
-        """, *where_params)
-        
+
         status_colors = {
             'new': '#3b82f6',
             'contacted': '#f59e0b',
@@ -663,49 +742,16 @@ async def get_crm_dashboard_stats(
         
         status_distribution = [
             {"status": r["status"] or "new", "count": r["count"], "color": status_colors.get(r["status"], "#94a3b8")}
-            for r in status_rows
+            for r in summary["status_distribution"] or []
         ]
 
-        # 8. Revenue & Leads Trend (Last 6 months)
-        # Using joins for trend to ensure seller filtering
-        trend_rows = await db.pool.fetch(f"""
-            WITH months AS (
-                SELECT generate_series(
-                    date_trunc('month', CURRENT_DATE - INTERVAL '5 months'),
-                    date_trunc('month', CURRENT_DATE),
-                    '1 month'::interval
-                ) as month_start
-            )
-            SELECT 
-                to_char(m.month_start, 'Mon') as month_label,
-                COUNT(l.id) as leads_count,
-                COALESCE(SUM(CASE WHEN l.status = 'closed_won' THEN 1000.0 ELSE 0 END), 0) as revenue
-            FROM months m
-            LEFT JOIN leads l ON date_trunc('month', l.created_at) = m.month_start 
-              AND l.tenant_id = $1 AND l.status != 'deleted'
-              { "AND l.assigned_seller_id = $2" if role in ['setter', 'closer'] else "" }
-            GROUP BY m.month_start
-            ORDER BY m.month_start ASC
-        """, *where_params)
-        
         revenue_leads_trend = [
-            {"month": r["month_label"], "revenue": float(r["revenue"]), "leads": r["leads_count"]}
-            for r in trend_rows
+            {"month": r["month"], "revenue": float(r["revenue"]), "leads": r["leads"]}
+            for r in summary["revenue_leads_trend"] or []
         ]
 
-        # 9. Recent leads
-        recent_leads = await db.pool.fetch("""
-            SELECT id, first_name, last_name, phone_number, status, 
-                   created_at, source, prospecting_niche
-            FROM leads 
-            WHERE tenant_id = $1 
-            AND status != 'deleted'
-            ORDER BY created_at DESC 
-            LIMIT 5
-        """, tenant_id)
-        
         formatted_recent_leads = []
-        for lead in recent_leads:
+        for lead in summary["recent_leads"] or []:
             name = f"{lead['first_name'] or ''} {lead['last_name'] or ''}".strip() or "Lead sin nombre"
             formatted_recent_leads.append({
                 "id": str(lead["id"]),
@@ -714,7 +760,7 @@ async def get_crm_dashboard_stats(
                 "status": lead["status"] or "new",
                 "source": lead["source"] or "manual",
                 "niche": lead["prospecting_niche"] or "General",
-                "created_at": lead["created_at"].isoformat() if lead["created_at"] else None
+                "created_at": lead["created_at"]
             })
         
         return CrmDashboardStats(
@@ -793,294 +839,21 @@ async def create_whatsapp_connection(
 # PROSPECTING ENDPOINTS (APIFY)
 # ============================================
 
-# Country prefix table (longest prefix first for correct matching)
-_COUNTRY_PREFIXES = [
-    # NANP specifics
-    ("1787", "PR"), ("1939", "PR"), ("1809", "DO"), ("1829", "DO"), ("1849", "DO"),
-    # Hispanoamérica
-    ("549", "AR"), ("54", "AR"), ("591", "BO"), ("56", "CL"), ("57", "CO"),
-    ("506", "CR"), ("53", "CU"), ("593", "EC"), ("503", "SV"), ("502", "GT"),
-    ("504", "HN"), ("521", "MX"), ("52", "MX"), ("505", "NI"), ("507", "PA"),
-    ("595", "PY"), ("51", "PE"), ("598", "UY"), ("58", "VE"), ("34", "ES"),
-    ("240", "GQ"),
-    # LatAm no hispana
-    ("55", "BR"), ("501", "BZ"), ("509", "HT"), ("592", "GY"), ("597", "SR"), ("594", "GF"),
-    # NANP genérico
-    ("1", "US"),
-]
-
-# Map country names / keywords to dial codes (for location inference)
-_LOCATION_COUNTRY_MAP = {
-    "argentina": "54", "ar": "54",
-    "argentina": "54",
-    "colombia": "57", "co": "57",
-    "chile": "56", "cl": "56",
-    "mexico": "52", "méxico": "52", "mx": "52",
-    "peru": "51", "perú": "51", "pe": "51",
-    "uruguay": "598", "uy": "598",
-    "paraguay": "595", "py": "595",
-    "bolivia": "591", "bo": "591",
-    "ecuador": "593", "ec": "593",
-    "venezuela": "58", "ve": "58",
-    "brasil": "55", "brazil": "55", "br": "55",
-    "españa": "34", "spain": "34", "es": "34",
-    "costa rica": "506", "cr": "506",
-    "panamá": "507", "panama": "507", "pa": "507",
-    "guatemala": "502", "gt": "502",
-    "honduras": "504", "hn": "504",
-    "el salvador": "503", "sv": "503",
-    "nicaragua": "505", "ni": "505",
-    "cuba": "53",
-    "united states": "1", "usa": "1", "us": "1",
-    "estados unidos": "1",
-    "puerto rico": "1787",
-    "dominican republic": "1809", "república dominicana": "1809",
-}
-
-
-def _infer_country_code(location: str) -> str:
-    """Infer dial code from a location query string (e.g. 'Medellín, Colombia' -> '57')."""
-    location_lower = location.lower().strip()
-    # Try multi-word matches first (e.g. "costa rica", "el salvador")
-    for keyword in sorted(_LOCATION_COUNTRY_MAP.keys(), key=len, reverse=True):
-        if keyword in location_lower:
-            return _LOCATION_COUNTRY_MAP[keyword]
-    return "54"  # Default: Argentina
-
-
-def _normalize_phone_e164(raw: str, default_country_code: str = "54") -> Optional[str]:
-    """
-    Ports the phone normalization logic from the n8n workflow (Scrap Phones.json).
-    Returns E.164 digits (without +) or None if invalid.
-    """
-    import re
-    digits = re.sub(r"\D", "", raw or "")
-    if not digits:
-        return None
-
-    # Check for garbage (repeating sequences like 0000000 or 1111111)
-    if re.match(r"^(\d)\1{6,}$", digits):
-        return None
-    # Strip leading 00 (international prefix alternative to +)
-    digits = re.sub(r"^00", "", digits)
-    # Strip leading single 0 (local trunk)
-    digits = re.sub(r"^0+", "", digits)
-
-    # Already has a known country code?
-    has_cc = False
-    for cc, _ in sorted(_COUNTRY_PREFIXES, key=lambda x: len(x[0]), reverse=True):
-        if digits.startswith(cc):
-            has_cc = True
-            break
-
-    if not has_cc:
-        # 10-digit NANP
-        if len(digits) == 10:
-            digits = "1" + digits
-        else:
-            digits = default_country_code + digits
-
-    # Arg-specific: ensure 549 prefix for mobile
-    if digits.startswith("54") and not digits.startswith("549"):
-        digits = "54" + "9" + digits[2:]
-    # Arg-specific: remove "15" after area code (e.g. 5492215... -> 5492 ...)
-    import re as _re
-    if digits.startswith("549"):
-        digits = _re.sub(r"^(549\d{2,5})15", r"\1", digits)
-
-    # Mex: ensure 521
-    if digits.startswith("52") and not digits.startswith("521"):
-        digits = "52" + "1" + digits[2:]
-
-    # Validate E.164 length (8-15 digits)
-    if len(digits) < 8 or len(digits) > 15:
-        return None
-    return digits
-
-
-async def _extract_phone_from_website(url: str, default_cc: str = "54") -> Optional[str]:
-    """
-    Secondary scrape: visit the website and extract the best phone number.
-    Ports the phone extraction regex logic from n8n Scrap Phones workflow.
-    """
-    import re
-    if not url:
-        return None
-    try:
-        async with httpx.AsyncClient(timeout=15.0, follow_redirects=False) as client:
-            resp = await client.get(url, headers={"User-Agent": "Mozilla/5.0 (compatible; PhoneScraper/1.0)"})
-            html = resp.text
-    except Exception:
-        return None
-
-    # 1) Extract tel: and wa.me links (highest quality)
-    link_phones = []
-    for href in re.findall(r'href=["\']([^"\']+)["\']', html):
-        tel_match = re.match(r'^tel:([\d\s\-\+\(\)]+)', href, re.IGNORECASE)
-        if tel_match:
-            link_phones.append(tel_match.group(1))
-        wa_match = re.search(r'wa\.me/(\d{7,15})', href, re.IGNORECASE)
-        if wa_match:
-            link_phones.append(wa_match.group(1))
-
-    # 2) Strip tags, extract text near phone-related keywords
-    cleaned = re.sub(r'<script[\s\S]*?</script>', '', html, flags=re.IGNORECASE)
-    cleaned = re.sub(r'<style[\s\S]*?</style>', '', cleaned, flags=re.IGNORECASE)
-    text = re.sub(r'<[^>]+>', ' ', cleaned)
-    text = re.sub(r'\s+', ' ', text)
-
-    keyword_frags = [
-        frag for frag in re.split(r'(?<=[.!?])\s+', text)
-        if re.search(r'tel|teléfono|telefono|whatsapp|contacto|celular|llamanos', frag, re.IGNORECASE)
-    ]
-    raw_candidates = []
-    for frag in keyword_frags:
-        raw_candidates.extend(re.findall(r'(?:\+?\d[\d()\s\-]{6,}\d)', frag))
-    raw_candidates.extend(link_phones)
-
-    # 3) Normalize and validate candidates
-    valid = []
-    seen = set()
-    for raw in raw_candidates:
-        norm = _normalize_phone_e164(raw, default_cc)
-        if norm and norm not in seen:
-            seen.add(norm)
-            valid.append(norm)
-
-    if not valid:
-        return None
-
-    # 4) Prioritize by country prefix (same priority as n8n)
-    def score(num: str) -> int:
-        for i, (cc, _) in enumerate(sorted(_COUNTRY_PREFIXES, key=lambda x: len(x[0]), reverse=True)):
-            if num.startswith(cc):
-                return len(_COUNTRY_PREFIXES) - i
-        return 0
-
-    valid.sort(key=score, reverse=True)
-    # n8n logic also prefers numbers that look like mobile (e.g. 549 in Arg)
-    mobile_priority = [v for v in valid if v.startswith("549") or v.startswith("521")]
-    return mobile_priority[0] if mobile_priority else valid[0]
-
-
-def _extract_social_links(apify_item: dict) -> dict:
-    """
-    Extracts social media profile URLs (IG, FB, LI) from Apify's webResults.
-    """
-    socials = {}
-    web_results = apify_item.get("webResults") or []
-    for res in web_results:
-        url = (res.get("url") or "").lower()
-        if "instagram.com/" in url and not socials.get("instagram"):
-            socials["instagram"] = res.get("url")
-        elif "facebook.com/" in url and not socials.get("facebook"):
-            socials["facebook"] = res.get("url")
-        elif "linkedin.com/" in url and not socials.get("linkedin"):
-            socials["linkedin"] = res.get("url")
-    return socials
-
-
 def _resolve_target_tenant_id(context: dict, allowed_ids: List[int], tenant_id: int) -> int:
     if tenant_id not in allowed_ids:
         raise HTTPException(status_code=403, detail="Sin acceso al tenant seleccionado")
     return tenant_id
 
-async def _send_prospecting_outreach_background(
-    tenant_id: int, 
-    template_name: str, 
-    language: str, 
-    lead_ids: Optional[List[str]] = None,
-    only_pending: bool = True
-):
-    """Background task to send bulk WhatsApp templates to leads."""
-    logger.info(f"outreach_background_start: tenant_id={tenant_id}, template={template_name}")
-    
-    # 1. Fetch leads
-    query = """
-        SELECT id, phone_number, first_name, apify_city
-        FROM leads
-        WHERE tenant_id = $1 AND (status IS NULL OR status != 'deleted')
-          AND ($2::bool = FALSE OR outreach_message_sent = FALSE)
-          AND phone_number ~ '^\d{8,15}$'
-    """
-    params: List[Any] = [tenant_id, only_pending]
-    if lead_ids:
-        query += " AND id = ANY($3::uuid[])"
-        params.append([uuid_lib.UUID(x) for x in lead_ids])
-    
-    leads = await db.pool.fetch(query, *params)
-    logger.info(f"outreach_leads_found: count={len(leads)}, tenant_id={tenant_id}")
-
-    # 2. Get business number
-    bot_phone = await db.pool.fetchval("SELECT bot_phone_number FROM tenants WHERE id = $1", tenant_id)
-    if not bot_phone:
-        logger.error(f"outreach_failed_no_bot_phone: tenant_id={tenant_id}")
-        return
-
-    # 3. Send to each lead
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        for lead in leads:
-            phone = normalize_phone(lead["phone_number"])
-            first_name = lead["first_name"] or " "
-            city = lead["apify_city"] or " "
-            
-            # Map components: {{1}} = name, {{2}} = city
-            components = [
-                {
-                    "type": "body",
-                    "parameters": [
-                        {"type": "text", "text": first_name},
-                        {"type": "text", "text": city}
-                    ]
-                }
-            ]
-            
-            try:
-                payload = {
-                    "to": phone,
-                    "type": "template",
-                    "template_name": template_name,
-                    "language": language,
-                    "components": components
-                }
-                
-                resp = await client.post(
-                    f"{WHATSAPP_SERVICE_URL}/send",
-                    json=payload,
-                    headers={"X-Internal-Token": INTERNAL_API_TOKEN, "X-Correlation-Id": str(uuid_lib.uuid4())},
-                    params={"from_number": bot_phone}
-                )
-                
-                if resp.status_code == 200:
-                    # Mark as sent
-                    await db.pool.execute(
-                        "UPDATE leads SET outreach_message_sent = TRUE, outreach_last_sent_at = NOW(), outreach_message_content = $1 WHERE id = $2 AND tenant_id = $3",
-                        f"Template: {template_name}", lead["id"], tenant_id
-                    )
-                    logger.info(f"outreach_sent_success: phone={phone}, lead_id={str(lead['id'])}")
-                else:
-                    logger.error(f"outreach_sent_failed: phone={phone}, status={resp.status_code}, body={resp.text[:200]}")
-                    
-            except Exception as e:
-                logger.error(f"outreach_error: phone={phone}, error={str(e)}")
-            
-            # Rate limiting / Sleep to avoid spam blocks
-            await asyncio.sleep(1.5)
-
-    logger.info(f"outreach_background_complete: tenant_id={tenant_id}")
-
-
-@router.post("/prospecting/scrape")
+@router.post("/prospecting/scrape", status_code=202)
 async def run_prospecting_scrape(
     payload: ProspectingScrapeRequest,
     context: dict = Depends(get_current_user_context),
     allowed_ids: List[int] = Depends(get_allowed_tenant_ids),
 ):
     """
-    Runs Apify Google Places scrape and inserts leads by (tenant_id, phone_number).
-    - Skips / preserves existing leads (ON CONFLICT DO NOTHING).
-    - If Apify has no phone but has a website, scrapes the site for the phone.
-    - Infers country dial code from the location query.
+    Queues an Apify Google Places scrape as a prospecting job and returns its id immediately.
+    Leads are upserted by (tenant_id, phone_number); items without phone get a website crawl.
+    Progress: GET /prospecting/jobs/{job_id} or Socket.IO PROSPECTING_JOB_PROGRESS.
     CEO only.
     """
     role = context.get("role") or context.get("user_role") or ""
@@ -1088,228 +861,101 @@ async def run_prospecting_scrape(
         raise HTTPException(status_code=403, detail="Solo el rol CEO puede ejecutar prospeccion")
 
     tenant_id = _resolve_target_tenant_id(context, allowed_ids, payload.tenant_id)
-    logger.info(f"🚀 Iniciando prospección Apify: niche={payload.niche}, location={payload.location}, tenant={tenant_id}")
-
-    apify_token = os.getenv("APIFY_API_TOKEN")
-    if not apify_token:
+    if not os.getenv("APIFY_API_TOKEN"):
         logger.error("❌ APIFY_API_TOKEN no encontrado en el entorno")
         raise HTTPException(status_code=500, detail="Missing APIFY_API_TOKEN in environment")
 
-    default_cc = _infer_country_code(payload.location)
-    logger.info(f"📍 Country code inferido: {default_cc}")
-
-    apify_body = {
-        "includeWebResults": True,
-        "language": "en",
-        "locationQuery": payload.location,
-        "maxCrawledPlacesPerSearch": payload.max_places,
-        "maxImages": 0,
-        "maximumLeadsEnrichmentRecords": 0,
-        "scrapeContacts": False,
-        "scrapeDirectories": False,
-        "scrapeImageAuthors": False,
-        "scrapePlaceDetailPage": False,
-        "scrapeReviewsPersonalData": True,
-        "scrapeTableReservationProvider": False,
-        "searchStringsArray": [payload.niche.lower().strip()],
-        "skipClosedPlaces": False,
-    }
-
-    try:
-        logger.info(f"📡 Iniciando Apify Run: {APIFY_ACTOR_URL.replace('/run-sync-get-dataset-items', '')}")
-        # 1. Start Actor Run
-        run_url = APIFY_ACTOR_URL.replace("/run-sync-get-dataset-items", "/runs")
-        async with httpx.AsyncClient(timeout=310.0) as client:
-            resp = await client.post(
-                run_url,
-                params={"token": apify_token},
-                json=apify_body,
-            )
-            resp.raise_for_status()
-            run_data = resp.json().get("data", {})
-            run_id = run_data.get("id")
-            dataset_id = run_data.get("defaultDatasetId")
-            
-            if not run_id:
-                raise HTTPException(status_code=502, detail="Failed to start Apify run (no run_id)")
-
-            # 2. Polling loop: Wait for SUCCEEDED (max 300s)
-            import asyncio
-            start_time = asyncio.get_event_loop().time()
-            max_wait = 300
-            run_status = run_data.get("status")
-
-            logger.info(f"⏳ Esperando finalización de Apify Run {run_id} (status={run_status})...")
-            
-            while run_status not in ["SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"]:
-                await asyncio.sleep(5) # Reduced from 10s to 5s for better responsiveness
-                status_resp = await client.get(
-                    f"https://api.apify.com/v2/actor-runs/{run_id}",
-                    params={"token": apify_token}
-                )
-                status_resp.raise_for_status()
-                run_data = status_resp.json().get("data", {})
-                run_status = run_data.get("status")
-                
-                elapsed = asyncio.get_event_loop().time() - start_time
-                if elapsed > max_wait:
-                    logger.warning(f"⏰ Timeout alcanzado esperando Apify run {run_id} ({int(elapsed)}s)")
-                    break
-                
-                # Log progress every 10s or on status change
-                logger.info(f"🔄 Check Apify {run_id}: {run_status} ({int(elapsed)}s)")
-
-            if run_status != "SUCCEEDED":
-                logger.warning(f"⚠️ Apify run finalizó con estado: {run_status}. Intentando obtener items parciales...")
-            
-            if not dataset_id:
-                dataset_id = run_data.get("defaultDatasetId")
-            
-            if not dataset_id:
-                raise HTTPException(status_code=502, detail="Apify run did not provide a dataset ID")
-
-            # 3. Get Dataset Items
-            items_url = f"https://api.apify.com/v2/datasets/{dataset_id}/items"
-            items_resp = await client.get(items_url, params={"token": apify_token})
-            items_resp.raise_for_status()
-            items = items_resp.json() if isinstance(items_resp.json(), list) else []
-            logger.info(f"✅ Apify respondió con {len(items)} items del dataset {dataset_id}")
-
-    except httpx.HTTPError as e:
-        logger.error(f"❌ Error en llamada a Apify: {e}")
-        raise HTTPException(status_code=502, detail=f"Apify request failed: {e}")
-
-    imported = 0
-    skipped_no_phone = 0
-    skipped_exists = 0
-    fetched_from_web = 0
-
-    for item in items:
-        # 1) Get phone from Apify directly
-        raw_phone = item.get("phoneUnformatted") or item.get("phone")
-        phone = _normalize_phone_e164(raw_phone, default_cc) if raw_phone else None
-
-        # 2) Website fallback
-        if not phone:
-            website = item.get("website") or ""
-            if not website and item.get("webResults"):
-                website = (item["webResults"][0] or {}).get("url", "")
-            if website:
-                phone = await _extract_phone_from_website(website, default_cc)
-                if phone:
-                    fetched_from_web += 1
-
-        if not phone:
-            skipped_no_phone += 1
-            continue
-
-        title = (item.get("title") or "").strip() or None
-        first_name = title[:100] if title else None
-
-        social_links = _extract_social_links(item)
-
-        scraped_at_iso = item.get("scrapedAt")
-        scraped_at = None
-        if isinstance(scraped_at_iso, str) and scraped_at_iso:
-            try:
-                scraped_at = datetime.fromisoformat(scraped_at_iso.replace("Z", "+00:00"))
-            except ValueError:
-                pass
-
-        # 3) UPSERT — Enrich if exists, preserve name if from WhatsApp
-        # Source differentiation: we only overwrite 'source' if it was originally 'apify_scrape'
-        # or if the existing record has no source.
-        result = await db.pool.execute(
-            """
-            INSERT INTO leads (
-                tenant_id, phone_number, first_name, email, status, source, tags, social_links,
-                apify_title, apify_category_name, apify_address, apify_city, apify_state, apify_country_code,
-                apify_website, apify_place_id, apify_total_score, apify_reviews_count, apify_scraped_at, apify_raw,
-                apify_rating, apify_reviews,
-                prospecting_niche, prospecting_location_query,
-                outreach_message_sent, outreach_send_requested,
-                created_at, updated_at
-            )
-            VALUES (
-                $1, $2, $3, $19, 'new', 'apify_scrape', '[]'::jsonb, $18::jsonb,
-                $4, $5, $6, $7, $8, $9,
-                $10, $11, $12, $13, $14, $15::jsonb,
-                $20, $21,
-                $16, $17,
-                FALSE, FALSE,
-                NOW(), NOW()
-            )
-            ON CONFLICT (tenant_id, phone_number)
-            DO UPDATE SET
-                -- Enriquecimiento: Solo actualizamos si el campo actual está vacío o es de prospección
-                social_links = CASE 
-                    WHEN leads.social_links IS NULL OR leads.social_links = '{}'::jsonb THEN EXCLUDED.social_links 
-                    ELSE leads.social_links || EXCLUDED.social_links 
-                END,
-                email = COALESCE(leads.email, EXCLUDED.email),
-                apify_title = COALESCE(leads.apify_title, EXCLUDED.apify_title),
-                apify_category_name = COALESCE(leads.apify_category_name, EXCLUDED.apify_category_name),
-                apify_address = COALESCE(leads.apify_address, EXCLUDED.apify_address),
-                apify_city = COALESCE(leads.apify_city, EXCLUDED.apify_city),
-                apify_state = COALESCE(leads.apify_state, EXCLUDED.apify_state),
-                apify_country_code = COALESCE(leads.apify_country_code, EXCLUDED.apify_country_code),
-                apify_website = COALESCE(leads.apify_website, EXCLUDED.apify_website),
-                apify_place_id = COALESCE(leads.apify_place_id, EXCLUDED.apify_place_id),
-                apify_total_score = EXCLUDED.apify_total_score,
-                apify_reviews_count = EXCLUDED.apify_reviews_count,
-                apify_rating = EXCLUDED.apify_rating,
-                apify_reviews = EXCLUDED.apify_reviews,
-                apify_scraped_at = EXCLUDED.apify_scraped_at,
-                apify_raw = EXCLUDED.apify_raw,
-                prospecting_niche = COALESCE(leads.prospecting_niche, EXCLUDED.prospecting_niche),
-                prospecting_location_query = COALESCE(leads.prospecting_location_query, EXCLUDED.prospecting_location_query),
-                updated_at = NOW()
-            """,
-            tenant_id,
-            phone,
-            first_name,
-            title,
-            item.get("categoryName"),
-            item.get("address"),
-            item.get("city"),
-            item.get("state"),
-            item.get("countryCode"),
-            item.get("website"),
-            item.get("placeId"),
-            item.get("totalScore"),
-            item.get("reviewsCount"),
-            scraped_at,
-            json.dumps(item),
-            payload.niche,
-            payload.location,
-            json.dumps(social_links),
-            item.get("email"),
-            item.get("totalScore"),
-            item.get("reviewsCount")
-        )
-        if result == "INSERT 0 1":
-            imported += 1
-        elif result == "UPDATE 1":
-            # Si se actualizó, técnicamente no es un 'bruto' nuevo, pero lo contamos como enriquecido
-            imported += 1 
-        else:
-            skipped_exists += 1
-
-    logger.info(f"🏁 Scraping finalizado: total={len(items)}, importados={imported}, sin_tel={skipped_no_phone}, duplicados={skipped_exists}")
+    default_cc = infer_country_code(payload.location)
+    user_id = context.get("user_id") or context.get("id")
+    job = await prospecting_job_runner.create_job(
+        tenant_id, payload.niche, payload.location, payload.max_places, default_cc,
+        created_by=UUID(str(user_id)) if user_id else None
+    )
+    logger.info(f"🚀 Prospección encolada: job={job['id']}, niche={payload.niche}, location={payload.location}, tenant={tenant_id}")
 
     return {
+        "job_id": str(job["id"]),
+        "status": job["status"],
         "tenant_id": tenant_id,
         "niche": payload.niche,
         "location": payload.location,
         "country_code_inferred": default_cc,
-        "total_results": len(items),
-        "imported": imported,
-        "skipped_no_phone": skipped_no_phone,
-        "skipped_already_exists": skipped_exists,
-        "fetched_from_web": fetched_from_web,
     }
 
 
+@router.get("/prospecting/jobs")
+async def list_prospecting_jobs(
+    tenant_id_override: int = Query(..., description="Tenant to query"),
+    limit: int = Query(20, ge=1, le=100),
+    context: dict = Depends(get_current_user_context),
+    allowed_ids: List[int] = Depends(get_allowed_tenant_ids),
+):
+    tenant_id = _resolve_target_tenant_id(context, allowed_ids, tenant_id_override)
+    return await prospecting_job_runner.list_jobs(tenant_id, limit=limit)
+
+
+@router.get("/prospecting/jobs/{job_id}")
+async def get_prospecting_job(
+    job_id: UUID,
+    tenant_id_override: int = Query(..., description="Tenant to query"),
+    context: dict = Depends(get_current_user_context),
+    allowed_ids: List[int] = Depends(get_allowed_tenant_ids),
+):
+    tenant_id = _resolve_target_tenant_id(context, allowed_ids, tenant_id_override)
+    job = await prospecting_job_runner.get_job(job_id, tenant_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/prospecting/jobs/{job_id}/cancel")
+async def cancel_prospecting_job(
+    job_id: UUID,
+    tenant_id_override: int = Query(..., description="Tenant to query"),
+    context: dict = Depends(get_current_user_context),
+    allowed_ids: List[int] = Depends(get_allowed_tenant_ids),
+):
+    role = context.get("role") or context.get("user_role") or ""
+    if role != "ceo":
+        raise HTTPException(status_code=403, detail="Solo el rol CEO puede cancelar prospeccion")
+    tenant_id = _resolve_target_tenant_id(context, allowed_ids, tenant_id_override)
+    job = await prospecting_job_runner.cancel_job(job_id, tenant_id)
+    if not job:
+        raise HTTPException(status_code=409, detail="Job not found or already finished")
+    return job
+
+
+@router.get("/prospecting/outreach-jobs/{job_id}")
+async def get_outreach_job(
+    job_id: UUID,
+    tenant_id_override: int = Query(..., description="Tenant to query"),
+    context: dict = Depends(get_current_user_context),
+    allowed_ids: List[int] = Depends(get_allowed_tenant_ids),
+):
+    tenant_id = _resolve_target_tenant_id(context, allowed_ids, tenant_id_override)
+    job = await outreach_dispatcher.get_job(job_id, tenant_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/prospecting/outreach-jobs/{job_id}/cancel")
+async def cancel_outreach_job(
+    job_id: UUID,
+    tenant_id_override: int = Query(..., description="Tenant to query"),
+    context: dict = Depends(get_current_user_context),
+    allowed_ids: List[int] = Depends(get_allowed_tenant_ids),
+):
+    role = context.get("role") or context.get("user_role") or ""
+    if role != "ceo":
+        raise HTTPException(status_code=403, detail="Solo el rol CEO puede cancelar envios de prospeccion")
+    tenant_id = _resolve_target_tenant_id(context, allowed_ids, tenant_id_override)
+    job = await outreach_dispatcher.cancel_job(job_id, tenant_id)
+    if not job:
+        raise HTTPException(status_code=409, detail="Job not found or already finished")
+    return job
+
+
 @router.get("/prospecting/leads", response_model=List[ProspectingLeadResponse])
 async def list_prospecting_leads(
     tenant_id_override: int = Query(..., description="Tenant to query"),
@@ -1372,7 +1018,6 @@ async def get_prospecting_templates(
 @router.post("/prospecting/request-send")
 async def request_prospecting_send(
     payload: ProspectingSendRequest,
-    from_fastapi_bg: BackgroundTasks,
     context: dict = Depends(get_current_user_context),
     allowed_ids: List[int] = Depends(get_allowed_tenant_ids),
 ):
@@ -1403,7 +1048,7 @@ async def request_prospecting_send(
               AND id = ANY($2::uuid[])
               AND (status IS NULL OR status != 'deleted')
               AND ($3::bool = FALSE OR outreach_message_sent = FALSE)
-              AND phone_number ~ '^\d{8,15}$'
+              AND phone_e164 ~ '^\d{8,15}$'
             """,
             tenant_id,
             ids,
@@ -1420,7 +1065,7 @@ async def request_prospecting_send(
               AND source = 'apify_scrape'
               AND (status IS NULL OR status != 'deleted')
               AND ($2::bool = FALSE OR outreach_message_sent = FALSE)
-              AND phone_number ~ '^\d{8,15}$'
+              AND phone_e164 ~ '^\d{8,15}$'
             """,
             tenant_id,
             payload.only_pending,
@@ -1428,17 +1073,24 @@ async def request_prospecting_send(
 
     updated_count = int(result.split(" ")[1]) if isinstance(result, str) and " " in result else 0
     
-    # PHASE 3: If template_name is provided, trigger the background task
+    # PHASE 3: If template_name is provided, enqueue a persisted outreach job (rate-limited, resumable)
     if payload.template_name:
-        from_fastapi_bg.add_task(
-            _send_prospecting_outreach_background,
-            tenant_id=tenant_id,
-            template_name=payload.template_name,
-            language=payload.language or "es_AR",
-            lead_ids=[str(x) for x in payload.lead_ids] if payload.lead_ids else None,
-            only_pending=payload.only_pending
-        )
-        return {"status": "sending", "tenant_id": tenant_id, "updated": updated_count, "template": payload.template_name}
+        user_id = context.get("user_id") or context.get("id")
+        try:
+            job = await outreach_dispatcher.create_job(
+                tenant_id,
+                payload.template_name,
+                payload.language or "es_AR",
+                recipient_filter=prospecting_recipient_filter(payload.lead_ids, payload.only_pending, param_idx=3),
+                kind="prospecting",
+                created_by=UUID(str(user_id)) if user_id else None,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {
+            "status": "sending", "tenant_id": tenant_id, "updated": updated_count,
+            "template": payload.template_name, "job_id": str(job["id"]), "total": job["total"],
+        }
 
     return {"status": "queued_placeholder", "tenant_id": tenant_id, "updated": updated_count}
 
@@ -1555,25 +1207,24 @@ async def launch_campaign(
     context: dict = Depends(get_current_user_context)
 ):
     """
-    Launch a campaign (placeholder).
-    Future implementation will queue messages for sending.
+    Launch a campaign: compiles target_segment and starts a paced outreach job.
+    If scheduled_at is in the future and immediate=False, the campaign is only scheduled.
     """
     tenant_id = context["tenant_id"]
-    
-    row = await db.pool.fetchrow("""
-        UPDATE campaigns
-        SET status = 'sending', started_at = NOW()
-        WHERE id = $1 AND tenant_id = $2
-        RETURNING id, tenant_id, name, template_id, target_segment, status, stats,
-                  scheduled_at, started_at, completed_at, created_at, updated_at
-    """, campaign_id, tenant_id)
-    
+    user_id = context.get("user_id") or context.get("id")
+
+    try:
+        row = await campaign_service.launch(
+            tenant_id, campaign_id, immediate=request.immediate,
+            created_by=UUID(str(user_id)) if user_id else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     if not row:
         raise HTTPException(status_code=404, detail="Campaign not found")
-    
-    # TODO: Implement actual campaign launch logic (queue messages)
-    
-    return dict(row)
+
+    return row
 
 
 # ============================================
@@ -1682,6 +1333,8 @@ async def update_seller(
     updates.append("updated_at = NOW()")
     set_clause = ", ".join(updates)
     await db.pool.execute(f"UPDATE sellers SET {set_clause} WHERE id = ${where_idx} AND tenant_id = ${where_tenant_idx}", *params)
+    from services.seller_assignment_service import invalidate_assignment_plan
+    invalidate_assignment_plan(row["tenant_id"])
     return {"id": id, "status": "updated"}
 
 
@@ -1780,6 +1433,7 @@ async def create_seller(
         INSERT INTO professionals (tenant_id, user_id, first_name, last_name, email, phone_number, is_active, created_at, updated_at)
         VALUES ($1, $2, $3, $4, $5, $6, TRUE, NOW(), NOW())
     """, tenant_id, uid, first_name, last_name, payload.email, (payload.phone_number or "").strip() or None)
+    invalidate_user_identity(uid)
     return {"status": "created", "user_id": str(uid)}
 
 
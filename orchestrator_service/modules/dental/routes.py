@@ -12,8 +12,9 @@ from db import db
 from gcal_service import gcal_service
 from analytics_service import analytics_service
 
-from core.security import verify_admin_token, get_resolved_tenant_id, get_allowed_tenant_ids, audit_access
+from core.security import verify_admin_token, get_resolved_tenant_id, get_allowed_tenant_ids, audit_access, invalidate_user_identity
 from core.rate_limiter import limiter
+from core.credentials import invalidate_tenant_credentials
 from core.utils import normalize_phone, encrypt_credential, ARG_TZ
 
 logger = logging.getLogger(__name__)
@@ -368,6 +369,7 @@ async def create_professional(professional: ProfessionalCreate, resolved_tenant_
         """, tenant_id, user_id, first_name, last_name, email, professional.phone, professional.specialty, professional.license_number, professional.is_active, wh_json)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    invalidate_user_identity(user_id)
     return {"status": "created", "user_id": str(user_id)}
 
 @router.put("/professionals/{id}", dependencies=[Depends(verify_admin_token)], tags=["Profesionales"])
@@ -427,6 +429,7 @@ async def connect_sovereign_calendar(payload: ConnectSovereignPayload, allowed_i
         await db.pool.execute("UPDATE credentials SET value = $1 WHERE tenant_id = $2 AND category = 'google_calendar' AND name = 'access_token'", encrypted, tenant_id)
     else:
         await db.pool.execute("INSERT INTO credentials (name, value, category, scope, tenant_id, description) VALUES ('access_token', $1, 'google_calendar', 'tenant', $2, 'Auth0 Token')", encrypted, tenant_id)
+    invalidate_tenant_credentials(tenant_id)
     
     await db.pool.execute("UPDATE tenants SET config = COALESCE(config, '{}')::jsonb || jsonb_build_object('calendar_provider', 'google'), updated_at = NOW() WHERE id = $1", tenant_id)
     return {"status": "connected", "tenant_id": tenant_id, "calendar_provider": "google"}
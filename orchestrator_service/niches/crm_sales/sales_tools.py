@@ -14,7 +14,7 @@ from dateutil.parser import parse as dateutil_parse
 
 from db import db
 from core.context import current_tenant_id, current_customer_phone
-from core.utils import normalize_phone, ARG_TZ
+from core.utils import normalize_phone, phone_lookup_key, ARG_TZ
 
 logger = logging.getLogger(__name__)
 
@@ -161,9 +161,9 @@ async def book_sales_meeting(
 
         # Obtener o crear LEAD (no cliente). Al agendar se convierte en lead.
         existing = await db.pool.fetchrow(
-            "SELECT id FROM leads WHERE tenant_id = $1 AND phone_number = $2",
+            "SELECT id FROM leads WHERE tenant_id = $1 AND phone_e164 = $2",
             tenant_id,
-            phone,
+            phone_lookup_key(phone),
         )
         if existing:
             lead_id = existing["id"]
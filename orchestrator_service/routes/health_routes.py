@@ -281,4 +281,21 @@ async def liveness_probe():
         # Verificación simple de que la aplicación responde
         return {"status": "alive", "timestamp": datetime.utcnow().isoformat()}
     except Exception as e:
-        return {"status": "dead", "error": str(e)}
\ No newline at end of file
+        return {"status": "dead", "error": str(e)}
+
+
+@router.get("/audit")
+async def audit_sink_status():
+    """
+    Métricas del audit sink (cola de system_events): encolados, escritos, descartados
+    """
+    from core.audit_sink import audit_sink
+    return audit_sink.stats()
+
+@router.get("/rate-limits")
+async def rate_limiter_status():
+    """
+    Decisiones del rate limiter por backend (redis / local) y errores de Redis
+    """
+    from core.rate_limiter import limiter
+    return limiter.stats()
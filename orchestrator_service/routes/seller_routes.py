@@ -8,7 +8,7 @@ from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel, Field
 
 from core.security import verify_admin_token, get_resolved_tenant_id, require_role
-from services.seller_assignment_service import seller_assignment_service
+from services.seller_assignment_service import seller_assignment_service, invalidate_assignment_plan
 from services.seller_metrics_service import seller_metrics_service
 
 logger = logging.getLogger(__name__)
@@ -27,6 +27,13 @@ class ReassignConversationRequest(BaseModel):
     new_seller_id: UUID = Field(..., description="ID of the new seller")
     reason: Optional[str] = Field(None, description="Reason for reassignment")
 
+class BulkReassignRequest(BaseModel):
+    phones: Optional[List[str]] = Field(None, description="Phone numbers of the conversations to move")
+    from_seller_id: Optional[UUID] = Field(None, description="Move the conversations currently held by this seller")
+    strategy: str = Field(default="seller", description="Target strategy: seller, round_robin, load_balance")
+    target_seller_id: Optional[UUID] = Field(None, description="Target seller (strategy 'seller')")
+    reason: Optional[str] = Field(None, description="Reason for reassignment")
+
 class AssignmentRuleCreate(BaseModel):
     rule_name: str = Field(..., description="Name of the rule")
     rule_type: str = Field(..., description="Type: round_robin, performance, specialty, load_balance")
@@ -129,6 +136,37 @@ async def reassign_conversation(
         logger.error(f"Error reassigning conversation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/conversations/bulk-reassign")
+async def bulk_reassign_conversations(
+    request: BulkReassignRequest,
+    tenant_id: int = Depends(get_resolved_tenant_id),
+    user_data = Depends(require_role(["ceo"]))
+):
+    """
+    Reassign many conversations at once (e.g. a departing seller's book of business). CEO only.
+    """
+    try:
+        result = await seller_assignment_service.bulk_reassign_conversations(
+            tenant_id=tenant_id,
+            reassigned_by=UUID(user_data.user_id),
+            strategy=request.strategy,
+            phones=request.phones,
+            from_seller_id=request.from_seller_id,
+            target_seller_id=request.target_seller_id,
+            reason=request.reason
+        )
+        
+        if not result["success"]:
+            raise HTTPException(status_code=400, detail=result["message"])
+        
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in bulk reassignment: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/conversations/{phone}/auto-assign")
 async def auto_assign_conversation(
     phone: str,
@@ -337,6 +375,7 @@ async def create_assignment_rule(
             request.apply_to_seller_roles, request.max_conversations_per_seller,
             request.min_response_time_seconds
         )
+        invalidate_assignment_plan(tenant_id)
         
         return {"success": True, "rule_id": str(rule_id), "message": "Rule created successfully"}
         
@@ -385,6 +424,7 @@ async def update_assignment_rule(
         
         if updated == "UPDATE 0":
             raise HTTPException(status_code=404, detail="Rule not found")
+        invalidate_assignment_plan(tenant_id)
         
         return {"success": True, "message": "Rule updated successfully"}
         
@@ -416,6 +456,7 @@ async def delete_assignment_rule(
         
         if deleted == "DELETE 0":
             raise HTTPException(status_code=404, detail="Rule not found")
+        invalidate_assignment_plan(tenant_id)
         
         return {"success": True, "message": "Rule deleted successfully"}
         
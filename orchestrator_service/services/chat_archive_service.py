@@ -0,0 +1,244 @@
+"""
+Chat Archive Service - Cold storage para historial conversacional.
+
+Exporta filas antiguas de chat_messages / inbound_messages / system_events a
+archivos NDJSON comprimidos (gzip) particionados por tenant/mes y luego las
+elimina de las tablas calientes en lotes. Cada archivo queda registrado en
+`chat_archive_segments`, que actúa como catálogo para lecturas bajo demanda.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import mmap
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+CHAT_ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR", "/app/data/archive")
+CHAT_RETENTION_DAYS = int(os.getenv("CHAT_RETENTION_DAYS", "180"))
+CHAT_ARCHIVE_BATCH_SIZE = int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", "5000"))
+
+# Definición de cada tabla archivable: columna temporal, expresión de tenant y columna de teléfono.
+# inbound_messages no tiene tenant_id propio; se toma del payload cuando existe (0 = desconocido).
+ARCHIVE_TABLES: Dict[str, Dict[str, Optional[str]]] = {
+    "chat_messages": {
+        "ts": "created_at",
+        "tenant": "COALESCE(tenant_id, 0)",
+        "phone": "from_number",
+    },
+    "inbound_messages": {
+        "ts": "received_at",
+        "tenant": "CASE WHEN payload->>'tenant_id' ~ '^[0-9]+$' THEN (payload->>'tenant_id')::int ELSE 0 END",
+        "phone": "from_number",
+    },
+    "system_events": {
+        "ts": "created_at",
+        "tenant": "COALESCE(tenant_id, 0)",
+        "phone": None,
+    },
+}
+
+
+class ArchivedSegmentReader:
+    """
+    Lector perezoso de un segmento NDJSON.gz.
+    El archivo se mapea en memoria y se descomprime en streaming, de modo que
+    solo se materializan las filas que el caller consume.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with open(self.path, "rb") as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                return
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with gzip.GzipFile(fileobj=mm, mode="rb") as gz:
+                    for line in gz:
+                        if line.strip():
+                            yield json.loads(line)
+
+
+class ChatArchiveService:
+    """Archiva conversaciones frías y las sirve bajo demanda."""
+
+    def __init__(self, base_dir: str = CHAT_ARCHIVE_DIR, batch_size: int = CHAT_ARCHIVE_BATCH_SIZE):
+        self.base_dir = base_dir
+        self.batch_size = batch_size
+
+    # ------------------------------------------------------------------ #
+    # Escritura
+    # ------------------------------------------------------------------ #
+    async def _get_retention_by_tenant(self) -> Dict[int, int]:
+        """Retención por tenant desde tenants.config->chat_retention_days (fallback global)."""
+        retention: Dict[int, int] = {}
+        rows = await db.pool.fetch("SELECT id, config FROM tenants")
+        for row in rows:
+            config = row["config"] or {}
+            if isinstance(config, str):
+                try:
+                    config = json.loads(config)
+                except ValueError:
+                    config = {}
+            try:
+                days = int(config.get("chat_retention_days") or CHAT_RETENTION_DAYS)
+            except (TypeError, ValueError):
+                days = CHAT_RETENTION_DAYS
+            retention[row["id"]] = max(days, 1)
+        return retention
+
+    def _segment_path(self, table: str, tenant_id: int, month: str) -> str:
+        directory = os.path.join(self.base_dir, table, f"tenant={tenant_id}", f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"part-{uuid.uuid4().hex}.ndjson.gz")
+
+    @staticmethod
+    def _write_segment(path: str, rows: List[Dict[str, Any]]) -> None:
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as gz:
+            for row in rows:
+                gz.write(json.dumps(row, default=str, ensure_ascii=False))
+                gz.write("\n")
+        os.replace(tmp_path, path)
+
+    async def _archive_batch(self, table: str, tenant_id: int, cutoff: datetime) -> int:
+        """Archiva un lote (un mes de un tenant) y lo elimina de la tabla caliente. Retorna filas movidas."""
+        spec = ARCHIVE_TABLES[table]
+        ts_col, tenant_expr = spec["ts"], spec["tenant"]
+
+        # Un segmento nunca cruza meses: se toma el mes más antiguo pendiente.
+        month_start = await db.pool.fetchval(f"""
+            SELECT date_trunc('month', MIN({ts_col}) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+            FROM {table} WHERE {tenant_expr} = $1 AND {ts_col} < $2
+        """, tenant_id, cutoff)
+        if month_start is None:
+            return 0
+
+        rows = await db.pool.fetch(f"""
+            SELECT * FROM {table}
+            WHERE {tenant_expr} = $1
+              AND {ts_col} >= $2
+              AND {ts_col} < LEAST($2 + INTERVAL '1 month', $3)
+            ORDER BY {ts_col}, id
+            LIMIT $4
+        """, tenant_id, month_start, cutoff, self.batch_size)
+        if not rows:
+            return 0
+
+        month = month_start.strftime("%Y-%m")
+        records = [dict(r) for r in rows]
+
+        path = self._segment_path(table, tenant_id, month)
+        # gzip + serialización JSON son CPU/IO bloqueantes: fuera del event loop.
+        await asyncio.to_thread(self._write_segment, path, records)
+
+        ids = [r["id"] for r in records]
+        phone_col = spec["phone"]
+        phones = sorted({r[phone_col] for r in records if r.get(phone_col)}) if phone_col else []
+
+        try:
+            async with db.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("""
+                        INSERT INTO chat_archive_segments
+                        (tenant_id, table_name, month, path, row_count, min_ts, max_ts, phone_numbers)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                    """, tenant_id, table, month, path, len(records),
+                        records[0][ts_col], records[-1][ts_col], phones)
+                    await conn.execute(f"DELETE FROM {table} WHERE id = ANY($1::bigint[])", ids)
+        except Exception:
+            # Sin registro en el catálogo el archivo es huérfano: se descarta y las filas siguen calientes.
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            raise
+        return len(records)
+
+    async def archive_table(self, table: str, retention: Optional[Dict[int, int]] = None) -> int:
+        if table not in ARCHIVE_TABLES:
+            raise ValueError(f"Tabla no archivable: {table}")
+        retention = retention if retention is not None else await self._get_retention_by_tenant()
+        spec = ARCHIVE_TABLES[table]
+        now = datetime.now(timezone.utc)
+
+        tenant_ids = [
+            r["tenant_id"] for r in await db.pool.fetch(
+                f"SELECT DISTINCT {spec['tenant']} AS tenant_id FROM {table} WHERE {spec['ts']} < $1",
+                now - timedelta(days=min(list(retention.values()) + [CHAT_RETENTION_DAYS]))
+            )
+        ]
+
+        total = 0
+        for tenant_id in tenant_ids:
+            cutoff = now - timedelta(days=retention.get(tenant_id, CHAT_RETENTION_DAYS))
+            while True:
+                moved = await self._archive_batch(table, tenant_id, cutoff)
+                if not moved:
+                    break
+                total += moved
+        return total
+
+    async def archive_all(self) -> Dict[str, int]:
+        """Job de archivado: procesa todas las tablas configuradas."""
+        retention = await self._get_retention_by_tenant()
+        results: Dict[str, int] = {}
+        for table in ARCHIVE_TABLES:
+            try:
+                results[table] = await self.archive_table(table, retention)
+            except Exception as e:
+                logger.error(f"❌ Error archivando {table}: {e}")
+                results[table] = -1
+        logger.info(f"🧊 Archivado de conversaciones completado: {results}")
+        return results
+
+    # ------------------------------------------------------------------ #
+    # Lectura
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _read_segment(path: str, phone: str) -> Optional[List[Dict[str, Any]]]:
+        """Filas del teléfono en un segmento, más recientes primero. None si el archivo no existe."""
+        if not os.path.exists(path):
+            return None
+        matches = [r for r in ArchivedSegmentReader(path) if r.get("from_number") == phone]
+        matches.sort(key=lambda r: (r.get("created_at") or "", r.get("id") or 0), reverse=True)
+        return matches
+
+    async def get_archived_chat_messages(
+        self, phone: str, tenant_id: int, limit: int, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Mensajes archivados de una conversación, más recientes primero
+        (misma semántica que la query caliente ORDER BY created_at DESC LIMIT/OFFSET).
+        Solo se abren los segmentos necesarios para cubrir offset + limit.
+        """
+        if limit <= 0:
+            return []
+        segments = await db.pool.fetch("""
+            SELECT path, row_count FROM chat_archive_segments
+            WHERE table_name = 'chat_messages' AND tenant_id = $1 AND phone_numbers @> ARRAY[$2]::text[]
+            ORDER BY max_ts DESC, id DESC
+        """, tenant_id, phone)
+
+        needed = offset + limit
+        collected: List[Dict[str, Any]] = []
+        for seg in segments:
+            # mmap + gunzip + json.loads en un hilo; solo vuelven las filas del teléfono.
+            matches = await asyncio.to_thread(self._read_segment, seg["path"], phone)
+            if matches is None:
+                logger.warning(f"⚠️ Segmento archivado no encontrado: {seg['path']}")
+                continue
+            collected.extend(matches)
+            if len(collected) >= needed:
+                break
+        return collected[offset:needed]
+
+
+chat_archive_service = ChatArchiveService()
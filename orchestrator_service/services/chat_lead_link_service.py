@@ -0,0 +1,143 @@
+"""
+Chat Lead Link Service - Vincula chat_messages.lead_id con el lead del mismo teléfono.
+
+Los mensajes nuevos ya se insertan vinculados (Database.append_chat_message). Este
+servicio rellena el histórico y los mensajes cuyo lead se creó después (p. ej. un
+import masivo), en lotes cortos para no bloquear la tabla. El avance se guarda en
+chat_lead_link_state (Parche 33): cada corrida solo mira mensajes con id mayor al
+último recorrido y leads creados desde la corrida anterior.
+"""
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from uuid import UUID
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+CHAT_LEAD_LINK_BATCH_SIZE = int(os.getenv("CHAT_LEAD_LINK_BATCH_SIZE", "5000"))
+CHAT_LEAD_LINK_PAUSE_SECONDS = float(os.getenv("CHAT_LEAD_LINK_PAUSE_SECONDS", "0.05"))
+# Solapamiento al releer leads nuevos: cubre transacciones que confirmaron después de la marca
+CHAT_LEAD_LINK_OVERLAP_MINUTES = int(os.getenv("CHAT_LEAD_LINK_OVERLAP_MINUTES", "10"))
+
+NIL_UUID = UUID(int=0)
+
+# Un lote de mensajes sin lead (keyset sobre id); si hay más de un lead con la
+# misma clave de teléfono gana el más antiguo, igual que en el INSERT.
+LINK_BATCH_SQL = """
+    WITH batch AS (
+        SELECT id, tenant_id, phone_e164
+        FROM chat_messages
+        WHERE lead_id IS NULL AND id > $1
+        ORDER BY id
+        LIMIT $2
+    ),
+    matches AS (
+        SELECT DISTINCT ON (b.id) b.id, l.id AS lead_id
+        FROM batch b
+        JOIN leads l ON l.tenant_id = b.tenant_id AND l.phone_e164 = b.phone_e164
+        ORDER BY b.id, l.created_at
+    ),
+    linked AS (
+        UPDATE chat_messages cm SET lead_id = m.lead_id
+        FROM matches m
+        WHERE cm.id = m.id
+        RETURNING cm.id
+    )
+    SELECT (SELECT MAX(id) FROM batch) AS last_id, (SELECT COUNT(*) FROM linked) AS linked
+"""
+
+
+# Mensajes sin lead de los leads creados desde la marca (keyset sobre (created_at, id));
+# cada mensaje va al lead más antiguo con su clave, igual que en LINK_BATCH_SQL.
+LINK_NEW_LEADS_SQL = """
+    WITH new_leads AS (
+        SELECT id, tenant_id, phone_e164, created_at
+        FROM leads
+        WHERE (created_at, id) > ($1, $2) AND phone_e164 IS NOT NULL
+        ORDER BY created_at, id
+        LIMIT $3
+    ),
+    matches AS (
+        SELECT DISTINCT ON (cm.id) cm.id, l.id AS lead_id
+        FROM (SELECT DISTINCT tenant_id, phone_e164 FROM new_leads) k
+        JOIN chat_messages cm ON cm.tenant_id = k.tenant_id AND cm.phone_e164 = k.phone_e164 AND cm.lead_id IS NULL
+        JOIN leads l ON l.tenant_id = cm.tenant_id AND l.phone_e164 = cm.phone_e164
+        ORDER BY cm.id, l.created_at
+    ),
+    linked AS (
+        UPDATE chat_messages cm SET lead_id = m.lead_id
+        FROM matches m
+        WHERE cm.id = m.id
+        RETURNING cm.id
+    ),
+    last_lead AS (
+        SELECT created_at, id FROM new_leads ORDER BY created_at DESC, id DESC LIMIT 1
+    )
+    SELECT (SELECT created_at FROM last_lead) AS last_created_at, (SELECT id FROM last_lead) AS last_id,
+           (SELECT COUNT(*) FROM linked) AS linked
+"""
+
+STATE_SQL = """
+    INSERT INTO chat_lead_link_state (id) VALUES (TRUE)
+    ON CONFLICT (id) DO UPDATE SET id = TRUE
+    RETURNING last_message_id, leads_linked_until, NOW() AS now
+"""
+
+
+class ChatLeadLinkService:
+    def __init__(self, batch_size: int = CHAT_LEAD_LINK_BATCH_SIZE, pause_seconds: float = CHAT_LEAD_LINK_PAUSE_SECONDS):
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+
+    async def backfill(self) -> int:
+        """
+        Vincula los mensajes sin lead desde la última corrida (un lote por transacción).
+        La primera corrida recorre todo el histórico; las siguientes, solo mensajes nuevos
+        y los de leads creados desde entonces. Retorna mensajes vinculados.
+        """
+        state = await db.pool.fetchrow(STATE_SQL)
+        first_run = state["leads_linked_until"] is None
+        total = await self._link_new_messages(state["last_message_id"])
+        if not first_run:
+            # El recorrido del histórico ya cubre a los leads existentes en la primera corrida
+            total += await self._link_new_leads(state["leads_linked_until"])
+        await db.pool.execute(
+            "UPDATE chat_lead_link_state SET leads_linked_until = $1, updated_at = NOW() WHERE id",
+            state["now"],
+        )
+        if total:
+            logger.info(f"🔗 chat_messages vinculados a leads: {total}")
+        return total
+
+    async def _link_new_messages(self, last_id: int) -> int:
+        total = 0
+        while True:
+            row = await db.pool.fetchrow(LINK_BATCH_SQL, last_id, self.batch_size)
+            if row["last_id"] is None:
+                break
+            last_id = row["last_id"]
+            total += row["linked"]
+            await db.pool.execute(
+                "UPDATE chat_lead_link_state SET last_message_id = $1, updated_at = NOW() WHERE id", last_id
+            )
+            if self.pause_seconds:
+                await asyncio.sleep(self.pause_seconds)
+        return total
+
+    async def _link_new_leads(self, since) -> int:
+        last_created_at, last_id, total = since - timedelta(minutes=CHAT_LEAD_LINK_OVERLAP_MINUTES), NIL_UUID, 0
+        while True:
+            row = await db.pool.fetchrow(LINK_NEW_LEADS_SQL, last_created_at, last_id, self.batch_size)
+            if row["last_id"] is None:
+                break
+            last_created_at, last_id = row["last_created_at"], row["last_id"]
+            total += row["linked"]
+            if self.pause_seconds:
+                await asyncio.sleep(self.pause_seconds)
+        return total
+
+
+chat_lead_link_service = ChatLeadLinkService()
@@ -0,0 +1,105 @@
+"""
+Lead Export Service - Exportación de leads en streaming (CSV / NDJSON).
+
+La consulta se recorre con un cursor server-side dentro de una transacción de solo
+lectura (snapshot consistente) y se emite por bloques: memoria constante sin importar
+el volumen. PostgreSQL hace la conversión a texto (CSV) o el JSON por fila (NDJSON),
+así Python solo concatena. Un semáforo acota las exportaciones simultáneas para que
+no acaparen el pool de conexiones.
+"""
+import asyncio
+import csv
+import io
+import logging
+import os
+from typing import AsyncIterator, List, Optional, Sequence
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+LEAD_EXPORT_BATCH_SIZE = int(os.getenv("LEAD_EXPORT_BATCH_SIZE", "5000"))
+LEAD_EXPORT_MAX_CONCURRENT = int(os.getenv("LEAD_EXPORT_MAX_CONCURRENT", "2"))
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+# Columnas exportables (whitelist: los nombres se interpolan en el SQL)
+EXPORT_COLUMNS = (
+    "id", "phone_number", "first_name", "last_name", "email",
+    "status", "stage_id", "assigned_seller_id", "source", "lead_source", "tags",
+    "apify_title", "apify_category_name", "apify_address", "apify_city", "apify_state", "apify_country_code",
+    "apify_website", "apify_place_id", "apify_total_score", "apify_reviews_count", "apify_scraped_at",
+    "prospecting_niche", "prospecting_location_query",
+    "outreach_message_sent", "outreach_send_requested", "outreach_last_requested_at", "outreach_last_sent_at",
+    "created_at", "updated_at",
+)
+
+DEFAULT_EXPORT_COLUMNS = (
+    "id", "phone_number", "first_name", "last_name", "email", "status",
+    "assigned_seller_id", "source", "tags", "created_at", "updated_at",
+)
+
+
+def parse_export_columns(columns: Optional[str]) -> List[str]:
+    """Lista de columnas a partir de "a,b,c" (ValueError si alguna no es exportable)."""
+    if not columns or not columns.strip():
+        return list(DEFAULT_EXPORT_COLUMNS)
+    selected = list(dict.fromkeys(c.strip() for c in columns.split(",") if c.strip()))
+    unknown = [c for c in selected if c not in EXPORT_COLUMNS]
+    if unknown or not selected:
+        raise ValueError(f"Columnas no exportables: {', '.join(unknown) or '(vacío)'}")
+    return selected
+
+
+def build_export_query(fmt: str, columns: Sequence[str], filter_sql: str = "") -> str:
+    """SELECT de exportación (tenant en $1, filtros adicionales a continuación), en orden de listado."""
+    if fmt == "ndjson":
+        select = "json_build_object(" + ", ".join(f"'{c}', {c}" for c in columns) + ")::text"
+    else:
+        select = ", ".join(f"{c}::text" for c in columns)
+    return f"""
+        SELECT {select}
+        FROM leads
+        WHERE tenant_id = $1 AND (status IS NULL OR status != 'deleted'){filter_sql}
+        ORDER BY created_at DESC, id DESC
+    """
+
+
+def encode_csv_rows(rows: Sequence[Sequence[Optional[str]]]) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue().encode()
+
+
+def encode_ndjson_rows(rows: Sequence[Sequence[str]]) -> bytes:
+    return ("\n".join(r[0] for r in rows) + "\n").encode()
+
+
+class LeadExportService:
+    def __init__(self, batch_size: int = LEAD_EXPORT_BATCH_SIZE, max_concurrent: int = LEAD_EXPORT_MAX_CONCURRENT):
+        self.batch_size = batch_size
+        self._sem = asyncio.Semaphore(max_concurrent)
+
+    async def stream(
+        self, tenant_id: int, fmt: str, columns: Sequence[str], filter_sql: str = "", filter_params: Sequence = ()
+    ) -> AsyncIterator[bytes]:
+        """Bloques de bytes listos para un StreamingResponse (CSV incluye encabezado)."""
+        query = build_export_query(fmt, columns, filter_sql)
+        encode = encode_ndjson_rows if fmt == "ndjson" else encode_csv_rows
+        exported = 0
+        async with self._sem:
+            async with db.pool.acquire() as conn:
+                async with conn.transaction(isolation="repeatable_read", readonly=True):
+                    cursor = await conn.cursor(query, tenant_id, *filter_params)
+                    if fmt == "csv":
+                        yield encode_csv_rows([columns])
+                    while True:
+                        rows = await cursor.fetch(self.batch_size)
+                        if not rows:
+                            break
+                        exported += len(rows)
+                        yield encode(rows)
+        logger.info(f"📤 Lead export: tenant={tenant_id}, format={fmt}, rows={exported}")
+
+
+lead_export_service = LeadExportService()
@@ -0,0 +1,228 @@
+"""
+Lead Import Service - Alta masiva de leads desde CSV / NDJSON.
+
+El archivo se parsea por lotes (nunca completo en memoria), los teléfonos se
+normalizan a E.164 por lote y cada lote se carga con COPY en una tabla temporal.
+Al final, un único INSERT ... SELECT ... ON CONFLICT aplica todo en `leads`.
+Las filas inválidas (teléfono, email, JSON) y los duplicados dentro del archivo
+se reportan como rechazos con su número de fila.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import re
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from core.utils import normalize_phone_e164
+from db import db
+
+logger = logging.getLogger(__name__)
+
+LEAD_IMPORT_BATCH_SIZE = int(os.getenv("LEAD_IMPORT_BATCH_SIZE", "5000"))
+LEAD_IMPORT_MAX_REJECTS_REPORTED = int(os.getenv("LEAD_IMPORT_MAX_REJECTS_REPORTED", "1000"))
+
+IMPORT_FORMATS = ("csv", "ndjson")
+CONFLICT_MODES = ("skip", "update")
+
+IMPORT_FIELDS = ("phone_number", "first_name", "last_name", "email", "status", "source", "tags")
+STAGE_COLUMNS = ["row_num", *IMPORT_FIELDS]
+
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+CREATE_STAGE_SQL = """
+    CREATE TEMP TABLE lead_import_stage (
+        row_num INTEGER,
+        phone_number TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        email TEXT,
+        status TEXT,
+        source TEXT,
+        tags TEXT
+    ) ON COMMIT DROP
+"""
+
+# Última aparición de cada teléfono gana; las anteriores se reportan como duplicadas
+DUPLICATES_SQL = """
+    SELECT row_num FROM (
+        SELECT row_num, ROW_NUMBER() OVER (PARTITION BY phone_number ORDER BY row_num DESC) AS rn
+        FROM lead_import_stage
+    ) d
+    WHERE rn > 1
+    ORDER BY row_num
+    LIMIT $1
+"""
+
+MERGE_SQL = """
+    WITH src AS (
+        SELECT DISTINCT ON (phone_number) *
+        FROM lead_import_stage
+        ORDER BY phone_number, row_num DESC
+    ),
+    merged AS (
+        INSERT INTO leads (tenant_id, phone_number, first_name, last_name, email, status, source, tags)
+        SELECT $1, phone_number, first_name, last_name, email,
+               COALESCE(status, 'new'), COALESCE(source, 'import'), COALESCE(tags::jsonb, '[]'::jsonb)
+        FROM src
+        ON CONFLICT (tenant_id, phone_number) DO UPDATE SET
+            first_name = COALESCE(EXCLUDED.first_name, leads.first_name),
+            last_name = COALESCE(EXCLUDED.last_name, leads.last_name),
+            email = COALESCE(EXCLUDED.email, leads.email),
+            tags = CASE WHEN EXCLUDED.tags = '[]'::jsonb THEN leads.tags
+                        ELSE (SELECT COALESCE(jsonb_agg(DISTINCT t), '[]'::jsonb)
+                              FROM jsonb_array_elements(COALESCE(leads.tags, '[]'::jsonb) || EXCLUDED.tags) AS t) END,
+            updated_at = NOW()
+        WHERE $2::bool
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT
+        COUNT(*) FILTER (WHERE inserted) AS inserted,
+        COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+        (SELECT COUNT(*) FROM src) - COUNT(*) AS skipped,
+        (SELECT COUNT(*) FROM lead_import_stage) - (SELECT COUNT(*) FROM src) AS duplicates
+    FROM merged
+"""
+
+
+def _clean(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _parse_tags(value: Any) -> Optional[str]:
+    """Tags como lista JSON o texto separado por comas / punto y coma."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        stripped = value.strip()
+        if stripped.startswith("["):
+            value = json.loads(stripped)
+        else:
+            value = re.split(r"[;,]", stripped)
+    if not isinstance(value, list):
+        raise ValueError("tags must be a list")
+    tags = [str(t).strip() for t in value if str(t).strip()]
+    return json.dumps(tags) if tags else None
+
+
+def iter_csv_rows(stream: BinaryIO) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """(row_num, registro, error) por fila de datos; row_num cuenta desde 1 sin el encabezado."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    if not reader.fieldnames or "phone_number" not in [f.strip() for f in reader.fieldnames]:
+        raise ValueError("CSV header must include a 'phone_number' column")
+    for row_num, row in enumerate(reader, start=1):
+        yield row_num, {(k or "").strip(): v for k, v in row.items()}, None
+
+
+def iter_ndjson_rows(stream: BinaryIO) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    row_num = 0
+    for raw in stream:
+        line = raw.strip()
+        if not line:
+            continue
+        row_num += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield row_num, None, "invalid_json"
+            continue
+        if not isinstance(record, dict):
+            yield row_num, None, "invalid_json"
+            continue
+        yield row_num, record, None
+
+
+def to_stage_record(row_num: int, record: Dict[str, Any], default_cc: str) -> Tuple[Optional[tuple], Optional[str]]:
+    """(fila de staging, None) o (None, motivo de rechazo)."""
+    raw_phone = _clean(record.get("phone_number") or record.get("phone"))
+    if not raw_phone:
+        return None, "missing_phone"
+    digits = normalize_phone_e164(raw_phone, default_cc)
+    if not digits:
+        return None, "invalid_phone"
+    # Mismo formato que los leads creados por WhatsApp (+E.164), para que el chat los encuentre
+    phone = "+" + digits
+    email = _clean(record.get("email"))
+    if email and not _EMAIL_RE.match(email):
+        return None, "invalid_email"
+    try:
+        tags = _parse_tags(record.get("tags"))
+    except ValueError:
+        return None, "invalid_tags"
+    return (
+        row_num, phone,
+        _clean(record.get("first_name")), _clean(record.get("last_name")), email,
+        _clean(record.get("status")), _clean(record.get("source")), tags,
+    ), None
+
+
+class LeadImportService:
+    def __init__(self, batch_size: int = LEAD_IMPORT_BATCH_SIZE, max_rejects: int = LEAD_IMPORT_MAX_REJECTS_REPORTED):
+        self.batch_size = batch_size
+        self.max_rejects = max_rejects
+
+    async def import_stream(
+        self, tenant_id: int, stream: BinaryIO, fmt: str, default_cc: str = "54", on_conflict: str = "skip"
+    ) -> Dict[str, Any]:
+        """
+        Importa un archivo completo en una transacción. on_conflict='update' completa datos de
+        leads existentes (sin pisar valores con vacíos); 'skip' los deja intactos.
+        """
+        rows = iter_ndjson_rows(stream) if fmt == "ndjson" else iter_csv_rows(stream)
+        rejects: List[Dict[str, Any]] = []
+        rejected = 0
+        received = 0
+
+        def reject(row_num: int, reason: str):
+            nonlocal rejected
+            rejected += 1
+            if len(rejects) < self.max_rejects:
+                rejects.append({"row": row_num, "reason": reason})
+
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(CREATE_STAGE_SQL)
+                batch: List[tuple] = []
+                for row_num, record, error in rows:
+                    received += 1
+                    if error:
+                        reject(row_num, error)
+                        continue
+                    stage_row, error = to_stage_record(row_num, record, default_cc)
+                    if error:
+                        reject(row_num, error)
+                        continue
+                    batch.append(stage_row)
+                    if len(batch) >= self.batch_size:
+                        await conn.copy_records_to_table("lead_import_stage", records=batch, columns=STAGE_COLUMNS)
+                        batch = []
+                if batch:
+                    await conn.copy_records_to_table("lead_import_stage", records=batch, columns=STAGE_COLUMNS)
+
+                for r in await conn.fetch(DUPLICATES_SQL, max(0, self.max_rejects - len(rejects))):
+                    rejects.append({"row": r["row_num"], "reason": "duplicate_in_file"})
+                result = await conn.fetchrow(MERGE_SQL, tenant_id, on_conflict == "update")
+
+        rejected += result["duplicates"]
+        rejects.sort(key=lambda r: r["row"])
+        logger.info(
+            f"📥 Lead import: tenant={tenant_id}, rows={received}, inserted={result['inserted']}, "
+            f"updated={result['updated']}, rejected={rejected}"
+        )
+        return {
+            "received": received,
+            "inserted": result["inserted"],
+            "updated": result["updated"],
+            "skipped_existing": result["skipped"],
+            "rejected": rejected,
+            "rejects": rejects,
+            "rejects_truncated": rejected > len(rejects),
+        }
+
+
+lead_import_service = LeadImportService()
@@ -0,0 +1,109 @@
+"""
+Lead Search Service - Búsqueda indexada de leads (CRM Sales).
+
+- Texto (nombre / apellido / email): expresión `LEAD_SEARCH_EXPR` indexada con
+  pg_trgm (GIN), filtrada con ILIKE y rankeada por word_similarity.
+- Teléfono ("últimos N dígitos"): prefijo sobre reverse(phone_number), cubierto
+  por un índice btree text_pattern_ops.
+Los índices se crean en el evolution pipeline de db.py (Parche 19).
+"""
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+# Debe coincidir exactamente con la expresión del índice idx_leads_search_trgm
+LEAD_SEARCH_EXPR = "lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || coalesce(email, ''))"
+
+MIN_PHONE_DIGITS = 3
+_PHONE_TERM_RE = re.compile(r"^[\d\s\-\+\(\)\.]+$")
+
+
+def _like_escape(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def is_phone_term(term: str) -> bool:
+    term = term.strip()
+    return bool(_PHONE_TERM_RE.match(term)) and len(re.sub(r"\D", "", term)) >= MIN_PHONE_DIGITS
+
+
+def build_lead_search_filter(term: str, param_idx: int) -> Tuple[str, List[Any]]:
+    """
+    Fragmento SQL (AND ...) y parámetros para filtrar leads por `term` usando los
+    índices de búsqueda. Compartido por /leads y /leads/search.
+    """
+    term = term.strip()
+    if is_phone_term(term):
+        digits = re.sub(r"\D", "", term)
+        return (
+            f" AND reverse(phone_number) LIKE ${param_idx}",
+            [_like_escape(digits[::-1]) + "%"],
+        )
+    return (
+        f" AND {LEAD_SEARCH_EXPR} LIKE ${param_idx}",
+        ["%" + _like_escape(term.lower()) + "%"],
+    )
+
+
+class LeadSearchService:
+    """Typeahead de leads con ranking por relevancia."""
+
+    def __init__(self):
+        self._trgm_available: Optional[bool] = None
+
+    async def _has_trgm(self) -> bool:
+        if self._trgm_available is None:
+            try:
+                self._trgm_available = bool(await db.pool.fetchval(
+                    "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+                ))
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo verificar pg_trgm: {e}")
+                self._trgm_available = False
+        return self._trgm_available
+
+    async def search(
+        self,
+        tenant_id: int,
+        term: str,
+        limit: int = 20,
+        seller_id: Optional[UUID] = None,
+    ) -> List[Dict[str, Any]]:
+        """Busca leads del tenant. seller_id restringe a leads asignados (setters/closers)."""
+        params: List[Any] = [tenant_id]
+        where = " WHERE tenant_id = $1 AND (status IS NULL OR status != 'deleted')"
+        if seller_id:
+            params.append(seller_id)
+            where += f" AND assigned_seller_id = ${len(params)}"
+
+        filter_sql, filter_params = build_lead_search_filter(term, len(params) + 1)
+        where += filter_sql
+        params.extend(filter_params)
+
+        if is_phone_term(term):
+            score = "1.0::real"
+        elif await self._has_trgm():
+            params.append(term.strip().lower())
+            score = f"word_similarity(${len(params)}, {LEAD_SEARCH_EXPR})"
+        else:
+            score = "0.0::real"
+
+        params.append(limit)
+        query = f"""
+            SELECT id, phone_number, first_name, last_name, email, status,
+                   assigned_seller_id, created_at, {score} AS score
+            FROM leads
+            {where}
+            ORDER BY score DESC, created_at DESC
+            LIMIT ${len(params)}
+        """
+        rows = await db.pool.fetch(query, *params)
+        return [dict(r) for r in rows]
+
+
+lead_search_service = LeadSearchService()
@@ -0,0 +1,146 @@
+"""
+Lead Stats Service - Rollups diarios de leads para el dashboard CRM.
+
+`lead_daily_stats` guarda el conteo de leads por (tenant, seller, día de creación,
+status actual, source). Lo mantienen triggers de sentencia sobre `leads`
+(Parche 20 en db.py) y se reconcilia cada noche contra la tabla fuente.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+NO_SELLER_ID = UUID("00000000-0000-0000-0000-000000000000")
+REVENUE_PER_WON_LEAD = 1000.0
+
+# Agregado canónico desde la tabla fuente (misma forma que mantienen los triggers)
+ROLLUP_SELECT_SQL = f"""
+    SELECT tenant_id,
+           COALESCE(assigned_seller_id, '{NO_SELLER_ID}'::uuid) AS seller_id,
+           (COALESCE(created_at, NOW()) AT TIME ZONE 'UTC')::date AS day,
+           COALESCE(status, 'new') AS status,
+           COALESCE(source, '') AS source,
+           COUNT(*) AS lead_count
+    FROM leads
+    WHERE tenant_id = $1
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+# Misma clave que toman (compartida) los triggers de Parche 20 en db.py
+RECONCILE_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('lead_daily_stats'), $1)"
+
+DASHBOARD_SQL = """
+    WITH s AS (
+        SELECT day, status, SUM(lead_count) AS n
+        FROM lead_daily_stats
+        WHERE tenant_id = $1 AND status <> 'deleted'
+          AND ($2::uuid IS NULL OR seller_id = $2::uuid)
+        GROUP BY day, status
+    ),
+    months AS (
+        SELECT generate_series(
+            date_trunc('month', CURRENT_DATE - INTERVAL '5 months')::date,
+            date_trunc('month', CURRENT_DATE)::date,
+            INTERVAL '1 month'
+        )::date AS month_start
+    )
+    SELECT
+        (SELECT COALESCE(SUM(n), 0) FROM s)::bigint AS total_leads,
+        (SELECT COALESCE(SUM(n), 0) FROM s
+            WHERE day >= $3 AND status NOT IN ('closed_won', 'closed_lost'))::bigint AS active_leads,
+        (SELECT COALESCE(SUM(n), 0) FROM s WHERE day >= $3 AND status = 'closed_won')::bigint AS converted_leads,
+        (SELECT COALESCE(SUM(n), 0) FROM s WHERE day >= $3)::bigint AS period_leads,
+        CASE WHEN $2::uuid IS NULL
+             THEN (SELECT COUNT(*) FROM clients WHERE tenant_id = $1)
+             ELSE (SELECT COALESCE(SUM(n), 0) FROM s WHERE status = 'closed_won')
+        END::bigint AS total_clients,
+        (SELECT COALESCE(json_agg(json_build_object('status', status, 'count', cnt)), '[]'::json)
+            FROM (SELECT status, SUM(n)::bigint AS cnt FROM s GROUP BY status) d) AS status_distribution,
+        (SELECT json_agg(json_build_object(
+                    'month', to_char(m.month_start, 'Mon'),
+                    'leads', COALESCE(t.leads, 0),
+                    'revenue', COALESCE(t.won, 0) * $4::float8
+                ) ORDER BY m.month_start)
+            FROM months m
+            LEFT JOIN (
+                SELECT date_trunc('month', day)::date AS month_start,
+                       SUM(n)::bigint AS leads,
+                       SUM(n) FILTER (WHERE status = 'closed_won')::bigint AS won
+                FROM s GROUP BY 1
+            ) t ON t.month_start = m.month_start) AS revenue_leads_trend,
+        (SELECT COALESCE(json_agg(r), '[]'::json) FROM (
+            SELECT id, first_name, last_name, phone_number, status, created_at, source, prospecting_niche
+            FROM leads
+            WHERE tenant_id = $1 AND status != 'deleted'
+            ORDER BY created_at DESC
+            LIMIT 5
+        ) r) AS recent_leads
+"""
+
+
+class LeadStatsService:
+    """Lectura y reconciliación de los rollups diarios de leads."""
+
+    async def get_dashboard_summary(
+        self, tenant_id: int, days: int, seller_id: Optional[UUID] = None
+    ) -> Dict[str, Any]:
+        """Métricas del dashboard CRM en una sola query sobre lead_daily_stats."""
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).date()
+        row = await db.pool.fetchrow(DASHBOARD_SQL, tenant_id, seller_id, since, REVENUE_PER_WON_LEAD)
+        return dict(row)
+
+    async def reconcile_tenant(self, tenant_id: int) -> int:
+        """
+        Reconstruye los rollups del tenant desde `leads`. El advisory lock exclusivo del
+        tenant espera a las escrituras en curso de ese tenant y frena las nuevas hasta el
+        commit (los triggers toman el mismo lock compartido); los demás tenants no se bloquean.
+        Retorna la cantidad de filas de rollup corregidas.
+        """
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(RECONCILE_LOCK_SQL, tenant_id)
+                result = await conn.fetchval(f"""
+                    WITH fresh AS ({ROLLUP_SELECT_SQL}),
+                    removed AS (
+                        DELETE FROM lead_daily_stats s
+                        WHERE s.tenant_id = $1
+                          AND NOT EXISTS (
+                              SELECT 1 FROM fresh f
+                              WHERE f.seller_id = s.seller_id AND f.day = s.day
+                                AND f.status = s.status AND f.source = s.source
+                          )
+                        RETURNING 1
+                    ),
+                    upserted AS (
+                        INSERT INTO lead_daily_stats (tenant_id, seller_id, day, status, source, lead_count)
+                        SELECT tenant_id, seller_id, day, status, source, lead_count FROM fresh
+                        ON CONFLICT (tenant_id, seller_id, day, status, source) DO UPDATE
+                            SET lead_count = EXCLUDED.lead_count, updated_at = NOW()
+                            WHERE lead_daily_stats.lead_count IS DISTINCT FROM EXCLUDED.lead_count
+                        RETURNING 1
+                    )
+                    SELECT (SELECT COUNT(*) FROM removed) + (SELECT COUNT(*) FROM upserted)
+                """, tenant_id)
+        return int(result or 0)
+
+    async def reconcile_all(self) -> Dict[int, int]:
+        """Job nocturno: reconcilia todos los tenants."""
+        results: Dict[int, int] = {}
+        tenants = await db.pool.fetch("SELECT id FROM tenants ORDER BY id")
+        for t in tenants:
+            try:
+                results[t["id"]] = await self.reconcile_tenant(t["id"])
+            except Exception as e:
+                logger.error(f"❌ Error reconciliando lead_daily_stats del tenant {t['id']}: {e}")
+        drift = {k: v for k, v in results.items() if v}
+        if drift:
+            logger.warning(f"⚠️ lead_daily_stats corregido (filas por tenant): {drift}")
+        logger.info(f"📊 Reconciliación de rollups completada para {len(results)} tenants")
+        return results
+
+
+lead_stats_service = LeadStatsService()
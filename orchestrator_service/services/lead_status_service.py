@@ -78,7 +78,7 @@ class LeadStatusService:
         async def _execute_change(connection: asyncpg.Connection):
             # 1. Obtener lead actual (y asegurar Tenant Isolation)
             lead = await connection.fetchrow(
-                "SELECT id, status FROM leads WHERE id = $1 AND tenant_id = $2 FOR UPDATE",
+                "SELECT id, status, assigned_seller_id FROM leads WHERE id = $1 AND tenant_id = $2 FOR UPDATE",
                 lead_id, tenant_id
             )
             
@@ -118,6 +118,11 @@ class LeadStatusService:
                 VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
             """, lead_id, tenant_id, current_status, new_status, user_id, user_name, comment, '{}')
             
+            # 4b. Lead cerrado: libera la conversación del contador de carga del vendedor
+            from services.seller_load_service import seller_load_service, CLOSED_LEAD_STATUSES
+            if new_status in CLOSED_LEAD_STATUSES and current_status not in CLOSED_LEAD_STATUSES:
+                await seller_load_service.release(tenant_id, lead['assigned_seller_id'], conn=connection)
+            
             # 5. Fase 5 Automatizaciones: Despachar Action Triggers
             # Import aquí para evitar dependencias cruzadas costosas al startup si LeadAutomationService crece
             from services.lead_automation_service import LeadAutomationService
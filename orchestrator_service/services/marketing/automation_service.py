@@ -212,10 +212,11 @@ class AutomationService:
 
     async def send_hsm(self, tenant_id: int, to: str, template_name: str, language: str, components: list, trigger_type: str, target_id: str, patient_id: int) -> bool:
         """Helper para enviar HSM vía YCloud y registrar log."""
-        from core.credentials import YCLOUD_API_KEY, get_tenant_credential
+        from core.credentials import YCLOUD_API_KEY, YCLOUD_WHATSAPP_NUMBER, get_tenant_credentials
         
-        api_key = await get_tenant_credential(tenant_id, YCLOUD_API_KEY)
-        from_number = await get_tenant_credential(tenant_id, "YCLOUD_WHATSAPP_NUMBER")
+        credentials = await get_tenant_credentials(tenant_id)
+        api_key = credentials.get(YCLOUD_API_KEY)
+        from_number = credentials.get(YCLOUD_WHATSAPP_NUMBER)
         
         if not api_key:
             logger.error(f"❌ No hay API Key de YCloud para tenant {tenant_id}")
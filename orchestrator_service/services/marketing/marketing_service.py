@@ -12,8 +12,9 @@ class MarketingService:
         """
         Calcula el ROI real cruzando datos de atribución con transacciones contables.
         """
-        from core.credentials import get_tenant_credential
-        token = await get_tenant_credential(tenant_id, "META_USER_LONG_TOKEN")
+        from core.credentials import get_tenant_credentials
+        credentials = await get_tenant_credentials(tenant_id)
+        token = credentials.get("META_USER_LONG_TOKEN")
         is_connected = bool(token)
         
         logger.info(f"🔍 ROI Debug: Tenant={tenant_id}, TokenFound={is_connected}, Range={time_range}")
@@ -58,7 +59,7 @@ class MarketingService:
 
             # 4. Inversión (Spend) - Sincronizada con Meta si hay conexión
             from services.marketing.meta_ads_service import MetaAdsClient
-            ad_account_id = await get_tenant_credential(tenant_id, "META_AD_ACCOUNT_ID")
+            ad_account_id = credentials.get("META_AD_ACCOUNT_ID")
             
             total_spend = 0.0
             currency = "ARS"
@@ -109,9 +110,10 @@ class MarketingService:
     @staticmethod
     async def get_token_status(tenant_id: int) -> Dict[str, Any]:
         """Verifica la salud del token de Meta y devuelve días para expirar."""
-        from core.credentials import get_tenant_credential
-        expires_at_str = await get_tenant_credential(tenant_id, "META_TOKEN_EXPIRES_AT")
-        token = await get_tenant_credential(tenant_id, "META_USER_LONG_TOKEN")
+        from core.credentials import get_tenant_credentials
+        credentials = await get_tenant_credentials(tenant_id)
+        expires_at_str = credentials.get("META_TOKEN_EXPIRES_AT")
+        token = credentials.get("META_USER_LONG_TOKEN")
         
         if not token:
             return {"needs_reconnect": True, "days_left": None}
@@ -142,11 +144,12 @@ class MarketingService:
         Retorna el rendimiento por campaña/anuncio, sincronizando con Meta si hay conexión.
         """
         try:
-            from core.credentials import get_tenant_credential
+            from core.credentials import get_tenant_credentials
             from services.marketing.meta_ads_service import MetaAdsClient
             
-            token = await get_tenant_credential(tenant_id, "META_USER_LONG_TOKEN")
-            ad_account_id = await get_tenant_credential(tenant_id, "META_AD_ACCOUNT_ID")
+            credentials = await get_tenant_credentials(tenant_id)
+            token = credentials.get("META_USER_LONG_TOKEN")
+            ad_account_id = credentials.get("META_AD_ACCOUNT_ID")
             
             logger.info(f"🔍 Campaigns Debug: Tenant={tenant_id}, TokenFound={bool(token)}, AdAccount={ad_account_id}, Range={time_range}")
             
@@ -622,11 +622,13 @@ class MetaOAuthService:
         """
         try:
             from db import db
+            from core.credentials import invalidate_tenant_credentials
  
             await db.execute(
                 "DELETE FROM credentials WHERE tenant_id = $1 AND name IN ('META_USER_LONG_TOKEN', 'META_CONNECTION_INFO', 'META_AD_ACCOUNT_ID')",
                 tenant_id
             )
+            invalidate_tenant_credentials(tenant_id)
             
             logger.info(f"Removed Meta credentials from Vault for tenant {tenant_id}")
             return True
@@ -0,0 +1,112 @@
+"""
+Campaign Service - Lanzamiento de campañas de plantillas sobre el outreach dispatcher.
+
+El envío en sí (segmento en streaming, pacing, stats incrementales) lo ejecuta
+OutreachDispatcher con un job `kind='campaign'` asociado a la campaña.
+"""
+import logging
+import re
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from db import db
+from services.outreach.outreach_dispatcher import outreach_dispatcher
+from services.outreach.segment_compiler import compile_segment
+
+logger = logging.getLogger(__name__)
+
+CAMPAIGN_COLUMNS = """
+    id, tenant_id, name, template_id, target_segment, status, stats,
+    scheduled_at, started_at, completed_at, created_at, updated_at
+"""
+
+LAUNCHABLE_STATUSES = ("draft", "scheduled")
+
+_BODY_VAR_RE = re.compile(r"\{\{\s*(\d+)\s*\}\}")
+
+
+def body_param_count(components: Any) -> int:
+    """Cantidad de variables {{n}} del BODY de una plantilla (formato de componentes de Meta)."""
+    if isinstance(components, dict):
+        components = components.get("components") or [components]
+    for comp in components or []:
+        if isinstance(comp, dict) and str(comp.get("type", "")).upper() == "BODY":
+            found = [int(n) for n in _BODY_VAR_RE.findall(comp.get("text") or "")]
+            return max(found) if found else 0
+    return 0
+
+
+class CampaignService:
+    async def launch(
+        self, tenant_id: int, campaign_id: UUID, immediate: bool = True, created_by: Optional[UUID] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Lanza (o programa, si scheduled_at es futuro y no es inmediato) una campaña.
+        Retorna None si no existe; ValueError si el segmento es inválido o ya fue lanzada.
+        """
+        campaign = await db.pool.fetchrow("""
+            SELECT c.status, c.target_segment, t.name AS template_name, t.language, t.components
+            FROM campaigns c
+            LEFT JOIN templates t ON t.id = c.template_id AND t.tenant_id = c.tenant_id
+            WHERE c.id = $1 AND c.tenant_id = $2
+        """, campaign_id, tenant_id)
+        if not campaign:
+            return None
+        if campaign["status"] not in LAUNCHABLE_STATUSES:
+            raise ValueError(f"La campaña ya está en estado '{campaign['status']}'")
+        if not campaign["template_name"]:
+            raise ValueError("La campaña no tiene una plantilla válida")
+        segment = campaign["target_segment"] or {}
+        compile_segment(segment, param_idx=3)
+
+        row = await db.pool.fetchrow(f"""
+            UPDATE campaigns
+            SET status = CASE WHEN NOT $3 AND scheduled_at > NOW() THEN 'scheduled' ELSE 'sending' END,
+                started_at = CASE WHEN NOT $3 AND scheduled_at > NOW() THEN started_at ELSE NOW() END,
+                stats = CASE WHEN NOT $3 AND scheduled_at > NOW() THEN stats
+                             ELSE '{{"queued": 0, "sent": 0, "failed": 0, "replied": 0}}'::jsonb END,
+                updated_at = NOW()
+            WHERE id = $1 AND tenant_id = $2 AND status = ANY($4::text[])
+            RETURNING {CAMPAIGN_COLUMNS}
+        """, campaign_id, tenant_id, immediate, list(LAUNCHABLE_STATUSES))
+        if not row:
+            raise ValueError("La campaña ya fue lanzada")
+        if row["status"] == "scheduled":
+            return dict(row)
+
+        try:
+            job = await outreach_dispatcher.create_job(
+                tenant_id,
+                campaign["template_name"],
+                campaign["language"] or "es",
+                kind="campaign",
+                campaign_id=campaign_id,
+                created_by=created_by,
+                segment=segment,
+                template_params=body_param_count(campaign["components"]),
+            )
+        except Exception:
+            await db.pool.execute(
+                "UPDATE campaigns SET status = $3, started_at = NULL, updated_at = NOW() WHERE id = $1 AND tenant_id = $2",
+                campaign_id, tenant_id, campaign["status"]
+            )
+            raise
+        logger.info(f"📣 Campaña {campaign_id} lanzada: outreach job {job['id']}")
+        return dict(row)
+
+    async def launch_due(self) -> int:
+        """Lanza las campañas programadas cuyo scheduled_at ya pasó."""
+        due = await db.pool.fetch(
+            "SELECT id, tenant_id FROM campaigns WHERE status = 'scheduled' AND scheduled_at <= NOW()"
+        )
+        launched = 0
+        for c in due:
+            try:
+                if await self.launch(c["tenant_id"], c["id"], immediate=True):
+                    launched += 1
+            except Exception as e:
+                logger.error(f"❌ No se pudo lanzar la campaña programada {c['id']}: {e}")
+        return launched
+
+
+campaign_service = CampaignService()
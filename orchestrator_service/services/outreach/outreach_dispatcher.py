@@ -0,0 +1,620 @@
+"""
+Outreach Dispatcher - Envíos masivos de plantillas WhatsApp como jobs persistidos.
+
+- `outreach_jobs` + `outreach_recipients` (una fila por destinatario: pending -> sending -> sent/failed),
+- ritmo por número emisor con token bucket (compartido entre jobs del mismo número en el proceso),
+- envíos en paralelo acotado sobre un único httpx.AsyncClient,
+- estados aplicados por lote en una sola transacción (recipients + leads + contadores del job),
+- resume al reiniciar: los 'pending' se retoman; los que quedaron en 'sending' (envío sin
+  confirmar) se marcan 'failed' para no duplicar mensajes.
+
+Los jobs de campaña (`kind='campaign'`) no materializan destinatarios al crearse: el segmento
+se compila a SQL y se recorre con un cursor server-side, encolando por chunks con checkpoint
+(`enqueue_cursor`). `campaigns.stats` (queued/sent/failed/replied) se actualiza de forma incremental.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import httpx
+
+from core.utils import normalize_phone
+from db import db
+from services.outreach.segment_compiler import compile_segment
+
+logger = logging.getLogger(__name__)
+
+WHATSAPP_SERVICE_URL = os.getenv("WHATSAPP_SERVICE_URL", "http://whatsapp_service:8002")
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "internal-secret-token")
+
+OUTREACH_RATE_PER_SECOND = float(os.getenv("OUTREACH_RATE_PER_SECOND", "5"))
+OUTREACH_BURST = float(os.getenv("OUTREACH_BURST", "10"))
+OUTREACH_CONCURRENCY = int(os.getenv("OUTREACH_CONCURRENCY", "8"))
+OUTREACH_BATCH_SIZE = int(os.getenv("OUTREACH_BATCH_SIZE", "50"))
+OUTREACH_MAX_ATTEMPTS = int(os.getenv("OUTREACH_MAX_ATTEMPTS", "3"))
+OUTREACH_STALE_SECONDS = int(os.getenv("OUTREACH_STALE_SECONDS", "120"))
+OUTREACH_ENQUEUE_CHUNK_SIZE = int(os.getenv("OUTREACH_ENQUEUE_CHUNK_SIZE", "1000"))
+
+ACTIVE_STATUSES = ("queued", "running", "cancelling")
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+JOB_COLUMNS = """
+    id, tenant_id, kind, campaign_id, template_name, language, from_number, status,
+    total, sent, failed, error, created_at, started_at, finished_at, updated_at,
+    segment, template_params, enqueued, enqueue_cursor
+"""
+
+# Destinatarios válidos para cualquier envío; los filtros propios de cada origen se agregan aparte.
+# Se valida la clave canónica (phone_e164, Parche 26): '+549...' (chat/import) y '549...' (Apify)
+# son el mismo destinatario, y se envía siempre a esos dígitos.
+BASE_RECIPIENT_PREDICATE = r"""
+    l.tenant_id = $2
+    AND (l.status IS NULL OR l.status != 'deleted')
+    AND l.phone_e164 ~ '^\d{8,15}$'
+"""
+
+
+# Contadores de la campaña: incrementos atómicos sobre el JSONB (sin leer-modificar-escribir en Python)
+CAMPAIGN_STATS_SQL = """
+    UPDATE campaigns
+    SET stats = COALESCE(stats, '{}'::jsonb) || jsonb_build_object(
+            'queued', COALESCE((stats->>'queued')::int, 0) + $2,
+            'sent', COALESCE((stats->>'sent')::int, 0) + $3,
+            'failed', COALESCE((stats->>'failed')::int, 0) + $4
+        ),
+        updated_at = NOW()
+    WHERE id = $1
+"""
+
+CAMPAIGN_FINAL_STATUS = {"completed": "completed", "failed": "failed", "cancelled": "cancelled"}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def prospecting_recipient_filter(
+    lead_ids: Optional[Sequence[UUID]], only_pending: bool, param_idx: int
+) -> Tuple[str, List[Any]]:
+    """
+    Filtro SQL (sobre `leads l`) de los destinatarios de outreach de prospección.
+    Sin lead_ids se toman todos los leads de Apify del tenant. Retorna (sql, params).
+    """
+    sql = f" AND (${param_idx}::bool = FALSE OR l.outreach_message_sent = FALSE)"
+    params: List[Any] = [only_pending]
+    if lead_ids:
+        sql += f" AND l.id = ANY(${param_idx + 1}::uuid[])"
+        params.append(list(lead_ids))
+    else:
+        sql += " AND l.source = 'apify_scrape'"
+    return sql, params
+
+
+def template_components(params: Sequence[str]) -> List[Dict[str, Any]]:
+    """Componentes de la plantilla: {{1}} = nombre, {{2}} = ciudad (ninguno si el body no tiene variables)."""
+    if not params:
+        return []
+    return [{"type": "body", "parameters": [{"type": "text", "text": p} for p in params]}]
+
+
+def recipient_params(first_name: Optional[str], city: Optional[str], count: int) -> List[str]:
+    """Variables del body ({{1}} nombre, {{2}} ciudad, resto en blanco) recortadas a `count`."""
+    values = [first_name or " ", city or " "]
+    return (values + [" "] * max(0, count - len(values)))[:count]
+
+
+class TokenBucket:
+    """Token bucket asíncrono: `rate` envíos/seg sostenidos con ráfagas de hasta `capacity`."""
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # El lock se mantiene durante la espera: los envíos salen en orden de llegada
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await self._sleep((1 - self._tokens) / self.rate)
+
+
+# Buckets por número emisor compartidos por todos los jobs del proceso
+SENDER_BUCKETS: Dict[str, TokenBucket] = {}
+
+
+class OutreachSender:
+    """
+    Envía plantillas al endpoint /send del whatsapp_service:
+
+        async with OutreachSender() as sender:
+            results = await sender.send_many(from_number, recipients, "promo", "es_AR")
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        concurrency: int = OUTREACH_CONCURRENCY,
+        rate_per_second: float = OUTREACH_RATE_PER_SECOND,
+        burst: float = OUTREACH_BURST,
+        max_attempts: int = OUTREACH_MAX_ATTEMPTS,
+        timeout: float = 20.0,
+        buckets: Optional[Dict[str, TokenBucket]] = None,
+    ):
+        self.base_url = (base_url or WHATSAPP_SERVICE_URL).rstrip("/")
+        self.concurrency = concurrency
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.buckets = SENDER_BUCKETS if buckets is None else buckets
+        self._sem = asyncio.Semaphore(concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def __aenter__(self):
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    def _bucket(self, from_number: str) -> TokenBucket:
+        if from_number not in self.buckets:
+            self.buckets[from_number] = TokenBucket(self.rate_per_second, self.burst)
+        return self.buckets[from_number]
+
+    async def send_one(
+        self, from_number: str, recipient: Dict[str, Any], template_name: str, language: str
+    ) -> Tuple[str, Optional[str], int]:
+        """(status 'sent'|'failed', error, intentos). Reintenta 429 / 5xx / errores de red."""
+        payload = {
+            "to": normalize_phone(recipient["phone"]),
+            "type": "template",
+            "template_name": template_name,
+            "language": language,
+            "components": template_components(recipient.get("params") or []),
+        }
+        bucket = self._bucket(from_number)
+        error = None
+        async with self._sem:
+            for attempt in range(1, self.max_attempts + 1):
+                await bucket.acquire()
+                retry_after = 0.5 * 2 ** (attempt - 1)
+                try:
+                    resp = await self._client.post(
+                        f"{self.base_url}/send",
+                        json=payload,
+                        headers={"X-Internal-Token": INTERNAL_API_TOKEN, "X-Correlation-Id": str(uuid.uuid4())},
+                        params={"from_number": from_number},
+                    )
+                    if resp.status_code == 200:
+                        return "sent", None, attempt
+                    error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+                    if resp.status_code != 429 and resp.status_code < 500:
+                        return "failed", error, attempt
+                    try:
+                        retry_after = min(30.0, float(resp.headers.get("retry-after", retry_after)))
+                    except ValueError:
+                        pass
+                except httpx.HTTPError as e:
+                    error = str(e)[:200] or e.__class__.__name__
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(retry_after)
+        return "failed", error, self.max_attempts
+
+    async def send_many(
+        self, from_number: str, recipients: List[Dict[str, Any]], template_name: str, language: str
+    ) -> List[Tuple[str, Optional[str], int]]:
+        return await asyncio.gather(
+            *(self.send_one(from_number, r, template_name, language) for r in recipients)
+        )
+
+
+class OutreachDispatcher:
+    """Ejecuta jobs de outreach en tareas asyncio del proceso (mismo esquema que los jobs de prospección)."""
+
+    def __init__(
+        self,
+        batch_size: int = OUTREACH_BATCH_SIZE,
+        sender_factory=OutreachSender,
+        enqueue_chunk_size: int = OUTREACH_ENQUEUE_CHUNK_SIZE,
+    ):
+        self.batch_size = batch_size
+        self.enqueue_chunk_size = enqueue_chunk_size
+        self.sender_factory = sender_factory
+        self.worker_id = f"{os.getenv('HOSTNAME', 'orchestrator')}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._tasks: Dict[UUID, asyncio.Task] = {}
+
+    # ------------------------------------------------------------------ #
+    # API pública
+    # ------------------------------------------------------------------ #
+    async def create_job(
+        self,
+        tenant_id: int,
+        template_name: str,
+        language: str,
+        recipient_filter: Tuple[str, List[Any]] = ("", []),
+        kind: str = "prospecting",
+        campaign_id: Optional[UUID] = None,
+        created_by: Optional[UUID] = None,
+        segment: Optional[Dict[str, Any]] = None,
+        template_params: int = 2,
+    ) -> Dict[str, Any]:
+        """
+        Crea el job. Con recipient_filter ((sql, params) sobre `leads l`, placeholders desde $3)
+        los destinatarios se materializan con un INSERT ... SELECT; con segment (campañas) se
+        encolan en streaming al ejecutar el job.
+        """
+        from_number = await db.pool.fetchval("SELECT bot_phone_number FROM tenants WHERE id = $1", tenant_id)
+        if not from_number:
+            raise ValueError("El tenant no tiene bot_phone_number configurado")
+        if segment is not None:
+            compile_segment(segment, param_idx=3)  # valida antes de crear el job
+        filter_sql, filter_params = recipient_filter
+
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                job_id = await conn.fetchval("""
+                    INSERT INTO outreach_jobs (tenant_id, created_by, kind, campaign_id, template_name, language,
+                                               from_number, status, worker_id, heartbeat_at,
+                                               segment, template_params, enqueued)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, 'queued', $8, NOW(), $9, $10, $11)
+                    RETURNING id
+                """, tenant_id, created_by, kind, campaign_id, template_name, language, from_number, self.worker_id,
+                    segment, template_params, segment is None)
+                if segment is None:
+                    await conn.execute(f"""
+                        INSERT INTO outreach_recipients (job_id, lead_id, phone, params)
+                        SELECT $1, l.id, l.phone_e164,
+                               jsonb_build_array(COALESCE(NULLIF(l.first_name, ''), ' '), COALESCE(NULLIF(l.apify_city, ''), ' '))
+                        FROM leads l
+                        WHERE {BASE_RECIPIENT_PREDICATE} {filter_sql}
+                        ON CONFLICT DO NOTHING
+                    """, job_id, tenant_id, *filter_params)
+                row = await conn.fetchrow(f"""
+                    UPDATE outreach_jobs
+                    SET total = (SELECT COUNT(*) FROM outreach_recipients WHERE job_id = $1)
+                    WHERE id = $1
+                    RETURNING {JOB_COLUMNS}
+                """, job_id)
+
+        logger.info(f"📨 Outreach job {job_id} creado: tenant={tenant_id}, destinatarios={row['total']}")
+        self._spawn(job_id)
+        return dict(row)
+
+    async def get_job(self, job_id: UUID, tenant_id: int) -> Optional[Dict[str, Any]]:
+        row = await db.pool.fetchrow(
+            f"SELECT {JOB_COLUMNS} FROM outreach_jobs WHERE id = $1 AND tenant_id = $2", job_id, tenant_id
+        )
+        return dict(row) if row else None
+
+    async def cancel_job(self, job_id: UUID, tenant_id: int) -> Optional[Dict[str, Any]]:
+        """Marca el job para cancelación; el worker corta al terminar el lote en curso."""
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(f"""
+                    UPDATE outreach_jobs
+                    SET status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE 'cancelling' END,
+                        finished_at = CASE WHEN status = 'queued' THEN NOW() ELSE finished_at END,
+                        updated_at = NOW()
+                    WHERE id = $1 AND tenant_id = $2 AND status IN ('queued', 'running')
+                    RETURNING {JOB_COLUMNS}
+                """, job_id, tenant_id)
+                # En cola se cancela acá mismo: el _finish del worker ya no lo toca
+                if row and row["status"] == "cancelled":
+                    await self._finish_campaign(conn, row["campaign_id"], "cancelled")
+        if row:
+            await self._emit(dict(row))
+        return dict(row) if row else None
+
+    async def resume_pending(self) -> int:
+        """Retoma jobs activos sin heartbeat reciente (reinicio / worker caído)."""
+        rows = await db.pool.fetch("""
+            UPDATE outreach_jobs
+            SET worker_id = $1, heartbeat_at = NOW(), updated_at = NOW()
+            WHERE status = ANY($2::text[])
+              AND (heartbeat_at IS NULL OR heartbeat_at < NOW() - make_interval(secs => $3))
+            RETURNING id
+        """, self.worker_id, list(ACTIVE_STATUSES), OUTREACH_STALE_SECONDS)
+        for r in rows:
+            self._spawn(r["id"])
+        if rows:
+            logger.info(f"🔁 Retomando {len(rows)} jobs de outreach")
+        return len(rows)
+
+    async def shutdown(self):
+        """Detiene las tareas locales; los jobs quedan activos y se retoman en el próximo arranque."""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        await db.pool.execute(
+            "UPDATE outreach_jobs SET heartbeat_at = NULL WHERE worker_id = $1 AND status = ANY($2::text[])",
+            self.worker_id, list(ACTIVE_STATUSES)
+        )
+
+    async def wait(self, job_id: UUID):
+        task = self._tasks.get(job_id)
+        if task:
+            await asyncio.gather(task, return_exceptions=True)
+
+    # ------------------------------------------------------------------ #
+    # Ejecución
+    # ------------------------------------------------------------------ #
+    def _spawn(self, job_id: UUID):
+        if job_id in self._tasks and not self._tasks[job_id].done():
+            return
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _t, jid=job_id: self._tasks.pop(jid, None))
+
+    async def _emit(self, job: Dict[str, Any]):
+        try:
+            from core.socket_manager import sio
+            await sio.emit("OUTREACH_JOB_PROGRESS", {
+                "job_id": str(job["id"]),
+                "tenant_id": job["tenant_id"],
+                "kind": job["kind"],
+                "campaign_id": str(job["campaign_id"]) if job["campaign_id"] else None,
+                "status": job["status"],
+                "total": job["total"],
+                "sent": job["sent"],
+                "failed": job["failed"],
+                "error": job["error"],
+            })
+        except Exception as e:
+            logger.debug(f"outreach_job_emit_failed: {e}")
+
+    async def _run(self, job_id: UUID):
+        job = dict(await db.pool.fetchrow(f"SELECT {JOB_COLUMNS} FROM outreach_jobs WHERE id = $1", job_id))
+        if job["status"] in TERMINAL_STATUSES:
+            return
+        try:
+            if job["status"] == "cancelling":
+                raise JobCancelled()
+            job = await self._start(job_id)
+            if not job["enqueued"]:
+                job = await self._enqueue_segment(job)
+            async with self.sender_factory() as sender:
+                while True:
+                    batch = await self._claim(job_id)
+                    if not batch:
+                        break
+                    results = await sender.send_many(job["from_number"], batch, job["template_name"], job["language"])
+                    job = await self._flush(job, batch, results)
+            await self._finish(job_id, "completed")
+            logger.info(f"🏁 Outreach job {job_id} completado: enviados={job['sent']}, fallidos={job['failed']}")
+        except JobCancelled:
+            await self._finish(job_id, "cancelled")
+            logger.info(f"🛑 Outreach job {job_id} cancelado")
+        except asyncio.CancelledError:
+            # Shutdown del proceso: el job queda activo para resume
+            raise
+        except Exception as e:
+            logger.error(f"❌ Outreach job {job_id} falló: {e}")
+            await self._finish(job_id, "failed", error=str(e)[:500])
+
+    async def _start(self, job_id: UUID) -> Dict[str, Any]:
+        """
+        Pasa a running y cierra como fallidos los envíos sin confirmar de una ejecución anterior.
+        Un job que ya terminó (p. ej. cancelado mientras estaba en cola) no se revive: JobCancelled.
+        """
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                lost = await conn.fetchval("""
+                    WITH lost AS (
+                        UPDATE outreach_recipients
+                        SET status = 'failed', error = 'interrupted_before_confirmation'
+                        WHERE job_id = $1 AND status = 'sending'
+                        RETURNING 1
+                    )
+                    SELECT COUNT(*) FROM lost
+                """, job_id)
+                row = await conn.fetchrow(f"""
+                    UPDATE outreach_jobs
+                    SET status = CASE WHEN status = 'cancelling' THEN status ELSE 'running' END,
+                        started_at = COALESCE(started_at, NOW()),
+                        failed = failed + $2,
+                        heartbeat_at = NOW(), updated_at = NOW()
+                    WHERE id = $1 AND status <> ALL($3::text[])
+                    RETURNING {JOB_COLUMNS}
+                """, job_id, lost, list(TERMINAL_STATUSES))
+                if row is None:
+                    raise JobCancelled()
+                if row["campaign_id"] and lost:
+                    await conn.execute(CAMPAIGN_STATS_SQL, row["campaign_id"], 0, 0, lost)
+        job = dict(row)
+        await self._emit(job)
+        if job["status"] == "cancelling":
+            raise JobCancelled()
+        return job
+
+    async def _claim(self, job_id: UUID) -> List[Dict[str, Any]]:
+        rows = await db.pool.fetch("""
+            UPDATE outreach_recipients r
+            SET status = 'sending'
+            FROM (
+                SELECT lead_id FROM outreach_recipients
+                WHERE job_id = $1 AND status = 'pending'
+                ORDER BY lead_id
+                LIMIT $2
+            ) next_batch
+            WHERE r.job_id = $1 AND r.lead_id = next_batch.lead_id
+            RETURNING r.lead_id, r.phone, r.params
+        """, job_id, self.batch_size)
+        return [dict(r) for r in rows]
+
+    async def _flush(
+        self, job: Dict[str, Any], batch: List[Dict[str, Any]], results: List[Tuple[str, Optional[str], int]]
+    ) -> Dict[str, Any]:
+        """Aplica el resultado del lote en una transacción. Lanza JobCancelled si se pidió cancelar."""
+        lead_ids = [r["lead_id"] for r in batch]
+        statuses = [status for status, _, _ in results]
+        sent_ids = [lid for lid, status in zip(lead_ids, statuses) if status == "sent"]
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    UPDATE outreach_recipients r
+                    SET status = u.status, error = u.error, attempts = r.attempts + u.attempts,
+                        sent_at = CASE WHEN u.status = 'sent' THEN NOW() END
+                    FROM unnest($2::uuid[], $3::text[], $4::text[], $5::int[]) AS u(lead_id, status, error, attempts)
+                    WHERE r.job_id = $1 AND r.lead_id = u.lead_id
+                """, job["id"], lead_ids, statuses, [e for _, e, _ in results], [a for _, _, a in results])
+                if sent_ids:
+                    await conn.execute("""
+                        UPDATE leads
+                        SET outreach_message_sent = TRUE, outreach_last_sent_at = NOW(), outreach_message_content = $3
+                        WHERE tenant_id = $1 AND id = ANY($2::uuid[])
+                    """, job["tenant_id"], sent_ids, f"Template: {job['template_name']}")
+                row = await conn.fetchrow(f"""
+                    UPDATE outreach_jobs
+                    SET sent = sent + $2, failed = failed + $3, heartbeat_at = NOW(), updated_at = NOW()
+                    WHERE id = $1
+                    RETURNING {JOB_COLUMNS}
+                """, job["id"], len(sent_ids), len(lead_ids) - len(sent_ids))
+                if row["campaign_id"]:
+                    await conn.execute(CAMPAIGN_STATS_SQL, row["campaign_id"], 0, len(sent_ids), len(lead_ids) - len(sent_ids))
+        job = dict(row)
+        await self._emit(job)
+        if job["status"] == "cancelling":
+            raise JobCancelled()
+        return job
+
+    async def _enqueue_segment(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Recorre el segmento con un cursor server-side (snapshot de solo lectura) en orden de lead id y
+        encola por chunks. Cada chunk se confirma junto con `enqueue_cursor`, así un resume continúa
+        después del último lead encolado. Memoria acotada a un chunk.
+        """
+        where_sql, where_params = compile_segment(job["segment"], param_idx=3)
+        query = f"""
+            SELECT l.id, l.phone_e164, l.first_name, l.apify_city
+            FROM leads l
+            WHERE {BASE_RECIPIENT_PREDICATE} {where_sql}
+              AND ($1::uuid IS NULL OR l.id > $1)
+            ORDER BY l.id
+        """
+        chunk: List[tuple] = []
+        async with db.pool.acquire() as read_conn:
+            async with read_conn.transaction(isolation="repeatable_read", readonly=True):
+                cursor = read_conn.cursor(
+                    query, job["enqueue_cursor"], job["tenant_id"], *where_params, prefetch=self.enqueue_chunk_size
+                )
+                async for rec in cursor:
+                    params = recipient_params(rec["first_name"], rec["apify_city"], job["template_params"])
+                    chunk.append((rec["id"], rec["phone_e164"], json.dumps(params)))
+                    if len(chunk) >= self.enqueue_chunk_size:
+                        job = await self._enqueue_chunk(job, chunk)
+                        chunk = []
+        if chunk:
+            job = await self._enqueue_chunk(job, chunk)
+        row = await db.pool.fetchrow(f"""
+            UPDATE outreach_jobs SET enqueued = TRUE, heartbeat_at = NOW(), updated_at = NOW()
+            WHERE id = $1
+            RETURNING {JOB_COLUMNS}
+        """, job["id"])
+        logger.info(f"📥 Outreach job {job['id']}: {row['total']} destinatarios encolados")
+        return dict(row)
+
+    async def _enqueue_chunk(self, job: Dict[str, Any], chunk: List[tuple]) -> Dict[str, Any]:
+        lead_ids, phones, params = zip(*chunk)
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                inserted = await conn.fetchval("""
+                    WITH ins AS (
+                        INSERT INTO outreach_recipients (job_id, lead_id, phone, params)
+                        SELECT $1, u.lead_id, u.phone, u.params::jsonb
+                        FROM unnest($2::uuid[], $3::text[], $4::text[]) AS u(lead_id, phone, params)
+                        ON CONFLICT DO NOTHING
+                        RETURNING 1
+                    )
+                    SELECT COUNT(*) FROM ins
+                """, job["id"], list(lead_ids), list(phones), list(params))
+                row = await conn.fetchrow(f"""
+                    UPDATE outreach_jobs
+                    SET total = total + $2, enqueue_cursor = $3, heartbeat_at = NOW(), updated_at = NOW()
+                    WHERE id = $1
+                    RETURNING {JOB_COLUMNS}
+                """, job["id"], inserted, lead_ids[-1])
+                if row["campaign_id"] and inserted:
+                    await conn.execute(CAMPAIGN_STATS_SQL, row["campaign_id"], inserted, 0, 0)
+        job = dict(row)
+        await self._emit(job)
+        if job["status"] == "cancelling":
+            raise JobCancelled()
+        return job
+
+    async def _finish(self, job_id: UUID, status: str, error: Optional[str] = None):
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                # Un job ya terminal (p. ej. cancelado en cola) no se reescribe, ni su campaña
+                row = await conn.fetchrow(f"""
+                    UPDATE outreach_jobs
+                    SET status = $2, error = COALESCE($3, error), finished_at = NOW(), updated_at = NOW()
+                    WHERE id = $1 AND status <> ALL($4::text[])
+                    RETURNING {JOB_COLUMNS}
+                """, job_id, status, error, list(TERMINAL_STATUSES))
+                if row is None:
+                    return
+                await self._finish_campaign(conn, row["campaign_id"], status)
+        await self._emit(dict(row))
+
+    @staticmethod
+    async def _finish_campaign(conn, campaign_id: Optional[UUID], status: str):
+        if campaign_id:
+            await conn.execute("""
+                UPDATE campaigns SET status = $2, completed_at = NOW(), updated_at = NOW()
+                WHERE id = $1
+            """, campaign_id, CAMPAIGN_FINAL_STATUS[status])
+
+    async def record_reply(self, tenant_id: int, lead_id: UUID) -> int:
+        """
+        Inbound de un lead: marca como respondidos sus envíos de campaña y suma `replied`
+        (una vez por destinatario). Retorna cuántos envíos quedaron marcados.
+        """
+        row = await db.pool.fetchrow("""
+            WITH replied AS (
+                UPDATE outreach_recipients r
+                SET replied_at = NOW()
+                FROM outreach_jobs j
+                WHERE r.lead_id = $1 AND r.status = 'sent' AND r.replied_at IS NULL
+                  AND j.id = r.job_id AND j.tenant_id = $2 AND j.campaign_id IS NOT NULL
+                RETURNING j.campaign_id
+            ),
+            per_campaign AS (
+                SELECT campaign_id, COUNT(*) AS n FROM replied GROUP BY campaign_id
+            ),
+            bumped AS (
+                UPDATE campaigns c
+                SET stats = COALESCE(c.stats, '{}'::jsonb)
+                            || jsonb_build_object('replied', COALESCE((c.stats->>'replied')::int, 0) + p.n),
+                    updated_at = NOW()
+                FROM per_campaign p
+                WHERE c.id = p.campaign_id
+                RETURNING 1
+            )
+            SELECT (SELECT COALESCE(SUM(n), 0) FROM per_campaign) AS replied, (SELECT COUNT(*) FROM bumped) AS campaigns
+        """, lead_id, tenant_id)
+        return int(row["replied"])
+
+
+outreach_dispatcher = OutreachDispatcher()
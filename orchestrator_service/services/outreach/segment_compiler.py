@@ -0,0 +1,88 @@
+"""
+Segment Compiler - Traduce `campaigns.target_segment` a un predicado SQL parametrizado sobre `leads l`.
+
+Claves soportadas (todas opcionales, se combinan con AND):
+    status / exclude_status        str | [str]
+    source / lead_source           str | [str]
+    city / niche                   str | [str]   (apify_city / prospecting_niche)
+    assigned_seller_id             uuid | [uuid] | "unassigned"
+    tags                           [str]  (al menos una)
+    tags_all                       [str]  (todas)
+    created_after / created_before ISO-8601
+    exclude_contacted              bool   (outreach_message_sent = FALSE)
+
+Claves desconocidas o valores inválidos lanzan ValueError: nunca se interpola un valor en el SQL.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+_TEXT_FIELDS = {
+    "status": "l.status",
+    "source": "l.source",
+    "lead_source": "l.lead_source",
+    "city": "l.apify_city",
+    "niche": "l.prospecting_niche",
+}
+
+
+def _as_list(key: str, value: Any) -> List[str]:
+    values = value if isinstance(value, list) else [value]
+    if not values or not all(isinstance(v, str) and v for v in values):
+        raise ValueError(f"Segmento inválido: '{key}' debe ser texto o lista de textos")
+    return values
+
+
+def _as_datetime(key: str, value: Any) -> datetime:
+    if not isinstance(value, str):
+        raise ValueError(f"Segmento inválido: '{key}' debe ser una fecha ISO-8601")
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Segmento inválido: '{key}' debe ser una fecha ISO-8601")
+
+
+def compile_segment(segment: Optional[Dict[str, Any]], param_idx: int) -> Tuple[str, List[Any]]:
+    """
+    Retorna (sql, params): sql empieza con " AND ..." (o vacío) y usa placeholders desde $param_idx.
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+
+    def bind(value: Any) -> str:
+        params.append(value)
+        return f"${param_idx + len(params) - 1}"
+
+    for key, value in (segment or {}).items():
+        if value is None:
+            continue
+        if key in _TEXT_FIELDS:
+            clauses.append(f"{_TEXT_FIELDS[key]} = ANY({bind(_as_list(key, value))}::text[])")
+        elif key == "exclude_status":
+            clauses.append(f"(l.status IS NULL OR NOT l.status = ANY({bind(_as_list(key, value))}::text[]))")
+        elif key == "tags":
+            clauses.append(f"COALESCE(l.tags, '[]'::jsonb) ?| {bind(_as_list(key, value))}::text[]")
+        elif key == "tags_all":
+            clauses.append(f"COALESCE(l.tags, '[]'::jsonb) ?& {bind(_as_list(key, value))}::text[]")
+        elif key == "assigned_seller_id":
+            if value == "unassigned":
+                clauses.append("l.assigned_seller_id IS NULL")
+                continue
+            try:
+                seller_ids = [UUID(str(v)) for v in (value if isinstance(value, list) else [value])]
+            except ValueError:
+                raise ValueError("Segmento inválido: 'assigned_seller_id' debe ser UUID, lista de UUID o 'unassigned'")
+            clauses.append(f"l.assigned_seller_id = ANY({bind(seller_ids)}::uuid[])")
+        elif key == "created_after":
+            clauses.append(f"l.created_at >= {bind(_as_datetime(key, value))}")
+        elif key == "created_before":
+            clauses.append(f"l.created_at < {bind(_as_datetime(key, value))}")
+        elif key == "exclude_contacted":
+            if not isinstance(value, bool):
+                raise ValueError("Segmento inválido: 'exclude_contacted' debe ser booleano")
+            if value:
+                clauses.append("l.outreach_message_sent IS NOT TRUE")
+        else:
+            raise ValueError(f"Segmento inválido: clave no soportada '{key}'")
+
+    return "".join(f" AND {c}" for c in clauses), params
@@ -0,0 +1,64 @@
+"""
+Apify Client - Llamadas a la API de Apify usadas por la prospección.
+
+APIFY_API_BASE permite apuntar a un stub local en tests.
+"""
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+APIFY_API_BASE = os.getenv("APIFY_API_BASE", "https://api.apify.com/v2")
+APIFY_PLACES_ACTOR = "compass~crawler-google-places"
+APIFY_TERMINAL_STATUSES = ("SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT")
+APIFY_DATASET_PAGE_SIZE = int(os.getenv("APIFY_DATASET_PAGE_SIZE", "200"))
+
+
+class ApifyClient:
+    """Cliente mínimo sobre un httpx.AsyncClient compartido."""
+
+    def __init__(self, token: str, base_url: Optional[str] = None, timeout: float = 30.0):
+        self.token = token
+        self.base_url = (base_url or APIFY_API_BASE).rstrip("/")
+        self._client = httpx.AsyncClient(timeout=timeout)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def _request(self, method: str, path: str, **kwargs) -> Any:
+        params = {**kwargs.pop("params", {}), "token": self.token}
+        resp = await self._client.request(method, f"{self.base_url}{path}", params=params, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def start_run(self, body: Dict[str, Any], actor: str = APIFY_PLACES_ACTOR) -> Dict[str, Any]:
+        """Inicia un run del actor. Retorna el objeto run (id, status, defaultDatasetId)."""
+        return (await self._request("POST", f"/acts/{actor}/runs", json=body)).get("data", {})
+
+    async def get_run(self, run_id: str) -> Dict[str, Any]:
+        return (await self._request("GET", f"/actor-runs/{run_id}")).get("data", {})
+
+    async def abort_run(self, run_id: str) -> Dict[str, Any]:
+        return (await self._request("POST", f"/actor-runs/{run_id}/abort")).get("data", {})
+
+    async def iter_dataset_items(
+        self, dataset_id: str, offset: int = 0, page_size: int = APIFY_DATASET_PAGE_SIZE
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Páginas del dataset vía offset/limit; nunca se tiene el dataset completo en memoria."""
+        while True:
+            page = await self._request(
+                "GET", f"/datasets/{dataset_id}/items",
+                params={"offset": offset, "limit": page_size, "clean": "true", "format": "json"},
+            )
+            if not isinstance(page, list) or not page:
+                return
+            yield page
+            offset += len(page)
+            if len(page) < page_size:
+                return
@@ -0,0 +1,268 @@
+"""
+Prospecting Ingestion - Alta/enriquecimiento de leads desde items de Apify.
+
+Los items se procesan por páginas: cada lote se carga con COPY en una tabla
+temporal (`prospect_stage`) y se aplica con un único INSERT ... ON CONFLICT
+set-based. Los contadores insertados / actualizados / omitidos salen del propio
+statement (RETURNING), no de los command tags.
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from core.utils import normalize_phone_e164
+from db import db
+from services.prospecting.website_phone_crawler import crawl_missing_phones, website_for_item
+
+logger = logging.getLogger(__name__)
+
+
+def extract_social_links(apify_item: dict) -> dict:
+    """
+    Extracts social media profile URLs (IG, FB, LI) from Apify's webResults.
+    """
+    socials = {}
+    web_results = apify_item.get("webResults") or []
+    for res in web_results:
+        url = (res.get("url") or "").lower()
+        if "instagram.com/" in url and not socials.get("instagram"):
+            socials["instagram"] = res.get("url")
+        elif "facebook.com/" in url and not socials.get("facebook"):
+            socials["facebook"] = res.get("url")
+        elif "linkedin.com/" in url and not socials.get("linkedin"):
+            socials["linkedin"] = res.get("url")
+    return socials
+
+
+STAGE_COLUMNS = [
+    "ord", "phone_number", "first_name", "email", "social_links",
+    "apify_title", "apify_category_name", "apify_address", "apify_city", "apify_state", "apify_country_code",
+    "apify_website", "apify_place_id", "apify_total_score", "apify_reviews_count", "apify_scraped_at", "apify_raw",
+]
+
+# JSON como TEXT: COPY binario no pasa por los codecs json/jsonb del pool
+CREATE_STAGE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS prospect_stage (
+        ord INTEGER,
+        phone_number TEXT,
+        first_name TEXT,
+        email TEXT,
+        social_links TEXT,
+        apify_title TEXT,
+        apify_category_name TEXT,
+        apify_address TEXT,
+        apify_city TEXT,
+        apify_state TEXT,
+        apify_country_code TEXT,
+        apify_website TEXT,
+        apify_place_id TEXT,
+        apify_total_score DOUBLE PRECISION,
+        apify_reviews_count INTEGER,
+        apify_scraped_at TIMESTAMPTZ,
+        apify_raw TEXT
+    ) ON COMMIT DELETE ROWS
+"""
+
+# Un lead existente solo se toca si el item trae un scrape más nuevo (o nunca fue scrapeado):
+# re-importar el mismo dataset no reescribe apify_raw y cuenta como omitido.
+MERGE_STAGE_SQL = """
+    WITH src AS (
+        SELECT DISTINCT ON (phone_number) *
+        FROM prospect_stage
+        ORDER BY phone_number, apify_scraped_at DESC NULLS LAST, ord DESC
+    ),
+    upserted AS (
+        INSERT INTO leads (
+            tenant_id, phone_number, first_name, email, status, source, tags, social_links,
+            apify_title, apify_category_name, apify_address, apify_city, apify_state, apify_country_code,
+            apify_website, apify_place_id, apify_total_score, apify_reviews_count, apify_scraped_at, apify_raw,
+            apify_rating, apify_reviews,
+            prospecting_niche, prospecting_location_query,
+            outreach_message_sent, outreach_send_requested,
+            created_at, updated_at
+        )
+        SELECT
+            $1, phone_number, first_name, email, 'new', 'apify_scrape', '[]'::jsonb, social_links::jsonb,
+            apify_title, apify_category_name, apify_address, apify_city, apify_state, apify_country_code,
+            apify_website, apify_place_id, apify_total_score, apify_reviews_count, apify_scraped_at, apify_raw::jsonb,
+            apify_total_score, apify_reviews_count,
+            $2, $3,
+            FALSE, FALSE,
+            NOW(), NOW()
+        FROM src
+        ON CONFLICT (tenant_id, phone_number)
+        DO UPDATE SET
+            -- Enriquecimiento: Solo actualizamos si el campo actual está vacío o es de prospección
+            social_links = CASE
+                WHEN leads.social_links IS NULL OR leads.social_links = '{}'::jsonb THEN EXCLUDED.social_links
+                ELSE leads.social_links || EXCLUDED.social_links
+            END,
+            email = COALESCE(leads.email, EXCLUDED.email),
+            apify_title = COALESCE(leads.apify_title, EXCLUDED.apify_title),
+            apify_category_name = COALESCE(leads.apify_category_name, EXCLUDED.apify_category_name),
+            apify_address = COALESCE(leads.apify_address, EXCLUDED.apify_address),
+            apify_city = COALESCE(leads.apify_city, EXCLUDED.apify_city),
+            apify_state = COALESCE(leads.apify_state, EXCLUDED.apify_state),
+            apify_country_code = COALESCE(leads.apify_country_code, EXCLUDED.apify_country_code),
+            apify_website = COALESCE(leads.apify_website, EXCLUDED.apify_website),
+            apify_place_id = COALESCE(leads.apify_place_id, EXCLUDED.apify_place_id),
+            apify_total_score = EXCLUDED.apify_total_score,
+            apify_reviews_count = EXCLUDED.apify_reviews_count,
+            apify_rating = EXCLUDED.apify_rating,
+            apify_reviews = EXCLUDED.apify_reviews,
+            apify_scraped_at = EXCLUDED.apify_scraped_at,
+            apify_raw = EXCLUDED.apify_raw,
+            prospecting_niche = COALESCE(leads.prospecting_niche, EXCLUDED.prospecting_niche),
+            prospecting_location_query = COALESCE(leads.prospecting_location_query, EXCLUDED.prospecting_location_query),
+            updated_at = NOW()
+        WHERE leads.apify_scraped_at IS NULL OR EXCLUDED.apify_scraped_at > leads.apify_scraped_at
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT
+        COUNT(*) FILTER (WHERE inserted) AS inserted,
+        COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+        (SELECT COUNT(*) FROM prospect_stage) - COUNT(*) AS skipped
+    FROM upserted
+"""
+
+# Checkpoint del job en la misma transacción que el lote: al retomar, `fetched` es el offset exacto
+JOB_CHECKPOINT_SQL = """
+    UPDATE prospecting_jobs
+    SET fetched = fetched + $2,
+        imported = imported + $3,
+        updated = updated + $4,
+        skipped_already_exists = skipped_already_exists + $5,
+        skipped_no_phone = skipped_no_phone + $6,
+        fetched_from_web = fetched_from_web + $7,
+        heartbeat_at = NOW(), updated_at = NOW()
+    WHERE id = $1
+"""
+
+
+def _parse_scraped_at(value: Any) -> Optional[datetime]:
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return None
+
+
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def build_stage_record(ord_: int, item: dict, phone: str) -> tuple:
+    """Fila de `prospect_stage` (orden de STAGE_COLUMNS) para un item de Apify con teléfono."""
+    title = (item.get("title") or "").strip() or None
+    return (
+        ord_,
+        phone,
+        title[:100] if title else None,
+        item.get("email"),
+        json.dumps(extract_social_links(item)),
+        title,
+        item.get("categoryName"),
+        item.get("address"),
+        item.get("city"),
+        item.get("state"),
+        item.get("countryCode"),
+        item.get("website"),
+        item.get("placeId"),
+        _as_float(item.get("totalScore")),
+        _as_int(item.get("reviewsCount")),
+        _parse_scraped_at(item.get("scrapedAt")),
+        json.dumps(item),
+    )
+
+
+class ProspectIngestor:
+    """
+    Ingesta por lotes sobre una conexión dedicada (la tabla temporal vive en la sesión):
+
+        async with ProspectIngestor(tenant_id, niche, location, "54") as ingestor:
+            async for page in client.iter_dataset_items(dataset_id):
+                counts = await ingestor.ingest_batch(page)
+    """
+
+    def __init__(self, tenant_id: int, niche: str, location: str, default_cc: str):
+        self.tenant_id = tenant_id
+        self.niche = niche
+        self.location = location
+        self.default_cc = default_cc
+        self._conn = None
+
+    async def __aenter__(self):
+        self._conn = await db.pool.acquire()
+        try:
+            await self._conn.execute(CREATE_STAGE_SQL)
+        except Exception:
+            await db.pool.release(self._conn)
+            self._conn = None
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._conn is not None:
+            await db.pool.release(self._conn)
+            self._conn = None
+
+    async def _resolve_phones(self, items: List[dict]) -> tuple:
+        """(records, skipped_no_phone, fetched_from_web). Teléfono de Apify; si falta, crawl del sitio web."""
+        item_phones = []
+        for item in items:
+            raw_phone = item.get("phoneUnformatted") or item.get("phone")
+            item_phones.append(normalize_phone_e164(raw_phone, self.default_cc) if raw_phone else None)
+        missing = [item for item, phone in zip(items, item_phones) if not phone]
+        web_phones = await crawl_missing_phones(missing, self.default_cc) if missing else {}
+
+        records = []
+        skipped_no_phone = 0
+        fetched_from_web = 0
+        for i, (item, phone) in enumerate(zip(items, item_phones)):
+            if not phone:
+                phone = web_phones.get(website_for_item(item))
+                if phone:
+                    fetched_from_web += 1
+            if not phone:
+                skipped_no_phone += 1
+                continue
+            records.append(build_stage_record(i, item, phone))
+        return records, skipped_no_phone, fetched_from_web
+
+    async def ingest_batch(self, items: List[dict], checkpoint_job_id=None) -> Dict[str, int]:
+        """
+        Upsert de un lote. Si se pasa checkpoint_job_id, los contadores del job
+        (incluido `fetched`) avanzan en la misma transacción.
+        """
+        records, skipped_no_phone, fetched_from_web = await self._resolve_phones(items)
+        inserted = updated = skipped = 0
+        async with self._conn.transaction():
+            if records:
+                await self._conn.copy_records_to_table("prospect_stage", records=records, columns=STAGE_COLUMNS)
+                row = await self._conn.fetchrow(MERGE_STAGE_SQL, self.tenant_id, self.niche, self.location)
+                inserted, updated, skipped = row["inserted"], row["updated"], row["skipped"]
+            if checkpoint_job_id is not None:
+                await self._conn.execute(
+                    JOB_CHECKPOINT_SQL, checkpoint_job_id, len(items),
+                    inserted, updated, skipped, skipped_no_phone, fetched_from_web
+                )
+        return {
+            "imported": inserted,
+            "updated": updated,
+            "skipped_no_phone": skipped_no_phone,
+            "skipped_already_exists": skipped,
+            "fetched_from_web": fetched_from_web,
+        }
+
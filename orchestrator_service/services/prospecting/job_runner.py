@@ -0,0 +1,307 @@
+"""
+Prospecting Job Runner - Scrapes de Apify como jobs asíncronos persistidos.
+
+Ciclo de vida de `prospecting_jobs.status`:
+    queued -> running (run de Apify en curso) -> importing -> completed
+                                                         \\-> failed / cancelled
+El progreso (fetched / imported / updated / skipped) se persiste por lote en la fila del job y se
+emite por Socket.IO como PROSPECTING_JOB_PROGRESS. Los jobs no terminados se
+retoman al iniciar el servicio (resume_pending), usando un heartbeat para que
+solo un worker tome cada job.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from db import db
+from services.prospecting.apify_client import ApifyClient, APIFY_TERMINAL_STATUSES
+from services.prospecting.ingestion import ProspectIngestor
+
+logger = logging.getLogger(__name__)
+
+PROSPECTING_POLL_SECONDS = float(os.getenv("PROSPECTING_POLL_SECONDS", "5"))
+PROSPECTING_MAX_WAIT_SECONDS = float(os.getenv("PROSPECTING_MAX_WAIT_SECONDS", "1800"))
+PROSPECTING_STALE_SECONDS = int(os.getenv("PROSPECTING_STALE_SECONDS", "120"))
+
+ACTIVE_STATUSES = ("queued", "running", "importing", "cancelling")
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+JOB_COLUMNS = """
+    id, tenant_id, niche, location, max_places, country_code, status,
+    apify_run_id, apify_dataset_id, apify_status,
+    fetched, imported, updated, skipped_no_phone, skipped_already_exists, fetched_from_web,
+    error, created_at, started_at, finished_at, updated_at
+"""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def build_apify_body(niche: str, location: str, max_places: int) -> Dict[str, Any]:
+    """Input del actor compass~crawler-google-places."""
+    return {
+        "includeWebResults": True,
+        "language": "en",
+        "locationQuery": location,
+        "maxCrawledPlacesPerSearch": max_places,
+        "maxImages": 0,
+        "maximumLeadsEnrichmentRecords": 0,
+        "scrapeContacts": False,
+        "scrapeDirectories": False,
+        "scrapeImageAuthors": False,
+        "scrapePlaceDetailPage": False,
+        "scrapeReviewsPersonalData": True,
+        "scrapeTableReservationProvider": False,
+        "searchStringsArray": [niche.lower().strip()],
+        "skipClosedPlaces": False,
+    }
+
+
+class ProspectingJobRunner:
+    """Ejecuta jobs de prospección en tareas asyncio del proceso."""
+
+    def __init__(self, poll_seconds: float = PROSPECTING_POLL_SECONDS, max_wait_seconds: float = PROSPECTING_MAX_WAIT_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.worker_id = f"{os.getenv('HOSTNAME', 'orchestrator')}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._tasks: Dict[UUID, asyncio.Task] = {}
+
+    # ------------------------------------------------------------------ #
+    # API pública
+    # ------------------------------------------------------------------ #
+    async def create_job(
+        self, tenant_id: int, niche: str, location: str, max_places: int,
+        country_code: str, created_by: Optional[UUID] = None
+    ) -> Dict[str, Any]:
+        row = await db.pool.fetchrow(f"""
+            INSERT INTO prospecting_jobs (tenant_id, created_by, niche, location, max_places, country_code,
+                                          status, worker_id, heartbeat_at)
+            VALUES ($1, $2, $3, $4, $5, $6, 'queued', $7, NOW())
+            RETURNING {JOB_COLUMNS}
+        """, tenant_id, created_by, niche, location, max_places, country_code, self.worker_id)
+        self._spawn(row["id"])
+        return dict(row)
+
+    async def get_job(self, job_id: UUID, tenant_id: int) -> Optional[Dict[str, Any]]:
+        row = await db.pool.fetchrow(
+            f"SELECT {JOB_COLUMNS} FROM prospecting_jobs WHERE id = $1 AND tenant_id = $2", job_id, tenant_id
+        )
+        return dict(row) if row else None
+
+    async def list_jobs(self, tenant_id: int, limit: int = 20) -> list:
+        rows = await db.pool.fetch(
+            f"SELECT {JOB_COLUMNS} FROM prospecting_jobs WHERE tenant_id = $1 ORDER BY created_at DESC LIMIT $2",
+            tenant_id, limit
+        )
+        return [dict(r) for r in rows]
+
+    async def cancel_job(self, job_id: UUID, tenant_id: int) -> Optional[Dict[str, Any]]:
+        """Marca el job para cancelación; el worker que lo ejecuta aborta el run de Apify."""
+        row = await db.pool.fetchrow(f"""
+            UPDATE prospecting_jobs
+            SET status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE 'cancelling' END,
+                finished_at = CASE WHEN status = 'queued' THEN NOW() ELSE finished_at END,
+                updated_at = NOW()
+            WHERE id = $1 AND tenant_id = $2 AND status IN ('queued', 'running', 'importing')
+            RETURNING {JOB_COLUMNS}
+        """, job_id, tenant_id)
+        if row:
+            await self._emit(dict(row))
+        return dict(row) if row else None
+
+    async def resume_pending(self) -> int:
+        """Retoma jobs activos sin heartbeat reciente (reinicio / worker caído)."""
+        rows = await db.pool.fetch("""
+            UPDATE prospecting_jobs
+            SET worker_id = $1, heartbeat_at = NOW(), updated_at = NOW()
+            WHERE status = ANY($2::text[])
+              AND (heartbeat_at IS NULL OR heartbeat_at < NOW() - make_interval(secs => $3))
+            RETURNING id
+        """, self.worker_id, list(ACTIVE_STATUSES), PROSPECTING_STALE_SECONDS)
+        for r in rows:
+            self._spawn(r["id"])
+        if rows:
+            logger.info(f"🔁 Retomando {len(rows)} jobs de prospección")
+        return len(rows)
+
+    async def shutdown(self):
+        """Detiene las tareas locales; los jobs quedan activos y se retoman en el próximo arranque."""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        # Liberar el heartbeat para que otro worker pueda tomarlos inmediatamente
+        await db.pool.execute(
+            "UPDATE prospecting_jobs SET heartbeat_at = NULL WHERE worker_id = $1 AND status = ANY($2::text[])",
+            self.worker_id, list(ACTIVE_STATUSES)
+        )
+
+    async def wait(self, job_id: UUID):
+        task = self._tasks.get(job_id)
+        if task:
+            await asyncio.gather(task, return_exceptions=True)
+
+    # ------------------------------------------------------------------ #
+    # Ejecución
+    # ------------------------------------------------------------------ #
+    def _spawn(self, job_id: UUID):
+        if job_id in self._tasks and not self._tasks[job_id].done():
+            return
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _t, jid=job_id: self._tasks.pop(jid, None))
+
+    async def _update(self, job_id: UUID, **fields) -> Dict[str, Any]:
+        """Actualiza columnas + heartbeat y emite progreso. Lanza JobCancelled si se pidió cancelar."""
+        # Un pedido de cancelación concurrente nunca se pisa con el avance de estado, y un job
+        # ya terminado (p. ej. cancelado mientras estaba en cola) no se revive
+        sets = "".join(
+            f"status = CASE WHEN status = 'cancelling' THEN status ELSE ${i + 2} END, " if k == "status"
+            else f"{k} = ${i + 2}, "
+            for i, k in enumerate(fields)
+        )
+        row = await db.pool.fetchrow(f"""
+            UPDATE prospecting_jobs SET {sets}heartbeat_at = NOW(), updated_at = NOW()
+            WHERE id = $1 AND status <> ALL(${len(fields) + 2}::text[])
+            RETURNING {JOB_COLUMNS}
+        """, job_id, *fields.values(), list(TERMINAL_STATUSES))
+        if row is None:
+            raise JobCancelled()
+        job = dict(row)
+        await self._emit(job)
+        if job["status"] == "cancelling":
+            raise JobCancelled()
+        return job
+
+    async def _emit(self, job: Dict[str, Any]):
+        try:
+            from core.socket_manager import sio
+            await sio.emit("PROSPECTING_JOB_PROGRESS", {
+                "job_id": str(job["id"]),
+                "tenant_id": job["tenant_id"],
+                "status": job["status"],
+                "apify_status": job["apify_status"],
+                "fetched": job["fetched"],
+                "imported": job["imported"],
+                "updated": job["updated"],
+                "skipped_no_phone": job["skipped_no_phone"],
+                "skipped_already_exists": job["skipped_already_exists"],
+                "fetched_from_web": job["fetched_from_web"],
+                "error": job["error"],
+            })
+        except Exception as e:
+            logger.debug(f"prospecting_job_emit_failed: {e}")
+
+    def _apify_client(self) -> ApifyClient:
+        token = os.getenv("APIFY_API_TOKEN")
+        if not token:
+            raise RuntimeError("Missing APIFY_API_TOKEN in environment")
+        return ApifyClient(token)
+
+    async def _run(self, job_id: UUID):
+        row = await db.pool.fetchrow(f"SELECT {JOB_COLUMNS} FROM prospecting_jobs WHERE id = $1", job_id)
+        if row is None:
+            logger.warning(f"⚠️ Prospecting job {job_id} no encontrado; se omite")
+            return
+        job = dict(row)
+        if job["status"] in TERMINAL_STATUSES:
+            return
+        client = None
+        try:
+            if job["status"] == "cancelling":
+                raise JobCancelled()
+            client = self._apify_client()
+
+            # 1. Start run (solo si todavía no existe: resume seguro)
+            if not job["apify_run_id"]:
+                run = await client.start_run(build_apify_body(job["niche"], job["location"], job["max_places"]))
+                if not run.get("id"):
+                    raise RuntimeError("Failed to start Apify run (no run_id)")
+                # Si el job se canceló durante start_run, el abort necesita el run recién creado
+                job.update(apify_run_id=run["id"], apify_status=run.get("status"))
+                job = await self._update(
+                    job_id, status="running", started_at=_now(), apify_run_id=run["id"],
+                    apify_dataset_id=run.get("defaultDatasetId"), apify_status=run.get("status")
+                )
+                logger.info(f"🚀 Prospecting job {job_id}: Apify run {run['id']} iniciado")
+
+            # 2. Polling hasta estado terminal de Apify
+            if job["status"] in ("queued", "running"):
+                job = await self._poll_run(client, job)
+
+            # 3. Import del dataset
+            job = await self._import(client, job)
+            await self._update(job_id, status="completed", finished_at=_now())
+            logger.info(f"🏁 Prospecting job {job_id} completado: importados={job['imported']}")
+
+        except JobCancelled:
+            if client and job.get("apify_run_id") and job.get("apify_status") not in APIFY_TERMINAL_STATUSES:
+                try:
+                    await client.abort_run(job["apify_run_id"])
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo abortar Apify run {job['apify_run_id']}: {e}")
+            await self._finish(job_id, "cancelled")
+            logger.info(f"🛑 Prospecting job {job_id} cancelado")
+        except asyncio.CancelledError:
+            # Shutdown del proceso: el job queda activo para resume
+            raise
+        except Exception as e:
+            logger.error(f"❌ Prospecting job {job_id} falló: {e}")
+            await self._finish(job_id, "failed", error=str(e)[:500])
+        finally:
+            if client:
+                await client.close()
+
+    async def _finish(self, job_id: UUID, status: str, error: Optional[str] = None):
+        row = await db.pool.fetchrow(f"""
+            UPDATE prospecting_jobs
+            SET status = $2, error = COALESCE($3, error), finished_at = NOW(), updated_at = NOW()
+            WHERE id = $1 AND status <> ALL($4::text[])
+            RETURNING {JOB_COLUMNS}
+        """, job_id, status, error, list(TERMINAL_STATUSES))
+        if row:
+            await self._emit(dict(row))
+
+    async def _poll_run(self, client: ApifyClient, job: Dict[str, Any]) -> Dict[str, Any]:
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        run_status = job["apify_status"]
+        while run_status not in APIFY_TERMINAL_STATUSES:
+            await asyncio.sleep(self.poll_seconds)
+            run = await client.get_run(job["apify_run_id"])
+            run_status = run.get("status")
+            job = await self._update(
+                job["id"], apify_status=run_status,
+                apify_dataset_id=job["apify_dataset_id"] or run.get("defaultDatasetId")
+            )
+            if loop.time() - start > self.max_wait_seconds:
+                logger.warning(f"⏰ Timeout esperando Apify run {job['apify_run_id']}; importando items parciales")
+                break
+        if run_status != "SUCCEEDED":
+            logger.warning(f"⚠️ Apify run {job['apify_run_id']} finalizó con estado {run_status}; importando items parciales")
+        return await self._update(job["id"], status="importing")
+
+    async def _import(self, client: ApifyClient, job: Dict[str, Any]) -> Dict[str, Any]:
+        if not job["apify_dataset_id"]:
+            raise RuntimeError("Apify run did not provide a dataset ID")
+        if job["status"] != "importing":
+            job = await self._update(job["id"], status="importing")
+
+        # Lotes paginados desde el último offset confirmado (fetched avanza en la transacción del lote)
+        async with ProspectIngestor(job["tenant_id"], job["niche"], job["location"], job["country_code"]) as ingestor:
+            async for page in client.iter_dataset_items(job["apify_dataset_id"], offset=job["fetched"]):
+                await ingestor.ingest_batch(page, checkpoint_job_id=job["id"])
+                job = await self._update(job["id"])
+        return job
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+prospecting_job_runner = ProspectingJobRunner()
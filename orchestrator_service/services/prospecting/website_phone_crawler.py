@@ -0,0 +1,241 @@
+"""
+Website Phone Crawler - Scrape secundario de teléfonos para prospección.
+
+Visita en paralelo los sitios web de los lugares que Apify devolvió sin teléfono:
+- un único httpx.AsyncClient compartido (pool de conexiones),
+- concurrencia global acotada + límite por host,
+- lectura en streaming con tope de bytes (no se carga el HTML completo),
+- regex precompiladas (lógica del workflow n8n Scrap Phones),
+- cache persistente (URL, país) -> teléfono con TTL (`website_phone_cache`); solo las
+  respuestas 2xx HTML son definitivas, los fallos se cachean por un TTL corto.
+"""
+import asyncio
+import logging
+import os
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from core.utils import COUNTRY_PREFIXES_BY_LENGTH, normalize_phone_e164
+
+logger = logging.getLogger(__name__)
+
+CRAWLER_MAX_CONCURRENCY = int(os.getenv("PHONE_CRAWLER_MAX_CONCURRENCY", "20"))
+CRAWLER_PER_HOST_LIMIT = int(os.getenv("PHONE_CRAWLER_PER_HOST_LIMIT", "2"))
+CRAWLER_TIMEOUT_SECONDS = float(os.getenv("PHONE_CRAWLER_TIMEOUT_SECONDS", "8"))
+CRAWLER_MAX_BYTES = int(os.getenv("PHONE_CRAWLER_MAX_BYTES", str(512 * 1024)))
+CRAWLER_CACHE_TTL_DAYS = int(os.getenv("PHONE_CRAWLER_CACHE_TTL_DAYS", "30"))
+CRAWLER_FAILURE_TTL_MINUTES = int(os.getenv("PHONE_CRAWLER_FAILURE_TTL_MINUTES", "60"))
+CRAWLER_USER_AGENT = "Mozilla/5.0 (compatible; PhoneScraper/1.0)"
+
+_HREF_RE = re.compile(r'href=["\']([^"\']+)["\']', re.IGNORECASE)
+_TEL_HREF_RE = re.compile(r'^tel:([\d\s\-\+\(\)]+)', re.IGNORECASE)
+_WA_HREF_RE = re.compile(r'wa\.me/(\d{7,15})', re.IGNORECASE)
+_SCRIPT_RE = re.compile(r'<script[\s\S]*?</script>', re.IGNORECASE)
+_STYLE_RE = re.compile(r'<style[\s\S]*?</style>', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+_PHONE_KEYWORD_RE = re.compile(r'tel|teléfono|telefono|whatsapp|contacto|celular|llamanos', re.IGNORECASE)
+_PHONE_CANDIDATE_RE = re.compile(r'(?:\+?\d[\d()\s\-]{6,}\d)')
+
+_PREFIX_SCORE = {cc: len(COUNTRY_PREFIXES_BY_LENGTH) - i for i, (cc, _) in enumerate(COUNTRY_PREFIXES_BY_LENGTH)}
+
+
+def _prefix_score(num: str) -> int:
+    for cc, _ in COUNTRY_PREFIXES_BY_LENGTH:
+        if num.startswith(cc):
+            return _PREFIX_SCORE[cc]
+    return 0
+
+
+def extract_phone_from_html(html: str, default_cc: str = "54") -> Optional[str]:
+    """Best phone in an HTML document (tel:/wa.me links first, then text near phone keywords)."""
+    # 1) Extract tel: and wa.me links (highest quality)
+    link_phones = []
+    for href in _HREF_RE.findall(html):
+        tel_match = _TEL_HREF_RE.match(href)
+        if tel_match:
+            link_phones.append(tel_match.group(1))
+        wa_match = _WA_HREF_RE.search(href)
+        if wa_match:
+            link_phones.append(wa_match.group(1))
+
+    # 2) Strip tags, extract text near phone-related keywords
+    cleaned = _STYLE_RE.sub('', _SCRIPT_RE.sub('', html))
+    text = _WS_RE.sub(' ', _TAG_RE.sub(' ', cleaned))
+
+    raw_candidates = []
+    for frag in _SENTENCE_SPLIT_RE.split(text):
+        if _PHONE_KEYWORD_RE.search(frag):
+            raw_candidates.extend(_PHONE_CANDIDATE_RE.findall(frag))
+    raw_candidates.extend(link_phones)
+
+    # 3) Normalize and validate candidates
+    valid = []
+    seen = set()
+    for raw in raw_candidates:
+        norm = normalize_phone_e164(raw, default_cc)
+        if norm and norm not in seen:
+            seen.add(norm)
+            valid.append(norm)
+
+    if not valid:
+        return None
+
+    # 4) Prioritize by country prefix, then numbers that look like mobile (549 Arg / 521 Mex)
+    valid.sort(key=_prefix_score, reverse=True)
+    mobile_priority = [v for v in valid if v.startswith("549") or v.startswith("521")]
+    return mobile_priority[0] if mobile_priority else valid[0]
+
+
+class WebsitePhoneCache:
+    """
+    Cache persistente (URL, país por defecto) -> teléfono. Las respuestas 2xx HTML
+    (con o sin teléfono) duran ttl_days; los fallos (red, no-2xx, no-HTML) solo
+    failure_ttl_minutes, para no repetir el request en cada job sin fijar un negativo largo.
+    """
+
+    def __init__(self, ttl_days: int = CRAWLER_CACHE_TTL_DAYS, failure_ttl_minutes: int = CRAWLER_FAILURE_TTL_MINUTES):
+        self.ttl_days = ttl_days
+        self.failure_ttl_minutes = failure_ttl_minutes
+
+    async def get_many(self, urls: List[str], default_cc: str) -> Dict[str, Optional[str]]:
+        from db import db
+        rows = await db.pool.fetch("""
+            SELECT url, phone FROM website_phone_cache
+            WHERE url = ANY($1::text[]) AND default_cc = $2
+              AND fetched_at > NOW() - CASE WHEN definitive THEN make_interval(days => $3)
+                                            ELSE make_interval(mins => $4) END
+        """, urls, default_cc, self.ttl_days, self.failure_ttl_minutes)
+        return {r["url"]: r["phone"] for r in rows}
+
+    async def set_many(self, results: Dict[str, Tuple[Optional[str], bool]], default_cc: str) -> None:
+        """results: url -> (teléfono, definitivo)."""
+        if not results:
+            return
+        from db import db
+        await db.pool.execute("""
+            INSERT INTO website_phone_cache (url, default_cc, phone, definitive, fetched_at)
+            SELECT url, $2, phone, definitive, NOW()
+            FROM unnest($1::text[], $3::text[], $4::bool[]) AS t(url, phone, definitive)
+            ON CONFLICT (url, default_cc) DO UPDATE
+                SET phone = EXCLUDED.phone, definitive = EXCLUDED.definitive, fetched_at = EXCLUDED.fetched_at
+        """, list(results.keys()), default_cc,
+            [phone for phone, _ in results.values()], [definitive for _, definitive in results.values()])
+
+
+class WebsitePhoneCrawler:
+    """
+    Crawler concurrente de sitios web. Usar como context manager para compartir el cliente:
+
+        async with WebsitePhoneCrawler() as crawler:
+            phones = await crawler.extract_many(urls, default_cc="54")
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = CRAWLER_MAX_CONCURRENCY,
+        per_host_limit: int = CRAWLER_PER_HOST_LIMIT,
+        timeout: float = CRAWLER_TIMEOUT_SECONDS,
+        max_bytes: int = CRAWLER_MAX_BYTES,
+        cache: Optional[WebsitePhoneCache] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.cache = cache
+        self._client: Optional[httpx.AsyncClient] = None
+        self._global_sem = asyncio.Semaphore(max_concurrency)
+        self._host_sems: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(self.per_host_limit))
+
+    async def __aenter__(self):
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            follow_redirects=False,
+            headers={"User-Agent": CRAWLER_USER_AGENT},
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch_capped(self, url: str) -> Optional[str]:
+        """GET en streaming; corta al llegar a max_bytes. None si no hubo una respuesta 2xx HTML."""
+        host = urlsplit(url).netloc.lower()
+        async with self._host_sems[host], self._global_sem:
+            try:
+                async with self._client.stream("GET", url) as resp:
+                    if not resp.is_success:
+                        return None
+                    content_type = resp.headers.get("content-type", "")
+                    if content_type and "html" not in content_type and "text" not in content_type:
+                        return None
+                    chunks = []
+                    received = 0
+                    async for chunk in resp.aiter_bytes():
+                        chunks.append(chunk)
+                        received += len(chunk)
+                        if received >= self.max_bytes:
+                            break
+                    body = b"".join(chunks)[:self.max_bytes]
+                    return body.decode(resp.encoding or "utf-8", errors="replace")
+            except Exception as e:
+                logger.debug(f"phone_crawler_fetch_failed: url={url}, error={e}")
+                return None
+
+    async def _crawl(self, url: str, default_cc: str) -> Tuple[Optional[str], bool]:
+        """(teléfono, definitivo): definitivo solo si el sitio respondió 2xx con HTML."""
+        html = await self._fetch_capped(url)
+        if html is None:
+            return None, False
+        return (extract_phone_from_html(html, default_cc) if html else None), True
+
+    async def extract_phone(self, url: str, default_cc: str = "54") -> Optional[str]:
+        if not url:
+            return None
+        phone, _ = await self._crawl(url, default_cc)
+        return phone
+
+    async def extract_many(self, urls: Iterable[str], default_cc: str = "54") -> Dict[str, Optional[str]]:
+        """Teléfono por URL (None si no se encontró). Consulta y alimenta la cache si está configurada."""
+        unique_urls = list(dict.fromkeys(u for u in urls if u))
+        results: Dict[str, Optional[str]] = {}
+        if self.cache and unique_urls:
+            try:
+                results.update(await self.cache.get_many(unique_urls, default_cc))
+            except Exception as e:
+                logger.warning(f"⚠️ website_phone_cache no disponible: {e}")
+
+        pending = [u for u in unique_urls if u not in results]
+        if pending:
+            crawled = await asyncio.gather(*(self._crawl(u, default_cc) for u in pending))
+            results.update({url: phone for url, (phone, _) in zip(pending, crawled)})
+            if self.cache:
+                try:
+                    await self.cache.set_many(dict(zip(pending, crawled)), default_cc)
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo persistir website_phone_cache: {e}")
+        return results
+
+
+def website_for_item(item: dict) -> str:
+    """URL a visitar para un item de Apify (website o primer webResult)."""
+    website = item.get("website") or ""
+    if not website and item.get("webResults"):
+        website = (item["webResults"][0] or {}).get("url", "")
+    return website
+
+
+async def crawl_missing_phones(items: List[dict], default_cc: str) -> Dict[str, Optional[str]]:
+    """Helper para la ingesta de prospección: crawlea los sitios de los items sin teléfono."""
+    urls = [website_for_item(item) for item in items]
+    async with WebsitePhoneCrawler(cache=WebsitePhoneCache()) as crawler:
+        return await crawler.extract_many(urls, default_cc)
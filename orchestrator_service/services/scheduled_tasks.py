@@ -159,6 +159,9 @@ class ScheduledTasksService:
                 updated_tenants = result.fetchall()
                 if updated_tenants:
                     await db.commit()
+                    from core.security import invalidate_tenant_identity
+                    for t in updated_tenants:
+                        invalidate_tenant_identity(t.id)
                     logger.info(f"Trials expired for tenants: {[t.id for t in updated_tenants]}")
                 else:
                     logger.info("No newly expired trials found")
@@ -204,6 +207,56 @@ class ScheduledTasksService:
         except Exception as e:
             logger.error(f"Error in scheduled daily reports: {e}")
     
+    async def archive_cold_conversations(self):
+        """Mover historial conversacional antiguo a cold storage"""
+        logger.info("Running scheduled chat archiving")
+        
+        try:
+            from .chat_archive_service import chat_archive_service
+            await chat_archive_service.archive_all()
+        except Exception as e:
+            logger.error(f"Error in scheduled chat archiving: {e}")
+    
+    async def reconcile_lead_rollups(self):
+        """Reconciliar lead_daily_stats contra la tabla leads"""
+        logger.info("Running scheduled lead rollup reconciliation")
+        
+        try:
+            from .lead_stats_service import lead_stats_service
+            await lead_stats_service.reconcile_all()
+        except Exception as e:
+            logger.error(f"Error in scheduled lead rollup reconciliation: {e}")
+    
+    async def launch_scheduled_campaigns(self):
+        """Lanzar campañas programadas cuyo horario ya llegó"""
+        logger.info("Running scheduled campaign launches")
+        
+        try:
+            from .outreach.campaign_service import campaign_service
+            await campaign_service.launch_due()
+        except Exception as e:
+            logger.error(f"Error in scheduled campaign launches: {e}")
+    
+    async def link_chat_messages_to_leads(self):
+        """Vincular mensajes de chat sin lead_id con su lead (histórico / leads creados después)"""
+        logger.info("Running scheduled chat-lead linking")
+        
+        try:
+            from .chat_lead_link_service import chat_lead_link_service
+            await chat_lead_link_service.backfill()
+        except Exception as e:
+            logger.error(f"Error in scheduled chat-lead linking: {e}")
+    
+    async def reconcile_seller_load(self):
+        """Recalcular contadores seller_load (vencimientos por ventana + drift)"""
+        logger.info("Running scheduled seller load reconciliation")
+        
+        try:
+            from .seller_load_service import seller_load_service
+            await seller_load_service.reconcile()
+        except Exception as e:
+            logger.error(f"Error in scheduled seller load reconciliation: {e}")
+    
     def start_all_tasks(self):
         """Iniciar todas las tareas programadas"""
         if not self.scheduler:
@@ -256,6 +309,53 @@ class ScheduledTasksService:
                 replace_existing=True
             )
             
+            # 6. Archivado de conversaciones frías a las 3:30 AM
+            self.scheduler.add_job(
+                self.archive_cold_conversations,
+                CronTrigger(hour=3, minute=30),
+                id='chat_archive',
+                name='Cold Chat Archive',
+                replace_existing=True
+            )
+            
+            # 7. Reconciliación de rollups de leads a las 3:00 AM
+            self.scheduler.add_job(
+                self.reconcile_lead_rollups,
+                CronTrigger(hour=3, minute=0),
+                id='lead_rollup_reconcile',
+                name='Lead Rollup Reconciliation',
+                replace_existing=True
+            )
+            
+            # 8. Lanzamiento de campañas programadas cada minuto
+            self.scheduler.add_job(
+                self.launch_scheduled_campaigns,
+                IntervalTrigger(minutes=1),
+                id='campaign_launcher',
+                name='Scheduled Campaign Launcher',
+                replace_existing=True
+            )
+            
+            # 9. Vinculación chat_messages -> leads a las 3:15 AM (y una vez al iniciar)
+            self.scheduler.add_job(
+                self.link_chat_messages_to_leads,
+                CronTrigger(hour=3, minute=15),
+                id='chat_lead_link',
+                name='Chat Lead Linking',
+                next_run_time=datetime.now(),
+                replace_existing=True
+            )
+            
+            # 10. Reconciliación de carga de vendedores cada 10 minutos (y una vez al iniciar)
+            self.scheduler.add_job(
+                self.reconcile_seller_load,
+                IntervalTrigger(minutes=10),
+                id='seller_load_reconcile',
+                name='Seller Load Reconciliation',
+                next_run_time=datetime.now(),
+                replace_existing=True
+            )
+            
             # Iniciar scheduler
             self.scheduler.start()
             logger.info("All scheduled tasks started")
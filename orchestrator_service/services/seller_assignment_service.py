@@ -1,16 +1,229 @@
 """
 Service for managing seller assignments to conversations and leads
 """
+import json
 import logging
-from typing import Optional, Dict, List, Any
+import os
+from collections import Counter
+from dataclasses import dataclass, replace
+from typing import Optional, Dict, List, Any, FrozenSet, Tuple
 from uuid import UUID
 from datetime import datetime, timedelta
 from db import db
+from core.cache import TTLCache
 from core.security import get_resolved_tenant_id
-from services.seller_notification_service import seller_notification_service, Notification
+from services.seller_notification_service import notification_service as seller_notification_service, Notification
+from services.seller_load_service import seller_load_service
 
 logger = logging.getLogger(__name__)
 
+# Plan de asignación compilado por tenant: reglas activas + roster, en memoria.
+# El CRUD de reglas y los cambios de usuarios/vendedores llaman a invalidate_assignment_plan;
+# el TTL cubre el resto (y la antigüedad del ranking de performance).
+ASSIGNMENT_PLAN_TTL_SECONDS = float(os.getenv("ASSIGNMENT_PLAN_TTL_SECONDS", "30"))
+
+_plan_cache = TTLCache(ASSIGNMENT_PLAN_TTL_SECONDS, 10000)
+
+ASSIGNABLE_ROLES = ('setter', 'closer', 'professional')
+
+PLAN_USERS_SQL = """
+    SELECT u.id, u.first_name, u.last_name, u.role, s.user_id IS NOT NULL AS is_seller
+    FROM users u
+    LEFT JOIN (SELECT DISTINCT user_id FROM sellers WHERE tenant_id = $1) s ON s.user_id = u.id
+    WHERE u.tenant_id = $1
+    AND u.status = 'active'
+    AND u.role IN ('setter', 'closer', 'professional', 'ceo')
+    ORDER BY u.id
+"""
+
+PLAN_RULES_SQL = """
+    SELECT id, rule_name, rule_type, apply_to_lead_source, apply_to_seller_roles, max_conversations_per_seller
+    FROM assignment_rules
+    WHERE tenant_id = $1 AND is_active = TRUE
+    ORDER BY priority ASC
+"""
+
+# Ranking de performance (mejor primero) entre los candidatos de las reglas 'performance';
+# cada regla toma el primero del ranking que esté entre sus propios candidatos
+PERFORMANCE_RANKING_SQL = """
+    SELECT sm.seller_id
+    FROM seller_metrics sm
+    JOIN users u ON sm.seller_id = u.id
+    WHERE sm.tenant_id = $1
+    AND sm.seller_id = ANY($2::uuid[])
+    AND u.status = 'active'
+    AND sm.metrics_period_start >= NOW() - INTERVAL '30 days'
+    ORDER BY sm.conversion_rate DESC NULLS LAST,
+             sm.leads_converted DESC
+"""
+
+# Avanza $3 posiciones el puntero de rotación (tenant, regla $2): un round trip atómico (el
+# lock de fila serializa asignaciones concurrentes, cada una recibe posiciones distintas)
+ROTATION_ADVANCE_SQL = """
+    INSERT INTO seller_rotation_state (tenant_id, rule_key, position, updated_at)
+    VALUES ($1, $2, $3, NOW())
+    ON CONFLICT (tenant_id, rule_key) DO UPDATE
+    SET position = seller_rotation_state.position + $3, updated_at = NOW()
+    RETURNING position
+"""
+
+# Puntero de la reasignación masiva round_robin (sobre todo el roster)
+BULK_ROTATION_KEY = ''
+
+# Reasignación masiva
+BULK_REASSIGN_MAX_CONVERSATIONS = int(os.getenv("BULK_REASSIGN_MAX_CONVERSATIONS", "5000"))
+BULK_REASSIGN_STRATEGIES = ('seller', 'round_robin', 'load_balance')
+
+# Conversaciones a mover: el vendedor actual es el del último mensaje de cada teléfono
+BULK_SELECT_CONVERSATIONS_SQL = """
+    SELECT phone, assigned_seller_id FROM (
+        SELECT DISTINCT ON (from_number) from_number AS phone, assigned_seller_id
+        FROM chat_messages
+        WHERE tenant_id = $1 AND ($2::text[] IS NULL OR from_number = ANY($2::text[]))
+        ORDER BY from_number, created_at DESC
+    ) c
+    WHERE $3::uuid IS NULL OR assigned_seller_id = $3::uuid
+    ORDER BY phone
+    LIMIT $4
+"""
+
+BULK_ASSIGN_CHATS_SQL = """
+    UPDATE chat_messages cm
+    SET assigned_seller_id = m.seller_id,
+        assigned_at = NOW(),
+        assigned_by = $2,
+        assignment_source = $3
+    FROM unnest($4::text[], $5::uuid[]) AS m(phone, seller_id)
+    WHERE cm.tenant_id = $1 AND cm.from_number = m.phone
+"""
+
+BULK_ASSIGN_LEADS_SQL = """
+    UPDATE leads l
+    SET assigned_seller_id = m.seller_id,
+        initial_assignment_source = $3,
+        assignment_history = COALESCE(l.assignment_history, '[]') || jsonb_build_array(
+            jsonb_build_object(
+                'seller_id', m.seller_id::text,
+                'assigned_at', NOW()::text,
+                'assigned_by', $2::text,
+                'source', $3
+            )
+        )
+    FROM unnest($4::text[], $5::uuid[]) AS m(phone, seller_id)
+    WHERE l.tenant_id = $1 AND l.phone_number = m.phone
+"""
+
+# Snapshot de conversaciones activas (24h) para varios vendedores en un upsert
+SELLER_ACTIVE_CONVERSATIONS_UPSERT_SQL = """
+    INSERT INTO seller_metrics
+    (seller_id, tenant_id, active_conversations, metrics_period_start, metrics_period_end)
+    SELECT s.id, $1, COUNT(DISTINCT cm.from_number),
+           DATE_TRUNC('day', NOW()), DATE_TRUNC('day', NOW()) + INTERVAL '1 day'
+    FROM unnest($2::uuid[]) AS s(id)
+    LEFT JOIN chat_messages cm ON cm.assigned_seller_id = s.id
+        AND cm.tenant_id = $1
+        AND cm.assigned_at >= NOW() - INTERVAL '24 hours'
+    GROUP BY s.id
+    ON CONFLICT (seller_id, tenant_id, metrics_period_start)
+    DO UPDATE SET
+        active_conversations = EXCLUDED.active_conversations,
+        metrics_calculated_at = NOW()
+"""
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """Regla activa con filtros normalizados y candidatos ya resueltos contra el roster"""
+    name: str
+    rule_type: str
+    lead_sources: Optional[FrozenSet[str]]
+    candidates: Tuple[Dict, ...]
+    max_conversations: Optional[int] = None
+    key: str = ''  # id de la regla: clave de su puntero de rotación
+    top_performer: Optional[UUID] = None  # solo 'performance': mejor ranking entre candidates
+
+    def matches(self, lead_source: Optional[str]) -> bool:
+        return not (self.lead_sources and lead_source and lead_source not in self.lead_sources)
+
+
+@dataclass(frozen=True)
+class AssignmentPlan:
+    """Decisión de asignación de un tenant, compilada una vez y evaluada en memoria"""
+    rules: Tuple[CompiledRule, ...]
+    roster: Tuple[Dict, ...]  # setter/closer/professional con registro en sellers, orden por id
+    fallback: Tuple[UUID, ...]  # roster + CEO con registro en sellers (orden rol/nombre)
+    ceo_id: Optional[UUID] = None
+
+
+async def compile_assignment_plan(tenant_id: int) -> AssignmentPlan:
+    users = [dict(r) for r in await db.fetch(PLAN_USERS_SQL, tenant_id)]
+    rules = await db.fetch(PLAN_RULES_SQL, tenant_id)
+
+    roster = tuple(
+        {k: u[k] for k in ('id', 'first_name', 'last_name', 'role')}
+        for u in users if u['is_seller'] and u['role'] in ASSIGNABLE_ROLES
+    )
+    fallback = tuple(
+        u['id'] for u in sorted(
+            (u for u in users if u['is_seller']), key=lambda u: (u['role'], u['first_name'] or '')
+        )
+    )
+    ceo_id = next((u['id'] for u in users if u['role'] == 'ceo'), None)
+
+    compiled = []
+    for rule in rules:
+        roles = set(rule['apply_to_seller_roles'] or [])
+        compiled.append(CompiledRule(
+            name=rule['rule_name'],
+            rule_type=rule['rule_type'],
+            lead_sources=frozenset(rule['apply_to_lead_source']) if rule['apply_to_lead_source'] else None,
+            candidates=tuple(s for s in roster if not roles or s['role'] in roles),
+            max_conversations=rule['max_conversations_per_seller'],
+            key=str(rule['id']),
+        ))
+
+    performance_candidates = {c['id'] for r in compiled if r.rule_type == 'performance' for c in r.candidates}
+    if performance_candidates:
+        ranking = [r['seller_id'] for r in await db.fetch(
+            PERFORMANCE_RANKING_SQL, tenant_id, list(performance_candidates)
+        )]
+
+        def best_of(rule: CompiledRule) -> Optional[UUID]:
+            ids = {c['id'] for c in rule.candidates}
+            return next((s for s in ranking if s in ids), None)
+
+        compiled = [replace(r, top_performer=best_of(r)) if r.rule_type == 'performance' else r for r in compiled]
+
+    return AssignmentPlan(tuple(compiled), roster, fallback, ceo_id)
+
+
+def spread_by_load(
+    current: List[Optional[UUID]],
+    candidates: List[UUID],
+    loads: Dict[UUID, int]
+) -> List[UUID]:
+    """Reparto greedy: cada conversación va al candidato menos cargado (empate -> orden de
+    candidates), descontando primero la conversación de su vendedor actual."""
+    loads = {c: loads.get(c, 0) for c in candidates}
+    targets = []
+    for seller_id in current:
+        if seller_id in loads:
+            loads[seller_id] -= 1
+        target = min(candidates, key=lambda c: loads[c])
+        loads[target] += 1
+        targets.append(target)
+    return targets
+
+
+def invalidate_assignment_plan(tenant_id: Optional[int] = None) -> None:
+    """Llamar tras el CRUD de reglas o al activar/suspender usuarios o modificar vendedores.
+    Sin tenant_id vacía todo."""
+    if tenant_id is None:
+        _plan_cache.invalidate()
+    else:
+        _plan_cache.invalidate(lambda key: key == tenant_id)
+
+
 class SellerAssignmentService:
     
     async def assign_conversation_to_seller(
@@ -73,6 +286,9 @@ class SellerAssignmentService:
                 WHERE phone_number = $4 AND tenant_id = $5
             """, seller_id, source, str(assigned_by), phone, tenant_id)
             
+            # 4b. Live load counters (+1 nuevo vendedor, -1 al anterior si es reasignación)
+            await seller_load_service.record_assignment(tenant_id, seller_id, conversation['assigned_seller_id'])
+            
             # 5. Notify seller and CEO
             await self._notify_assignment(phone, seller_id, seller.get('first_name', 'Vendedor'), tenant_id, source)
             
@@ -165,14 +381,14 @@ class SellerAssignmentService:
                     COALESCE(sm.active_conversations, 0) as active_conversations,
                     COALESCE(sm.conversion_rate, 0) as conversion_rate
                 FROM users u
+                -- Ensure they have a record in sellers table (B-01 requirement): one semi-join
+                JOIN (SELECT DISTINCT user_id FROM sellers WHERE tenant_id = $1) s ON s.user_id = u.id
                 LEFT JOIN seller_metrics sm ON u.id = sm.seller_id 
                     AND sm.tenant_id = $1 
                     AND sm.metrics_period_start >= NOW() - INTERVAL '7 days'
                 WHERE u.tenant_id = $1 
                 AND u.status = 'active'
                 AND u.role IN ('setter', 'closer', 'professional', 'ceo')
-                -- Ensure they have a record in sellers table (B-01 requirement)
-                AND EXISTS (SELECT 1 FROM sellers s WHERE s.user_id = u.id)
             """
             
             params = [tenant_id]
@@ -197,45 +413,34 @@ class SellerAssignmentService:
         lead_source: Optional[str] = None
     ) -> Dict:
         """
-        Automatically assign conversation based on rules
+        Automatically assign conversation based on rules (compiled plan, evaluated in memory)
         """
         try:
-            # 1. Get active assignment rules for this tenant
-            rules = await db.fetch("""
-                SELECT * FROM assignment_rules 
-                WHERE tenant_id = $1 AND is_active = TRUE
-                ORDER BY priority ASC
-            """, tenant_id)
-            
-            if not rules:
+            plan = await self.get_assignment_plan(tenant_id)
+            
+            if not plan.rules:
                 # No rules, assign to CEO if exists
-                ceo = await db.fetchrow("""
-                    SELECT id FROM users 
-                    WHERE tenant_id = $1 AND role = 'ceo' AND status = 'active'
-                    LIMIT 1
-                """, tenant_id)
-                
-                if ceo:
+                if plan.ceo_id:
                     return await self.assign_conversation_to_seller(
-                        phone, ceo['id'], UUID(int=0), tenant_id, "auto_ceo_fallback"
+                        phone, plan.ceo_id, UUID(int=0), tenant_id, "auto_ceo_fallback"
                     )
                 return {"success": False, "message": "No assignment rules and no CEO found"}
             
-            # 2. Apply rules in priority order
-            for rule in rules:
-                seller_id = await self._apply_assignment_rule(rule, tenant_id, lead_source)
+            # Apply rules in priority order
+            for rule in plan.rules:
+                if not rule.matches(lead_source):
+                    continue
+                seller_id = await self._apply_assignment_rule(rule, plan, tenant_id, lead_source)
                 if seller_id:
                     return await self.assign_conversation_to_seller(
-                        phone, seller_id, UUID(int=0), tenant_id, f"auto_{rule['rule_type']}"
+                        phone, seller_id, UUID(int=0), tenant_id, f"auto_{rule.rule_type}"
                     )
             
-            # 3. Fallback to round-robin among all active sellers
-            sellers = await self.get_available_sellers(tenant_id)
-            if sellers:
-                # Simple round-robin: get seller with fewest active conversations
-                sellers_sorted = sorted(sellers, key=lambda x: x.get('active_conversations', 0))
+            # Fallback: seller with fewest open conversations among all active sellers
+            if plan.fallback:
+                seller_id = await seller_load_service.least_loaded(tenant_id, list(plan.fallback))
                 return await self.assign_conversation_to_seller(
-                    phone, sellers_sorted[0]['id'], UUID(int=0), tenant_id, "auto_round_robin"
+                    phone, seller_id, UUID(int=0), tenant_id, "auto_round_robin"
                 )
             
             return {"success": False, "message": "No available sellers for assignment"}
@@ -246,147 +451,67 @@ class SellerAssignmentService:
     
     async def _apply_assignment_rule(
         self,
-        rule: Dict,
+        rule: CompiledRule,
+        plan: AssignmentPlan,
         tenant_id: int,
         lead_source: Optional[str] = None
     ) -> Optional[UUID]:
         """
-        Apply a specific assignment rule and return seller_id if match
+        Apply a compiled assignment rule and return seller_id if match
         """
         try:
-            rule_type = rule['rule_type']
-            config = rule.get('config', {})
-            
-            # Check filters
-            if not self._check_rule_filters(rule, lead_source):
-                return None
-            
-            if rule_type == 'round_robin':
-                return await self._round_robin_assignment(tenant_id, config)
-            elif rule_type == 'performance':
-                return await self._performance_based_assignment(tenant_id, config)
-            elif rule_type == 'specialty':
-                return await self._specialty_based_assignment(tenant_id, config, lead_source)
-            elif rule_type == 'load_balance':
-                return await self._load_balance_assignment(tenant_id, config)
+            if rule.rule_type == 'round_robin':
+                return await self._round_robin_assignment(tenant_id, rule.candidates, rule.key)
+            elif rule.rule_type == 'performance':
+                return rule.top_performer
+            elif rule.rule_type == 'specialty':
+                return self._specialty_based_assignment(rule.candidates, lead_source)
+            elif rule.rule_type == 'load_balance':
+                return await self._load_balance_assignment(tenant_id, rule.candidates, rule.max_conversations)
             
             return None
             
         except Exception as e:
-            logger.error(f"Error applying rule {rule.get('rule_name')}: {e}")
+            logger.error(f"Error applying rule {rule.name}: {e}")
             return None
     
+    async def get_assignment_plan(self, tenant_id: int) -> AssignmentPlan:
+        """Compiled rules + roster for the tenant (cached until invalidated or TTL)"""
+        return await _plan_cache.get_or_load(tenant_id, lambda: compile_assignment_plan(tenant_id))
+
     async def _round_robin_assignment(
         self,
         tenant_id: int,
-        config: Dict
+        candidates: Tuple[Dict, ...],
+        rule_key: str = BULK_ROTATION_KEY
     ) -> Optional[UUID]:
-        """Round-robin assignment among available sellers"""
-        sellers = await self.get_available_sellers(tenant_id)
-        if not sellers:
+        """Round-robin assignment: persistent per-rule rotation pointer over the rule's compiled candidates"""
+        if not candidates:
             return None
         
-        # Get seller with oldest assignment (or never assigned)
-        seller_with_oldest = await db.fetchrow("""
-            SELECT u.id, MAX(cm.assigned_at) as last_assigned
-            FROM users u
-            LEFT JOIN chat_messages cm ON u.id = cm.assigned_seller_id
-            WHERE u.tenant_id = $1 
-            AND u.status = 'active'
-            AND u.role IN ('setter', 'closer', 'professional')
-            GROUP BY u.id
-            ORDER BY last_assigned NULLS FIRST
-            LIMIT 1
-        """, tenant_id)
-        
-        if seller_with_oldest:
-            return seller_with_oldest['id']
-        
-        # Fallback to first seller
-        return sellers[0]['id']
-    
-    async def _performance_based_assignment(
-        self,
-        tenant_id: int,
-        config: Dict
-    ) -> Optional[UUID]:
-        """Assign to seller with best performance metrics"""
-        seller = await db.fetchrow("""
-            SELECT sm.seller_id
-            FROM seller_metrics sm
-            JOIN users u ON sm.seller_id = u.id
-            WHERE sm.tenant_id = $1
-            AND u.status = 'active'
-            AND sm.metrics_period_start >= NOW() - INTERVAL '30 days'
-            ORDER BY sm.conversion_rate DESC NULLS LAST,
-                     sm.leads_converted DESC
-            LIMIT 1
-        """, tenant_id)
-        
-        return seller['seller_id'] if seller else None
+        position = await db.fetchval(ROTATION_ADVANCE_SQL, tenant_id, rule_key, 1)
+        return candidates[(position - 1) % len(candidates)]['id']
     
-    async def _specialty_based_assignment(
+    def _specialty_based_assignment(
         self,
-        tenant_id: int,
-        config: Dict,
+        candidates: Tuple[Dict, ...],
         lead_source: Optional[str]
     ) -> Optional[UUID]:
         """Assign based on seller specialty"""
         # Default: setters for new leads, closers for warm leads
-        if lead_source == 'META_ADS' or not lead_source:
-            # New leads go to setters
-            seller = await db.fetchrow("""
-                SELECT id FROM users 
-                WHERE tenant_id = $1 
-                AND role = 'setter'
-                AND status = 'active'
-                LIMIT 1
-            """, tenant_id)
-            return seller['id'] if seller else None
-        else:
-            # Other leads go to closers
-            seller = await db.fetchrow("""
-                SELECT id FROM users 
-                WHERE tenant_id = $1 
-                AND role = 'closer'
-                AND status = 'active'
-                LIMIT 1
-            """, tenant_id)
-            return seller['id'] if seller else None
+        role = 'setter' if lead_source == 'META_ADS' or not lead_source else 'closer'
+        return next((s['id'] for s in candidates if s['role'] == role), None)
     
     async def _load_balance_assignment(
         self,
         tenant_id: int,
-        config: Dict
+        candidates: Tuple[Dict, ...],
+        max_conversations: Optional[int] = None
     ) -> Optional[UUID]:
-        """Assign to seller with lightest load"""
-        seller = await db.fetchrow("""
-            SELECT u.id, COALESCE(sm.active_conversations, 0) as load
-            FROM users u
-            LEFT JOIN seller_metrics sm ON u.id = sm.seller_id 
-                AND sm.tenant_id = $1
-            WHERE u.tenant_id = $1 
-            AND u.status = 'active'
-            AND u.role IN ('setter', 'closer', 'professional')
-            ORDER BY load ASC
-            LIMIT 1
-        """, tenant_id)
-        
-        return seller['id'] if seller else None
-    
-    def _check_rule_filters(
-        self,
-        rule: Dict,
-        lead_source: Optional[str]
-    ) -> bool:
-        """Check if rule filters match the lead"""
-        apply_to_source = rule.get('apply_to_lead_source')
-        if apply_to_source and lead_source:
-            if lead_source not in apply_to_source:
-                return False
-        
-        # Add more filter checks as needed
-        return True
+        """Assign to seller with lightest load: one read of the live seller_load counters"""
+        return await seller_load_service.least_loaded(
+            tenant_id, [s['id'] for s in candidates], max_conversations
+        )
     
     async def _update_seller_metrics(
         self,
@@ -394,27 +519,16 @@ class SellerAssignmentService:
         tenant_id: int
     ):
         """Update seller metrics after assignment"""
+        await self._update_sellers_metrics([seller_id], tenant_id)
+    
+    async def _update_sellers_metrics(
+        self,
+        seller_ids: List[UUID],
+        tenant_id: int
+    ):
+        """Refresh the active_conversations snapshot of several sellers in one statement"""
         try:
-            # Calculate active conversations
-            active_convs = await db.fetchval("""
-                SELECT COUNT(DISTINCT from_number)
-                FROM chat_messages
-                WHERE assigned_seller_id = $1 
-                AND tenant_id = $2
-                AND assigned_at >= NOW() - INTERVAL '24 hours'
-            """, seller_id, tenant_id)
-            
-            # Update or insert metrics
-            await db.execute("""
-                INSERT INTO seller_metrics 
-                (seller_id, tenant_id, active_conversations, metrics_period_start, metrics_period_end)
-                VALUES ($1, $2, $3, DATE_TRUNC('day', NOW()), DATE_TRUNC('day', NOW()) + INTERVAL '1 day')
-                ON CONFLICT (seller_id, tenant_id, metrics_period_start) 
-                DO UPDATE SET 
-                    active_conversations = EXCLUDED.active_conversations,
-                    metrics_calculated_at = NOW()
-            """, seller_id, tenant_id, active_convs)
-            
+            await db.execute(SELLER_ACTIVE_CONVERSATIONS_UPSERT_SQL, tenant_id, seller_ids)
         except Exception as e:
             logger.error(f"Error updating seller metrics: {e}")
     
@@ -435,7 +549,7 @@ class SellerAssignmentService:
                     l.last_name,
                     l.status as lead_status
                 FROM chat_messages cm
-                LEFT JOIN leads l ON cm.from_number = l.phone_number AND cm.tenant_id = l.tenant_id
+                LEFT JOIN leads l ON l.id = cm.lead_id
                 WHERE cm.assigned_seller_id = $1 
                 AND cm.tenant_id = $2
             """
@@ -497,6 +611,166 @@ class SellerAssignmentService:
             logger.error(f"Error reassigning conversation: {e}")
             return {"success": False, "message": f"Error: {str(e)}"}
 
+    async def bulk_reassign_conversations(
+        self,
+        tenant_id: int,
+        reassigned_by: UUID,
+        strategy: str,
+        phones: Optional[List[str]] = None,
+        from_seller_id: Optional[UUID] = None,
+        target_seller_id: Optional[UUID] = None,
+        reason: Optional[str] = None
+    ) -> Dict:
+        """
+        Reassign many conversations in one transaction (set-based UPDATEs).
+        Selection: phones and/or conversations currently held by from_seller_id.
+        strategy: 'seller' (all to target_seller_id), 'round_robin' or 'load_balance' over the roster.
+        Returns: {"success": bool, "reassigned": int, "unchanged": int, "by_seller": {seller_id: count}}
+        """
+        if strategy not in BULK_REASSIGN_STRATEGIES:
+            return {"success": False, "message": f"Unknown strategy '{strategy}'"}
+        if not phones and not from_seller_id:
+            return {"success": False, "message": "Provide phones or from_seller_id"}
+        if strategy == 'seller' and not target_seller_id:
+            return {"success": False, "message": "target_seller_id is required for strategy 'seller'"}
+        
+        try:
+            if strategy == 'seller':
+                seller = await db.fetchrow("""
+                    SELECT id FROM users 
+                    WHERE id = $1 AND tenant_id = $2 AND status = 'active'
+                """, target_seller_id, tenant_id)
+                if not seller:
+                    return {"success": False, "message": "Seller not found or inactive"}
+                candidates = [target_seller_id]
+            else:
+                plan = await self.get_assignment_plan(tenant_id)
+                candidates = [s['id'] for s in plan.roster if s['id'] != from_seller_id]
+                if not candidates:
+                    return {"success": False, "message": "No available sellers for assignment"}
+            
+            source = "bulk_reassignment"
+            async with db.pool.acquire() as conn:
+                async with conn.transaction():
+                    # 1. Resolve the conversations and their current seller
+                    rows = await conn.fetch(
+                        BULK_SELECT_CONVERSATIONS_SQL, tenant_id, phones or None, from_seller_id,
+                        BULK_REASSIGN_MAX_CONVERSATIONS + 1
+                    )
+                    if len(rows) > BULK_REASSIGN_MAX_CONVERSATIONS:
+                        return {
+                            "success": False,
+                            "message": f"More than {BULK_REASSIGN_MAX_CONVERSATIONS} conversations match; narrow the filter"
+                        }
+                    current = [r['assigned_seller_id'] for r in rows]
+                    
+                    # 2. Pick targets in memory
+                    if strategy == 'round_robin' and rows:
+                        end = await conn.fetchval(ROTATION_ADVANCE_SQL, tenant_id, BULK_ROTATION_KEY, len(rows))
+                        start = end - len(rows)
+                        targets = [candidates[(start + i) % len(candidates)] for i in range(len(rows))]
+                    elif strategy == 'load_balance':
+                        loads = await conn.fetch(
+                            "SELECT seller_id, open_conversations FROM seller_load WHERE tenant_id = $1", tenant_id
+                        )
+                        targets = spread_by_load(current, candidates, {r['seller_id']: r['open_conversations'] for r in loads})
+                    else:
+                        targets = [target_seller_id] * len(rows)
+                    
+                    moves = [(r['phone'], r['assigned_seller_id'], t) for r, t in zip(rows, targets) if r['assigned_seller_id'] != t]
+                    if not moves:
+                        return {"success": True, "reassigned": 0, "unchanged": len(rows), "by_seller": {}}
+                    moved_phones = [m[0] for m in moves]
+                    previous = [m[1] for m in moves]
+                    new = [m[2] for m in moves]
+                    
+                    # 3. Set-based UPDATEs + live load counters
+                    await conn.execute(BULK_ASSIGN_CHATS_SQL, tenant_id, reassigned_by, source, moved_phones, new)
+                    await conn.execute(BULK_ASSIGN_LEADS_SQL, tenant_id, str(reassigned_by), source, moved_phones, new)
+                    await seller_load_service.record_bulk_assignment(tenant_id, new, previous, conn=conn)
+                    
+                    # 4. One audit event for the whole batch
+                    by_seller = Counter(str(t) for t in new)
+                    by_previous = Counter(str(p) for p in previous if p)
+                    await conn.execute("""
+                        INSERT INTO system_events 
+                        (tenant_id, user_id, event_type, severity, message, payload)
+                        VALUES ($1, $2, 'seller_bulk_reassignment', 'info', 
+                                'Conversations reassigned in bulk',
+                                jsonb_build_object(
+                                    'count', $3::int,
+                                    'strategy', $4::text,
+                                    'from_seller_id', $5::text,
+                                    'to_sellers', $6::jsonb,
+                                    'from_sellers', $7::jsonb,
+                                    'reassigned_by', $8::text,
+                                    'reason', $9::text
+                                ))
+                    """, tenant_id, reassigned_by, len(moves), strategy,
+                       str(from_seller_id) if from_seller_id else None,
+                       json.dumps(by_seller), json.dumps(by_previous), str(reassigned_by), reason or "")
+            
+            # 5. Coalesced notifications and one metrics refresh for every affected seller
+            await self._notify_bulk_assignment(tenant_id, moved_phones, new, source)
+            affected = list({*new, *(p for p in previous if p)})
+            await self._update_sellers_metrics(affected, tenant_id)
+            
+            return {
+                "success": True,
+                "reassigned": len(moves),
+                "unchanged": len(rows) - len(moves),
+                "by_seller": dict(by_seller)
+            }
+            
+        except Exception as e:
+            logger.error(f"Error in bulk reassignment: {e}")
+            return {"success": False, "message": f"Error: {str(e)}"}
+
+    async def _notify_bulk_assignment(self, tenant_id: int, phones: List[str], seller_ids: List[UUID], source: str):
+        """
+        One notification per receiving seller plus one summary for the CEO.
+        """
+        try:
+            timestamp = datetime.utcnow().timestamp()
+            phones_by_seller: Dict[str, List[str]] = {}
+            for phone, seller_id in zip(phones, seller_ids):
+                phones_by_seller.setdefault(str(seller_id), []).append(phone)
+            
+            notifications = [
+                Notification(
+                    id=f"bulk_assign_{seller_id}_{timestamp}",
+                    tenant_id=tenant_id,
+                    type="assignment",
+                    title="🔔 Leads Reasignados",
+                    message=f"Se te asignaron {len(seller_phones)} conversaciones vía {source}",
+                    priority="high",
+                    recipient_id=seller_id,
+                    related_entity_type="conversation",
+                    metadata={"count": len(seller_phones), "phones": seller_phones[:50], "source": source}
+                )
+                for seller_id, seller_phones in phones_by_seller.items()
+            ]
+            
+            ceo = await db.fetchrow("SELECT id FROM users WHERE tenant_id = $1 AND role = 'ceo' AND status = 'active' LIMIT 1", tenant_id)
+            if ceo:
+                notifications.append(Notification(
+                    id=f"bulk_assign_ceo_{timestamp}",
+                    tenant_id=tenant_id,
+                    type="assignment",
+                    title="📢 Reasignación Masiva (Global)",
+                    message=f"{len(phones)} conversaciones reasignadas entre {len(phones_by_seller)} vendedores",
+                    priority="medium",
+                    recipient_id=str(ceo['id']),
+                    related_entity_type="conversation",
+                    metadata={"count": len(phones), "by_seller": {k: len(v) for k, v in phones_by_seller.items()}}
+                ))
+            
+            await seller_notification_service.save_notifications(notifications)
+            await seller_notification_service.broadcast_notifications(notifications)
+            
+        except Exception as e:
+            logger.error(f"Error triggering bulk assignment notifications: {e}")
+
     async def _notify_assignment(self, phone: str, seller_id: UUID, seller_name: str, tenant_id: int, source: str):
         """
         Send notification to the assigned seller and a global copy to the CEO.
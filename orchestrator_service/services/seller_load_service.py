@@ -0,0 +1,184 @@
+"""
+Seller Load Service - Carga en vivo de conversaciones abiertas por vendedor.
+
+`seller_load` guarda un contador por (tenant, vendedor): +1 al asignar, -1 al vendedor
+anterior en una reasignación y -1 cuando el lead se cierra (closed_won/closed_lost). Las
+conversaciones que vencen (sin reasignación en SELLER_LOAD_WINDOW_HOURS) y cualquier
+drift se corrigen con la reconciliación periódica contra chat_messages.
+"""
+import logging
+import os
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+SELLER_LOAD_WINDOW_HOURS = int(os.getenv("SELLER_LOAD_WINDOW_HOURS", "24"))
+
+CLOSED_LEAD_STATUSES = ('closed_won', 'closed_lost')
+
+# Incrementa al nuevo vendedor y descuenta al anterior (si cambió) en un solo statement
+RECORD_ASSIGNMENT_SQL = """
+    WITH released AS (
+        UPDATE seller_load
+        SET open_conversations = GREATEST(open_conversations - 1, 0), updated_at = NOW()
+        WHERE tenant_id = $1 AND seller_id = $3::uuid
+    )
+    INSERT INTO seller_load (tenant_id, seller_id, open_conversations, updated_at)
+    VALUES ($1, $2, 1, NOW())
+    ON CONFLICT (tenant_id, seller_id) DO UPDATE
+        SET open_conversations = seller_load.open_conversations + 1, updated_at = NOW()
+"""
+
+# Variante set-based: un delta por vendedor (+ nuevas, - anteriores) aplicado en un statement
+RECORD_BULK_ASSIGNMENT_SQL = """
+    WITH delta AS (
+        SELECT seller_id, SUM(d)::int AS d
+        FROM (
+            SELECT unnest($2::uuid[]) AS seller_id, 1 AS d
+            UNION ALL
+            SELECT unnest($3::uuid[]), -1
+        ) x
+        WHERE seller_id IS NOT NULL
+        GROUP BY seller_id
+        HAVING SUM(d) <> 0
+    ),
+    updated AS (
+        UPDATE seller_load sl
+        SET open_conversations = GREATEST(sl.open_conversations + delta.d, 0), updated_at = NOW()
+        FROM delta
+        WHERE sl.tenant_id = $1 AND sl.seller_id = delta.seller_id
+        RETURNING sl.seller_id
+    )
+    INSERT INTO seller_load (tenant_id, seller_id, open_conversations, updated_at)
+    SELECT $1, seller_id, d, NOW() FROM delta
+    WHERE d > 0 AND seller_id NOT IN (SELECT seller_id FROM updated)
+    ON CONFLICT (tenant_id, seller_id) DO UPDATE
+        SET open_conversations = seller_load.open_conversations + EXCLUDED.open_conversations, updated_at = NOW()
+"""
+
+RELEASE_SQL = """
+    UPDATE seller_load
+    SET open_conversations = GREATEST(open_conversations - 1, 0), updated_at = NOW()
+    WHERE tenant_id = $1 AND seller_id = $2
+"""
+
+# Cierra el lead devolviendo el estado y vendedor previos (bloqueados) para liberar la carga
+CLOSE_LEAD_SQL = """
+    WITH prev AS (
+        SELECT id, status, assigned_seller_id FROM leads WHERE id = $1 AND tenant_id = $2 FOR UPDATE
+    )
+    UPDATE leads l SET status = $3, updated_at = NOW()
+    FROM prev
+    WHERE l.id = prev.id
+    RETURNING prev.status AS previous_status, prev.assigned_seller_id
+"""
+
+# Menor carga entre los candidatos (opcionalmente bajo un tope); empate -> orden del roster
+LEAST_LOADED_SQL = """
+    SELECT c.id
+    FROM unnest($2::uuid[]) WITH ORDINALITY AS c(id, ord)
+    LEFT JOIN seller_load sl ON sl.tenant_id = $1 AND sl.seller_id = c.id
+    WHERE $3::int IS NULL OR COALESCE(sl.open_conversations, 0) < $3
+    ORDER BY COALESCE(sl.open_conversations, 0), c.ord
+    LIMIT 1
+"""
+
+# Conversaciones abiertas reales: asignadas dentro de la ventana y con lead no cerrado
+ACTUAL_LOAD_SQL = """
+    SELECT cm.tenant_id, cm.assigned_seller_id AS seller_id, COUNT(DISTINCT cm.from_number) AS open_conversations
+    FROM chat_messages cm
+    LEFT JOIN leads l ON l.id = cm.lead_id
+    WHERE cm.assigned_seller_id IS NOT NULL
+      AND cm.assigned_at >= NOW() - make_interval(hours => $1)
+      AND l.status IS DISTINCT FROM 'closed_won' AND l.status IS DISTINCT FROM 'closed_lost'
+    GROUP BY cm.tenant_id, cm.assigned_seller_id
+"""
+
+RECONCILE_SQL = f"""
+    WITH actual AS ({ACTUAL_LOAD_SQL}),
+    upserted AS (
+        INSERT INTO seller_load (tenant_id, seller_id, open_conversations, updated_at, reconciled_at)
+        SELECT tenant_id, seller_id, open_conversations, NOW(), NOW() FROM actual
+        ON CONFLICT (tenant_id, seller_id) DO UPDATE
+            SET open_conversations = EXCLUDED.open_conversations, updated_at = NOW(), reconciled_at = NOW()
+            WHERE seller_load.open_conversations IS DISTINCT FROM EXCLUDED.open_conversations
+        RETURNING 1
+    ),
+    expired AS (
+        UPDATE seller_load sl
+        SET open_conversations = 0, updated_at = NOW(), reconciled_at = NOW()
+        WHERE sl.open_conversations <> 0
+          AND NOT EXISTS (SELECT 1 FROM actual a WHERE a.tenant_id = sl.tenant_id AND a.seller_id = sl.seller_id)
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM upserted) + (SELECT COUNT(*) FROM expired)
+"""
+
+
+class SellerLoadService:
+    """Contadores de carga por vendedor y su reconciliación."""
+
+    async def record_assignment(self, tenant_id: int, seller_id: UUID, previous_seller_id: Optional[UUID] = None):
+        """Asignación o reasignación de una conversación (misma persona -> no cambia nada)."""
+        if previous_seller_id is not None and str(previous_seller_id) == str(seller_id):
+            return
+        await db.execute(RECORD_ASSIGNMENT_SQL, tenant_id, seller_id, previous_seller_id)
+
+    async def record_bulk_assignment(
+        self, tenant_id: int, seller_ids: List[UUID], previous_seller_ids: List[Optional[UUID]], conn=None
+    ):
+        """Reasignación masiva: seller_ids[i] recibe la conversación que tenía previous_seller_ids[i]."""
+        if conn is not None:
+            await conn.execute(RECORD_BULK_ASSIGNMENT_SQL, tenant_id, seller_ids, previous_seller_ids)
+        else:
+            await db.execute(RECORD_BULK_ASSIGNMENT_SQL, tenant_id, seller_ids, previous_seller_ids)
+
+    async def release(self, tenant_id: int, seller_id: Optional[UUID], conn=None):
+        """Conversación cerrada (lead pasó a CLOSED_LEAD_STATUSES)."""
+        if seller_id is None:
+            return
+        if conn is not None:
+            await conn.execute(RELEASE_SQL, tenant_id, seller_id)
+        else:
+            await db.execute(RELEASE_SQL, tenant_id, seller_id)
+
+    async def close_lead(self, tenant_id: int, lead_id: UUID, status: str, conn) -> bool:
+        """
+        Pasa el lead a `status` fuera de LeadStatusService (p. ej. conversión a cliente) y, si
+        lo cierra, libera la conversación del vendedor en la misma transacción de `conn`.
+        Retorna False si el lead no existe.
+        """
+        row = await conn.fetchrow(CLOSE_LEAD_SQL, lead_id, tenant_id, status)
+        if row is None:
+            return False
+        if status in CLOSED_LEAD_STATUSES and row["previous_status"] not in CLOSED_LEAD_STATUSES:
+            await self.release(tenant_id, row["assigned_seller_id"], conn=conn)
+        return True
+
+    async def least_loaded(
+        self, tenant_id: int, seller_ids: List[UUID], max_open: Optional[int] = None
+    ) -> Optional[UUID]:
+        """Vendedor con menos conversaciones abiertas entre los candidatos (una query).
+        Con max_open, None si todos llegaron al tope."""
+        if not seller_ids:
+            return None
+        return await db.fetchval(LEAST_LOADED_SQL, tenant_id, seller_ids, max_open)
+
+    async def get_loads(self, tenant_id: int) -> Dict[UUID, int]:
+        rows = await db.fetch(
+            "SELECT seller_id, open_conversations FROM seller_load WHERE tenant_id = $1", tenant_id
+        )
+        return {r["seller_id"]: r["open_conversations"] for r in rows}
+
+    async def reconcile(self) -> int:
+        """Recalcula todos los contadores desde chat_messages. Retorna filas corregidas."""
+        corrected = await db.fetchval(RECONCILE_SQL, SELLER_LOAD_WINDOW_HOURS)
+        if corrected:
+            logger.info(f"⚖️ seller_load reconciliado: {corrected} contadores corregidos")
+        return int(corrected or 0)
+
+
+seller_load_service = SellerLoadService()
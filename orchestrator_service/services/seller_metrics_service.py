@@ -9,6 +9,186 @@ from db import db
 
 logger = logging.getLogger(__name__)
 
+CONVERTED_LEAD_STATUSES = ['converted', 'closed_won', 'client']
+
+# Todas las métricas de todos los vendedores pedidos en una pasada:
+# $1 tenant, $2 sellers, $3/$4 período, $5 estados convertidos
+TEAM_METRICS_SQL = """
+    WITH msgs AS (
+        -- Solo mensajes de la ventana: escritos en el período o de conversaciones asignadas en él
+        -- (o en las últimas 24h, para active_conversations); last_activity_at es la del período
+        SELECT assigned_seller_id AS seller_id, from_number, role, created_at, assigned_at,
+               created_at BETWEEN $3 AND $4 AS in_period,
+               assigned_at BETWEEN $3 AND $4 AS assigned_in_period
+        FROM chat_messages
+        WHERE tenant_id = $1 AND assigned_seller_id = ANY($2::uuid[])
+        AND (created_at BETWEEN $3 AND $4
+             OR assigned_at >= $3
+             OR assigned_at >= NOW() - INTERVAL '24 hours')
+    ),
+    conv AS (
+        SELECT seller_id,
+               COUNT(DISTINCT from_number) FILTER (WHERE assigned_in_period) AS total_conversations,
+               COUNT(DISTINCT from_number) FILTER (WHERE assigned_at >= NOW() - INTERVAL '24 hours') AS active_conversations,
+               COUNT(DISTINCT from_number) FILTER (WHERE assigned_at::date = CURRENT_DATE) AS conversations_assigned_today,
+               COUNT(*) FILTER (WHERE role = 'assistant' AND in_period) AS total_messages_sent,
+               COUNT(*) FILTER (WHERE role = 'user' AND in_period) AS total_messages_received,
+               COUNT(*) FILTER (WHERE in_period) AS period_messages,
+               COUNT(DISTINCT created_at::date) FILTER (WHERE in_period) AS active_days_in_period,
+               MAX(created_at) AS last_activity_at
+        FROM msgs
+        GROUP BY seller_id
+    ),
+    threads AS (
+        SELECT seller_id,
+               AVG(assigned_minutes) AS avg_conversation_duration_minutes,
+               SUM(chat_minutes) AS total_chat_minutes
+        FROM (
+            SELECT seller_id, from_number,
+                   EXTRACT(EPOCH FROM (MAX(created_at) FILTER (WHERE assigned_in_period)
+                                       - MIN(created_at) FILTER (WHERE assigned_in_period))) / 60 AS assigned_minutes,
+                   EXTRACT(EPOCH FROM (MAX(created_at) FILTER (WHERE in_period)
+                                       - MIN(created_at) FILTER (WHERE in_period))) / 60 AS chat_minutes
+            FROM msgs
+            GROUP BY seller_id, from_number
+        ) t
+        GROUP BY seller_id
+    ),
+    lead_totals AS (
+        SELECT assigned_seller_id AS seller_id,
+               COUNT(*) AS leads_assigned,
+               COUNT(*) FILTER (WHERE status = ANY($5::text[])) AS leads_converted,
+               COUNT(*) FILTER (WHERE lead_source = 'PROSPECTING') AS prospects_generated,
+               COUNT(*) FILTER (WHERE lead_source = 'PROSPECTING' AND status = ANY($5::text[])) AS prospects_converted
+        FROM leads
+        WHERE tenant_id = $1 AND assigned_seller_id = ANY($2::uuid[]) AND created_at BETWEEN $3 AND $4
+        GROUP BY assigned_seller_id
+    ),
+    user_msgs AS (
+        SELECT from_number, created_at AS user_time,
+               LEAD(created_at) OVER (PARTITION BY from_number ORDER BY created_at) AS next_user_time
+        FROM chat_messages
+        WHERE tenant_id = $1 AND role = 'user' AND created_at BETWEEN $3 AND $4
+        AND from_number IN (SELECT from_number FROM msgs)
+    ),
+    responses AS (
+        SELECT m.seller_id,
+               AVG(EXTRACT(EPOCH FROM (m.created_at - um.user_time))) AS avg_response_time_seconds,
+               percentile_disc(0.5) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM (m.created_at - um.user_time))) AS response_time_p50_seconds,
+               percentile_disc(0.9) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM (m.created_at - um.user_time))) AS response_time_p90_seconds,
+               COUNT(*) AS total_responses_analyzed
+        FROM user_msgs um
+        JOIN msgs m ON m.from_number = um.from_number AND m.role = 'assistant' AND m.in_period
+        WHERE m.created_at > um.user_time
+        AND (um.next_user_time IS NULL OR m.created_at < um.next_user_time)
+        GROUP BY m.seller_id
+    )
+    SELECT s.seller_id,
+           conv.total_conversations, conv.active_conversations, conv.conversations_assigned_today,
+           conv.total_messages_sent, conv.total_messages_received, conv.period_messages,
+           conv.active_days_in_period, conv.last_activity_at,
+           threads.avg_conversation_duration_minutes, threads.total_chat_minutes,
+           lead_totals.leads_assigned, lead_totals.leads_converted,
+           lead_totals.prospects_generated, lead_totals.prospects_converted,
+           responses.avg_response_time_seconds, responses.response_time_p50_seconds,
+           responses.response_time_p90_seconds, responses.total_responses_analyzed
+    FROM unnest($2::uuid[]) AS s(seller_id)
+    LEFT JOIN conv ON conv.seller_id = s.seller_id
+    LEFT JOIN threads ON threads.seller_id = s.seller_id
+    LEFT JOIN lead_totals ON lead_totals.seller_id = s.seller_id
+    LEFT JOIN responses ON responses.seller_id = s.seller_id
+"""
+
+# Un solo upsert para todos los vendedores (arrays paralelos)
+SAVE_TEAM_METRICS_SQL = """
+    INSERT INTO seller_metrics (
+        seller_id, tenant_id,
+        total_conversations, active_conversations, conversations_assigned_today,
+        total_messages_sent, total_messages_received, avg_response_time_seconds,
+        leads_assigned, leads_converted, conversion_rate,
+        prospects_generated, prospects_converted,
+        total_chat_minutes, avg_session_duration_minutes,
+        last_activity_at, metrics_calculated_at,
+        metrics_period_start, metrics_period_end
+    )
+    SELECT m.seller_id, $1,
+           m.total_conversations, m.active_conversations, m.conversations_assigned_today,
+           m.total_messages_sent, m.total_messages_received, m.avg_response_time_seconds,
+           m.leads_assigned, m.leads_converted, m.conversion_rate,
+           m.prospects_generated, m.prospects_converted,
+           m.total_chat_minutes, m.avg_session_duration_minutes,
+           m.last_activity_at, NOW(),
+           $2, $3
+    FROM unnest(
+        $4::uuid[], $5::int[], $6::int[], $7::int[], $8::int[], $9::int[], $10::int[],
+        $11::int[], $12::int[], $13::numeric[], $14::int[], $15::int[], $16::int[], $17::int[],
+        $18::timestamptz[]
+    ) AS m(
+        seller_id, total_conversations, active_conversations, conversations_assigned_today,
+        total_messages_sent, total_messages_received, avg_response_time_seconds,
+        leads_assigned, leads_converted, conversion_rate,
+        prospects_generated, prospects_converted,
+        total_chat_minutes, avg_session_duration_minutes, last_activity_at
+    )
+    ON CONFLICT (seller_id, tenant_id, metrics_period_start) 
+    DO UPDATE SET
+        total_conversations = EXCLUDED.total_conversations,
+        active_conversations = EXCLUDED.active_conversations,
+        conversations_assigned_today = EXCLUDED.conversations_assigned_today,
+        total_messages_sent = EXCLUDED.total_messages_sent,
+        total_messages_received = EXCLUDED.total_messages_received,
+        avg_response_time_seconds = EXCLUDED.avg_response_time_seconds,
+        leads_assigned = EXCLUDED.leads_assigned,
+        leads_converted = EXCLUDED.leads_converted,
+        conversion_rate = EXCLUDED.conversion_rate,
+        prospects_generated = EXCLUDED.prospects_generated,
+        prospects_converted = EXCLUDED.prospects_converted,
+        total_chat_minutes = EXCLUDED.total_chat_minutes,
+        avg_session_duration_minutes = EXCLUDED.avg_session_duration_minutes,
+        last_activity_at = EXCLUDED.last_activity_at,
+        metrics_calculated_at = EXCLUDED.metrics_calculated_at,
+        metrics_period_end = EXCLUDED.metrics_period_end
+"""
+
+
+def _format_metrics(row, total_days: int) -> Dict:
+    """Fila de TEAM_METRICS_SQL -> dict de métricas (mismas claves que la API histórica)"""
+    def num(key):
+        return float(row[key] or 0)
+
+    sent, received = int(num('total_messages_sent')), int(num('total_messages_received'))
+    leads_assigned, leads_converted = int(num('leads_assigned')), int(num('leads_converted'))
+    prospects_generated, prospects_converted = int(num('prospects_generated')), int(num('prospects_converted'))
+    active_days = int(num('active_days_in_period'))
+    responses = int(num('total_responses_analyzed'))
+    last_activity = row['last_activity_at']
+
+    return {
+        "total_conversations": int(num('total_conversations')),
+        "active_conversations": int(num('active_conversations')),
+        "conversations_assigned_today": int(num('conversations_assigned_today')),
+        "avg_conversation_duration_minutes": round(num('avg_conversation_duration_minutes'), 1),
+        "total_messages_sent": sent,
+        "total_messages_received": received,
+        "total_chat_minutes": round(num('total_chat_minutes'), 1),
+        "message_ratio": round(sent / max(received, 1), 2),
+        "leads_assigned": leads_assigned,
+        "leads_converted": leads_converted,
+        "conversion_rate": round((leads_converted / max(leads_assigned, 1)) * 100, 2),
+        "prospects_generated": prospects_generated,
+        "prospects_converted": prospects_converted,
+        "prospect_conversion_rate": round((prospects_converted / max(prospects_generated, 1)) * 100, 2),
+        "avg_response_time_seconds": round(num('avg_response_time_seconds'), 1),
+        "response_time_p50_seconds": round(num('response_time_p50_seconds'), 1),
+        "response_time_p90_seconds": round(num('response_time_p90_seconds'), 1) if responses > 1 else 0,
+        "total_responses_analyzed": responses,
+        "active_days_in_period": active_days,
+        "last_activity_at": last_activity.isoformat() if last_activity else None,
+        "avg_messages_per_day": round(num('period_messages') / total_days, 1),
+        "activity_rate_percent": round((active_days / total_days) * 100, 1),
+    }
+
+
 class SellerMetricsService:
     
     async def calculate_seller_metrics(
@@ -21,55 +201,51 @@ class SellerMetricsService:
         Calculate comprehensive metrics for a seller
         Returns: {"success": bool, "metrics": dict, "period": dict}
         """
+        result = await self.calculate_team_metrics(tenant_id, [seller_id], period_days)
+        if not result["success"]:
+            return result
+        return {
+            "success": True,
+            "metrics": result["metrics"][str(seller_id)],
+            "period": result["period"]
+        }
+    
+    async def calculate_team_metrics(
+        self,
+        tenant_id: int,
+        seller_ids: List[UUID],
+        period_days: int = 7
+    ) -> Dict:
+        """
+        Calculate metrics for several sellers at once: one set-based query + one batched upsert
+        Returns: {"success": bool, "metrics": {seller_id: dict}, "period": dict}
+        """
         try:
-            period_start = datetime.now() - timedelta(days=period_days)
             period_end = datetime.now()
+            period_start = period_end - timedelta(days=period_days)
+            total_days = (period_end - period_start).days or 1
             
-            # 1. Conversation metrics
-            conv_metrics = await self._calculate_conversation_metrics(
-                seller_id, tenant_id, period_start, period_end
-            )
-            
-            # 2. Message metrics
-            msg_metrics = await self._calculate_message_metrics(
-                seller_id, tenant_id, period_start, period_end
-            )
-            
-            # 3. Lead conversion metrics
-            lead_metrics = await self._calculate_lead_metrics(
-                seller_id, tenant_id, period_start, period_end
-            )
-            
-            # 4. Response time metrics
-            response_metrics = await self._calculate_response_metrics(
-                seller_id, tenant_id, period_start, period_end
-            )
-            
-            # 5. Activity metrics
-            activity_metrics = await self._calculate_activity_metrics(
-                seller_id, tenant_id, period_start, period_end
-            )
-            
-            # Combine all metrics
-            metrics = {
-                **conv_metrics,
-                **msg_metrics,
-                **lead_metrics,
-                **response_metrics,
-                **activity_metrics,
-                "seller_id": str(seller_id),
-                "tenant_id": tenant_id,
-                "period_start": period_start.isoformat(),
-                "period_end": period_end.isoformat(),
-                "calculated_at": datetime.now().isoformat()
-            }
-            
-            # 6. Save to database
-            await self._save_metrics_to_db(seller_id, tenant_id, metrics, period_start, period_end)
+            metrics_by_seller = {}
+            if seller_ids:
+                rows = await db.fetch(
+                    TEAM_METRICS_SQL, tenant_id, list(seller_ids), period_start, period_end, CONVERTED_LEAD_STATUSES
+                )
+                for row in rows:
+                    metrics = _format_metrics(row, total_days)
+                    metrics.update({
+                        "seller_id": str(row['seller_id']),
+                        "tenant_id": tenant_id,
+                        "period_start": period_start.isoformat(),
+                        "period_end": period_end.isoformat(),
+                        "calculated_at": datetime.now().isoformat()
+                    })
+                    metrics_by_seller[str(row['seller_id'])] = (row, metrics)
+                
+                await self._save_team_metrics_to_db(tenant_id, metrics_by_seller, period_start, period_end)
             
             return {
                 "success": True,
-                "metrics": metrics,
+                "metrics": {seller_id: metrics for seller_id, (_, metrics) in metrics_by_seller.items()},
                 "period": {
                     "start": period_start.isoformat(),
                     "end": period_end.isoformat(),
@@ -81,386 +257,38 @@ class SellerMetricsService:
             logger.error(f"Error calculating seller metrics: {e}")
             return {"success": False, "message": f"Error: {str(e)}"}
     
-    async def _calculate_conversation_metrics(
-        self,
-        seller_id: UUID,
-        tenant_id: int,
-        period_start: datetime,
-        period_end: datetime
-    ) -> Dict:
-        """Calculate conversation-related metrics"""
-        try:
-            # Total conversations assigned in period
-            total_convs = await db.fetchval("""
-                SELECT COUNT(DISTINCT from_number)
-                FROM chat_messages
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND assigned_at BETWEEN $3 AND $4
-            """, seller_id, tenant_id, period_start, period_end) or 0
-            
-            # Active conversations (assigned in last 24h)
-            active_convs = await db.fetchval("""
-                SELECT COUNT(DISTINCT from_number)
-                FROM chat_messages
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND assigned_at >= NOW() - INTERVAL '24 hours'
-            """, seller_id, tenant_id) or 0
-            
-            # Conversations assigned today
-            convs_today = await db.fetchval("""
-                SELECT COUNT(DISTINCT from_number)
-                FROM chat_messages
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND assigned_at::date = CURRENT_DATE
-            """, seller_id, tenant_id) or 0
-            
-            # Average conversation duration
-            avg_duration = await db.fetchval("""
-                SELECT AVG(EXTRACT(EPOCH FROM (MAX(created_at) - MIN(created_at)))) / 60
-                FROM chat_messages
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND assigned_at BETWEEN $3 AND $4
-                GROUP BY from_number
-            """, seller_id, tenant_id, period_start, period_end) or 0
-            
-            return {
-                "total_conversations": int(total_convs),
-                "active_conversations": int(active_convs),
-                "conversations_assigned_today": int(convs_today),
-                "avg_conversation_duration_minutes": round(float(avg_duration), 1)
-            }
-            
-        except Exception as e:
-            logger.error(f"Error calculating conversation metrics: {e}")
-            return {
-                "total_conversations": 0,
-                "active_conversations": 0,
-                "conversations_assigned_today": 0,
-                "avg_conversation_duration_minutes": 0
-            }
-    
-    async def _calculate_message_metrics(
-        self,
-        seller_id: UUID,
-        tenant_id: int,
-        period_start: datetime,
-        period_end: datetime
-    ) -> Dict:
-        """Calculate message-related metrics"""
-        try:
-            # Messages sent by seller
-            messages_sent = await db.fetchval("""
-                SELECT COUNT(*)
-                FROM chat_messages
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND role = 'assistant'
-                AND created_at BETWEEN $3 AND $4
-            """, seller_id, tenant_id, period_start, period_end) or 0
-            
-            # Messages received from leads
-            messages_received = await db.fetchval("""
-                SELECT COUNT(*)
-                FROM chat_messages cm
-                WHERE cm.assigned_seller_id = $1
-                AND cm.tenant_id = $2
-                AND cm.role = 'user'
-                AND cm.created_at BETWEEN $3 AND $4
-            """, seller_id, tenant_id, period_start, period_end) or 0
-            
-            # Total chat minutes
-            chat_minutes = await db.fetchval("""
-                SELECT SUM(EXTRACT(EPOCH FROM (MAX(created_at) - MIN(created_at)))) / 60
-                FROM chat_messages
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND created_at BETWEEN $3 AND $4
-                GROUP BY from_number
-            """, seller_id, tenant_id, period_start, period_end) or 0
-            
-            return {
-                "total_messages_sent": int(messages_sent),
-                "total_messages_received": int(messages_received),
-                "total_chat_minutes": round(float(chat_minutes), 1),
-                "message_ratio": round(messages_sent / max(messages_received, 1), 2)
-            }
-            
-        except Exception as e:
-            logger.error(f"Error calculating message metrics: {e}")
-            return {
-                "total_messages_sent": 0,
-                "total_messages_received": 0,
-                "total_chat_minutes": 0,
-                "message_ratio": 0
-            }
-    
-    async def _calculate_lead_metrics(
+    async def _save_team_metrics_to_db(
         self,
-        seller_id: UUID,
         tenant_id: int,
-        period_start: datetime,
-        period_end: datetime
-    ) -> Dict:
-        """Calculate lead conversion metrics"""
-        try:
-            # Leads assigned
-            leads_assigned = await db.fetchval("""
-                SELECT COUNT(*)
-                FROM leads
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND created_at BETWEEN $3 AND $4
-            """, seller_id, tenant_id, period_start, period_end) or 0
-            
-            # Leads converted (status = 'converted' or similar)
-            leads_converted = await db.fetchval("""
-                SELECT COUNT(*)
-                FROM leads
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND status IN ('converted', 'closed_won', 'client')
-                AND created_at BETWEEN $3 AND $4
-            """, seller_id, tenant_id, period_start, period_end) or 0
-            
-            # Conversion rate
-            conversion_rate = round((leads_converted / max(leads_assigned, 1)) * 100, 2)
-            
-            # Prospecting metrics
-            prospects_generated = await db.fetchval("""
-                SELECT COUNT(*)
-                FROM leads
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND lead_source = 'PROSPECTING'
-                AND created_at BETWEEN $3 AND $4
-            """, seller_id, tenant_id, period_start, period_end) or 0
-            
-            prospects_converted = await db.fetchval("""
-                SELECT COUNT(*)
-                FROM leads
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND lead_source = 'PROSPECTING'
-                AND status IN ('converted', 'closed_won', 'client')
-                AND created_at BETWEEN $3 AND $4
-            """, seller_id, tenant_id, period_start, period_end) or 0
-            
-            return {
-                "leads_assigned": int(leads_assigned),
-                "leads_converted": int(leads_converted),
-                "conversion_rate": conversion_rate,
-                "prospects_generated": int(prospects_generated),
-                "prospects_converted": int(prospects_converted),
-                "prospect_conversion_rate": round((prospects_converted / max(prospects_generated, 1)) * 100, 2)
-            }
-            
-        except Exception as e:
-            logger.error(f"Error calculating lead metrics: {e}")
-            return {
-                "leads_assigned": 0,
-                "leads_converted": 0,
-                "conversion_rate": 0,
-                "prospects_generated": 0,
-                "prospects_converted": 0,
-                "prospect_conversion_rate": 0
-            }
-    
-    async def _calculate_response_metrics(
-        self,
-        seller_id: UUID,
-        tenant_id: int,
-        period_start: datetime,
-        period_end: datetime
-    ) -> Dict:
-        """Calculate response time metrics"""
-        try:
-            # Get response times between user messages and seller responses
-            response_times = await db.fetch("""
-                WITH user_messages AS (
-                    SELECT 
-                        from_number,
-                        created_at as user_time,
-                        LEAD(created_at) OVER (PARTITION BY from_number ORDER BY created_at) as next_user_time
-                    FROM chat_messages
-                    WHERE tenant_id = $2
-                    AND from_number IN (
-                        SELECT DISTINCT from_number 
-                        FROM chat_messages 
-                        WHERE assigned_seller_id = $1 AND tenant_id = $2
-                    )
-                    AND role = 'user'
-                    AND created_at BETWEEN $3 AND $4
-                ),
-                seller_responses AS (
-                    SELECT 
-                        from_number,
-                        created_at as response_time
-                    FROM chat_messages
-                    WHERE assigned_seller_id = $1
-                    AND tenant_id = $2
-                    AND role = 'assistant'
-                    AND created_at BETWEEN $3 AND $4
-                )
-                SELECT 
-                    EXTRACT(EPOCH FROM (sr.response_time - um.user_time)) as response_seconds
-                FROM user_messages um
-                JOIN seller_responses sr ON um.from_number = sr.from_number
-                WHERE sr.response_time > um.user_time
-                AND (um.next_user_time IS NULL OR sr.response_time < um.next_user_time)
-                ORDER BY um.user_time
-            """, seller_id, tenant_id, period_start, period_end)
-            
-            if response_times:
-                response_seconds = [rt['response_seconds'] for rt in response_times if rt['response_seconds']]
-                avg_response_seconds = sum(response_seconds) / len(response_seconds) if response_seconds else 0
-                
-                # Calculate percentiles
-                sorted_times = sorted(response_seconds)
-                p50 = sorted_times[len(sorted_times) // 2] if sorted_times else 0
-                p90 = sorted_times[int(len(sorted_times) * 0.9)] if len(sorted_times) > 1 else 0
-                
-                return {
-                    "avg_response_time_seconds": round(avg_response_seconds, 1),
-                    "response_time_p50_seconds": round(p50, 1),
-                    "response_time_p90_seconds": round(p90, 1),
-                    "total_responses_analyzed": len(response_times)
-                }
-            else:
-                return {
-                    "avg_response_time_seconds": 0,
-                    "response_time_p50_seconds": 0,
-                    "response_time_p90_seconds": 0,
-                    "total_responses_analyzed": 0
-                }
-                
-        except Exception as e:
-            logger.error(f"Error calculating response metrics: {e}")
-            return {
-                "avg_response_time_seconds": 0,
-                "response_time_p50_seconds": 0,
-                "response_time_p90_seconds": 0,
-                "total_responses_analyzed": 0
-            }
-    
-    async def _calculate_activity_metrics(
-        self,
-        seller_id: UUID,
-        tenant_id: int,
-        period_start: datetime,
-        period_end: datetime
-    ) -> Dict:
-        """Calculate activity and engagement metrics"""
-        try:
-            # Days active in period
-            active_days = await db.fetchval("""
-                SELECT COUNT(DISTINCT DATE(created_at))
-                FROM chat_messages
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND created_at BETWEEN $3 AND $4
-            """, seller_id, tenant_id, period_start, period_end) or 0
-            
-            # Last activity timestamp
-            last_activity = await db.fetchval("""
-                SELECT MAX(created_at)
-                FROM chat_messages
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-            """, seller_id, tenant_id)
-            
-            # Average messages per day
-            total_days = (period_end - period_start).days or 1
-            avg_messages_per_day = await db.fetchval("""
-                SELECT COUNT(*) / $3
-                FROM chat_messages
-                WHERE assigned_seller_id = $1
-                AND tenant_id = $2
-                AND created_at BETWEEN $4 AND $5
-            """, seller_id, tenant_id, total_days, period_start, period_end) or 0
-            
-            return {
-                "active_days_in_period": int(active_days),
-                "last_activity_at": last_activity.isoformat() if last_activity else None,
-                "avg_messages_per_day": round(float(avg_messages_per_day), 1),
-                "activity_rate_percent": round((active_days / total_days) * 100, 1)
-            }
-            
-        except Exception as e:
-            logger.error(f"Error calculating activity metrics: {e}")
-            return {
-                "active_days_in_period": 0,
-                "last_activity_at": None,
-                "avg_messages_per_day": 0,
-                "activity_rate_percent": 0
-            }
-    
-    async def _save_metrics_to_db(
-        self,
-        seller_id: UUID,
-        tenant_id: int,
-        metrics: Dict,
+        metrics_by_seller: Dict[str, Tuple],
         period_start: datetime,
         period_end: datetime
     ):
-        """Save calculated metrics to database"""
-        try:
-            await db.execute("""
-                INSERT INTO seller_metrics (
-                    seller_id, tenant_id,
-                    total_conversations, active_conversations, conversations_assigned_today,
-                    total_messages_sent, total_messages_received, avg_response_time_seconds,
-                    leads_assigned, leads_converted, conversion_rate,
-                    prospects_generated, prospects_converted,
-                    total_chat_minutes, avg_session_duration_minutes,
-                    last_activity_at, metrics_calculated_at,
-                    metrics_period_start, metrics_period_end
-                ) VALUES (
-                    $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11,
-                    $12, $13, $14, $15, $16, $17, $18, $19
-                )
-                ON CONFLICT (seller_id, tenant_id, metrics_period_start) 
-                DO UPDATE SET
-                    total_conversations = EXCLUDED.total_conversations,
-                    active_conversations = EXCLUDED.active_conversations,
-                    conversations_assigned_today = EXCLUDED.conversations_assigned_today,
-                    total_messages_sent = EXCLUDED.total_messages_sent,
-                    total_messages_received = EXCLUDED.total_messages_received,
-                    avg_response_time_seconds = EXCLUDED.avg_response_time_seconds,
-                    leads_assigned = EXCLUDED.leads_assigned,
-                    leads_converted = EXCLUDED.leads_converted,
-                    conversion_rate = EXCLUDED.conversion_rate,
-                    prospects_generated = EXCLUDED.prospects_generated,
-                    prospects_converted = EXCLUDED.prospects_converted,
-                    total_chat_minutes = EXCLUDED.total_chat_minutes,
-                    avg_session_duration_minutes = EXCLUDED.avg_session_duration_minutes,
-                    last_activity_at = EXCLUDED.last_activity_at,
-                    metrics_calculated_at = EXCLUDED.metrics_calculated_at,
-                    metrics_period_end = EXCLUDED.metrics_period_end
-            """,
-                seller_id, tenant_id,
-                metrics.get('total_conversations', 0),
-                metrics.get('active_conversations', 0),
-                metrics.get('conversations_assigned_today', 0),
-                metrics.get('total_messages_sent', 0),
-                metrics.get('total_messages_received', 0),
-                metrics.get('avg_response_time_seconds', 0),
-                metrics.get('leads_assigned', 0),
-                metrics.get('leads_converted', 0),
-                metrics.get('conversion_rate', 0),
-                metrics.get('prospects_generated', 0),
-                metrics.get('prospects_converted', 0),
-                metrics.get('total_chat_minutes', 0),
-                metrics.get('avg_conversation_duration_minutes', 0),
-                metrics.get('last_activity_at'),
-                datetime.now(),
-                period_start,
-                period_end
+        """Save calculated metrics for all sellers with a single upsert"""
+        columns = [[] for _ in range(15)]
+        for row, metrics in metrics_by_seller.values():
+            values = (
+                row['seller_id'],
+                metrics['total_conversations'],
+                metrics['active_conversations'],
+                metrics['conversations_assigned_today'],
+                metrics['total_messages_sent'],
+                metrics['total_messages_received'],
+                round(metrics['avg_response_time_seconds']),
+                metrics['leads_assigned'],
+                metrics['leads_converted'],
+                metrics['conversion_rate'],
+                metrics['prospects_generated'],
+                metrics['prospects_converted'],
+                round(metrics['total_chat_minutes']),
+                round(metrics['avg_conversation_duration_minutes']),
+                row['last_activity_at'],
             )
-            
+            for column, value in zip(columns, values):
+                column.append(value)
+        
+        try:
+            await db.execute(SAVE_TEAM_METRICS_SQL, tenant_id, period_start, period_end, *columns)
         except Exception as e:
             logger.error(f"Error saving metrics to DB: {e}")
     
@@ -515,21 +343,37 @@ class SellerMetricsService:
                 AND role IN ('setter', 'closer', 'professional', 'ceo')
             """, tenant_id)
             
-            team_metrics = []
-            for seller in sellers:
-                metrics_result = await self.get_seller_metrics(
-                    seller['id'], tenant_id, period_days
-                )
-                
-                if metrics_result['success']:
-                    seller_data = {
-                        "seller_id": str(seller['id']),
-                        "first_name": seller['first_name'],
-                        "last_name": seller['last_name'],
-                        "role": seller['role'],
-                        "metrics": metrics_result.get('metrics', {})
-                    }
-                    team_metrics.append(seller_data)
+            seller_ids = [seller['id'] for seller in sellers]
+            period_start = datetime.now() - timedelta(days=period_days)
+            
+            # Latest stored metrics of every seller in one query
+            stored = await db.fetch("""
+                SELECT DISTINCT ON (seller_id) *
+                FROM seller_metrics
+                WHERE tenant_id = $1
+                AND seller_id = ANY($2::uuid[])
+                AND metrics_period_start >= $3
+                ORDER BY seller_id, metrics_period_start DESC
+            """, tenant_id, seller_ids, period_start)
+            metrics_by_seller = {str(row['seller_id']): dict(row) for row in stored}
+            
+            # Calculate the missing ones together
+            missing = [seller_id for seller_id in seller_ids if str(seller_id) not in metrics_by_seller]
+            if missing:
+                fresh = await self.calculate_team_metrics(tenant_id, missing, period_days)
+                if fresh['success']:
+                    metrics_by_seller.update(fresh['metrics'])
+            
+            team_metrics = [
+                {
+                    "seller_id": str(seller['id']),
+                    "first_name": seller['first_name'],
+                    "last_name": seller['last_name'],
+                    "role": seller['role'],
+                    "metrics": metrics_by_seller[str(seller['id'])]
+                }
+                for seller in sellers if str(seller['id']) in metrics_by_seller
+            ]
             
             # Calculate team totals
             totals = self._calculate_team_totals(team_metrics)
@@ -727,20 +571,14 @@ class SellerMetricsService:
             
             sellers = await db.fetch(query, tenant_id)
             
-            refreshed_count = 0
-            error_count = 0
-            
-            for seller in sellers:
-                try:
-                    await self.calculate_seller_metrics(
-                        seller_id=seller["id"],
-                        tenant_id=tenant_id,
-                        period_days=1  # Solo hoy
-                    )
-                    refreshed_count += 1
-                except Exception as e:
-                    logger.error(f"Error refreshing metrics for seller {seller['id']}: {e}")
-                    error_count += 1
+            # Una pasada set-based para todos los vendedores (solo hoy)
+            result = await self.calculate_team_metrics(
+                tenant_id, [seller["id"] for seller in sellers], period_days=1
+            )
+            if result["success"]:
+                refreshed_count, error_count = len(result["metrics"]), 0
+            else:
+                refreshed_count, error_count = 0, len(sellers)
             
             return {
                 "success": True,
@@ -206,8 +206,7 @@ class SellerNotificationService:
                                 ELSE 1.0
                             END as status_multiplier
                         FROM leads l
-                        LEFT JOIN chat_messages cm ON cm.from_number = l.phone_number 
-                            AND cm.tenant_id = l.tenant_id
+                        LEFT JOIN chat_messages cm ON cm.lead_id = l.id
                             AND cm.created_at > NOW() - INTERVAL '24 hours'
                         WHERE l.tenant_id = :tenant_id
                             AND l.status NOT IN ('cerrado_ganado', 'cerrado_perdido', 'descartado')
@@ -317,8 +316,7 @@ class SellerNotificationService:
                             MAX(l.status) as lead_status,
                             MAX(l.created_at) as lead_created_at
                         FROM chat_messages cm
-                        LEFT JOIN leads l ON l.phone_number = cm.from_number 
-                            AND l.tenant_id = cm.tenant_id
+                        LEFT JOIN leads l ON l.id = cm.lead_id
                         WHERE cm.tenant_id = :tenant_id
                             AND cm.created_at > NOW() - INTERVAL '30 days'
                             AND cm.assigned_seller_id IS NOT NULL
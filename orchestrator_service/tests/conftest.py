@@ -0,0 +1,75 @@
+"""
+Shared fixtures for orchestrator_service tests.
+
+Tests that need a real PostgreSQL are marked `@pytest.mark.postgres` and run only when
+TEST_POSTGRES_DSN points to a disposable database (the schema is created by
+Database.connect()). Tests without a database install a FakePool with `fake_pool`.
+
+Wall-clock comparisons (inline vs. offloaded, looped vs. batched...) are marked
+`@pytest.mark.benchmark` and run only with RUN_BENCHMARKS=1: on shared CI runners
+timing ratios are noise, so the default suite keeps deterministic checks only.
+"""
+
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_POSTGRES_DSN = os.getenv("TEST_POSTGRES_DSN")
+RUN_BENCHMARKS = os.getenv("RUN_BENCHMARKS", "").lower() in ("1", "true", "yes")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "postgres: needs TEST_POSTGRES_DSN (a disposable PostgreSQL)")
+    config.addinivalue_line("markers", "benchmark: wall-clock comparison, runs only with RUN_BENCHMARKS=1")
+
+
+def pytest_collection_modifyitems(config, items):
+    skip_postgres = pytest.mark.skip(reason="TEST_POSTGRES_DSN not set (needs a disposable PostgreSQL)")
+    skip_benchmark = pytest.mark.skip(reason="benchmark: set RUN_BENCHMARKS=1 to run")
+    for item in items:
+        if "postgres" in item.keywords and not TEST_POSTGRES_DSN:
+            item.add_marker(skip_postgres)
+        if "benchmark" in item.keywords and not RUN_BENCHMARKS:
+            item.add_marker(skip_benchmark)
+
+
+class FakePool:
+    """Stand-in for asyncpg.Pool: every acquire() yields the same fake connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    """Installs FakePool(conn) as the pool of `database` (default: the global db)."""
+    import db as db_module
+
+    def install(conn, database=None):
+        pool = FakePool(conn)
+        monkeypatch.setattr(database or db_module.db, "pool", pool)
+        return pool
+
+    return install
+
+
+@pytest.fixture
+async def pg_db(monkeypatch):
+    """Database instance connected to TEST_POSTGRES_DSN with migrations applied."""
+    import db as db_module
+
+    monkeypatch.setattr(db_module, "POSTGRES_DSN", TEST_POSTGRES_DSN)
+    database = db_module.Database()
+    await database.connect()
+    try:
+        yield database
+    finally:
+        await database.disconnect()
@@ -0,0 +1,155 @@
+"""
+Audit sink (core.audit_sink): batching, overflow policy, retries and shutdown flush.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from core.audit_sink import AuditSink
+
+
+class RecordingPool:
+    """Fake pool: records each multi-row INSERT; optionally fails the first N calls or rejects event types."""
+
+    def __init__(self, fail_times=0, delay=0.0):
+        self.batches = []
+        self.fail_times = fail_times
+        self.delay = delay
+        self.calls = 0
+        self.rejected = set()
+        self.gate = None
+
+    async def execute(self, query, *args):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.calls <= self.fail_times:
+            raise RuntimeError("db down")
+        if self.rejected & set(args[0]):
+            raise ValueError("invalid input syntax for type json")
+        assert "INSERT INTO system_events" in query and "unnest" in query
+        self.batches.append([list(col) for col in args])
+        return f"INSERT 0 {len(args[0])}"
+
+    @property
+    def rows(self):
+        return [list(row) for batch in self.batches for row in zip(*batch)]
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    import db as db_module
+    fake = RecordingPool()
+    monkeypatch.setattr(db_module.db, "pool", fake)
+    return fake
+
+
+def _emit(sink, n, prefix="evt"):
+    for i in range(n):
+        sink.emit(f"{prefix}_{i}", "info", f"msg {i}", {"i": i})
+
+
+class TestAuditSink:
+    async def test_flushes_by_batch_size(self, pool):
+        sink = AuditSink(batch_size=10, flush_interval_ms=10_000)
+        _emit(sink, 25)
+        await asyncio.sleep(0.05)
+        assert [len(b[0]) for b in pool.batches] == [10, 10]
+        await sink.shutdown()
+        assert [len(b[0]) for b in pool.batches] == [10, 10, 5]
+        assert sink.stats()["written"] == 25
+
+    async def test_flushes_by_interval(self, pool):
+        sink = AuditSink(batch_size=1000, flush_interval_ms=20)
+        _emit(sink, 3)
+        assert pool.batches == []
+        await asyncio.sleep(0.1)
+        assert len(pool.batches) == 1
+        event_type, severity, message, payload, tenant_id, _ = pool.rows[0]
+        assert (event_type, severity, message, tenant_id) == ("evt_0", "info", "msg 0", None)
+        assert json.loads(payload) == {"i": 0}
+        await sink.shutdown()
+
+    async def test_shutdown_flushes_pending(self, pool):
+        sink = AuditSink(batch_size=1000, flush_interval_ms=60_000)
+        _emit(sink, 7)
+        await sink.shutdown()
+        assert len(pool.rows) == 7
+        stats = sink.stats()
+        assert stats["queued"] == 0 and not stats["running"]
+
+    async def test_drop_oldest_keeps_latest_events(self, pool):
+        sink = AuditSink(max_queue=5, batch_size=1000, flush_interval_ms=60_000, overflow_policy="drop_oldest")
+        _emit(sink, 8)
+        assert sink.stats()["dropped_overflow"] == 3
+        await sink.shutdown()
+        assert [r[0] for r in pool.rows] == [f"evt_{i}" for i in range(3, 8)]
+
+    async def test_drop_newest_rejects_incoming(self, pool):
+        sink = AuditSink(max_queue=5, batch_size=1000, flush_interval_ms=60_000, overflow_policy="drop_newest")
+        _emit(sink, 5)
+        assert sink.emit("late", "info", "late", {}) is False
+        await sink.shutdown()
+        assert [r[0] for r in pool.rows] == [f"evt_{i}" for i in range(5)]
+        assert sink.stats()["dropped_overflow"] == 1
+
+    def test_rejects_unknown_policy(self):
+        with pytest.raises(ValueError):
+            AuditSink(overflow_policy="block")
+
+    async def test_retries_then_drops_failed_batch(self, pool):
+        pool.fail_times = 1
+        sink = AuditSink(batch_size=1000, flush_interval_ms=60_000, max_retries=2)
+        _emit(sink, 4)
+        await sink.shutdown()
+        assert len(pool.rows) == 4
+        assert sink.stats()["write_errors"] == 1
+
+        pool.fail_times = 10
+        pool.calls = 0
+        sink = AuditSink(batch_size=1000, flush_interval_ms=60_000, max_retries=2)
+        _emit(sink, 4)
+        await sink.shutdown()
+        assert sink.stats()["dropped_failed"] == 4
+
+    async def test_failed_batch_isolates_bad_row(self, pool):
+        pool.rejected = {"evt_2"}
+        sink = AuditSink(batch_size=1000, flush_interval_ms=60_000, max_retries=2)
+        _emit(sink, 5)
+        await sink.shutdown()
+        assert [row[0] for row in pool.rows] == ["evt_0", "evt_1", "evt_3", "evt_4"]
+        stats = sink.stats()
+        assert (stats["written"], stats["dropped_failed"], stats["queued"]) == (4, 1, 0)
+
+    async def test_security_event_does_not_wait_for_database(self, pool, monkeypatch):
+        import core.audit_sink as audit_module
+        from core.security import log_security_event
+
+        pool.gate = asyncio.Event()
+        sink = AuditSink(batch_size=1000, flush_interval_ms=10)
+        monkeypatch.setattr(audit_module, "audit_sink", sink)
+        request = SimpleNamespace(
+            client=SimpleNamespace(host="10.0.0.1"), headers={"user-agent": "pytest"},
+            url=SimpleNamespace(path="/admin/core/crm/leads/1"), method="GET",
+        )
+        user = SimpleNamespace(user_id="u-1", email="a@b.co", role="ceo")
+
+        await log_security_event(request, user, "read_lead", resource_id=1)
+        for _ in range(100):
+            if pool.calls:
+                break
+            await asyncio.sleep(0.01)
+        assert pool.calls == 1  # the first INSERT is now parked on the gate
+
+        for _ in range(50):
+            await log_security_event(request, user, "read_lead", resource_id=1)
+        assert not pool.gate.is_set() and pool.batches == []
+
+        pool.gate.set()
+        await sink.shutdown()
+        assert len(pool.rows) == 51
+        assert json.loads(pool.rows[0][3])["path"] == "/admin/core/crm/leads/1"
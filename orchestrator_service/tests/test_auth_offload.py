@@ -0,0 +1,131 @@
+"""
+bcrypt offload in auth_service + login-storm benchmark.
+
+The benchmark serves a login route (bcrypt verify) and a trivial `/chat` route from
+the same event loop, fires a storm of concurrent logins and measures event-loop lag
+and `/chat` p99 with bcrypt inline vs. offloaded to the AUTH_CRYPTO_WORKERS pool.
+The benchmark runs only with RUN_BENCHMARKS=1; add `-s` to print the report.
+"""
+
+import asyncio
+import os
+import statistics
+import threading
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-" + "x" * 64)
+
+from auth_service import AuthService, pwd_context  # noqa: E402
+
+STORM_LOGINS = 24
+CHAT_REQUESTS = 40
+BENCH_BCRYPT_ROUNDS = 8  # ~10-20 ms por verify: suficiente para ver el bloqueo sin alargar el test
+
+PASSWORD = "correct horse battery staple"
+PASSWORD_HASH = pwd_context.copy(bcrypt__rounds=BENCH_BCRYPT_ROUNDS).hash(PASSWORD)
+
+
+def _app(offload: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/auth/login")
+    async def login(payload: dict):
+        if offload:
+            ok = await AuthService.verify_password_async(payload["password"], PASSWORD_HASH)
+        else:
+            ok = AuthService.verify_password(payload["password"], PASSWORD_HASH)
+        if not ok:
+            raise HTTPException(status_code=401)
+        return {"access_token": AuthService.create_access_token({"user_id": "u"})}
+
+    @app.post("/chat")
+    async def chat(payload: dict):
+        await asyncio.sleep(0)
+        return {"reply": "ok"}
+
+    return app
+
+
+def _p99(samples):
+    return statistics.quantiles(samples, n=100, method="inclusive")[98]
+
+
+async def _login_storm(offload: bool) -> dict:
+    transport = httpx.ASGITransport(app=_app(offload))
+    lags, chat_latencies = [], []
+    done = asyncio.Event()
+
+    async def lag_probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async def chatter():
+            for _ in range(CHAT_REQUESTS):
+                start = time.perf_counter()
+                response = await client.post("/chat", json={"message": "hola"})
+                chat_latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+                await asyncio.sleep(0.002)
+
+        probe = asyncio.create_task(lag_probe())
+        logins = [client.post("/auth/login", json={"password": PASSWORD}) for _ in range(STORM_LOGINS)]
+        results = await asyncio.gather(chatter(), *logins)
+        done.set()
+        await probe
+
+    assert all(r.status_code == 200 for r in results[1:])
+    return {
+        "loop_lag_max_ms": max(lags) * 1000,
+        "loop_lag_p99_ms": _p99(lags) * 1000,
+        "chat_p50_ms": statistics.median(chat_latencies) * 1000,
+        "chat_p99_ms": _p99(chat_latencies) * 1000,
+    }
+
+
+class TestPasswordOffload:
+    async def test_async_helpers_match_sync(self):
+        hashed = await AuthService.get_password_hash_async("s3cret")
+        assert AuthService.verify_password("s3cret", hashed)
+        assert await AuthService.verify_password_async("s3cret", hashed)
+        assert not await AuthService.verify_password_async("wrong", hashed)
+
+    async def test_long_passwords_are_truncated_like_sync(self):
+        hashed = await AuthService.get_password_hash_async("a" * 100)
+        assert await AuthService.verify_password_async("a" * 72, hashed)
+
+    async def test_verify_runs_off_the_event_loop(self, monkeypatch):
+        # El verify bloquea hasta que el loop vuelva a correr: inline, el loop nunca llegaría al set()
+        loop_ran = threading.Event()
+        threads = []
+
+        def blocking_verify(plain, hashed):
+            threads.append(threading.current_thread())
+            return loop_ran.wait(timeout=5)
+
+        monkeypatch.setattr(AuthService, "verify_password", staticmethod(blocking_verify))
+        verify = asyncio.ensure_future(AuthService.verify_password_async("x", "y"))
+        await asyncio.sleep(0)
+        loop_ran.set()
+        assert await verify
+        assert threads[0] is not threading.main_thread()
+        assert threads[0].name.startswith("auth-crypto")
+
+
+@pytest.mark.benchmark
+class TestLoginStormBenchmark:
+    async def test_offload_keeps_event_loop_responsive(self):
+        inline = await _login_storm(offload=False)
+        offloaded = await _login_storm(offload=True)
+        print("\nlogin storm", f"({STORM_LOGINS} logins, bcrypt rounds={BENCH_BCRYPT_ROUNDS})")
+        for name, report in (("inline", inline), ("offloaded", offloaded)):
+            print(f"  {name:<10}" + "  ".join(f"{k}={v:.1f}" for k, v in report.items()))
+        # Inline, cada verify bloquea el loop entero; en el pool el loop sigue libre
+        assert offloaded["loop_lag_max_ms"] < inline["loop_lag_max_ms"] / 2
+        assert offloaded["chat_p99_ms"] < inline["chat_p99_ms"]
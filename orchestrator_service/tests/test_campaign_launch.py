@@ -0,0 +1,114 @@
+"""
+Campaign launch: segment compilation (no database) and streamed campaign jobs (TEST_POSTGRES_DSN).
+"""
+
+import uuid
+
+import pytest
+
+from services.outreach.campaign_service import body_param_count
+from services.outreach.segment_compiler import compile_segment
+
+
+class TestCompileSegment:
+    def test_empty_segment(self):
+        assert compile_segment(None, 3) == ("", [])
+        assert compile_segment({}, 3) == ("", [])
+
+    def test_placeholders_are_numbered_from_param_idx(self):
+        sql, params = compile_segment({"status": "new", "tags": ["vip", "dental"], "exclude_contacted": True}, 3)
+        assert sql == (
+            " AND l.status = ANY($3::text[])"
+            " AND COALESCE(l.tags, '[]'::jsonb) ?| $4::text[]"
+            " AND l.outreach_message_sent IS NOT TRUE"
+        )
+        assert params == [["new"], ["vip", "dental"]]
+
+    def test_seller_and_dates(self):
+        seller = uuid.uuid4()
+        sql, params = compile_segment(
+            {"assigned_seller_id": [str(seller)], "created_after": "2024-01-01T00:00:00Z"}, 5
+        )
+        assert "l.assigned_seller_id = ANY($5::uuid[])" in sql
+        assert "l.created_at >= $6" in sql
+        assert params[0] == [seller]
+        assert compile_segment({"assigned_seller_id": "unassigned"}, 1) == (" AND l.assigned_seller_id IS NULL", [])
+
+    @pytest.mark.parametrize("segment", [
+        {"unknown": 1},
+        {"status": ["new", 3]},
+        {"status": "new'; DROP TABLE leads; --", "evil": True},
+        {"created_after": "yesterday"},
+        {"assigned_seller_id": "not-a-uuid"},
+        {"exclude_contacted": "yes"},
+    ])
+    def test_invalid_segments_raise(self, segment):
+        with pytest.raises(ValueError):
+            compile_segment(segment, 1)
+
+
+class TestBodyParamCount:
+    def test_meta_components(self):
+        components = [
+            {"type": "HEADER", "format": "TEXT", "text": "Hola {{1}}"},
+            {"type": "BODY", "text": "Hola {{1}}, tenemos novedades en {{2}}."},
+        ]
+        assert body_param_count(components) == 2
+        assert body_param_count({"components": components}) == 2
+        assert body_param_count([{"type": "BODY", "text": "Sin variables"}]) == 0
+        assert body_param_count(None) == 0
+
+
+@pytest.mark.postgres
+class TestCampaignJob:
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch, pg_db):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+
+    async def test_streamed_campaign_updates_stats(self, pg_db):
+        from services.outreach.outreach_dispatcher import OutreachDispatcher
+        from test_outreach_dispatcher import SendStub, _sender
+
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        await pg_db.execute(
+            "UPDATE tenants SET bot_phone_number = COALESCE(bot_phone_number, '5491100000000') WHERE id = $1", tenant_id
+        )
+        niche = f"campaign-{uuid.uuid4().hex[:8]}"
+        for i in range(7):
+            await pg_db.execute("""
+                INSERT INTO leads (tenant_id, phone_number, first_name, prospecting_niche, status)
+                VALUES ($1, $2, $3, $4, $5)
+            """, tenant_id, f"549351{uuid.uuid4().int % 10**7:07d}", f"Lead {i}", niche, "new" if i < 5 else "closed_lost")
+        campaign_id = await pg_db.fetchval("""
+            INSERT INTO campaigns (tenant_id, name, target_segment, status, stats)
+            VALUES ($1, 'Test', $2, 'sending', '{}') RETURNING id
+        """, tenant_id, {"niche": niche, "status": "new"})
+
+        async with SendStub(delay=0) as stub:
+            dispatcher = OutreachDispatcher(batch_size=2, enqueue_chunk_size=2, sender_factory=lambda: _sender(stub))
+            job = await dispatcher.create_job(
+                tenant_id, "promo", "es", kind="campaign", campaign_id=campaign_id,
+                segment={"niche": niche, "status": "new"}, template_params=1,
+            )
+            await dispatcher.wait(job["id"])
+
+        try:
+            done = await dispatcher.get_job(job["id"], tenant_id)
+            assert (done["status"], done["total"], done["sent"]) == ("completed", 5, 5)
+            assert all(len(body["components"][0]["parameters"]) == 1 for _, _, body in stub.requests)
+
+            lead_id = await pg_db.fetchval(
+                "SELECT id FROM leads WHERE tenant_id = $1 AND prospecting_niche = $2 AND status = 'new' LIMIT 1",
+                tenant_id, niche
+            )
+            assert await dispatcher.record_reply(tenant_id, lead_id) == 1
+            assert await dispatcher.record_reply(tenant_id, lead_id) == 0
+
+            campaign = await pg_db.fetchrow("SELECT status, stats FROM campaigns WHERE id = $1", campaign_id)
+            assert campaign["status"] == "completed"
+            assert campaign["stats"] == {"queued": 5, "sent": 5, "failed": 0, "replied": 1}
+        finally:
+            await pg_db.execute("DELETE FROM outreach_jobs WHERE id = $1", job["id"])
+            await pg_db.execute("DELETE FROM campaigns WHERE id = $1", campaign_id)
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND prospecting_niche = $2", tenant_id, niche)
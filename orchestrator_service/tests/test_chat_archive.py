@@ -0,0 +1,166 @@
+"""
+Cold storage of chat history (chat_archive_service) and the archive fallback of the chat endpoint.
+
+The segment/reader/fallback tests need no database; the archive round trip needs TEST_POSTGRES_DSN.
+"""
+
+import json
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+import services.chat_archive_service as archive_module
+from services.chat_archive_service import ArchivedSegmentReader, ChatArchiveService
+
+
+class ArchivePool:
+    """Fake pool answering the tenants and chat_archive_segments queries the service issues."""
+
+    def __init__(self, tenants=(), segments=(), hot=()):
+        self.tenants = list(tenants)
+        self.segments = list(segments)
+        self.hot = list(hot)
+
+    async def fetch(self, query, *args):
+        if "FROM tenants" in query:
+            return self.tenants
+        if "FROM chat_archive_segments" in query:
+            return self.segments
+        return self.hot
+
+    async def fetchval(self, query, *args):
+        return len(self.hot)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    import db as db_module
+    fake = ArchivePool()
+    monkeypatch.setattr(db_module.db, "pool", fake)
+    return fake
+
+
+def _message(i, phone="+5491100000001"):
+    return {"id": i, "from_number": phone, "role": "user", "content": f"mensaje {i} ñ",
+            "created_at": datetime(2025, 1, 1, 12, i, tzinfo=timezone.utc)}
+
+
+class TestSegments:
+    def test_write_read_round_trip(self, tmp_path):
+        path = str(tmp_path / "part.ndjson.gz")
+        ChatArchiveService._write_segment(path, [_message(1), _message(2)])
+        rows = list(ArchivedSegmentReader(path))
+        assert [r["id"] for r in rows] == [1, 2]
+        assert rows[0]["content"] == "mensaje 1 ñ"
+        assert rows[0]["created_at"] == "2025-01-01 12:01:00+00:00"
+        assert not (tmp_path / "part.ndjson.gz.tmp").exists()
+
+    def test_empty_file_yields_nothing(self, tmp_path):
+        path = tmp_path / "empty.ndjson.gz"
+        path.write_bytes(b"")
+        assert list(ArchivedSegmentReader(str(path))) == []
+
+    def test_system_events_archived_by_created_at(self):
+        assert archive_module.ARCHIVE_TABLES["system_events"]["ts"] == "created_at"
+
+
+class TestRetention:
+    async def test_per_tenant_override_and_global_fallback(self, pool):
+        pool.tenants = [
+            {"id": 1, "config": {"chat_retention_days": 30}},
+            {"id": 2, "config": json.dumps({"chat_retention_days": "7"})},
+            {"id": 3, "config": None},
+            {"id": 4, "config": "no es json"},
+            {"id": 5, "config": {"chat_retention_days": "abc"}},
+            {"id": 6, "config": {"chat_retention_days": -5}},
+        ]
+        retention = await ChatArchiveService()._get_retention_by_tenant()
+        default = archive_module.CHAT_RETENTION_DAYS
+        assert retention == {1: 30, 2: 7, 3: default, 4: default, 5: default, 6: 1}
+
+
+class TestArchivedReads:
+    async def test_newest_first_with_offset_and_missing_segment_skipped(self, pool, tmp_path):
+        newer, older = str(tmp_path / "newer.ndjson.gz"), str(tmp_path / "older.ndjson.gz")
+        ChatArchiveService._write_segment(newer, [_message(3), _message(4), _message(5, phone="+otro")])
+        ChatArchiveService._write_segment(older, [_message(1), _message(2)])
+        pool.segments = [
+            {"path": newer, "row_count": 3},
+            {"path": str(tmp_path / "borrado.ndjson.gz"), "row_count": 9},
+            {"path": older, "row_count": 2},
+        ]
+        service = ChatArchiveService(base_dir=str(tmp_path))
+        rows = await service.get_archived_chat_messages("+5491100000001", 1, limit=3, offset=1)
+        assert [r["id"] for r in rows] == [3, 2, 1]
+        assert await service.get_archived_chat_messages("+5491100000001", 1, limit=0) == []
+
+
+class TestChatEndpointFallback:
+    async def test_incomplete_hot_page_is_completed_from_archive(self, pool, monkeypatch):
+        import admin_routes
+        pool.hot = [{**_message(9), "created_at": "2025-02-01 00:00:00+00:00"}]
+        calls = []
+
+        async def archived(phone, tenant_id, limit, offset=0):
+            calls.append((phone, tenant_id, limit, offset))
+            return [{**_message(1), "created_at": "2025-01-01 00:00:00+00:00"}]
+
+        monkeypatch.setattr(archive_module.chat_archive_service, "get_archived_chat_messages", archived)
+        messages = await admin_routes.get_chat_messages("+5491100000001", 1, limit=5, offset=0, allowed_ids=[1])
+        assert [m["id"] for m in messages] == [1, 9]
+        assert calls == [("+5491100000001", 1, 4, 0)]
+
+    async def test_archive_errors_keep_hot_page(self, pool, monkeypatch):
+        import admin_routes
+        pool.hot = [{**_message(9), "created_at": "2025-02-01 00:00:00+00:00"}]
+
+        async def broken(*args, **kwargs):
+            raise OSError("disk gone")
+
+        monkeypatch.setattr(archive_module.chat_archive_service, "get_archived_chat_messages", broken)
+        messages = await admin_routes.get_chat_messages("+5491100000001", 1, limit=5, offset=0, allowed_ids=[1])
+        assert [m["id"] for m in messages] == [9]
+
+
+@pytest.mark.postgres
+class TestArchiveRoundTrip:
+    async def test_archive_all_moves_old_rows_to_segments(self, pg_db, monkeypatch, tmp_path):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+        tag = uuid.uuid4().hex[:8]
+        phone = f"+arch{tag}"
+        tenant_id = await pg_db.fetchval(
+            "INSERT INTO tenants (clinic_name, bot_phone_number, config) VALUES ('archive-test', $1, $2::jsonb) RETURNING id",
+            f"+ar{tag}", json.dumps({"chat_retention_days": 30})
+        )
+        try:
+            await pg_db.execute("""
+                INSERT INTO chat_messages (from_number, role, content, tenant_id, created_at)
+                VALUES ($1, 'user', 'viejo', $2, NOW() - INTERVAL '60 days'),
+                       ($1, 'assistant', 'viejo 2', $2, NOW() - INTERVAL '59 days'),
+                       ($1, 'user', 'nuevo', $2, NOW())
+            """, phone, tenant_id)
+            await pg_db.execute("""
+                INSERT INTO system_events (tenant_id, event_type, message, created_at)
+                VALUES ($1, 'archive_test', 'viejo', NOW() - INTERVAL '60 days'),
+                       ($1, 'archive_test', 'nuevo', NOW())
+            """, tenant_id)
+
+            service = ChatArchiveService(base_dir=str(tmp_path))
+            results = await service.archive_all()
+            assert -1 not in results.values()
+            assert results["chat_messages"] >= 2 and results["system_events"] >= 1
+
+            assert await pg_db.fetchval("SELECT COUNT(*) FROM chat_messages WHERE tenant_id = $1", tenant_id) == 1
+            assert await pg_db.fetchval("SELECT COUNT(*) FROM system_events WHERE tenant_id = $1", tenant_id) == 1
+            archived = await service.get_archived_chat_messages(phone, tenant_id, limit=10)
+            assert [r["content"] for r in archived] == ["viejo 2", "viejo"]
+            assert await pg_db.fetchval(
+                "SELECT COUNT(*) FROM chat_archive_segments WHERE tenant_id = $1 AND table_name = 'system_events'", tenant_id
+            ) == 1
+        finally:
+            await pg_db.execute("DELETE FROM chat_archive_segments WHERE tenant_id = $1", tenant_id)
+            await pg_db.execute("DELETE FROM system_events WHERE tenant_id = $1", tenant_id)
+            await pg_db.execute("DELETE FROM chat_messages WHERE tenant_id = $1", tenant_id)
+            await pg_db.execute("DELETE FROM tenants WHERE id = $1", tenant_id)
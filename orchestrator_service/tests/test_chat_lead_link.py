@@ -0,0 +1,145 @@
+"""
+chat_messages.lead_id: linking at insert time and batched backfill.
+
+The watermark tests use a fake pool; the linking tests need TEST_POSTGRES_DSN.
+"""
+
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.chat_lead_link_service import (
+    CHAT_LEAD_LINK_OVERLAP_MINUTES, LINK_BATCH_SQL, LINK_NEW_LEADS_SQL, NIL_UUID, STATE_SQL, ChatLeadLinkService,
+)
+
+NOW = datetime(2026, 1, 2, tzinfo=timezone.utc)
+
+
+class LinkStatePool:
+    """Fake pool: one stored state row, one batch of messages and of leads after the marks."""
+
+    def __init__(self, last_message_id, leads_linked_until):
+        self.state = {"last_message_id": last_message_id, "leads_linked_until": leads_linked_until}
+        self.fetches = []
+        self.updates = []
+
+    async def fetchrow(self, query, *args):
+        self.fetches.append((query, args))
+        if query == STATE_SQL:
+            return {**self.state, "now": NOW}
+        if query == LINK_BATCH_SQL:
+            return {"last_id": args[0] + 10, "linked": 2} if len(self.fetches) == 2 else {"last_id": None, "linked": 0}
+        if query == LINK_NEW_LEADS_SQL:
+            first = args[1] == NIL_UUID
+            return {"last_created_at": NOW, "last_id": uuid.uuid4(), "linked": 3} if first \
+                else {"last_created_at": None, "last_id": None, "linked": 0}
+        raise AssertionError(query)
+
+    async def execute(self, query, *args):
+        self.updates.append(args)
+
+
+@pytest.fixture
+def link_pool(monkeypatch):
+    import db as db_module
+
+    def install(last_message_id, leads_linked_until):
+        fake = LinkStatePool(last_message_id, leads_linked_until)
+        monkeypatch.setattr(db_module.db, "pool", fake)
+        return fake
+    return install
+
+
+class TestBackfillWatermarks:
+    async def test_first_run_scans_history_and_stores_marks(self, link_pool):
+        pool = link_pool(0, None)
+        assert await ChatLeadLinkService(pause_seconds=0).backfill() == 2
+        assert pool.fetches[1] == (LINK_BATCH_SQL, (0, ChatLeadLinkService().batch_size))
+        assert not any(q == LINK_NEW_LEADS_SQL for q, _ in pool.fetches)
+        assert pool.updates == [(10,), (NOW,)]
+
+    async def test_next_run_resumes_after_marks(self, link_pool):
+        since = NOW - timedelta(hours=1)
+        pool = link_pool(500, since)
+        assert await ChatLeadLinkService(batch_size=7, pause_seconds=0).backfill() == 5
+        assert pool.fetches[1] == (LINK_BATCH_SQL, (500, 7))
+        leads_query = [args for q, args in pool.fetches if q == LINK_NEW_LEADS_SQL][0]
+        assert leads_query == (since - timedelta(minutes=CHAT_LEAD_LINK_OVERLAP_MINUTES), NIL_UUID, 7)
+        assert pool.updates == [(510,), (NOW,)]
+
+
+@pytest.mark.postgres
+class TestChatLeadLink:
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch, pg_db):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+
+    async def test_append_links_message_to_lead(self, pg_db):
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        phone = f"+96{uuid.uuid4().int % 10**10:010d}"
+        try:
+            lead = await pg_db.ensure_lead_exists(tenant_id, phone)
+            # Same number written differently still resolves through phone_e164
+            await pg_db.append_chat_message(phone[1:], "assistant", "hola", "corr-1", tenant_id)
+            await pg_db.append_chat_message(phone, "assistant", "chau", "corr-2", tenant_id, lead_id=lead["id"])
+            linked = await pg_db.fetch("SELECT lead_id FROM chat_messages WHERE tenant_id = $1 AND phone_e164 = $2",
+                                       tenant_id, phone[1:])
+            assert [r["lead_id"] for r in linked] == [lead["id"], lead["id"]]
+        finally:
+            await pg_db.execute("DELETE FROM chat_messages WHERE tenant_id = $1 AND phone_e164 = $2", tenant_id, phone[1:])
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND phone_number = $2", tenant_id, phone)
+
+    async def test_backfill_links_in_batches(self, pg_db):
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        phones = [f"+95{uuid.uuid4().int % 10**10:010d}" for _ in range(3)]
+        try:
+            # Messages written before their leads existed
+            await pg_db.execute("""
+                INSERT INTO chat_messages (from_number, role, content, tenant_id)
+                SELECT p, 'user', 'msg ' || g, $1
+                FROM unnest($2::text[]) p, generate_series(1, 5) g
+            """, tenant_id, phones)
+            for phone in phones[:2]:
+                await pg_db.ensure_lead_exists(tenant_id, phone)
+
+            linked = await ChatLeadLinkService(batch_size=4, pause_seconds=0).backfill()
+            assert linked >= 10
+            counts = await pg_db.fetch("""
+                SELECT cm.from_number, COUNT(*) FILTER (WHERE cm.lead_id = l.id) AS linked
+                FROM chat_messages cm LEFT JOIN leads l ON l.tenant_id = cm.tenant_id AND l.phone_number = cm.from_number
+                WHERE cm.tenant_id = $1 AND cm.from_number = ANY($2::text[])
+                GROUP BY cm.from_number
+            """, tenant_id, phones)
+            assert {r["from_number"]: r["linked"] for r in counts} == {phones[0]: 5, phones[1]: 5, phones[2]: 0}
+        finally:
+            await pg_db.execute("DELETE FROM chat_messages WHERE tenant_id = $1 AND from_number = ANY($2::text[])", tenant_id, phones)
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND phone_number = ANY($2::text[])", tenant_id, phones)
+
+    async def test_lead_created_after_run_links_old_messages(self, pg_db):
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        phone = f"+94{uuid.uuid4().int % 10**10:010d}"
+        service = ChatLeadLinkService(batch_size=4, pause_seconds=0)
+        try:
+            await pg_db.execute("""
+                INSERT INTO chat_messages (from_number, role, content, tenant_id)
+                SELECT $2, 'user', 'msg ' || g, $1 FROM generate_series(1, 3) g
+            """, tenant_id, phone)
+            await service.backfill()
+            await service.backfill()  # con la marca guardada, la primera ya dejó todo vinculado
+            last_message_id = await pg_db.fetchval("SELECT last_message_id FROM chat_lead_link_state")
+            assert last_message_id >= await pg_db.fetchval(
+                "SELECT MAX(id) FROM chat_messages WHERE tenant_id = $1 AND from_number = $2", tenant_id, phone
+            )
+
+            # Lead creado después: sus mensajes ya quedaron detrás de la marca de mensajes
+            lead = await pg_db.ensure_lead_exists(tenant_id, phone)
+            assert await service.backfill() >= 3
+            assert await pg_db.fetchval(
+                "SELECT COUNT(*) FROM chat_messages WHERE tenant_id = $1 AND from_number = $2 AND lead_id = $3",
+                tenant_id, phone, lead["id"]
+            ) == 3
+        finally:
+            await pg_db.execute("DELETE FROM chat_messages WHERE tenant_id = $1 AND from_number = $2", tenant_id, phone)
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND phone_number = $2", tenant_id, phone)
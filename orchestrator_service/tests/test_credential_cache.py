@@ -0,0 +1,93 @@
+"""
+Per-tenant decrypted credential cache in core.credentials (no database required).
+"""
+
+import asyncio
+
+import pytest
+
+import core.credentials as credentials
+
+
+class CredentialsConn:
+    """Fake connection over an in-memory credentials table; counts round trips."""
+
+    def __init__(self, rows, delay=0.0):
+        self.rows = rows  # {(tenant_id, name): value}
+        self.delay = delay
+        self.queries = []
+
+    async def fetch(self, query, *args):
+        self.queries.append(query)
+        await asyncio.sleep(self.delay)
+        tenant_id = args[0]
+        return [{"name": n, "value": v} for (t, n), v in self.rows.items() if t == tenant_id]
+
+    async def execute(self, query, *args):
+        self.queries.append(query)
+        tenant_id, name, value = args[0], args[1], args[2]
+        self.rows[(tenant_id, name)] = value
+        return "INSERT 0 1"
+
+
+@pytest.fixture
+def conn(fake_pool):
+    fake = CredentialsConn({
+        (1, "YCLOUD_API_KEY"): "key-1",
+        (1, "YCLOUD_WHATSAPP_NUMBER"): "+5491100000000",
+        (1, "EMPTY"): "",
+        (2, "YCLOUD_API_KEY"): "key-2",
+    })
+    fake_pool(fake)
+    credentials.invalidate_tenant_credentials()
+    yield fake
+    credentials.invalidate_tenant_credentials()
+
+
+class TestCredentialCache:
+    async def test_one_query_per_tenant(self, conn):
+        assert await credentials.get_tenant_credential(1, "YCLOUD_API_KEY") == "key-1"
+        assert await credentials.get_tenant_credential(1, "YCLOUD_WHATSAPP_NUMBER") == "+5491100000000"
+        assert await credentials.get_tenant_credential(1, "EMPTY") is None
+        assert await credentials.get_tenant_credential(1, "MISSING") is None
+        assert len(conn.queries) == 1
+
+        assert await credentials.get_tenant_credential(2, "YCLOUD_API_KEY") == "key-2"
+        assert await credentials.get_tenant_credential(2, "YCLOUD_WHATSAPP_NUMBER") is None
+        assert len(conn.queries) == 2
+
+    async def test_values_are_decrypted_once(self, conn, monkeypatch):
+        from cryptography.fernet import Fernet
+        key = Fernet.generate_key().decode()
+        monkeypatch.setattr(credentials, "CREDENTIALS_FERNET_KEY", key)
+        conn.rows[(3, "META_USER_LONG_TOKEN")] = credentials.encrypt_value("secret-token")
+
+        decrypts = []
+        real_decrypt = credentials.decrypt_value
+        monkeypatch.setattr(credentials, "decrypt_value", lambda v: decrypts.append(v) or real_decrypt(v))
+        for _ in range(5):
+            assert await credentials.get_tenant_credential(3, "META_USER_LONG_TOKEN") == "secret-token"
+        assert len(decrypts) == 1
+
+    async def test_save_invalidates(self, conn):
+        assert await credentials.get_tenant_credential(1, "YCLOUD_API_KEY") == "key-1"
+        await credentials.save_tenant_credential(1, "YCLOUD_API_KEY", "key-1b")
+        assert await credentials.get_tenant_credential(1, "YCLOUD_API_KEY") == "key-1b"
+
+    async def test_invalidation_is_per_tenant(self, conn):
+        await credentials.get_tenant_credentials(1)
+        await credentials.get_tenant_credentials(2)
+        conn.rows.pop((1, "YCLOUD_API_KEY"))
+        conn.rows[(2, "YCLOUD_API_KEY")] = "changed"
+        credentials.invalidate_tenant_credentials(1)
+        before = len(conn.queries)
+
+        assert await credentials.get_tenant_credential(1, "YCLOUD_API_KEY") is None
+        assert await credentials.get_tenant_credential(2, "YCLOUD_API_KEY") == "key-2"
+        assert len(conn.queries) == before + 1
+
+    async def test_concurrent_misses_share_one_query(self, conn):
+        conn.delay = 0.01
+        values = await asyncio.gather(*[credentials.get_tenant_credential(1, "YCLOUD_API_KEY") for _ in range(20)])
+        assert values == ["key-1"] * 20
+        assert len(conn.queries) == 1
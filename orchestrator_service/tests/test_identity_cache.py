@@ -0,0 +1,140 @@
+"""
+Identity / tenant resolution cache in core.security (no database required).
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import core.security as security
+from core.cache import TTLCache
+
+
+class CountingPool:
+    """Fake pool: sellers map user -> tenant; counts every round trip."""
+
+    def __init__(self, sellers=None, tenants=(1, 2, 3), delay=0.0):
+        self.sellers = dict(sellers or {})
+        self.tenants = list(tenants)
+        self.delay = delay
+        self.queries = []
+
+    async def fetchval(self, query, *args):
+        self.queries.append(query)
+        await asyncio.sleep(self.delay)
+        if "FROM sellers" in query:
+            return self.sellers.get(args[0])
+        return None
+
+    async def fetch(self, query, *args):
+        self.queries.append(query)
+        await asyncio.sleep(self.delay)
+        return [{"id": t} for t in self.tenants]
+
+    async def fetchrow(self, query, *args):
+        self.queries.append(query)
+        return {"subscription_status": "active", "trial_ends_at": None}
+
+
+def _user(role="closer", user_id=None):
+    return SimpleNamespace(user_id=str(user_id or uuid.uuid4()), email="a@b.co", role=role)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    import db as db_module
+    fake = CountingPool()
+    monkeypatch.setattr(db_module.db, "pool", fake)
+    security.invalidate_tenant_identity()
+    yield fake
+    security.invalidate_tenant_identity()
+
+
+class TestIdentityCache:
+    async def test_warm_cache_needs_no_round_trips(self, pool):
+        uid = uuid.uuid4()
+        pool.sellers[uid] = 2
+        user = _user(user_id=uid)
+
+        assert await security.get_resolved_tenant_id(user) == 2
+        assert await security.get_allowed_tenant_ids(user) == [2]
+        cold = len(pool.queries)
+        assert cold == 1
+
+        for _ in range(10):
+            assert await security.get_resolved_tenant_id(_user(user_id=uid)) == 2
+            assert await security.get_tenant_status(2) is not None
+        assert len(pool.queries) == cold + 1  # solo la primera carga del estado del tenant
+
+    async def test_ceo_sees_all_tenants_and_falls_back_to_first(self, pool):
+        ceo = _user(role="ceo")
+        assert await security.get_allowed_tenant_ids(ceo) == [1, 2, 3]
+        assert await security.get_resolved_tenant_id(ceo) == 1
+
+    async def test_request_scope_resolves_once(self, pool):
+        request = SimpleNamespace(state=SimpleNamespace())
+        user = _user()
+        first = await security.resolve_identity(user, request)
+        security.invalidate_user_identity(user.user_id)
+        assert await security.resolve_identity(user, request) is first
+
+    async def test_invalidation(self, pool):
+        uid = uuid.uuid4()
+        pool.sellers[uid] = 2
+        user = _user(user_id=uid)
+        assert await security.get_resolved_tenant_id(user) == 2
+
+        pool.sellers[uid] = 3
+        assert await security.get_resolved_tenant_id(user) == 2
+        security.invalidate_user_identity(uid)
+        assert await security.get_resolved_tenant_id(user) == 3
+
+        ceo = _user(role="ceo")
+        assert await security.get_allowed_tenant_ids(ceo) == [1, 2, 3]
+        pool.tenants.append(4)
+        security.invalidate_tenant_identity(4)
+        assert await security.get_allowed_tenant_ids(ceo) == [1, 2, 3, 4]
+
+    async def test_concurrent_misses_share_one_load(self, pool):
+        pool.delay = 0.01
+        uid = uuid.uuid4()
+        pool.sellers[uid] = 2
+        results = await asyncio.gather(*[security.get_resolved_tenant_id(_user(user_id=uid)) for _ in range(20)])
+        assert results == [2] * 20
+        assert len(pool.queries) == 1
+
+    async def test_loader_errors_are_not_cached(self):
+        cache = TTLCache(ttl=30, max_entries=10)
+        calls = 0
+
+        async def flaky():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise RuntimeError("db down")
+            return "ok"
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_load("k", flaky)
+        assert await cache.get_or_load("k", flaky) == "ok"
+        assert await cache.get_or_load("k", flaky) == "ok"
+        assert calls == 2
+
+
+class TestCurrentUserContext:
+    async def test_expired_trial_still_blocks_from_cache(self, pool, monkeypatch):
+        ends = datetime.now(timezone.utc) - timedelta(minutes=1)
+
+        async def fetchrow(query, *args):
+            pool.queries.append(query)
+            return {"subscription_status": "trial", "trial_ends_at": ends}
+
+        monkeypatch.setattr(pool, "fetchrow", fetchrow)
+        request = SimpleNamespace(state=SimpleNamespace(), url=SimpleNamespace(path="/admin/core/crm/leads"))
+        from fastapi import HTTPException
+        with pytest.raises(HTTPException) as exc:
+            await security.get_current_user_context(request, _user())
+        assert exc.value.status_code == 402
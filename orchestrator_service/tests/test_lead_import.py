@@ -0,0 +1,123 @@
+"""
+Bulk lead import: parsing / per-row rejects (no database) and COPY staging + merge (TEST_POSTGRES_DSN).
+
+The 100k-row timing test also needs RUN_BENCHMARKS=1.
+"""
+
+import io
+import json
+import time
+import uuid
+
+import pytest
+
+from services.lead_import_service import LeadImportService, iter_csv_rows, iter_ndjson_rows, to_stage_record
+
+
+class TestImportParsing:
+    def test_csv_rows(self):
+        data = "﻿phone_number,first_name, tags\n+54 9 351 555-1234,Ana,\"vip;dental\"\n,Sin teléfono,\n".encode()
+        rows = list(iter_csv_rows(io.BytesIO(data)))
+        assert [r[0] for r in rows] == [1, 2]
+        assert rows[0][1]["tags"] == "vip;dental"
+        with pytest.raises(ValueError):
+            list(iter_csv_rows(io.BytesIO(b"name,email\nAna,a@b.co\n")))
+
+    def test_ndjson_rows(self):
+        data = b'{"phone_number": "3515551234"}\n\nnot json\n[1, 2]\n{"phone": "3515551235"}\n'
+        rows = list(iter_ndjson_rows(io.BytesIO(data)))
+        assert [(r[0], r[2]) for r in rows] == [(1, None), (2, "invalid_json"), (3, "invalid_json"), (4, None)]
+
+    def test_stage_record_and_rejects(self):
+        record, error = to_stage_record(7, {"phone_number": "+54 9 351 444-1234", "first_name": " Ana ", "tags": "vip, dental"}, "54")
+        assert error is None
+        assert record == (7, "+5493514441234", "Ana", None, None, None, None, json.dumps(["vip", "dental"]))
+        assert to_stage_record(1, {"first_name": "Ana"}, "54") == (None, "missing_phone")
+        assert to_stage_record(1, {"phone_number": "0000000"}, "54") == (None, "invalid_phone")
+        assert to_stage_record(1, {"phone_number": "3515551234", "email": "nope"}, "54") == (None, "invalid_email")
+        assert to_stage_record(1, {"phone_number": "3515551234", "tags": "[broken"}, "54") == (None, "invalid_tags")
+        assert to_stage_record(1, {"phone_number": "3515551234", "tags": {"a": 1}}, "54") == (None, "invalid_tags")
+
+
+@pytest.mark.postgres
+class TestLeadImport:
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch, pg_db):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+
+    async def test_import_merges_and_reports_rejects(self, pg_db):
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        source = f"import-{uuid.uuid4().hex[:8]}"
+        base = uuid.uuid4().int % 10**6 * 10  # 54920000 + 7 dígitos: sin "15" que el normalizador quite
+        await pg_db.execute(
+            "INSERT INTO leads (tenant_id, phone_number, first_name, source, status) VALUES ($1, $2, 'Existente', $3, 'new')",
+            tenant_id, f"+54920000{base:07d}", source
+        )
+        lines = [
+            f"54920000{base:07d},Ana,,{source}",  # existente
+            f"54920000{base + 1:07d},Beto,,{source}",
+            f"54920000{base + 1:07d},Beto 2,,{source}",  # duplicado en el archivo: gana la última fila
+            f",Sin teléfono,,{source}",
+            f"54920000{base + 2:07d},Caro,mal-email,{source}",
+        ]
+        data = ("phone_number,first_name,email,source\n" + "\n".join(lines) + "\n").encode()
+        try:
+            result = await LeadImportService(batch_size=2).import_stream(tenant_id, io.BytesIO(data), "csv")
+            assert (result["received"], result["inserted"], result["updated"], result["skipped_existing"]) == (5, 1, 0, 1)
+            assert result["rejects"] == [
+                {"row": 2, "reason": "duplicate_in_file"},
+                {"row": 4, "reason": "missing_phone"},
+                {"row": 5, "reason": "invalid_email"},
+            ]
+            assert await pg_db.fetchval(
+                "SELECT first_name FROM leads WHERE tenant_id = $1 AND phone_number = $2", tenant_id, f"+54920000{base + 1:07d}"
+            ) == "Beto 2"
+
+            result = await LeadImportService().import_stream(tenant_id, io.BytesIO(data), "csv", on_conflict="update")
+            assert (result["inserted"], result["updated"]) == (0, 2)
+            assert await pg_db.fetchval(
+                "SELECT first_name FROM leads WHERE tenant_id = $1 AND phone_number = $2", tenant_id, f"+54920000{base:07d}"
+            ) == "Ana"
+        finally:
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND source = $2", tenant_id, source)
+
+    @staticmethod
+    def _ndjson(source, rows):
+        base = uuid.uuid4().int % 90 * 10**5
+        return "\n".join(
+            json.dumps({"phone_number": f"54920000{base + i:07d}", "first_name": f"Lead {i}", "source": source})
+            for i in range(rows)
+        ).encode()
+
+    async def test_import_many_rows_across_batches(self, pg_db):
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        source = f"import-{uuid.uuid4().hex[:8]}"
+        data = self._ndjson(source, 5_000)
+        try:
+            result = await LeadImportService(batch_size=1_000).import_stream(tenant_id, io.BytesIO(data), "ndjson")
+            assert (result["received"], result["inserted"], result["rejected"]) == (5_000, 5_000, 0)
+            assert await pg_db.fetchval(
+                "SELECT COUNT(*) FROM leads WHERE tenant_id = $1 AND source = $2", tenant_id, source
+            ) == 5_000
+
+            result = await LeadImportService(batch_size=1_000).import_stream(
+                tenant_id, io.BytesIO(data), "ndjson", on_conflict="update"
+            )
+            assert (result["inserted"], result["updated"]) == (0, 5_000)
+        finally:
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND source = $2", tenant_id, source)
+
+    @pytest.mark.benchmark
+    async def test_import_100k_rows(self, pg_db):
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        source = f"import-{uuid.uuid4().hex[:8]}"
+        data = self._ndjson(source, 100_000)
+        try:
+            start = time.perf_counter()
+            result = await LeadImportService().import_stream(tenant_id, io.BytesIO(data), "ndjson")
+            elapsed = time.perf_counter() - start
+            assert result["inserted"] == 100_000
+            assert elapsed < 30
+        finally:
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND source = $2", tenant_id, source)
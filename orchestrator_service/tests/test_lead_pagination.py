@@ -0,0 +1,151 @@
+"""
+Keyset pagination of GET /leads: opaque (created_at, id) cursor and the X-Next-Cursor header.
+
+The fake-pool tests need no database; the tie test against real ordering needs TEST_POSTGRES_DSN.
+"""
+
+import base64
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+import modules.crm_sales.routes as crm_routes
+from core.security import get_current_user_context
+from modules.crm_sales.routes import _decode_lead_cursor, _encode_lead_cursor
+
+BASE = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class LeadsPool:
+    """Fake pool that applies the listing's keyset predicate/ORDER BY/LIMIT to in-memory rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def fetch(self, query, *args):
+        self.queries.append((query, args))
+        rows = sorted(self.rows, key=lambda r: (r["created_at"], r["id"]), reverse=True)
+        if "(created_at, id) <" in query:
+            cursor = (args[-4], args[-3])
+            rows = [r for r in rows if (r["created_at"], r["id"]) < cursor]
+        limit, offset = args[-2], args[-1]
+        return rows[offset:offset + limit]
+
+
+def _lead(created_at, i):
+    return {
+        "id": uuid.UUID(int=i), "tenant_id": 1, "phone_number": f"54911000{i:05d}", "first_name": f"Lead {i}",
+        "last_name": None, "email": None, "status": "new", "stage_id": None, "assigned_seller_id": None,
+        "source": "manual", "meta_lead_id": None, "tags": [], "created_at": created_at, "updated_at": created_at,
+    }
+
+
+@pytest.fixture
+def leads(monkeypatch):
+    import db as db_module
+    # 3 leads comparten created_at: el id desempata el orden
+    rows = [_lead(BASE, i) for i in (1, 2, 3)] + [_lead(BASE + timedelta(minutes=i), i) for i in (4, 5)]
+    monkeypatch.setattr(crm_routes.limiter, "enabled", False)
+    monkeypatch.setattr(db_module.db, "pool", LeadsPool(rows))
+    return rows
+
+
+def _client():
+    app = FastAPI()
+    app.include_router(crm_routes.router)
+    app.dependency_overrides[get_current_user_context] = lambda: {"tenant_id": 1, "role": "ceo"}
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def _walk(client, limit):
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/leads", params=params)
+        assert response.status_code == 200
+        pages.append([lead["id"] for lead in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+
+
+class TestLeadCursor:
+    def test_round_trip(self):
+        lead_id = uuid.uuid4()
+        cursor = _encode_lead_cursor(BASE, lead_id)
+        assert "=" not in cursor
+        assert _decode_lead_cursor(cursor) == (BASE, lead_id)
+
+    @pytest.mark.parametrize("cursor", [
+        "no-es-base64!",
+        base64.urlsafe_b64encode(b"[1, 2]").decode(),
+        base64.urlsafe_b64encode(b'{"c": "ayer", "i": "x"}').decode(),
+        _encode_lead_cursor(BASE, uuid.uuid4())[:-3],
+    ])
+    def test_invalid_cursor_is_400(self, cursor):
+        with pytest.raises(HTTPException) as exc:
+            _decode_lead_cursor(cursor)
+        assert exc.value.status_code == 400
+
+
+class TestListLeadsPagination:
+    async def test_pages_cover_every_lead_once_across_ties(self, leads):
+        async with _client() as client:
+            pages = await _walk(client, limit=2)
+        ids = [i for page in pages for i in page]
+        assert ids == [str(uuid.UUID(int=i)) for i in (5, 4, 3, 2, 1)]
+        assert [len(p) for p in pages] == [2, 2, 1]
+
+    async def test_last_full_page_yields_empty_page_without_cursor(self, leads):
+        async with _client() as client:
+            pages = await _walk(client, limit=5)
+        assert [len(p) for p in pages] == [5, 0]
+
+    async def test_short_page_has_no_cursor(self, leads):
+        async with _client() as client:
+            response = await client.get("/leads", params={"limit": 10})
+        assert len(response.json()) == 5
+        assert "X-Next-Cursor" not in response.headers
+
+    async def test_tampered_cursor_is_400(self, leads):
+        async with _client() as client:
+            response = await client.get("/leads", params={"cursor": "tampered"})
+        assert response.status_code == 400
+
+    async def test_cursor_overrides_offset(self, leads):
+        cursor = _encode_lead_cursor(BASE, uuid.UUID(int=3))
+        async with _client() as client:
+            response = await client.get("/leads", params={"cursor": cursor, "offset": 40})
+        assert [lead["id"] for lead in response.json()] == [str(uuid.UUID(int=i)) for i in (2, 1)]
+
+
+@pytest.mark.postgres
+class TestListLeadsPaginationPostgres:
+    async def test_ties_on_created_at(self, pg_db, monkeypatch):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+        monkeypatch.setattr(crm_routes.limiter, "enabled", False)
+        tag = uuid.uuid4().hex[:8]
+        tenant_id = await pg_db.fetchval(
+            "INSERT INTO tenants (clinic_name, bot_phone_number) VALUES ('cursor-test', $1) RETURNING id", f"+cu{tag}"
+        )
+        try:
+            await pg_db.execute("""
+                INSERT INTO leads (tenant_id, phone_number, first_name, status, created_at)
+                SELECT $1, '5491' || $2 || g, 'Lead', 'new', $3 FROM generate_series(1, 7) g
+            """, tenant_id, str(uuid.uuid4().int % 10**6), BASE)
+            app = FastAPI()
+            app.include_router(crm_routes.router)
+            app.dependency_overrides[get_current_user_context] = lambda: {"tenant_id": tenant_id, "role": "ceo"}
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                pages = await _walk(client, limit=3)
+            ids = [i for page in pages for i in page]
+            assert len(ids) == len(set(ids)) == 7
+            assert ids == sorted(ids, reverse=True)
+        finally:
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1", tenant_id)
+            await pg_db.execute("DELETE FROM tenants WHERE id = $1", tenant_id)
@@ -0,0 +1,117 @@
+"""
+Indexed lead search (lead_search_service): term classification, generated predicates and ranking.
+
+The filter/query tests need no database; the ranking test needs TEST_POSTGRES_DSN.
+"""
+
+import uuid
+
+import pytest
+
+from services.lead_search_service import (
+    LEAD_SEARCH_EXPR, LeadSearchService, build_lead_search_filter, is_phone_term,
+)
+
+
+class SearchPool:
+    """Fake pool: answers the pg_trgm probe and records the search query."""
+
+    def __init__(self, trgm=True):
+        self.trgm = trgm
+        self.fetches = []
+
+    async def fetchval(self, query, *args):
+        return self.trgm
+
+    async def fetch(self, query, *args):
+        self.fetches.append((query, args))
+        return []
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    import db as db_module
+    fake = SearchPool()
+    monkeypatch.setattr(db_module.db, "pool", fake)
+    return fake
+
+
+class TestIsPhoneTerm:
+    @pytest.mark.parametrize("term", ["1234", " 351 ", "+54 9 (351) 444-1234", "555.010"])
+    def test_phone_terms(self, term):
+        assert is_phone_term(term)
+
+    @pytest.mark.parametrize("term", ["12", "+-()", "ana", "ana 351", "a1b2c3", "", "@1234"])
+    def test_text_terms(self, term):
+        assert not is_phone_term(term)
+
+
+class TestBuildLeadSearchFilter:
+    def test_phone_matches_reversed_suffix(self):
+        sql, params = build_lead_search_filter(" +54 (351) 444-12 ", 4)
+        assert sql == " AND reverse(phone_number) LIKE $4"
+        assert params == ["2144415345%"]
+
+    def test_text_matches_indexed_expression(self):
+        sql, params = build_lead_search_filter("  Ana Pérez ", 2)
+        assert sql == f" AND {LEAD_SEARCH_EXPR} LIKE $2"
+        assert params == ["%ana pérez%"]
+
+    def test_like_wildcards_are_escaped(self):
+        _, params = build_lead_search_filter("50%_off\\", 1)
+        assert params == ["%50\\%\\_off\\\\%"]
+
+
+class TestLeadSearchQuery:
+    async def test_text_search_ranks_by_word_similarity(self, pool):
+        seller = uuid.uuid4()
+        await LeadSearchService().search(7, "Ana", limit=5, seller_id=seller)
+        query, params = pool.fetches[0]
+        assert "assigned_seller_id = $2" in query
+        assert f"word_similarity($4, {LEAD_SEARCH_EXPR}) AS score" in query
+        assert "LIMIT $5" in query
+        assert params == (7, seller, "%ana%", "ana", 5)
+
+    async def test_text_search_without_trgm_keeps_filter(self, pool):
+        pool.trgm = False
+        await LeadSearchService().search(7, "Ana")
+        query, params = pool.fetches[0]
+        assert "0.0::real AS score" in query
+        assert params == (7, "%ana%", 20)
+
+    async def test_phone_search_skips_similarity(self, pool):
+        await LeadSearchService().search(7, "4441234")
+        query, params = pool.fetches[0]
+        assert "1.0::real AS score" in query and "word_similarity" not in query
+        assert params == (7, "4321444%", 20)
+
+
+@pytest.mark.postgres
+class TestLeadSearchRanking:
+    async def test_exact_word_ranks_first_and_phone_suffix_matches(self, pg_db, monkeypatch):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+        tag = uuid.uuid4().hex[:8]
+        tenant_id = await pg_db.fetchval(
+            "INSERT INTO tenants (clinic_name, bot_phone_number) VALUES ('search-test', $1) RETURNING id", f"+se{tag}"
+        )
+        try:
+            await pg_db.execute("""
+                INSERT INTO leads (tenant_id, phone_number, first_name, last_name, email, status)
+                VALUES ($1, '5493514441234', 'Anabel', 'Ruiz', NULL, 'new'),
+                       ($1, '5493515550000', 'Ana', 'Gómez', NULL, 'new'),
+                       ($1, '5493516660000', 'Mariana', 'Pérez', NULL, 'new'),
+                       ($1, '5493517770000', 'Ana', 'Borrada', NULL, 'deleted')
+            """, tenant_id)
+            service = LeadSearchService()
+
+            by_name = await service.search(tenant_id, "ana")
+            assert {r["last_name"] for r in by_name} == {"Ruiz", "Gómez", "Pérez"}
+            if await service._has_trgm():
+                assert by_name[0]["last_name"] == "Gómez"  # palabra exacta antes que prefijo/substring
+
+            by_phone = await service.search(tenant_id, "441234")
+            assert [r["first_name"] for r in by_phone] == ["Anabel"]
+        finally:
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1", tenant_id)
+            await pg_db.execute("DELETE FROM tenants WHERE id = $1", tenant_id)
@@ -0,0 +1,151 @@
+"""
+Daily lead rollups (lead_daily_stats): Parche 20 trigger deltas, per-tenant reconciliation and
+the dashboard query.
+
+The fake-pool tests need no database; trigger/reconcile/dashboard tests need TEST_POSTGRES_DSN.
+"""
+
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+
+from services.lead_stats_service import (
+    NO_SELLER_ID, RECONCILE_LOCK_SQL, REVENUE_PER_WON_LEAD, LeadStatsService,
+)
+
+
+def _json(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+class ReconcileConn:
+    def __init__(self):
+        self.queries = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, query, *args):
+        self.queries.append((query, args))
+
+    async def fetchval(self, query, *args):
+        self.queries.append((query, args))
+        return 3
+
+
+class TestReconcileLocking:
+    async def test_takes_only_the_tenant_advisory_lock(self, fake_pool):
+        conn = ReconcileConn()
+        fake_pool(conn)
+        assert await LeadStatsService().reconcile_tenant(42) == 3
+        assert conn.queries[0] == (RECONCILE_LOCK_SQL, (42,))
+        assert not any("LOCK TABLE" in q for q, _ in conn.queries)
+
+
+@pytest.mark.postgres
+class TestLeadDailyStats:
+    @pytest.fixture
+    async def tenant(self, pg_db, monkeypatch):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+        tag = uuid.uuid4().hex[:8]
+        tenant_ids = [
+            await pg_db.fetchval(
+                "INSERT INTO tenants (clinic_name, bot_phone_number) VALUES ('stats-test', $1) RETURNING id", f"+st{tag}{i}"
+            )
+            for i in range(2)
+        ]
+        try:
+            yield tenant_ids
+        finally:
+            for tenant_id in tenant_ids:
+                await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1", tenant_id)
+                await pg_db.execute("DELETE FROM lead_daily_stats WHERE tenant_id = $1", tenant_id)
+                await pg_db.execute("DELETE FROM tenants WHERE id = $1", tenant_id)
+
+    @staticmethod
+    async def _counts(pg_db, tenant_id):
+        rows = await pg_db.fetch(
+            "SELECT status, SUM(lead_count)::int AS n FROM lead_daily_stats WHERE tenant_id = $1 GROUP BY status",
+            tenant_id,
+        )
+        return {r["status"]: r["n"] for r in rows if r["n"]}
+
+    @staticmethod
+    async def _insert_leads(pg_db, tenant_id, n, status="new"):
+        return [r["id"] for r in await pg_db.fetch("""
+            INSERT INTO leads (tenant_id, phone_number, first_name, status, source)
+            SELECT $1, '549' || $2 || g, 'Lead', $3, 'import' FROM generate_series(1, $4::int) g
+            RETURNING id
+        """, tenant_id, str(uuid.uuid4().int % 10**6), status, n)]
+
+    async def test_insert_update_delete_deltas(self, pg_db, tenant):
+        tenant_id, _ = tenant
+        ids = await self._insert_leads(pg_db, tenant_id, 4)
+        assert await self._counts(pg_db, tenant_id) == {"new": 4}
+
+        await pg_db.execute("UPDATE leads SET status = 'closed_won' WHERE id = ANY($1::uuid[])", ids[:2])
+        assert await self._counts(pg_db, tenant_id) == {"new": 2, "closed_won": 2}
+
+        seller = await pg_db.fetchval("""
+            INSERT INTO users (email, password_hash, role, status, tenant_id)
+            VALUES ('st-' || $1 || '@example.com', 'x', 'closer', 'active', $2) RETURNING id
+        """, uuid.uuid4().hex[:8], tenant_id)
+        await pg_db.execute("UPDATE leads SET assigned_seller_id = $2 WHERE id = $1", ids[2], seller)
+        assert await pg_db.fetchval(
+            "SELECT SUM(lead_count) FROM lead_daily_stats WHERE tenant_id = $1 AND seller_id = $2", tenant_id, seller
+        ) == 1
+        assert await self._counts(pg_db, tenant_id) == {"new": 2, "closed_won": 2}
+
+        await pg_db.execute("DELETE FROM leads WHERE id = ANY($1::uuid[])", ids[1:3])
+        assert await self._counts(pg_db, tenant_id) == {"new": 1, "closed_won": 1}
+        assert await LeadStatsService().reconcile_tenant(tenant_id) == 0
+
+    async def test_reconcile_fixes_drift(self, pg_db, tenant):
+        tenant_id, _ = tenant
+        await self._insert_leads(pg_db, tenant_id, 3)
+        await pg_db.execute("UPDATE lead_daily_stats SET lead_count = 99 WHERE tenant_id = $1", tenant_id)
+        await pg_db.execute("""
+            INSERT INTO lead_daily_stats (tenant_id, seller_id, day, status, source, lead_count)
+            VALUES ($1, $2, CURRENT_DATE - 400, 'ghost', '', 5)
+        """, tenant_id, NO_SELLER_ID)
+
+        assert await LeadStatsService().reconcile_tenant(tenant_id) == 2
+        assert await self._counts(pg_db, tenant_id) == {"new": 3}
+        assert await LeadStatsService().reconcile_tenant(tenant_id) == 0
+
+    async def test_reconcile_lock_does_not_block_other_tenants(self, pg_db, tenant):
+        locked, other = tenant
+        async with pg_db.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(RECONCILE_LOCK_SQL, locked)
+                await asyncio.wait_for(self._insert_leads(pg_db, other, 1), timeout=5)
+                blocked = asyncio.ensure_future(self._insert_leads(pg_db, locked, 1))
+                await asyncio.sleep(0.3)
+                assert not blocked.done()
+        await asyncio.wait_for(blocked, timeout=5)
+        assert await self._counts(pg_db, locked) == {"new": 1}
+
+    async def test_dashboard_summary(self, pg_db, tenant):
+        tenant_id, _ = tenant
+        ids = await self._insert_leads(pg_db, tenant_id, 5)
+        await pg_db.execute("UPDATE leads SET status = 'closed_won' WHERE id = ANY($1::uuid[])", ids[:2])
+        await pg_db.execute("UPDATE leads SET status = 'closed_lost' WHERE id = $1", ids[2])
+        await pg_db.execute("UPDATE leads SET status = 'deleted' WHERE id = $1", ids[3])
+
+        summary = await LeadStatsService().get_dashboard_summary(tenant_id, days=30)
+        assert summary["total_leads"] == 4
+        assert summary["period_leads"] == 4
+        assert summary["active_leads"] == 1
+        assert summary["converted_leads"] == 2
+        trend = _json(summary["revenue_leads_trend"])
+        assert len(trend) == 6
+        assert trend[-1]["leads"] == 4 and trend[-1]["revenue"] == 2 * REVENUE_PER_WON_LEAD
+        assert len(_json(summary["recent_leads"])) == 4
+
+        scoped = await LeadStatsService().get_dashboard_summary(tenant_id, days=30, seller_id=uuid.uuid4())
+        assert scoped["total_leads"] == 0 and scoped["total_clients"] == 0
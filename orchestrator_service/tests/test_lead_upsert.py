@@ -0,0 +1,110 @@
+"""
+Tests for Database.ensure_lead_exists (single-statement upsert).
+"""
+
+import asyncio
+import uuid
+
+import pytest
+
+from db import Database
+
+
+class FakeConnection:
+    """Records every statement sent to the server."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def fetchrow(self, query, *args):
+        self.calls.append(("fetchrow", query, args))
+        return {
+            "id": uuid.uuid4(), "tenant_id": args[0], "phone_number": args[1],
+            "first_name": args[2], "last_name": args[3], "status": "new",
+            "source": args[4], "lead_source": args[5], "inserted": True,
+        }
+
+    async def fetch(self, query, *args):
+        self.calls.append(("fetch", query, args))
+        return []
+
+    async def execute(self, query, *args):
+        self.calls.append(("execute", query, args))
+        return "OK"
+
+
+class TestEnsureLeadExistsUpsert:
+    """Round trips and parameter mapping (no database required)."""
+
+    @pytest.fixture(autouse=True)
+    def database(self, fake_pool):
+        self.database = Database()
+        fake_pool(FakeConnection(), self.database)
+
+    async def test_single_round_trip(self):
+        lead = await self.database.ensure_lead_exists(1, "+5491100000000", customer_name="Ana Pérez")
+
+        calls = self.database.pool.conn.calls
+        assert len(calls) == 1
+        assert calls[0][1] == Database.ENSURE_LEAD_SQL
+        assert lead["first_name"] == "Ana"
+        assert lead["last_name"] == "Pérez"
+        assert lead["lead_source"] == "ORGANIC"
+
+    async def test_statement_text_is_constant(self):
+        await self.database.ensure_lead_exists(1, "+1", customer_name=None)
+        await self.database.ensure_lead_exists(1, "+2", referral={"ad_id": "ad_1", "campaign_id": "c_1"})
+
+        queries = {call[1] for call in self.database.pool.conn.calls}
+        assert queries == {Database.ENSURE_LEAD_SQL}
+
+    async def test_referral_attribution_params(self):
+        await self.database.ensure_lead_exists(1, "+1", referral={"ad_id": "ad_1", "campaign_id": "c_1"})
+        await self.database.ensure_lead_exists(1, "+1", referral={"headline": "no ad"})
+
+        with_ad, without_ad = [call[2] for call in self.database.pool.conn.calls]
+        assert with_ad[5:] == ("META_ADS", "ad_1", "c_1")
+        assert without_ad[5:] == ("ORGANIC", None, None)
+
+
+@pytest.mark.postgres
+class TestEnsureLeadExistsConcurrency:
+    """Parallel first messages for the same phone against a real PostgreSQL."""
+
+    async def test_parallel_first_messages_create_one_lead(self, pg_db):
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        phone = f"+99{uuid.uuid4().int % 10**10:010d}"
+
+        try:
+            results = await asyncio.gather(*[
+                pg_db.ensure_lead_exists(tenant_id, phone, customer_name=None if i % 2 else f"Lead{i} Test")
+                for i in range(20)
+            ])
+
+            assert len({r["id"] for r in results}) == 1
+            assert sum(1 for r in results if r["inserted"]) == 1
+            count = await pg_db.fetchval(
+                "SELECT COUNT(*) FROM leads WHERE tenant_id = $1 AND phone_number = $2", tenant_id, phone
+            )
+            assert count == 1
+            # A real display name always wins over the "Lead" placeholder
+            first_name = await pg_db.fetchval(
+                "SELECT first_name FROM leads WHERE tenant_id = $1 AND phone_number = $2", tenant_id, phone
+            )
+            assert first_name != "Lead"
+        finally:
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND phone_number = $2", tenant_id, phone)
+
+    async def test_attribution_is_preserved_without_referral(self, pg_db):
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        phone = f"+98{uuid.uuid4().int % 10**10:010d}"
+
+        try:
+            await pg_db.ensure_lead_exists(tenant_id, phone, referral={"ad_id": "ad_9", "campaign_id": "c_9"})
+            lead = await pg_db.ensure_lead_exists(tenant_id, phone, customer_name="Juan")
+
+            assert lead["inserted"] is False
+            assert lead["lead_source"] == "META_ADS"
+            assert lead["first_name"] == "Juan"
+        finally:
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND phone_number = $2", tenant_id, phone)
@@ -0,0 +1,358 @@
+"""
+Tests + throughput benchmark for the bulk outreach dispatcher against a stub whatsapp_service /send.
+
+Sender/token-bucket tests need no database (the bucket runs on a fake clock); the dispatcher job tests
+need TEST_POSTGRES_DSN and the throughput benchmark runs only with RUN_BENCHMARKS=1.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from services.outreach.outreach_dispatcher import OutreachSender, TokenBucket
+
+SEND_DELAY_SECONDS = 0.02
+BENCH_RECIPIENTS = 200
+
+
+def make_recipients(count: int):
+    return [{"lead_id": uuid.uuid4(), "phone": f"549351{i:07d}", "params": ["Clínica", "Córdoba"]} for i in range(count)]
+
+
+class SendStub:
+    """Minimal whatsapp_service: POST /send with a fixed latency and scripted failures per phone."""
+
+    def __init__(self, delay: float = SEND_DELAY_SECONDS, failures=None):
+        self.delay = delay
+        self.failures = dict(failures or {})  # phone -> list of status codes to answer before 200
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.server = None
+        self.port = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            body = json.loads(await reader.readexactly(length)) if length else {}
+            target = urlsplit(request_line.split(" ")[1])
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(self.delay)
+            self.in_flight -= 1
+            self.requests.append((time.perf_counter(), parse_qs(target.query).get("from_number", [""])[0], body))
+            scripted = self.failures.get(body.get("to"))
+            status = scripted.pop(0) if scripted else 200
+            payload = b'{"status": "ok"}'
+            writer.write(
+                f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+
+def _sender(stub, **kwargs):
+    kwargs.setdefault("rate_per_second", 10_000)
+    kwargs.setdefault("burst", 10_000)
+    return OutreachSender(base_url=stub.base_url, buckets={}, **kwargs)
+
+
+class FakeClock:
+    """Monotonic clock that only moves when the bucket sleeps (use power-of-two rates: exact float steps)."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+def _bucket(rate, capacity):
+    clock = FakeClock()
+    return TokenBucket(rate=rate, capacity=capacity, clock=clock, sleep=clock.sleep), clock
+
+
+class TestTokenBucket:
+    async def test_paces_to_rate(self):
+        bucket, clock = _bucket(rate=32, capacity=1)
+        for _ in range(21):
+            await bucket.acquire()
+        # First token is immediate, then 20 more at 32/s
+        assert clock.now == 20 / 32
+        assert len(clock.sleeps) == 20
+
+    async def test_burst_is_immediate(self):
+        bucket, clock = _bucket(rate=1, capacity=10)
+        for _ in range(10):
+            await bucket.acquire()
+        assert clock.sleeps == []
+        await bucket.acquire()
+        assert clock.now == 1.0
+
+
+class TestOutreachSender:
+    async def test_payload_and_retries(self):
+        recipients = make_recipients(3)
+        failures = {"+5493510000000": [500], "+5493510000001": [400]}
+        async with SendStub(delay=0, failures=failures) as stub:
+            async with _sender(stub, max_attempts=2) as sender:
+                sender_results = await sender.send_many("5491100000000", recipients, "promo", "es_AR")
+
+        assert [status for status, _, _ in sender_results] == ["sent", "failed", "sent"]
+        assert sender_results[0][2] == 2  # 500 -> retried
+        assert sender_results[1][2] == 1  # 400 -> not retried
+        _, from_number, body = stub.requests[-1]
+        assert from_number == "5491100000000"
+        assert body["template_name"] == "promo"
+        assert body["components"][0]["parameters"][1] == {"type": "text", "text": "Córdoba"}
+
+    async def test_rate_limit_per_sender_number(self):
+        buckets = {number: _bucket(rate=64, capacity=1) for number in ("111", "222")}
+        async with SendStub(delay=0) as stub:
+            sender = OutreachSender(
+                base_url=stub.base_url, concurrency=16, buckets={n: b for n, (b, _) in buckets.items()}
+            )
+            async with sender:
+                await asyncio.gather(
+                    sender.send_many("111", make_recipients(20), "promo", "es_AR"),
+                    sender.send_many("222", make_recipients(20), "promo", "es_AR"),
+                )
+
+        # Each number is paced by its own bucket: 19 waits at 64/s, independent of the other number
+        for number, (_, clock) in buckets.items():
+            assert clock.now == 19 / 64
+            assert sum(1 for _, n, _ in stub.requests if n == number) == 20
+
+    async def test_concurrency_is_bounded(self):
+        async with SendStub() as stub:
+            async with _sender(stub, concurrency=4) as sender:
+                await sender.send_many("111", make_recipients(20), "promo", "es_AR")
+        assert stub.max_in_flight <= 4
+
+    @pytest.mark.benchmark
+    async def test_benchmark_throughput(self):
+        recipients = make_recipients(BENCH_RECIPIENTS)
+        async with SendStub() as stub:
+            async with _sender(stub, concurrency=1) as sender:
+                start = time.perf_counter()
+                sequential = await sender.send_many("111", recipients, "promo", "es_AR")
+                sequential_elapsed = time.perf_counter() - start
+
+            async with _sender(stub, concurrency=16) as sender:
+                start = time.perf_counter()
+                parallel = await sender.send_many("111", recipients, "promo", "es_AR")
+                parallel_elapsed = time.perf_counter() - start
+
+        assert all(status == "sent" for status, _, _ in sequential + parallel)
+        assert parallel_elapsed < sequential_elapsed / 4
+
+
+class TerminalJobConn:
+    """Fake connection: the job row is already terminal, so the guarded UPDATE matches nothing."""
+
+    def __init__(self):
+        self.queries = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetchval(self, query, *args):
+        return 0
+
+    async def fetchrow(self, query, *args):
+        self.queries.append((query, args))
+        return None
+
+    async def execute(self, query, *args):
+        self.queries.append((query, args))
+
+
+class TestTerminalGuards:
+    async def test_start_of_terminal_job_raises_cancelled(self, fake_pool):
+        from services.outreach.outreach_dispatcher import TERMINAL_STATUSES, JobCancelled, OutreachDispatcher
+        conn = TerminalJobConn()
+        fake_pool(conn)
+        with pytest.raises(JobCancelled):
+            await OutreachDispatcher()._start(uuid.uuid4())
+        query, args = conn.queries[0]
+        assert "status <> ALL($3::text[])" in query
+        assert args[-1] == list(TERMINAL_STATUSES)
+
+    async def test_late_finish_does_not_overwrite_terminal_job(self, fake_pool, monkeypatch):
+        from services.outreach.outreach_dispatcher import TERMINAL_STATUSES, OutreachDispatcher
+        conn = TerminalJobConn()
+        fake_pool(conn)
+        dispatcher = OutreachDispatcher()
+        emitted = []
+
+        async def emit(job):
+            emitted.append(job)
+
+        monkeypatch.setattr(dispatcher, "_emit", emit)
+        await dispatcher._finish(uuid.uuid4(), "completed")
+        query, args = conn.queries[0]
+        assert "status <> ALL($4::text[])" in query
+        assert args[-1] == list(TERMINAL_STATUSES)
+        assert len(conn.queries) == 1  # sin UPDATE de campaña
+        assert emitted == []
+
+
+@pytest.mark.postgres
+class TestOutreachDispatcher:
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch, pg_db):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+
+    async def _setup(self, pg_db, count: int):
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        await pg_db.execute(
+            "UPDATE tenants SET bot_phone_number = COALESCE(bot_phone_number, '5491100000000') WHERE id = $1", tenant_id
+        )
+        niche = f"outreach-{uuid.uuid4().hex[:8]}"
+        lead_ids = [
+            await pg_db.fetchval("""
+                INSERT INTO leads (tenant_id, phone_number, first_name, source, prospecting_niche)
+                VALUES ($1, $2, $3, 'apify_scrape', $4) RETURNING id
+            """, tenant_id, f"549351{uuid.uuid4().int % 10**7:07d}", f"Lead {i}", niche)
+            for i in range(count)
+        ]
+        return tenant_id, niche, lead_ids
+
+    async def _cleanup(self, pg_db, tenant_id, niche, job_ids):
+        await pg_db.execute("DELETE FROM outreach_jobs WHERE id = ANY($1::uuid[])", job_ids)
+        await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND prospecting_niche = $2", tenant_id, niche)
+
+    async def test_job_sends_in_batches_and_marks_leads(self, pg_db):
+        from services.outreach.outreach_dispatcher import OutreachDispatcher, prospecting_recipient_filter
+        tenant_id, niche, lead_ids = await self._setup(pg_db, 7)
+        async with SendStub(delay=0) as stub:
+            dispatcher = OutreachDispatcher(batch_size=3, sender_factory=lambda: _sender(stub))
+            job = await dispatcher.create_job(
+                tenant_id, "promo", "es_AR", recipient_filter=prospecting_recipient_filter(lead_ids, True, 3)
+            )
+            await dispatcher.wait(job["id"])
+        try:
+            done = await dispatcher.get_job(job["id"], tenant_id)
+            assert (done["status"], done["total"], done["sent"], done["failed"]) == ("completed", 7, 7, 0)
+            assert len(stub.requests) == 7
+            sent = await pg_db.fetchval(
+                "SELECT COUNT(*) FROM leads WHERE id = ANY($1::uuid[]) AND outreach_message_sent", lead_ids
+            )
+            assert sent == 7
+        finally:
+            await self._cleanup(pg_db, tenant_id, niche, [job["id"]])
+
+    async def test_cancel_while_queued_is_not_revived(self, pg_db, monkeypatch):
+        from services.outreach.outreach_dispatcher import OutreachDispatcher, prospecting_recipient_filter
+        tenant_id, niche, lead_ids = await self._setup(pg_db, 3)
+        async with SendStub(delay=0) as stub:
+            dispatcher = OutreachDispatcher(sender_factory=lambda: _sender(stub))
+            start = dispatcher._start
+
+            async def cancel_then_start(job_id):
+                # El worker ya leyó el job en cola cuando llega la cancelación
+                cancelled = await dispatcher.cancel_job(job_id, tenant_id)
+                assert cancelled["status"] == "cancelled"
+                return await start(job_id)
+
+            monkeypatch.setattr(dispatcher, "_start", cancel_then_start)
+            job = await dispatcher.create_job(
+                tenant_id, "promo", "es_AR", recipient_filter=prospecting_recipient_filter(lead_ids, True, 3)
+            )
+            await dispatcher.wait(job["id"])
+        try:
+            done = await dispatcher.get_job(job["id"], tenant_id)
+            assert done["status"] == "cancelled" and done["started_at"] is None
+            assert stub.requests == []
+        finally:
+            await self._cleanup(pg_db, tenant_id, niche, [job["id"]])
+
+    async def test_imported_leads_are_recipients(self, pg_db):
+        import io
+        from services.lead_import_service import LeadImportService
+        from services.outreach.outreach_dispatcher import OutreachDispatcher, prospecting_recipient_filter
+        tenant_id, niche, _ = await self._setup(pg_db, 0)
+        base = uuid.uuid4().int % 10**6 * 10
+        data = f"phone_number,first_name\n+54 9 2000 0{base:07d},Importado\n".encode()
+        result = await LeadImportService().import_stream(tenant_id, io.BytesIO(data), "csv")
+        assert result["inserted"] == 1
+        lead_id, stored = await pg_db.fetchrow(
+            "SELECT id, phone_number FROM leads WHERE tenant_id = $1 AND first_name = 'Importado' AND phone_number = $2",
+            tenant_id, f"+54920000{base:07d}"
+        )
+        await pg_db.execute("UPDATE leads SET prospecting_niche = $2 WHERE id = $1", lead_id, niche)
+        async with SendStub(delay=0) as stub:
+            dispatcher = OutreachDispatcher(sender_factory=lambda: _sender(stub))
+            job = await dispatcher.create_job(
+                tenant_id, "promo", "es_AR", recipient_filter=prospecting_recipient_filter([lead_id], False, 3)
+            )
+            await dispatcher.wait(job["id"])
+        try:
+            assert stored.startswith("+")
+            assert job["total"] == 1
+            assert await pg_db.fetchval("SELECT phone FROM outreach_recipients WHERE job_id = $1", job["id"]) == stored[1:]
+            assert len(stub.requests) == 1
+        finally:
+            await self._cleanup(pg_db, tenant_id, niche, [job["id"]])
+
+    async def test_resume_skips_sent_and_fails_unconfirmed(self, pg_db):
+        from services.outreach.outreach_dispatcher import OutreachDispatcher
+        tenant_id, niche, lead_ids = await self._setup(pg_db, 5)
+        # A job left "running" by a dead worker: 2 sent, 1 in flight, 2 pending
+        job_id = await pg_db.fetchval("""
+            INSERT INTO outreach_jobs (tenant_id, template_name, language, from_number, status, total, sent, heartbeat_at)
+            VALUES ($1, 'promo', 'es_AR', '5491100000000', 'running', 5, 2, NOW() - INTERVAL '1 hour')
+            RETURNING id
+        """, tenant_id)
+        for i, (lead_id, status) in enumerate(zip(lead_ids, ["sent", "sent", "sending", "pending", "pending"])):
+            await pg_db.execute("""
+                INSERT INTO outreach_recipients (job_id, lead_id, phone, status) VALUES ($1, $2, $3, $4)
+            """, job_id, lead_id, f"54935100000{i:02d}", status)
+
+        async with SendStub(delay=0) as stub:
+            dispatcher = OutreachDispatcher(sender_factory=lambda: _sender(stub))
+            assert await dispatcher.resume_pending() >= 1
+            await dispatcher.wait(job_id)
+        try:
+            job = await dispatcher.get_job(job_id, tenant_id)
+            assert (job["status"], job["sent"], job["failed"]) == ("completed", 4, 1)
+            assert len(stub.requests) == 2
+        finally:
+            await self._cleanup(pg_db, tenant_id, niche, [job_id])
@@ -0,0 +1,36 @@
+"""
+Phone lookup key: core.utils.phone_lookup_key and the phone_e164 generated column.
+
+The generated-column test needs TEST_POSTGRES_DSN.
+"""
+
+import uuid
+
+import pytest
+
+from core.utils import phone_lookup_key
+
+
+class TestPhoneLookupKey:
+    def test_variants_share_one_key(self):
+        variants = ["+54 9 351 444-1234", "5493514441234", "(549) 351-444-1234", "+5493514441234"]
+        assert {phone_lookup_key(v) for v in variants} == {"5493514441234"}
+        assert phone_lookup_key("") is None and phone_lookup_key(None) is None and phone_lookup_key("n/a") is None
+
+
+@pytest.mark.postgres
+class TestPhoneE164Column:
+    async def test_generated_column_matches_python_normalizer(self, pg_db):
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        phone = f"+97 {uuid.uuid4().int % 10**10:010d}"
+        try:
+            await pg_db.ensure_lead_exists(tenant_id, phone)
+            stored = await pg_db.fetchval(
+                "SELECT phone_e164 FROM leads WHERE tenant_id = $1 AND phone_e164 = $2",
+                tenant_id, phone_lookup_key(phone)
+            )
+            assert stored == phone_lookup_key(phone)
+            for raw in ["+54 9 351 444-1234", "00 1 (555) 010", "sin número", ""]:
+                assert await pg_db.fetchval("SELECT phone_lookup_key($1)", raw) == phone_lookup_key(raw)
+        finally:
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND phone_number = $2", tenant_id, phone)
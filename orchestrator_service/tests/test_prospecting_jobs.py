@@ -0,0 +1,322 @@
+"""
+Prospecting jobs against a local Apify stub.
+
+The ApifyClient tests need no database; the job runner tests need TEST_POSTGRES_DSN.
+"""
+
+import asyncio
+import json
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import services.prospecting.apify_client as apify_client_module
+from services.prospecting.apify_client import ApifyClient
+
+
+def make_items(count: int, with_phone: bool = True, scraped_at: str = "2024-05-01T10:00:00Z"):
+    return [
+        {
+            "title": f"Clínica {i}",
+            "phoneUnformatted": f"+54 9 351 5{i:03d}-{i:04d}" if with_phone else None,
+            "city": "Córdoba",
+            "placeId": f"place-{i}",
+            "totalScore": 4.5,
+            "reviewsCount": i,
+            "scrapedAt": scraped_at,
+        }
+        for i in range(count)
+    ]
+
+
+class ApifyStub:
+    """Minimal Apify API: start run, run status, abort, dataset items (offset/limit)."""
+
+    def __init__(self, items, polls_until_done: int = 2, start_delay: float = 0.0):
+        self.items = items
+        self.start_delay = start_delay
+        self.start_requested = asyncio.Event()
+        self.page_requests = 0
+        self.polls_until_done = polls_until_done
+        self.polls = 0
+        self.aborted = False
+        self.started = 0
+        self.server = None
+        self.port = None
+
+    def _run(self):
+        if self.aborted:
+            status = "ABORTED"
+        elif self.polls_until_done is not None and self.polls >= self.polls_until_done:
+            status = "SUCCEEDED"
+        else:
+            status = "RUNNING"
+        return {"data": {"id": "run-1", "status": status, "defaultDatasetId": "ds-1"}}
+
+    def _route(self, method: str, path: str, query: dict):
+        if method == "POST" and path.endswith("/runs"):
+            self.started += 1
+            return self._run()
+        if method == "GET" and path == "/actor-runs/run-1":
+            self.polls += 1
+            return self._run()
+        if method == "POST" and path == "/actor-runs/run-1/abort":
+            self.aborted = True
+            return self._run()
+        if method == "GET" and path == "/datasets/ds-1/items":
+            self.page_requests += 1
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", [str(len(self.items))])[0])
+            return self.items[offset:offset + limit]
+        return None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            if length:
+                await reader.readexactly(length)
+            method, target, _ = request_line.split(" ", 2)
+            parts = urlsplit(target)
+            if method == "POST" and parts.path.endswith("/runs"):
+                self.start_requested.set()
+                await asyncio.sleep(self.start_delay)
+            body = self._route(method, parts.path, parse_qs(parts.query))
+            status = "200 OK" if body is not None else "404 Not Found"
+            payload = json.dumps(body if body is not None else {"error": "not found"}).encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+
+class TestApifyClient:
+    async def test_run_lifecycle(self):
+        async with ApifyStub(make_items(3), polls_until_done=1) as stub:
+            async with ApifyClient("token", base_url=stub.base_url) as client:
+                run = await client.start_run({"searchStringsArray": ["dentista"]})
+                assert run["status"] == "RUNNING"
+                assert (await client.get_run(run["id"]))["status"] == "SUCCEEDED"
+                pages = [page async for page in client.iter_dataset_items(run["defaultDatasetId"])]
+        assert sum(len(page) for page in pages) == 3
+
+    async def test_iter_dataset_items_pages(self):
+        async with ApifyStub(make_items(7)) as stub:
+            async with ApifyClient("token", base_url=stub.base_url) as client:
+                pages = [page async for page in client.iter_dataset_items("ds-1", page_size=3)]
+                resumed = [page async for page in client.iter_dataset_items("ds-1", offset=5, page_size=3)]
+        assert [len(p) for p in pages] == [3, 3, 1]
+        assert [item["placeId"] for item in pages[2]] == ["place-6"]
+        assert [len(p) for p in resumed] == [2]
+
+    async def test_abort(self):
+        async with ApifyStub([], polls_until_done=None) as stub:
+            async with ApifyClient("token", base_url=stub.base_url) as client:
+                await client.start_run({})
+                await client.abort_run("run-1")
+                assert (await client.get_run("run-1"))["status"] == "ABORTED"
+
+
+class TerminalJobPool:
+    """Fake pool: every guarded UPDATE finds the job already terminal (no row)."""
+
+    def __init__(self):
+        self.queries = []
+
+    async def fetchrow(self, query, *args):
+        self.queries.append((query, args))
+        return None
+
+
+class TestJobStatusGuard:
+    @pytest.fixture
+    def pool(self, monkeypatch):
+        import db as db_module
+        fake = TerminalJobPool()
+        monkeypatch.setattr(db_module.db, "pool", fake)
+        return fake
+
+    async def test_update_of_terminal_job_raises_cancelled(self, pool):
+        from services.prospecting.job_runner import TERMINAL_STATUSES, JobCancelled, ProspectingJobRunner
+        with pytest.raises(JobCancelled):
+            await ProspectingJobRunner()._update(uuid.uuid4(), status="running")
+        query, args = pool.queries[0]
+        assert "status <> ALL($3::text[])" in query
+        assert args[-1] == list(TERMINAL_STATUSES)
+
+    async def test_finish_never_overwrites_terminal_status(self, pool):
+        from services.prospecting.job_runner import ProspectingJobRunner
+        await ProspectingJobRunner()._finish(uuid.uuid4(), "failed", error="boom")
+        assert "status <> ALL($4::text[])" in pool.queries[0][0]
+
+    async def test_run_of_missing_job_is_a_noop(self, pool):
+        from services.prospecting.job_runner import ProspectingJobRunner
+        await ProspectingJobRunner()._run(uuid.uuid4())
+        assert len(pool.queries) == 1
+
+
+@pytest.mark.postgres
+class TestProspectingJobRunner:
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch, pg_db):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+        monkeypatch.setenv("APIFY_API_TOKEN", "test-token")
+        # No website crawling for these items
+        monkeypatch.setattr("services.prospecting.ingestion.crawl_missing_phones", _no_crawl)
+
+    async def _tenant(self, pg_db):
+        return await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+
+    async def test_job_completes_with_progress(self, monkeypatch, pg_db):
+        from services.prospecting.job_runner import ProspectingJobRunner
+        tenant_id = await self._tenant(pg_db)
+        niche = f"test-{uuid.uuid4().hex[:8]}"
+
+        async with ApifyStub(make_items(5), polls_until_done=2) as stub:
+            monkeypatch.setattr(apify_client_module, "APIFY_API_BASE", stub.base_url)
+            monkeypatch.setattr(apify_client_module, "APIFY_DATASET_PAGE_SIZE", 2)
+            runner = ProspectingJobRunner(poll_seconds=0.01)
+            job = await runner.create_job(tenant_id, niche, "Córdoba, Argentina", 5, "54")
+            assert job["status"] == "queued"
+            await runner.wait(job["id"])
+
+        try:
+            done = await runner.get_job(job["id"], tenant_id)
+            assert done["status"] == "completed"
+            assert done["fetched"] == 5
+            assert done["imported"] + done["updated"] + done["skipped_already_exists"] == 5
+            assert stub.started == 1
+            assert stub.page_requests == 3
+        finally:
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND prospecting_niche = $2", tenant_id, niche)
+            await pg_db.execute("DELETE FROM prospecting_jobs WHERE id = $1", job["id"])
+
+    async def test_cancel_aborts_apify_run(self, monkeypatch, pg_db):
+        from services.prospecting.job_runner import ProspectingJobRunner
+        tenant_id = await self._tenant(pg_db)
+
+        async with ApifyStub(make_items(5), polls_until_done=None) as stub:
+            monkeypatch.setattr(apify_client_module, "APIFY_API_BASE", stub.base_url)
+            runner = ProspectingJobRunner(poll_seconds=0.01)
+            job = await runner.create_job(tenant_id, "cancel-test", "Córdoba", 5, "54")
+            while stub.polls < 2:
+                await asyncio.sleep(0.01)
+            await runner.cancel_job(job["id"], tenant_id)
+            await runner.wait(job["id"])
+
+        try:
+            assert stub.aborted
+            assert (await runner.get_job(job["id"], tenant_id))["status"] == "cancelled"
+        finally:
+            await pg_db.execute("DELETE FROM prospecting_jobs WHERE id = $1", job["id"])
+
+    async def test_cancel_while_queued_is_not_revived(self, monkeypatch, pg_db):
+        from services.prospecting.job_runner import ProspectingJobRunner
+        tenant_id = await self._tenant(pg_db)
+
+        async with ApifyStub(make_items(5), polls_until_done=None, start_delay=0.3) as stub:
+            monkeypatch.setattr(apify_client_module, "APIFY_API_BASE", stub.base_url)
+            runner = ProspectingJobRunner(poll_seconds=0.01)
+            job = await runner.create_job(tenant_id, "cancel-queued-test", "Córdoba", 5, "54")
+            # El worker está dentro de start_run con el job todavía en cola
+            await asyncio.wait_for(stub.start_requested.wait(), timeout=5)
+            cancelled = await runner.cancel_job(job["id"], tenant_id)
+            assert cancelled["status"] == "cancelled"
+            await runner.wait(job["id"])
+
+        try:
+            done = await runner.get_job(job["id"], tenant_id)
+            assert done["status"] == "cancelled"
+            assert done["apify_run_id"] is None
+            assert stub.aborted and stub.polls == 0
+        finally:
+            await pg_db.execute("DELETE FROM prospecting_jobs WHERE id = $1", job["id"])
+
+    async def test_resume_continues_existing_run(self, monkeypatch, pg_db):
+        from services.prospecting.job_runner import ProspectingJobRunner
+        tenant_id = await self._tenant(pg_db)
+        niche = f"resume-{uuid.uuid4().hex[:8]}"
+        # A job left "running" by a dead worker: the Apify run already exists
+        job_id = await pg_db.fetchval("""
+            INSERT INTO prospecting_jobs (tenant_id, niche, location, max_places, country_code, status,
+                                          apify_run_id, apify_dataset_id, apify_status, heartbeat_at)
+            VALUES ($1, $2, 'Córdoba', 5, '54', 'running', 'run-1', 'ds-1', 'RUNNING', NOW() - INTERVAL '1 hour')
+            RETURNING id
+        """, tenant_id, niche)
+
+        async with ApifyStub(make_items(4), polls_until_done=1) as stub:
+            monkeypatch.setattr(apify_client_module, "APIFY_API_BASE", stub.base_url)
+            runner = ProspectingJobRunner(poll_seconds=0.01)
+            assert await runner.resume_pending() >= 1
+            await runner.wait(job_id)
+
+        try:
+            assert stub.started == 0
+            job = await runner.get_job(job_id, tenant_id)
+            assert job["status"] == "completed"
+            assert job["fetched"] == 4
+        finally:
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND prospecting_niche = $2", tenant_id, niche)
+            await pg_db.execute("DELETE FROM prospecting_jobs WHERE id = $1", job_id)
+
+
+@pytest.mark.postgres
+class TestProspectIngestor:
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch, pg_db):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+        monkeypatch.setattr("services.prospecting.ingestion.crawl_missing_phones", _no_crawl)
+
+    async def test_counts_come_from_database(self, pg_db):
+        from services.prospecting.ingestion import ProspectIngestor
+        tenant_id = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        niche = f"ingest-{uuid.uuid4().hex[:8]}"
+        items = make_items(4)
+        try:
+            async with ProspectIngestor(tenant_id, niche, "Córdoba", "54") as ingestor:
+                first = await ingestor.ingest_batch(items + make_items(1, with_phone=False) + items[:1])
+                # Mismo scrape: no se reescribe nada
+                same = await ingestor.ingest_batch(items)
+                # Scrape más nuevo: enriquecimiento
+                newer = await ingestor.ingest_batch(make_items(2, scraped_at="2024-06-01T10:00:00Z"))
+
+            assert first == {"imported": 4, "updated": 0, "skipped_no_phone": 1,
+                             "skipped_already_exists": 1, "fetched_from_web": 0}
+            assert (same["imported"], same["updated"], same["skipped_already_exists"]) == (0, 0, 4)
+            assert (newer["imported"], newer["updated"], newer["skipped_already_exists"]) == (0, 2, 0)
+            refreshed = await pg_db.fetchval("""
+                SELECT COUNT(*) FROM leads
+                WHERE tenant_id = $1 AND prospecting_niche = $2 AND apify_scraped_at >= '2024-06-01'
+            """, tenant_id, niche)
+            assert refreshed == 2
+        finally:
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND prospecting_niche = $2", tenant_id, niche)
+
+
+async def _no_crawl(items, default_cc):
+    return {}
@@ -0,0 +1,153 @@
+"""
+Plan regression tests for the hot queries (TEST_POSTGRES_DSN).
+
+Seeds a realistic spread of tenants / sellers / leads / messages, runs ANALYZE and
+fails if EXPLAIN shows a sequential scan on the table a hot query targets.
+"""
+
+import json
+import uuid
+
+import pytest
+
+SEED_TENANTS = 50
+SEED_SELLERS = 20
+SEED_MESSAGES = 60_000
+SEED_LEADS = 20_000
+SEED_AUTOMATION_LOGS = 20_000
+
+# (name, table that must not be seq-scanned, SQL, params builder)
+HOT_QUERIES = [
+    (
+        "chat_history", "chat_messages",
+        "SELECT role, content FROM chat_messages WHERE from_number = $1 AND tenant_id = $2 ORDER BY created_at DESC LIMIT 15",
+        lambda s: [s["phone"], s["chat_tenant"]],
+    ),
+    (
+        "seller_conversations", "chat_messages",
+        """SELECT COUNT(DISTINCT from_number) FROM chat_messages
+           WHERE assigned_seller_id = $1 AND tenant_id = $2 AND assigned_at >= NOW() - INTERVAL '24 hours'""",
+        lambda s: [s["seller"], s["chat_tenant"]],
+    ),
+    (
+        "seller_inbound", "chat_messages",
+        """SELECT COUNT(*) FROM chat_messages cm
+           WHERE cm.assigned_seller_id = $1 AND cm.tenant_id = $2 AND cm.role = 'user'
+             AND cm.created_at >= NOW() - INTERVAL '24 hours'""",
+        lambda s: [s["seller"], s["chat_tenant"]],
+    ),
+    (
+        "lead_conversation", "chat_messages",
+        "SELECT content, created_at FROM chat_messages WHERE lead_id = $1 ORDER BY created_at DESC LIMIT 1",
+        lambda s: [s["lead_id"]],
+    ),
+    (
+        "leads_by_status", "leads",
+        "SELECT id FROM leads WHERE tenant_id = $1 AND status = $2 ORDER BY created_at DESC LIMIT 50",
+        lambda s: [s["lead_tenant"], "contacted"],
+    ),
+    (
+        "lead_by_phone", "leads",
+        "SELECT id FROM leads WHERE tenant_id = $1 AND phone_e164 = $2",
+        lambda s: [s["lead_tenant"], s["lead_phone"].lstrip("+")],
+    ),
+    (
+        "automation_dedup", "automation_logs",
+        "SELECT COUNT(*) FROM automation_logs WHERE target_id = $1 AND trigger_type = $2 AND status = $3",
+        lambda s: [s["target_id"], "appointment_reminder", "failed"],
+    ),
+]
+
+
+def seq_scanned_relations(plan) -> set:
+    """Tablas leídas con Seq Scan en un plan EXPLAIN (FORMAT JSON)."""
+    found = set()
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            if node.get("Node Type") == "Seq Scan":
+                found.add(node.get("Relation Name"))
+            stack.extend(node.get("Plans", []))
+            if "Plan" in node:
+                stack.append(node["Plan"])
+    return found
+
+
+class TestPlanWalker:
+    def test_finds_nested_seq_scans(self):
+        plan = [{"Plan": {"Node Type": "Aggregate", "Plans": [
+            {"Node Type": "Nested Loop", "Plans": [
+                {"Node Type": "Seq Scan", "Relation Name": "leads"},
+                {"Node Type": "Index Scan", "Relation Name": "chat_messages"},
+            ]},
+        ]}}]
+        assert seq_scanned_relations(plan) == {"leads"}
+        assert seq_scanned_relations([{"Plan": {"Node Type": "Result"}}]) == set()
+
+
+@pytest.mark.postgres
+class TestHotQueryPlans:
+    @pytest.fixture
+    async def seeded(self, pg_db):
+        tag = f"plan-{uuid.uuid4().hex[:8]}"
+        lead_tenant = await pg_db.fetchval("SELECT id FROM tenants ORDER BY id LIMIT 1")
+        chat_tenant_base = 900_000 + uuid.uuid4().int % 1000 * 100
+        sellers = [r["id"] for r in await pg_db.fetch("""
+            INSERT INTO users (email, password_hash, role, status)
+            SELECT $1 || '-' || g || '@example.com', 'x', 'closer', 'active' FROM generate_series(1, $2) g
+            RETURNING id
+        """, tag, SEED_SELLERS)]
+        lead_ids = [r["id"] for r in await pg_db.fetch("""
+            INSERT INTO leads (tenant_id, phone_number, first_name, source, status, created_at)
+            SELECT $1, '+5497' || lpad(g::text, 9, '0'), 'Lead ' || g, $2,
+                   (ARRAY['new','contacted','interested','negotiation','closed_won','closed_lost'])[1 + g % 6],
+                   NOW() - (g || ' minutes')::interval
+            FROM generate_series(1, $3) g
+            RETURNING id
+        """, lead_tenant, tag, SEED_LEADS)]
+        await pg_db.execute("""
+            INSERT INTO chat_messages (from_number, role, content, tenant_id, assigned_seller_id, assigned_at, created_at, lead_id)
+            SELECT '+54911' || lpad((g % 5000)::text, 6, '0'),
+                   CASE WHEN g % 2 = 0 THEN 'user' ELSE 'assistant' END,
+                   'msg ' || g,
+                   $1 + g % $2,
+                   ($3::uuid[])[1 + g % array_length($3::uuid[], 1)],
+                   NOW() - ((g % 720) || ' hours')::interval,
+                   NOW() - ((g % 720) || ' hours')::interval,
+                   ($4::uuid[])[1 + g % array_length($4::uuid[], 1)]
+            FROM generate_series(1, $5) g
+        """, chat_tenant_base, SEED_TENANTS, sellers, lead_ids, SEED_MESSAGES)
+        await pg_db.execute("""
+            INSERT INTO automation_logs (tenant_id, trigger_type, status, target_id)
+            SELECT $1, (ARRAY['appointment_reminder','appointment_feedback','lead_recovery'])[1 + g % 3],
+                   CASE WHEN g % 4 = 0 THEN 'failed' ELSE 'sent' END, $2 || '-' || g
+            FROM generate_series(1, $3) g
+        """, lead_tenant, tag, SEED_AUTOMATION_LOGS)
+        for table in ("chat_messages", "leads", "automation_logs"):
+            await pg_db.execute(f"ANALYZE {table}")
+
+        lead_phone = await pg_db.fetchval("SELECT phone_number FROM leads WHERE id = $1", lead_ids[len(lead_ids) // 2])
+        try:
+            yield {
+                "phone": "+54911000042", "chat_tenant": chat_tenant_base + 42,
+                "seller": sellers[3], "lead_id": lead_ids[7], "lead_tenant": lead_tenant,
+                "lead_phone": lead_phone, "target_id": f"{tag}-4",
+            }
+        finally:
+            await pg_db.execute("DELETE FROM automation_logs WHERE target_id LIKE $1 || '-%'", tag)
+            await pg_db.execute(
+                "DELETE FROM chat_messages WHERE tenant_id >= $1 AND tenant_id < $2",
+                chat_tenant_base, chat_tenant_base + SEED_TENANTS
+            )
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1 AND source = $2", lead_tenant, tag)
+            await pg_db.execute("DELETE FROM users WHERE email LIKE $1 || '-%'", tag)
+
+    @pytest.mark.parametrize("name,table,sql,params", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+    async def test_hot_query_uses_an_index(self, pg_db, seeded, name, table, sql, params):
+        plan = await pg_db.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *params(seeded))
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        assert table not in seq_scanned_relations(plan), f"{name}: sequential scan on {table}\n{json.dumps(plan, indent=2)}"
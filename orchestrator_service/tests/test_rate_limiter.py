@@ -0,0 +1,132 @@
+"""
+Distributed rate limiter (core.rate_limiter): parsing, local fallback, endpoint decorator
+and, with TEST_REDIS_URL, the shared Lua sliding window across replicas.
+"""
+
+import asyncio
+import os
+import uuid
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from core.rate_limiter import (
+    DistributedLimiter,
+    RateLimitExceeded,
+    _LocalWindow,
+    default_key,
+    parse_limit,
+    rate_limit_exceeded_handler,
+)
+
+requires_redis = pytest.mark.skipif(
+    not os.getenv("TEST_REDIS_URL"), reason="TEST_REDIS_URL not set (needs a disposable Redis)"
+)
+
+
+def _app(limiter: DistributedLimiter) -> FastAPI:
+    app = FastAPI()
+    app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
+
+    @app.get("/ping")
+    @limiter.limit("3/minute")
+    async def ping(request: Request):
+        return {"ok": True}
+
+    return app
+
+
+async def _get(app, n, path="/ping"):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return [await client.get(path) for _ in range(n)]
+
+
+class TestParseLimit:
+    def test_formats(self):
+        assert parse_limit("100/minute") == (100, 60)
+        assert parse_limit("3/hour") == (3, 3600)
+        assert parse_limit("10 per 5 minutes") == (10, 300)
+        assert parse_limit("2/day") == (2, 86400)
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            parse_limit("fast")
+
+
+class TestLocalWindow:
+    def test_slides(self, monkeypatch):
+        import core.rate_limiter as rl
+        now = [1000.0]
+        monkeypatch.setattr(rl.time, "monotonic", lambda: now[0])
+        window = _LocalWindow()
+        assert [window.hit("k", 2, 10)[0] for _ in range(3)] == [True, True, False]
+        allowed, count, retry_after = window.hit("k", 2, 10)
+        assert not allowed and count == 2 and retry_after == pytest.approx(10)
+        now[0] += 10.01
+        assert window.hit("k", 2, 10)[0]
+
+    def test_bounded_keys(self):
+        window = _LocalWindow(max_keys=3)
+        for i in range(10):
+            window.hit(f"k{i}", 1, 60)
+        assert list(window._hits) == ["k7", "k8", "k9"]
+
+
+class TestKeys:
+    def test_authenticated_requests_are_keyed_by_tenant_and_user(self):
+        state = SimpleNamespace(user=SimpleNamespace(user_id="abc"), identity={"tenant_id": 7})
+        request = SimpleNamespace(state=state, client=SimpleNamespace(host="1.2.3.4"))
+        assert default_key(request) == "t7:uabc"
+        request.state = SimpleNamespace()
+        assert default_key(request) == "ip:1.2.3.4"
+
+
+class TestDecorator:
+    async def test_local_limit_returns_429(self):
+        limiter = DistributedLimiter(redis_url=None)
+        responses = await _get(_app(limiter), 5)
+        assert [r.status_code for r in responses] == [200, 200, 200, 429, 429]
+        assert responses[-1].json() == {"error": "Rate limit exceeded: 3/minute"}
+        assert int(responses[-1].headers["Retry-After"]) >= 1
+        stats = limiter.stats()
+        assert (stats["allowed_local"], stats["denied_local"], stats["backend"]) == (3, 2, "local")
+
+    async def test_disabled(self):
+        limiter = DistributedLimiter(redis_url=None, enabled=False)
+        assert {r.status_code for r in await _get(_app(limiter), 5)} == {200}
+
+    async def test_redis_down_degrades_to_local(self):
+        limiter = DistributedLimiter(redis_url="redis://127.0.0.1:1/0")
+        responses = await _get(_app(limiter), 5)
+        assert [r.status_code for r in responses] == [200, 200, 200, 429, 429]
+        stats = limiter.stats()
+        # Tras el primer error no se vuelve a intentar Redis hasta RATE_LIMIT_REDIS_RETRY_SECONDS
+        assert stats["redis_errors"] == 1
+        assert stats["backend"] == "local"
+
+
+@requires_redis
+class TestRedisSlidingWindow:
+    async def test_limit_is_shared_across_replicas(self):
+        replicas = [DistributedLimiter(redis_url=os.getenv("TEST_REDIS_URL")) for _ in range(4)]
+        key = f"rl:test:{uuid.uuid4().hex}"
+        results = await asyncio.gather(*[
+            replicas[i % 4].hit(key, 10, 60) for i in range(40)
+        ])
+        assert sum(allowed for allowed, _, _ in results) == 10
+        denied = [retry for allowed, _, retry in results if not allowed]
+        assert all(0 < retry <= 60 for retry in denied)
+        assert sum(r.stats()["denied_redis"] for r in replicas) == 30
+        assert sum(r.stats()["redis_errors"] for r in replicas) == 0
+        await replicas[0].redis_client.delete(key)
+
+    async def test_window_slides(self):
+        limiter = DistributedLimiter(redis_url=os.getenv("TEST_REDIS_URL"))
+        key = f"rl:test:{uuid.uuid4().hex}"
+        assert (await limiter.hit(key, 1, 1))[0]
+        assert not (await limiter.hit(key, 1, 1))[0]
+        await asyncio.sleep(1.05)
+        assert (await limiter.hit(key, 1, 1))[0]
@@ -0,0 +1,341 @@
+"""
+Seller assignment: compiled per-tenant assignment plan, round-robin rotation pointer and
+bulk reassignment.
+
+The fake-pool tests need no database; the concurrency and bulk tests need TEST_POSTGRES_DSN.
+"""
+
+import asyncio
+import uuid
+from collections import Counter
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+pytest.importorskip("pydantic_settings", reason="services.seller_notification_service needs config.Settings")
+
+from services.seller_assignment_service import (  # noqa: E402
+    SellerAssignmentService, invalidate_assignment_plan, spread_by_load,
+)
+
+
+class RotationConn:
+    """Fake connection: plan queries (users/rules/ranking) + per-rule rotation counters; counts round trips."""
+
+    def __init__(self, roster):
+        self.roster = roster
+        self.roles = {}
+        self.rules = []
+        self.ranking = []
+        self.positions = Counter()
+        self.queries = []
+
+    async def fetch(self, query, *args):
+        if "assignment_rules" in query:
+            self.queries.append("rules")
+            return self.rules
+        if "seller_metrics" in query:
+            self.queries.append("ranking")
+            return [{"seller_id": s} for s in self.ranking if s in args[1]]
+        self.queries.append("roster")
+        return [
+            {"id": s, "first_name": "V", "last_name": "", "role": self.roles.get(s, "closer"), "is_seller": True}
+            for s in self.roster
+        ]
+
+    async def fetchval(self, query, *args):
+        self.queries.append("rotate")
+        await asyncio.sleep(0)
+        self.positions[args[0], args[1]] += args[2]
+        return self.positions[args[0], args[1]]
+
+
+@pytest.fixture
+def conn(fake_pool):
+    fake = RotationConn([uuid.UUID(int=i) for i in range(1, 4)])
+    fake_pool(fake)
+    invalidate_assignment_plan()
+    yield fake
+    invalidate_assignment_plan()
+
+
+def _rule(rule_type, sources=None, roles=None, max_conversations=None):
+    return {
+        "id": uuid.uuid4(), "rule_name": rule_type, "rule_type": rule_type, "apply_to_lead_source": sources,
+        "apply_to_seller_roles": roles, "max_conversations_per_seller": max_conversations,
+    }
+
+
+async def _round_robin(service, tenant_id=1):
+    plan = await service.get_assignment_plan(tenant_id)
+    return await service._round_robin_assignment(tenant_id, plan.roster)
+
+
+class TestRoundRobin:
+    async def test_rotates_in_order_with_one_round_trip(self, conn):
+        service = SellerAssignmentService()
+        picks = [await _round_robin(service) for _ in range(7)]
+        assert picks == [conn.roster[i % 3] for i in range(7)]
+        # Plan compilado una vez; cada asignación es un único UPDATE ... RETURNING
+        assert conn.queries.count("roster") == 1
+        assert conn.queries.count("rotate") == 7
+
+    async def test_concurrent_picks_are_fair(self, conn):
+        service = SellerAssignmentService()
+        picks = await asyncio.gather(*[_round_robin(service) for _ in range(30)])
+        assert set(Counter(picks).values()) == {10}
+
+    async def test_empty_roster(self, conn):
+        conn.roster.clear()
+        assert await _round_robin(SellerAssignmentService()) is None
+        assert "rotate" not in conn.queries
+
+
+class TestAssignmentPlan:
+    async def test_compiled_once_per_tenant(self, conn):
+        conn.rules = [_rule("round_robin")]
+        service = SellerAssignmentService()
+        plans = await asyncio.gather(*[service.get_assignment_plan(1) for _ in range(10)])
+        assert all(p is plans[0] for p in plans)
+        assert conn.queries == ["roster", "rules"]
+
+    async def test_invalidation_recompiles(self, conn):
+        service = SellerAssignmentService()
+        assert (await service.get_assignment_plan(1)).rules == ()
+        conn.rules = [_rule("load_balance")]
+        conn.roster.append(uuid.UUID(int=4))
+        invalidate_assignment_plan(1)
+        plan = await service.get_assignment_plan(1)
+        assert [r.rule_type for r in plan.rules] == ["load_balance"]
+        assert len(plan.roster) == 4
+
+    async def test_rule_filters_are_precompiled(self, conn):
+        setter = conn.roster[0]
+        conn.roles = {setter: "setter"}
+        conn.rules = [_rule("round_robin", sources=["META_ADS"], roles=["setter"]), _rule("specialty")]
+        rr, specialty = (await SellerAssignmentService().get_assignment_plan(1)).rules
+        assert rr.matches("META_ADS") and rr.matches(None) and not rr.matches("WEBSITE")
+        assert [c["id"] for c in rr.candidates] == [setter]
+        assert specialty.matches("WEBSITE")
+
+    async def test_specialty_is_resolved_in_memory(self, conn):
+        conn.roles = {conn.roster[1]: "setter"}
+        conn.rules = [_rule("specialty")]
+        service = SellerAssignmentService()
+        plan = await service.get_assignment_plan(1)
+        before = len(conn.queries)
+        assert await service._apply_assignment_rule(plan.rules[0], plan, 1, "META_ADS") == conn.roster[1]
+        assert await service._apply_assignment_rule(plan.rules[0], plan, 1, "REFERRAL") == conn.roster[0]
+        assert len(conn.queries) == before
+
+    async def test_round_robin_rules_rotate_independently(self, conn):
+        setter = conn.roster[0]
+        conn.roles = {setter: "setter"}
+        conn.rules = [_rule("round_robin", sources=["META_ADS"], roles=["setter"]), _rule("round_robin")]
+        service = SellerAssignmentService()
+        plan = await service.get_assignment_plan(1)
+        setters_only, everyone = plan.rules
+        assert [await service._apply_assignment_rule(setters_only, plan, 1) for _ in range(2)] == [setter, setter]
+        # La regla de setters no movió el puntero de la otra regla
+        picks = [await service._apply_assignment_rule(everyone, plan, 1) for _ in range(3)]
+        assert picks == conn.roster
+
+    async def test_performance_top_is_restricted_to_rule_candidates(self, conn):
+        a, b, c = conn.roster
+        conn.roles = {a: "setter", b: "closer", c: "closer"}
+        conn.ranking = [a, c, b]
+        conn.rules = [_rule("performance", roles=["closer"]), _rule("performance")]
+        service = SellerAssignmentService()
+        plan = await service.get_assignment_plan(1)
+        closers, everyone = plan.rules
+        assert await service._apply_assignment_rule(closers, plan, 1) == c
+        assert await service._apply_assignment_rule(everyone, plan, 1) == a
+        assert conn.queries.count("ranking") == 1
+
+    async def test_performance_without_metrics(self, conn):
+        conn.rules = [_rule("performance")]
+        service = SellerAssignmentService()
+        plan = await service.get_assignment_plan(1)
+        assert await service._apply_assignment_rule(plan.rules[0], plan, 1) is None
+
+
+class TestBulkReassignPlanning:
+    def test_spread_by_load_fills_lightest_first(self):
+        a, b, c = (uuid.UUID(int=i) for i in range(1, 4))
+        targets = spread_by_load([a] * 6, [b, c], {b: 3, c: 0})
+        assert Counter(targets) == {b: 2, c: 4}
+
+    def test_spread_by_load_keeps_conversation_when_owner_is_lightest(self):
+        a, b = uuid.UUID(int=1), uuid.UUID(int=2)
+        assert spread_by_load([a], [a, b], {a: 1, b: 1}) == [a]
+
+    async def test_requires_a_selection(self, conn):
+        result = await SellerAssignmentService().bulk_reassign_conversations(1, uuid.uuid4(), "round_robin")
+        assert not result["success"]
+        assert conn.queries == []
+
+    async def test_rejects_unknown_strategy(self, conn):
+        result = await SellerAssignmentService().bulk_reassign_conversations(
+            1, uuid.uuid4(), "random", phones=["+1"]
+        )
+        assert not result["success"]
+
+
+class TestBulkReassignRoute:
+    def _app(self, role):
+        from core.security import get_resolved_tenant_id, verify_admin_token
+        from routes.seller_routes import router
+
+        app = FastAPI()
+        app.include_router(router)
+        self.user_id = uuid.uuid4()
+        app.dependency_overrides[verify_admin_token] = lambda: SimpleNamespace(
+            user_id=str(self.user_id), email="ceo@example.com", role=role, tenant_id=7
+        )
+        app.dependency_overrides[get_resolved_tenant_id] = lambda: 7
+        return app
+
+    async def _post(self, app, body):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/admin/core/sellers/conversations/bulk-reassign", json=body)
+
+    async def test_ceo_reassigns_with_uuid_actor(self, monkeypatch):
+        from routes import seller_routes
+        calls = []
+
+        async def bulk(**kwargs):
+            calls.append(kwargs)
+            return {"success": True, "reassigned": 2, "unchanged": 0, "by_seller": {}}
+
+        monkeypatch.setattr(seller_routes.seller_assignment_service, "bulk_reassign_conversations", bulk)
+        app = self._app("ceo")
+        seller = uuid.uuid4()
+        response = await self._post(app, {"from_seller_id": str(seller), "strategy": "round_robin"})
+        assert response.status_code == 200
+        assert response.json()["reassigned"] == 2
+        assert calls[0]["reassigned_by"] == self.user_id
+        assert calls[0]["tenant_id"] == 7
+        assert calls[0]["from_seller_id"] == seller
+
+    async def test_non_ceo_is_forbidden(self, monkeypatch):
+        from routes import seller_routes
+
+        async def bulk(**kwargs):
+            raise AssertionError("must not be called")
+
+        monkeypatch.setattr(seller_routes.seller_assignment_service, "bulk_reassign_conversations", bulk)
+        response = await self._post(self._app("closer"), {"phones": ["+1"], "strategy": "round_robin"})
+        assert response.status_code == 403
+
+    async def test_service_validation_error_is_400(self, monkeypatch):
+        from routes import seller_routes
+
+        async def bulk(**kwargs):
+            return {"success": False, "message": "Provide phones or from_seller_id"}
+
+        monkeypatch.setattr(seller_routes.seller_assignment_service, "bulk_reassign_conversations", bulk)
+        response = await self._post(self._app("ceo"), {"strategy": "round_robin"})
+        assert response.status_code == 400
+
+
+@pytest.mark.postgres
+class TestRotationPointer:
+    async def test_concurrent_assignments_spread_evenly(self, pg_db, monkeypatch):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+        invalidate_assignment_plan()
+        tag = uuid.uuid4().hex[:8]
+        tenant_id = await pg_db.fetchval(
+            "INSERT INTO tenants (clinic_name, bot_phone_number) VALUES ('rotation-test', $1) RETURNING id", f"+rr{tag}"
+        )
+        try:
+            users = [r["id"] for r in await pg_db.fetch("""
+                INSERT INTO users (email, password_hash, role, status, tenant_id)
+                SELECT 'rr-' || $1 || '-' || g || '@example.com', 'x', 'closer', 'active', $2 FROM generate_series(1, 5) g
+                RETURNING id
+            """, tag, tenant_id)]
+            await pg_db.execute(
+                "INSERT INTO sellers (user_id, tenant_id, is_active) SELECT unnest($1::uuid[]), $2, TRUE", users, tenant_id
+            )
+            service = SellerAssignmentService()
+            picks = await asyncio.gather(*[_round_robin(service, tenant_id) for _ in range(50)])
+            assert Counter(picks) == {u: 10 for u in users}
+            assert await pg_db.fetchval(
+                "SELECT position FROM seller_rotation_state WHERE tenant_id = $1 AND rule_key = ''", tenant_id
+            ) == 50
+        finally:
+            await pg_db.execute("DELETE FROM tenants WHERE id = $1", tenant_id)
+            invalidate_assignment_plan()
+
+
+@pytest.mark.postgres
+class TestBulkReassign:
+    async def test_departing_seller_book_is_spread_in_one_transaction(self, pg_db, monkeypatch):
+        import db as db_module
+        from services.seller_assignment_service import seller_notification_service
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+        sent = []
+
+        async def save(notifications):
+            sent.extend(notifications)
+
+        async def broadcast(notifications):
+            pass
+
+        monkeypatch.setattr(seller_notification_service, "save_notifications", save)
+        monkeypatch.setattr(seller_notification_service, "broadcast_notifications", broadcast)
+        invalidate_assignment_plan()
+        tag = uuid.uuid4().hex[:8]
+        tenant_id = await pg_db.fetchval(
+            "INSERT INTO tenants (clinic_name, bot_phone_number) VALUES ('bulk-test', $1) RETURNING id", f"+bk{tag}"
+        )
+        try:
+            departing, b, c = [r["id"] for r in await pg_db.fetch("""
+                INSERT INTO users (email, password_hash, role, status, tenant_id)
+                SELECT 'bk-' || $1 || '-' || g || '@example.com', 'x', 'closer', 'active', $2 FROM generate_series(1, 3) g
+                RETURNING id
+            """, tag, tenant_id)]
+            await pg_db.execute(
+                "INSERT INTO sellers (user_id, tenant_id, is_active) SELECT unnest($1::uuid[]), $2, TRUE",
+                [departing, b, c], tenant_id
+            )
+            await pg_db.execute("""
+                INSERT INTO chat_messages (from_number, role, content, tenant_id, assigned_seller_id, assigned_at)
+                SELECT '+77' || g, 'user', 'hola', $1, $2, NOW() FROM generate_series(1, 30) g, generate_series(1, 2)
+            """, tenant_id, departing)
+
+            result = await SellerAssignmentService().bulk_reassign_conversations(
+                tenant_id, departing, "round_robin", from_seller_id=departing
+            )
+            assert result["success"] and result["reassigned"] == 30
+            assert sorted(result["by_seller"].values()) == [15, 15]
+
+            counts = await pg_db.fetch("""
+                SELECT assigned_seller_id, COUNT(DISTINCT from_number) AS n
+                FROM chat_messages WHERE tenant_id = $1 GROUP BY 1
+            """, tenant_id)
+            assert {r["assigned_seller_id"]: r["n"] for r in counts} == {b: 15, c: 15}
+            loads = await pg_db.fetch("SELECT seller_id, open_conversations FROM seller_load WHERE tenant_id = $1", tenant_id)
+            assert {r["seller_id"]: r["open_conversations"] for r in loads} == {b: 15, c: 15}
+            assert await pg_db.fetchval(
+                "SELECT COUNT(*) FROM system_events WHERE tenant_id = $1 AND event_type = 'seller_bulk_reassignment'", tenant_id
+            ) == 1
+            # Una notificación por vendedor receptor (no una por conversación)
+            assert sorted(n.recipient_id for n in sent) == sorted([str(b), str(c)])
+        finally:
+            await pg_db.execute("DELETE FROM system_events WHERE tenant_id = $1", tenant_id)
+            await pg_db.execute("DELETE FROM chat_messages WHERE tenant_id = $1", tenant_id)
+            await pg_db.execute("DELETE FROM tenants WHERE id = $1", tenant_id)
+            invalidate_assignment_plan()
+
+
+class TestNotificationImport:
+    def test_assignment_uses_the_exported_notification_service(self):
+        # services.seller_notification_service exports `notification_service`; the old
+        # `seller_notification_service` import name never existed and broke module import.
+        import services.seller_assignment_service as assignment_module
+        from services.seller_notification_service import notification_service
+        assert assignment_module.seller_notification_service is notification_service
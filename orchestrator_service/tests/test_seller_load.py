@@ -0,0 +1,155 @@
+"""
+Live seller load counters (seller_load) and their reconciliation.
+
+The fake-pool tests need no database; the counter/reconciliation tests need TEST_POSTGRES_DSN.
+"""
+
+import uuid
+
+import pytest
+
+from services.seller_load_service import SellerLoadService
+
+
+class RecordingConn:
+    def __init__(self, value=None, row=None):
+        self.value = value
+        self.row = row
+        self.calls = []
+
+    async def execute(self, query, *args):
+        self.calls.append(args)
+        return "UPDATE 1"
+
+    async def fetchval(self, query, *args):
+        self.calls.append(args)
+        return self.value
+
+    async def fetchrow(self, query, *args):
+        self.calls.append(args)
+        return self.row
+
+
+@pytest.fixture
+def conn(fake_pool):
+    fake = RecordingConn()
+    fake_pool(fake)
+    return fake
+
+
+class TestSellerLoadShortcuts:
+    async def test_reassign_to_same_seller_is_a_noop(self, conn):
+        seller = uuid.uuid4()
+        await SellerLoadService().record_assignment(1, seller, seller)
+        assert conn.calls == []
+
+    async def test_assignment_is_one_statement(self, conn):
+        seller, previous = uuid.uuid4(), uuid.uuid4()
+        await SellerLoadService().record_assignment(1, seller, previous)
+        assert conn.calls == [(1, seller, previous)]
+
+    async def test_least_loaded_without_candidates(self, conn):
+        assert await SellerLoadService().least_loaded(1, []) is None
+        assert conn.calls == []
+
+    async def test_release_without_seller(self, conn):
+        await SellerLoadService().release(1, None)
+        assert conn.calls == []
+
+
+class TestCloseLead:
+    async def test_closing_an_open_lead_releases_its_seller(self):
+        seller, lead = uuid.uuid4(), uuid.uuid4()
+        conn = RecordingConn(row={"previous_status": "contacted", "assigned_seller_id": seller})
+        assert await SellerLoadService().close_lead(1, lead, "closed_won", conn)
+        assert conn.calls == [(lead, 1, "closed_won"), (1, seller)]
+
+    async def test_already_closed_lead_is_not_released_twice(self):
+        conn = RecordingConn(row={"previous_status": "closed_lost", "assigned_seller_id": uuid.uuid4()})
+        assert await SellerLoadService().close_lead(1, uuid.uuid4(), "closed_won", conn)
+        assert len(conn.calls) == 1
+
+    async def test_missing_lead(self):
+        conn = RecordingConn(row=None)
+        assert not await SellerLoadService().close_lead(1, uuid.uuid4(), "closed_won", conn)
+        assert len(conn.calls) == 1
+
+
+@pytest.mark.postgres
+class TestSellerLoadCounters:
+    @pytest.fixture
+    async def tenant(self, pg_db, monkeypatch):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+        tag = uuid.uuid4().hex[:8]
+        tenant_id = await pg_db.fetchval(
+            "INSERT INTO tenants (clinic_name, bot_phone_number) VALUES ('load-test', $1) RETURNING id", f"+ld{tag}"
+        )
+        sellers = [r["id"] for r in await pg_db.fetch("""
+            INSERT INTO users (email, password_hash, role, status, tenant_id)
+            SELECT 'ld-' || $1 || '-' || g || '@example.com', 'x', 'closer', 'active', $2 FROM generate_series(1, 3) g
+            RETURNING id
+        """, tag, tenant_id)]
+        try:
+            yield tenant_id, sellers
+        finally:
+            await pg_db.execute("DELETE FROM chat_messages WHERE tenant_id = $1", tenant_id)
+            await pg_db.execute("DELETE FROM tenants WHERE id = $1", tenant_id)
+
+    async def test_assign_reassign_release(self, tenant):
+        tenant_id, (a, b, c) = tenant
+        service = SellerLoadService()
+        await service.record_assignment(tenant_id, a)
+        await service.record_assignment(tenant_id, a)
+        await service.record_assignment(tenant_id, b, a)
+        assert await service.get_loads(tenant_id) == {a: 1, b: 1}
+        assert await service.least_loaded(tenant_id, [a, b, c]) == c
+
+        await service.release(tenant_id, b)
+        await service.release(tenant_id, b)  # nunca negativo
+        assert (await service.get_loads(tenant_id))[b] == 0
+        assert await service.least_loaded(tenant_id, [a, b]) == b
+
+    async def test_reconcile_fixes_drift_and_expires_old_assignments(self, pg_db, tenant):
+        tenant_id, (a, b, c) = tenant
+        await pg_db.execute("""
+            INSERT INTO chat_messages (from_number, role, content, tenant_id, assigned_seller_id, assigned_at)
+            VALUES ('+1001', 'user', 'hola', $1, $2, NOW()),
+                   ('+1001', 'user', 'sigo', $1, $2, NOW()),
+                   ('+1002', 'user', 'hola', $1, $2, NOW()),
+                   ('+1003', 'user', 'hola', $1, $3, NOW() - INTERVAL '3 days')
+        """, tenant_id, a, b)
+        service = SellerLoadService()
+        # Drift: a quedó corto, b tiene una conversación ya vencida
+        await service.record_assignment(tenant_id, a)
+        await service.record_assignment(tenant_id, b)
+
+        assert await service.reconcile() >= 2
+        assert await service.get_loads(tenant_id) == {a: 2, b: 0}
+        assert await service.reconcile() == 0
+
+    async def test_convert_lead_to_client_releases_seller(self, pg_db, tenant, monkeypatch):
+        import httpx
+        from fastapi import FastAPI
+        import modules.crm_sales.routes as crm_routes
+        from core.security import get_current_user_context
+        tenant_id, (a, _, _) = tenant
+        monkeypatch.setattr(crm_routes.limiter, "enabled", False)
+        lead_id = await pg_db.fetchval("""
+            INSERT INTO leads (tenant_id, phone_number, first_name, status, assigned_seller_id)
+            VALUES ($1, '+5491155550001', 'Cliente', 'contacted', $2) RETURNING id
+        """, tenant_id, a)
+        service = SellerLoadService()
+        await service.record_assignment(tenant_id, a)
+        app = FastAPI()
+        app.include_router(crm_routes.router)
+        app.dependency_overrides[get_current_user_context] = lambda: {"tenant_id": tenant_id, "role": "ceo"}
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                response = await client.post(f"/leads/{lead_id}/convert-to-client")
+            assert response.status_code == 201
+            assert await pg_db.fetchval("SELECT status FROM leads WHERE id = $1", lead_id) == "closed_won"
+            assert (await service.get_loads(tenant_id))[a] == 0
+        finally:
+            await pg_db.execute("DELETE FROM clients WHERE tenant_id = $1", tenant_id)
+            await pg_db.execute("DELETE FROM leads WHERE tenant_id = $1", tenant_id)
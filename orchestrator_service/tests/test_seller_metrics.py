@@ -0,0 +1,196 @@
+"""
+Set-based team metrics in seller_metrics_service + benchmark on a seeded multi-seller tenant.
+
+The fake-pool tests need no database; the seeded-tenant tests need TEST_POSTGRES_DSN and the
+timing comparison also RUN_BENCHMARKS=1. Run with `-s` to print the report.
+"""
+
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+
+from services.seller_metrics_service import SellerMetricsService, _format_metrics
+
+METRIC_COLUMNS = (
+    "total_conversations", "active_conversations", "conversations_assigned_today",
+    "total_messages_sent", "total_messages_received", "period_messages", "active_days_in_period",
+    "last_activity_at", "avg_conversation_duration_minutes", "total_chat_minutes",
+    "leads_assigned", "leads_converted", "prospects_generated", "prospects_converted",
+    "avg_response_time_seconds", "response_time_p50_seconds", "response_time_p90_seconds",
+    "total_responses_analyzed",
+)
+
+BENCH_SELLERS = 30
+BENCH_CONVERSATIONS = 20  # por vendedor
+BENCH_MESSAGES = 6  # por conversación
+
+
+class MetricsConn:
+    """Fake connection: one empty metrics row per requested seller; records round trips."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def fetch(self, query, *args):
+        self.calls.append(("fetch", args))
+        return [{"seller_id": s, **{c: None for c in METRIC_COLUMNS}} for s in args[1]]
+
+    async def execute(self, query, *args):
+        self.calls.append(("execute", args))
+        return "INSERT 0 1"
+
+
+class CountingPool:
+    """Wraps a real pool and counts round trips (acquire calls)."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.acquires = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.acquires += 1
+        async with self.pool.acquire() as conn:
+            yield conn
+
+
+@pytest.fixture
+def conn(fake_pool):
+    fake = MetricsConn()
+    fake_pool(fake)
+    return fake
+
+
+class TestFormatMetrics:
+    def test_empty_row_is_all_zero(self):
+        metrics = _format_metrics({c: None for c in METRIC_COLUMNS}, 7)
+        assert metrics["total_conversations"] == 0
+        assert metrics["conversion_rate"] == 0
+        assert metrics["last_activity_at"] is None
+
+    def test_ratios(self):
+        row = {c: None for c in METRIC_COLUMNS}
+        row.update({
+            "total_messages_sent": 6, "total_messages_received": 3, "leads_assigned": 4, "leads_converted": 1,
+            "active_days_in_period": 7, "period_messages": 14, "total_responses_analyzed": 1,
+            "response_time_p90_seconds": 30, "last_activity_at": datetime(2026, 1, 1),
+        })
+        metrics = _format_metrics(row, 7)
+        assert metrics["message_ratio"] == 2.0
+        assert metrics["conversion_rate"] == 25.0
+        assert metrics["activity_rate_percent"] == 100.0
+        assert metrics["avg_messages_per_day"] == 2.0
+        assert metrics["response_time_p90_seconds"] == 0  # un solo dato: sin p90
+        assert metrics["last_activity_at"] == "2026-01-01T00:00:00"
+
+
+class TestTeamMetricsRoundTrips:
+    async def test_whole_team_in_one_query_and_one_upsert(self, conn):
+        sellers = [uuid.uuid4() for _ in range(25)]
+        result = await SellerMetricsService().calculate_team_metrics(1, sellers)
+        assert result["success"]
+        assert set(result["metrics"]) == {str(s) for s in sellers}
+        assert [kind for kind, _ in conn.calls] == ["fetch", "execute"]
+        upsert_args = conn.calls[1][1]
+        assert upsert_args[3] == sellers  # arrays paralelos, un elemento por vendedor
+
+    async def test_single_seller_uses_same_path(self, conn):
+        seller = uuid.uuid4()
+        result = await SellerMetricsService().calculate_seller_metrics(seller, 1)
+        assert result["metrics"]["seller_id"] == str(seller)
+        assert len(conn.calls) == 2
+
+    async def test_no_sellers_no_queries(self, conn):
+        result = await SellerMetricsService().calculate_team_metrics(1, [])
+        assert result["success"] and result["metrics"] == {}
+        assert conn.calls == []
+
+
+@pytest.mark.postgres
+class TestTeamMetricsPostgres:
+    @pytest.fixture
+    async def seeded(self, pg_db, monkeypatch):
+        import db as db_module
+        counting = CountingPool(pg_db.pool)
+        monkeypatch.setattr(db_module.db, "pool", counting)
+        tag = uuid.uuid4().hex[:8]
+        tenant_id = await pg_db.fetchval(
+            "INSERT INTO tenants (clinic_name, bot_phone_number) VALUES ('metrics-bench', $1) RETURNING id", f"+mb{tag}"
+        )
+        try:
+            sellers = [r["id"] for r in await pg_db.fetch("""
+                INSERT INTO users (email, password_hash, role, status, tenant_id)
+                SELECT 'mb-' || $1 || '-' || g || '@example.com', 'x', 'closer', 'active', $2
+                FROM generate_series(1, $3::int) g
+                RETURNING id
+            """, tag, tenant_id, BENCH_SELLERS)]
+            # Conversaciones alternando user/assistant, un minuto entre mensajes
+            await pg_db.execute("""
+                INSERT INTO chat_messages (from_number, role, content, tenant_id, assigned_seller_id, assigned_at, created_at)
+                SELECT '+55' || s.n || '-' || c, CASE WHEN m % 2 = 1 THEN 'user' ELSE 'assistant' END, 'msg',
+                       $1, s.id, NOW() - INTERVAL '1 hour', NOW() - INTERVAL '1 hour' + m * INTERVAL '1 minute'
+                FROM unnest($2::uuid[]) WITH ORDINALITY AS s(id, n),
+                     generate_series(1, $3::int) c, generate_series(1, $4::int) m
+            """, tenant_id, sellers, BENCH_CONVERSATIONS, BENCH_MESSAGES)
+            yield tenant_id, sellers, counting
+        finally:
+            await pg_db.execute("DELETE FROM seller_metrics WHERE tenant_id = $1", tenant_id)
+            await pg_db.execute("DELETE FROM chat_messages WHERE tenant_id = $1", tenant_id)
+            await pg_db.execute("DELETE FROM tenants WHERE id = $1", tenant_id)
+
+    async def test_set_based_refresh_matches_per_seller(self, pg_db, seeded):
+        tenant_id, sellers, counting = seeded
+        service = SellerMetricsService()
+        looped = [await service.calculate_seller_metrics(s, tenant_id) for s in sellers]
+        counting.acquires = 0
+        batched = await service.calculate_team_metrics(tenant_id, sellers)
+
+        assert counting.acquires == 2
+        for result in looped:
+            single = result["metrics"]
+            team = batched["metrics"][single["seller_id"]]
+            assert single["total_conversations"] == team["total_conversations"]
+            assert single["total_messages_sent"] == team["total_messages_sent"]
+        metrics = batched["metrics"][str(sellers[0])]
+        assert metrics["total_conversations"] == BENCH_CONVERSATIONS
+        assert metrics["total_messages_sent"] == BENCH_CONVERSATIONS * BENCH_MESSAGES // 2
+        assert metrics["avg_response_time_seconds"] == 60.0
+        assert metrics["total_responses_analyzed"] == BENCH_CONVERSATIONS * BENCH_MESSAGES // 2
+        assert await pg_db.fetchval(
+            "SELECT COUNT(DISTINCT seller_id) FROM seller_metrics WHERE tenant_id = $1", tenant_id
+        ) == BENCH_SELLERS
+
+    async def test_messages_outside_the_window_are_ignored(self, pg_db, seeded):
+        tenant_id, sellers, _ = seeded
+        before = await SellerMetricsService().calculate_seller_metrics(sellers[0], tenant_id)
+        await pg_db.execute("""
+            INSERT INTO chat_messages (from_number, role, content, tenant_id, assigned_seller_id, assigned_at, created_at)
+            SELECT '+55-viejo-' || g, 'assistant', 'msg', $1, $2, NOW() - INTERVAL '90 days', NOW() - INTERVAL '90 days'
+            FROM generate_series(1, 5) g
+        """, tenant_id, sellers[0])
+        after = await SellerMetricsService().calculate_seller_metrics(sellers[0], tenant_id)
+        for key in ("total_conversations", "total_messages_sent", "total_chat_minutes", "last_activity_at"):
+            assert after["metrics"][key] == before["metrics"][key]
+
+    @pytest.mark.benchmark
+    async def test_set_based_refresh_is_faster(self, seeded):
+        tenant_id, sellers, counting = seeded
+        service = SellerMetricsService()
+        counting.acquires = 0
+        start = time.perf_counter()
+        for s in sellers:
+            await service.calculate_seller_metrics(s, tenant_id)
+        looped_s, looped_trips = time.perf_counter() - start, counting.acquires
+
+        counting.acquires = 0
+        start = time.perf_counter()
+        await service.calculate_team_metrics(tenant_id, sellers)
+        batched_s, batched_trips = time.perf_counter() - start, counting.acquires
+
+        print(f"\nteam metrics ({BENCH_SELLERS} sellers x {BENCH_CONVERSATIONS} conversations x {BENCH_MESSAGES} messages)")
+        print(f"  per-seller  {looped_s * 1000:.1f} ms  round trips={looped_trips}")
+        print(f"  set-based   {batched_s * 1000:.1f} ms  round trips={batched_trips}")
+        assert batched_s < looped_s
@@ -0,0 +1,229 @@
+"""
+Tests + benchmark for the prospecting website phone crawler against a local fixture web server.
+
+The concurrent vs. sequential benchmark runs only with RUN_BENCHMARKS=1.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import Counter
+
+import pytest
+
+from services.prospecting.website_phone_crawler import (
+    WebsitePhoneCache, WebsitePhoneCrawler, extract_phone_from_html,
+)
+
+PAGE_DELAY_SECONDS = 0.05
+FIXTURE_PAGES = 40
+
+
+def _response_for(path: str) -> tuple:
+    """(status line, content type, body) for a fixture path."""
+    if path.startswith("/error"):
+        return "500 Internal Server Error", "text/html", b"<p>Contacto: +54 9 351 400-0000.</p>"
+    if path.startswith("/pdf"):
+        return "200 OK", "application/pdf", b"%PDF-1.4 tel +54 9 351 400-0000"
+    return "200 OK", "text/html; charset=utf-8", _page_for(path)
+
+
+def _page_for(path: str) -> bytes:
+    if path.startswith("/big"):
+        # Phone only after ~1 MB of padding: must not be reached with the byte cap
+        return b"<html><body>" + b"x" * (1024 * 1024) + b'<a href="tel:+5491155550000">Llamar</a></body></html>'
+    if path.startswith("/nophone"):
+        return b"<html><body><p>Sin datos de contacto.</p></body></html>"
+    n = int(path.strip("/").split("/")[-1] or 0)
+    return (
+        "<html><head><script>var x = '+54 11 0000 0000';</script></head><body>"
+        f"<p>Bienvenidos.</p><p>Contacto: whatsapp +54 9 351 4{n:03d}-{n:04d}.</p>"
+        "</body></html>"
+    ).encode()
+
+
+class FixtureServer:
+    """Minimal HTTP/1.1 server with a fixed per-response delay; tracks peak in-flight requests per Host."""
+
+    def __init__(self):
+        self.server = None
+        self.port = None
+        self.requests = 0
+        self.in_flight = Counter()
+        self.peak_in_flight = Counter()
+
+    async def _handle(self, reader, writer):
+        host = None
+        try:
+            request_line = await reader.readline()
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "host":
+                    host = value.strip().rsplit(":", 1)[0]
+            path = request_line.split(b" ")[1].decode()
+            self.requests += 1
+            self.in_flight[host] += 1
+            self.peak_in_flight[host] = max(self.peak_in_flight[host], self.in_flight[host])
+            await asyncio.sleep(PAGE_DELAY_SECONDS)
+            self.in_flight[host] -= 1
+            status, content_type, body = _response_for(path)
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n".encode()
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            )
+            writer.write(body)
+            await writer.drain()
+        except (ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def url(self, path: str, host: str = "127.0.0.1") -> str:
+        return f"http://{host}:{self.port}{path}"
+
+
+class InMemoryCache:
+    """(url, default_cc) -> (phone, definitive); failures_expired simulates the short failure TTL."""
+
+    def __init__(self):
+        self.store = {}
+        self.failures_expired = False
+
+    async def get_many(self, urls, default_cc):
+        hits = {u: self.store.get((u, default_cc)) for u in urls}
+        return {
+            u: hit[0] for u, hit in hits.items()
+            if hit is not None and (hit[1] or not self.failures_expired)
+        }
+
+    async def set_many(self, results, default_cc):
+        self.store.update({(u, default_cc): result for u, result in results.items()})
+
+
+class TestExtractPhoneFromHtml:
+    def test_prefers_tel_links_and_ignores_scripts(self):
+        html = '<script>"+54 11 9999 9999"</script><a href="tel:+54 9 11 5555-1234">Llamar</a>'
+        assert extract_phone_from_html(html, "54") == "5491155551234"
+
+    def test_keyword_text(self):
+        assert extract_phone_from_html("<p>Teléfono: (0351) 15 432-1000.</p>", "54") == "5493514321000"
+
+    def test_no_phone(self):
+        assert extract_phone_from_html("<p>Hola mundo</p>", "54") is None
+
+
+class TestWebsitePhoneCrawler:
+    async def test_extracts_phones_concurrently(self):
+        async with FixtureServer() as server:
+            urls = [server.url(f"/site/{i}") for i in range(FIXTURE_PAGES)]
+            async with WebsitePhoneCrawler(max_concurrency=20, per_host_limit=20) as crawler:
+                results = await crawler.extract_many(urls, default_cc="54")
+
+        assert len(results) == FIXTURE_PAGES
+        assert results[urls[7]] == "54935140070007"
+
+    async def test_byte_cap_stops_reading(self):
+        async with FixtureServer() as server:
+            async with WebsitePhoneCrawler(max_bytes=64 * 1024) as crawler:
+                assert await crawler.extract_phone(server.url("/big"), "54") is None
+            async with WebsitePhoneCrawler(max_bytes=4 * 1024 * 1024) as crawler:
+                assert await crawler.extract_phone(server.url("/big"), "54") == "5491155550000"
+
+    async def test_per_host_limit(self):
+        async with FixtureServer() as server:
+            urls = [
+                server.url(f"/site/{i}", host="127.0.0.1" if i % 2 else "localhost")
+                for i in range(20)
+            ]
+            async with WebsitePhoneCrawler(max_concurrency=20, per_host_limit=2) as crawler:
+                results = await crawler.extract_many(urls, "54")
+
+        assert len(results) == 20
+        assert set(server.peak_in_flight) == {"127.0.0.1", "localhost"}
+        assert max(server.peak_in_flight.values()) <= 2
+
+    async def test_cache_skips_network_and_only_2xx_html_is_definitive(self):
+        cache = InMemoryCache()
+        async with FixtureServer() as server:
+            ok_url, empty_url = server.url("/site/3"), server.url("/nophone")
+            error_url, pdf_url = server.url("/error"), server.url("/pdf")
+            down_url = "http://127.0.0.1:1/unreachable"
+            async with WebsitePhoneCrawler(cache=cache) as crawler:
+                first = await crawler.extract_many([ok_url, empty_url, error_url, pdf_url, down_url], "54")
+                requests_after_first = server.requests
+                again = await crawler.extract_many([ok_url, empty_url, error_url, pdf_url], "54")
+                assert server.requests == requests_after_first
+
+                cache.failures_expired = True
+                await crawler.extract_many([ok_url, empty_url, error_url, pdf_url], "54")
+                assert server.requests == requests_after_first + 2
+
+        assert first[error_url] is None and first[pdf_url] is None
+        assert again[ok_url] == "54935140030003"
+        assert again[empty_url] is None
+        assert cache.store[(ok_url, "54")] == ("54935140030003", True)
+        assert cache.store[(empty_url, "54")] == (None, True)
+        for url in (error_url, pdf_url, down_url):
+            assert cache.store[(url, "54")] == (None, False)
+
+    async def test_cache_is_keyed_by_default_country(self):
+        cache = InMemoryCache()
+        async with FixtureServer() as server:
+            url = server.url("/site/3")
+            async with WebsitePhoneCrawler(cache=cache) as crawler:
+                await crawler.extract_many([url], "54")
+                await crawler.extract_many([url], "52")
+                await crawler.extract_many([url], "54")
+            assert server.requests == 2
+        assert set(cache.store) == {(url, "54"), (url, "52")}
+
+    @pytest.mark.benchmark
+    async def test_benchmark_concurrent_vs_sequential(self):
+        async with FixtureServer() as server:
+            # Two "hosts" (127.0.0.1 / localhost) to exercise per-host limits
+            urls = [
+                server.url(f"/site/{i}", host="127.0.0.1" if i % 2 else "localhost")
+                for i in range(FIXTURE_PAGES)
+            ]
+
+            async with WebsitePhoneCrawler(max_concurrency=1, per_host_limit=1) as crawler:
+                start = time.perf_counter()
+                sequential = await crawler.extract_many(urls, "54")
+                sequential_elapsed = time.perf_counter() - start
+
+            async with WebsitePhoneCrawler(max_concurrency=20, per_host_limit=8) as crawler:
+                start = time.perf_counter()
+                concurrent = await crawler.extract_many(urls, "54")
+                concurrent_elapsed = time.perf_counter() - start
+
+        assert concurrent == sequential
+        assert concurrent_elapsed < sequential_elapsed / 4
+
+
+@pytest.mark.postgres
+class TestWebsitePhoneCachePostgres:
+    async def test_keyed_by_country_and_failures_expire_early(self, pg_db, monkeypatch):
+        import db as db_module
+        monkeypatch.setattr(db_module.db, "pool", pg_db.pool)
+        ok_url, failed_url = f"https://ok-{uuid.uuid4().hex}.test/", f"https://down-{uuid.uuid4().hex}.test/"
+        try:
+            cache = WebsitePhoneCache(ttl_days=30, failure_ttl_minutes=60)
+            await cache.set_many({ok_url: ("5493514000000", True), failed_url: (None, False)}, "54")
+            assert await cache.get_many([ok_url, failed_url], "54") == {ok_url: "5493514000000", failed_url: None}
+            assert await cache.get_many([ok_url, failed_url], "52") == {}
+
+            expired = WebsitePhoneCache(ttl_days=30, failure_ttl_minutes=0)
+            assert await expired.get_many([ok_url, failed_url], "54") == {ok_url: "5493514000000"}
+        finally:
+            await pg_db.execute(
+                "DELETE FROM website_phone_cache WHERE url = ANY($1::text[])", [ok_url, failed_url]
+            )